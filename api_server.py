@@ -0,0 +1,479 @@
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import parse_qsl, urlsplit
+
+from database import POOL_SIZE, is_locked_error
+from models import utc_now
+
+# HTTP/JSON API to the Flight Management System, so many clients can share one long-running process (with its connection
+# pool, caches and background status updates already warm) instead of each starting the program. Built on asyncio's
+# streams, with no dependencies outside the standard library. Each request's database work runs on a bounded pool of
+# worker threads, so a slow query never holds up the event loop, and listings are streamed as a chunked JSON array a
+# page at a time. The endpoints call the same operations as the menus and 'cli.py'. Usage:
+#
+#   python api_server.py --port 8080
+#   curl 'http://127.0.0.1:8080/flights?status=scheduled&limit=20'
+#   curl -X POST http://127.0.0.1:8080/flights -d '{"from": "JFK", "to": "LHR", "departure": "01-06-2030 09:30", "duration": "7:05"}'
+#   curl -X POST http://127.0.0.1:8080/flights/12/pilot -d '{"pilot_id": 3}'
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# number of worker threads running database work - one per pooled connection, so every worker can reuse an idle connection
+WORKER_THREADS = POOL_SIZE
+
+# seconds a read may take before the client is sent '504 Gateway Timeout', seconds a client has to send the request line
+# and headers, and the largest request body accepted in bytes
+REQUEST_TIMEOUT = 30
+HEADER_TIMEOUT = 10
+MAX_BODY_SIZE = 1024 * 1024
+
+# number of records read from the database and sent to the client at a time when streaming a listing
+STREAM_PAGE_SIZE = 500
+
+# reason phrases of the status codes the server sends
+STATUS_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+# the thread pool running database work and the request timeout in use, set by 'serve'
+_executor = None
+_request_timeout = REQUEST_TIMEOUT
+
+# exception raised by a handler to send an error response with a status code other than '400 Bad Request'
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# an iterator of records returned by a handler, which is sent to the client as a JSON array a page at a time
+class Stream:
+    def __init__(self, records):
+        self.records = iter(records)
+
+# helper function to read a value with one of the parsers from 'cli.py', raising a ValueError (sent as '400 Bad Request')
+# naming the field if it is invalid
+def _parse(parser, value, field):
+    try:
+        return parser(str(value))
+    except argparse.ArgumentTypeError as error:
+        raise ValueError(f"'{field}': {error}")
+
+# helper function to read a required field from a request body or query string
+def _required(values, field):
+    if values.get(field) in (None, ""):
+        raise ValueError(f"'{field}' is required.")
+    return values[field]
+
+# helper function to read an optional whole number from a request body or query string
+def _optional_int(values, field):
+    value = values.get(field)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be a whole number.")
+
+# helper function to read an optional true/false flag from a query string, such as 'future=1' or 'future=true'
+def _flag(values, field):
+    return str(values.get(field, "")).lower() in ("1", "true", "yes")
+
+# helper function to read an optional date and time ('DD-MM-YYYY HH:MM' or ISO 8601) from a request body or query string
+def _optional_time(values, field):
+    from cli import parse_time
+    value = values.get(field)
+    return _parse(parse_time, value, field) if value not in (None, "") else None
+
+# helper function to read an optional flight status from a query string
+def _status(values, field):
+    value = values.get(field) or None
+    if value not in (None, "scheduled", "departed", "cancelled"):
+        raise ValueError(f"'{field}' must be 'scheduled', 'departed' or 'cancelled'.")
+    return value
+
+# helper function to read the flight ID from a request's path, raising an HTTPError (sent as '404 Not Found') if no flight
+# has that ID, so it is not reported as an invalid request like a flight which has departed or is cancelled
+def _flight_id(params):
+    from flights_helpers import find_flight
+    flight_id = int(params["flight_id"])
+    if not find_flight(flight_id, columns=["flight_id"]):
+        raise HTTPError(404, f"Flight {flight_id} does not exist.")
+    return flight_id
+
+# handler to report that the server is running, with the schema version of the database it serves and, on a read-only
+# replica, how far behind the primary it is
+def health(params, query, body):
+    from database import is_read_only, replica_status
+    from migrations import get_schema_version
+    result = {"status": "ok", "schema_version": get_schema_version()}
+    if is_read_only():
+        result["replica"] = replica_status()
+    return result
+
+# handler to list flights matching the query string's 'status', 'exclude_status', 'pilot', 'destination' and 'future'
+# filters, in departure order, streamed a page at a time. 'limit' caps the number of flights listed
+def list_flights(params, query, body):
+    from cli import FLIGHT_COLUMNS, to_records
+    from flights_helpers import iter_flights
+    flights = iter_flights(
+        FLIGHT_COLUMNS, pilot=_optional_int(query, "pilot"), is_future=_flag(query, "future") or None,
+        exclude_status=_status(query, "exclude_status"), status=_status(query, "status"),
+        destination=query.get("destination") or None, page_size=STREAM_PAGE_SIZE
+    )
+    limit = _optional_int(query, "limit")
+    if limit is not None:
+        flights = islice(flights, limit)
+    return Stream(to_records(flights, FLIGHT_COLUMNS))
+
+# handler to show a single flight
+def show_flight(params, query, body):
+    from cli import FLIGHT_COLUMNS, to_records
+    from flights_helpers import find_flight
+    flight = find_flight(int(params["flight_id"]), columns=FLIGHT_COLUMNS)
+    if not flight:
+        raise HTTPError(404, f"Flight {params['flight_id']} does not exist.")
+    return next(to_records([flight], FLIGHT_COLUMNS))
+
+# handler to schedule a new flight from the body's 'from' and 'to' (Airport IDs or IATA codes), 'departure' time and
+# 'duration' ('HH:MM' or a number of minutes)
+def schedule_flight(params, query, body):
+    from cli import find_airport_id, parse_duration, parse_time
+    from flights import schedule_flight
+    departure = _parse(parse_time, _required(body, "departure"), "departure")
+    flight_id, flight_number, arrival_time = schedule_flight(
+        find_airport_id(str(_required(body, "from"))), find_airport_id(str(_required(body, "to"))), departure,
+        _parse(parse_duration, _required(body, "duration"), "duration")
+    )
+    return 201, {
+        "flight_id": flight_id, "flight_number": flight_number,
+        "departure_time": str(departure), "arrival_time": str(arrival_time), "status": "scheduled"
+    }
+
+# handler to cancel a flight
+def cancel_flight(params, query, body):
+    from flights import cancel_flight
+    flight_id = _flight_id(params)
+    return {"flight_id": flight_id, "flight_number": cancel_flight(flight_id), "status": "cancelled"}
+
+# handler to change the departure time of a flight to the body's 'departure' (the arrival time moves by the same amount)
+def reschedule_flight(params, query, body):
+    from cli import parse_time
+    from flights import change_flight_departure_time
+    flight_id = _flight_id(params)
+    departure = _parse(parse_time, _required(body, "departure"), "departure")
+    flight_number, arrival_time = change_flight_departure_time(flight_id, departure)
+    return {"flight_id": flight_id, "flight_number": flight_number, "departure_time": str(departure), "arrival_time": str(arrival_time)}
+
+# handler to change the arrival airport of a flight to the body's 'to' (an Airport ID or IATA code)
+def change_destination(params, query, body):
+    from cli import find_airport_id
+    from flights import change_flight_destination
+    flight_id = _flight_id(params)
+    arrival_airport_id = find_airport_id(str(_required(body, "to")))
+    flight_number = change_flight_destination(flight_id, arrival_airport_id)
+    return {"flight_id": flight_id, "flight_number": flight_number, "arrival_airport_id": arrival_airport_id}
+
+# handler to assign the body's 'pilot_id' to a flight
+def assign_pilot(params, query, body):
+    from pilots import assign_pilot
+    flight_id, pilot_id = _flight_id(params), _optional_int(body, "pilot_id")
+    if pilot_id is None:
+        raise ValueError("'pilot_id' is required.")
+    flight_number, pilot_name = assign_pilot(flight_id, pilot_id)
+    return {"flight_id": flight_id, "flight_number": flight_number, "pilot_id": pilot_id, "pilot_name": pilot_name}
+
+# handler to list pilots, optionally only those free between the query string's 'available_from' and 'available_to'
+def list_pilots(params, query, body):
+    from cli import to_records
+    from reference_cache import cached_query
+    pilots = cached_query("SELECT pilot_id, first_name, last_name, licence_number FROM pilots ORDER BY pilot_id", tables=("pilots",))
+    available_from, available_to = _optional_time(query, "available_from"), _optional_time(query, "available_to")
+    if available_from or available_to:
+        if not (available_from and available_to):
+            raise ValueError("Both 'available_from' and 'available_to' must be provided.")
+        from pilot_availability import get_available_pilot_ids
+        available = get_available_pilot_ids([pilot[0] for pilot in pilots], available_from, available_to)
+        pilots = [pilot for pilot in pilots if pilot[0] in available]
+    return list(to_records(pilots, ["pilot_id", "first_name", "last_name", "licence_number"]))
+
+# handler to list the flights assigned to a pilot, streamed a page at a time. Accepts the same 'future' and 'limit' as
+# 'list_flights'
+def pilot_schedule(params, query, body):
+    return list_flights(params, {**query, "pilot": params["pilot_id"], "status": None, "exclude_status": None, "destination": None}, body)
+
+# handler to list the conflicts found in the pilots' schedules, optionally only those of the query string's 'pilot'
+def list_conflicts(params, query, body):
+    from cli import to_records
+    from conflicts import get_conflicts
+    return Stream(to_records(get_conflicts(pilot_id=_optional_int(query, "pilot")), [
+        "pilot_id", "conflict_type", "flight_id", "flight_number", "departure_time", "other_flight_id", "other_flight_number", "detail"
+    ]))
+
+# handler to list every destination
+def list_destinations(params, query, body):
+    from cli import to_records
+    from reference_cache import cached_query
+    destinations = cached_query("SELECT destination_id, city, country FROM destinations ORDER BY destination_id", tables=("destinations",))
+    return list(to_records(destinations, ["destination_id", "city", "country"]))
+
+# handler to search for destinations matching the query string's 'q', best match first
+def search_destinations(params, query, body):
+    from cli import to_records
+    from destinations_helpers import DESTINATION_SEARCH_LIMIT, search_destinations
+    matches = search_destinations(_required(query, "q"), _optional_int(query, "limit") or DESTINATION_SEARCH_LIMIT)
+    return list(to_records(matches, ["airport_id", "airport_name", "iata_code", "city", "country"]))
+
+# handler to list every airport and its destination
+def list_airports(params, query, body):
+    from cli import to_records
+    from reference_cache import cached_query
+    columns = ["a.airport_id", "a.airport_name", "a.iata_code", "d.city", "d.country"]
+    airports = cached_query(f'''
+        SELECT {", ".join(columns)} FROM airports AS a
+        JOIN destinations AS d ON a.destination_id = d.destination_id
+        ORDER BY a.airport_id
+    ''', tables=("airports", "destinations"))
+    return list(to_records(airports, columns))
+
+# handler to search for the earliest-arriving routes between the query string's 'from' and 'to' airports, with the first
+# flight departing between 'depart' and 'until', and at most 'max_connections' connections
+def search_routes(params, query, body):
+    from cli import find_airport_id
+    from route_search import MAX_CONNECTIONS, find_routes
+    max_connections = _optional_int(query, "max_connections")
+    return find_routes(
+        find_airport_id(_required(query, "from")), find_airport_id(_required(query, "to")),
+        _optional_time(query, "depart") or utc_now(), _optional_time(query, "until"),
+        MAX_CONNECTIONS if max_connections is None else max_connections
+    )
+
+# list of (method, path pattern, handler) routes. Named groups in the pattern are passed to the handler as 'params'
+ROUTES = [
+    ("GET", r"/health", health),
+    ("GET", r"/flights", list_flights),
+    ("POST", r"/flights", schedule_flight),
+    ("GET", r"/flights/(?P<flight_id>\d+)", show_flight),
+    ("POST", r"/flights/(?P<flight_id>\d+)/cancel", cancel_flight),
+    ("POST", r"/flights/(?P<flight_id>\d+)/reschedule", reschedule_flight),
+    ("POST", r"/flights/(?P<flight_id>\d+)/destination", change_destination),
+    ("POST", r"/flights/(?P<flight_id>\d+)/pilot", assign_pilot),
+    ("GET", r"/pilots", list_pilots),
+    ("GET", r"/pilots/conflicts", list_conflicts),
+    ("GET", r"/pilots/(?P<pilot_id>\d+)/flights", pilot_schedule),
+    ("GET", r"/destinations", list_destinations),
+    ("GET", r"/destinations/search", search_destinations),
+    ("GET", r"/airports", list_airports),
+    ("GET", r"/routes", search_routes),
+]
+_compiled_routes = [(method, re.compile(pattern + "/?"), handler) for method, pattern, handler in ROUTES]
+
+# helper function to find the handler for a request. Raises an HTTPError if no route matches the path, or none matches
+# the method
+def find_route(method, path):
+    allowed = False
+    for route_method, pattern, handler in _compiled_routes:
+        match = pattern.fullmatch(path)
+        if match:
+            if route_method == method:
+                return handler, match.groupdict()
+            allowed = True
+    raise HTTPError(405, f"{method} is not supported for {path}.") if allowed else HTTPError(404, f"No such endpoint: {path}")
+
+# helper function to run a function on the worker threads, giving up after 'timeout' seconds (or waiting for it to finish
+# when 'timeout' is None). The work itself cannot be interrupted, so an operation which times out may still complete
+async def run_in_worker(timeout, function, *args):
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(_executor, function, *args), timeout)
+
+# helper function to read a request's line, headers and body. Returns (method, target, version, headers, body), or None if
+# the client closed the connection before sending a request
+async def read_request(reader):
+    line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(400, "Chunked request bodies are not supported - send a Content-Length.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY_SIZE} bytes.")
+    body = await asyncio.wait_for(reader.readexactly(length), HEADER_TIMEOUT) if length else b""
+    return method.upper(), target, version.upper(), headers, body
+
+# helper function to write a response's status line and headers
+def write_head(writer, status, headers):
+    lines = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+# helper function to send a JSON response
+async def send_json(writer, status, payload, keep_alive):
+    data = json.dumps(payload).encode()
+    write_head(writer, status, {
+        "Content-Type": "application/json", "Content-Length": len(data), "Connection": "keep-alive" if keep_alive else "close"
+    })
+    writer.write(data)
+    await writer.drain()
+
+# helper function to send a stream of records as a JSON array, reading 'STREAM_PAGE_SIZE' records at a time on the worker
+# threads and writing each page as it is read, so only one page is held in memory. HTTP/1.1 clients receive the array with
+# chunked transfer encoding; HTTP/1.0 clients receive it up to the end of the connection. Once the response's head has been
+# sent an error can no longer be reported with a status code, so the connection is closed, leaving the array unterminated.
+# Returns whether the connection can be kept open
+async def send_stream(writer, stream, deadline, chunked, keep_alive):
+    def write(text):
+        data = text.encode()
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n" if chunked else data)
+
+    first_page = await run_in_worker(deadline - time.monotonic(), lambda: list(islice(stream.records, STREAM_PAGE_SIZE)))
+    headers = {"Content-Type": "application/json", "Connection": "keep-alive" if keep_alive and chunked else "close"}
+    if chunked:
+        headers["Transfer-Encoding"] = "chunked"
+    write_head(writer, 200, headers)
+    page, count = first_page, 0
+    try:
+        write("[")
+        while page:
+            write("".join(("," if count + index else "") + "\n" + json.dumps(record) for index, record in enumerate(page)))
+            count += len(page)
+            await writer.drain()
+            if len(page) < STREAM_PAGE_SIZE:
+                break
+            page = await run_in_worker(deadline - time.monotonic(), lambda: list(islice(stream.records, STREAM_PAGE_SIZE)))
+        write("\n]\n" if count else "]\n")
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    except Exception as error:
+        # any error, not only a timeout or database error, must close the connection rather than reach 'handle_client',
+        # which would send an error response into the middle of the array
+        print(f"Stream closed after {count} records: {error!r}", file=sys.stderr)
+        if not isinstance(error, (asyncio.TimeoutError, sqlite3.Error, ConnectionError)):
+            traceback.print_exc()
+        return False
+    return keep_alive and chunked
+
+# helper function to run a request's handler and send its response. Handlers return a JSON payload, a (status, payload)
+# tuple, or a 'Stream'. ValueErrors raised by the operations (such as a flight which has departed) are sent as '400 Bad
+# Request', a database which stays locked as '503 Service Unavailable', and reads taking longer than the request timeout
+# as '504 Gateway Timeout'. Changes are always waited for, as one which timed out could still be saved after the client
+# was told it failed, and a retry would then repeat it. Returns the status sent and whether the connection can be kept open
+async def respond(writer, method, target, version, body, keep_alive):
+    deadline = time.monotonic() + _request_timeout
+    try:
+        url = urlsplit(target)
+        handler, params = find_route(method, url.path)
+        query = dict(parse_qsl(url.query))
+        try:
+            payload = json.loads(body) if body.strip() else {}
+        except ValueError:
+            raise HTTPError(400, "The request body must be a JSON object.")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "The request body must be a JSON object.")
+        result = await run_in_worker(_request_timeout if method == "GET" else None, handler, params, query, payload)
+        if isinstance(result, Stream):
+            return 200, await send_stream(writer, result, deadline, version == "HTTP/1.1", keep_alive)
+        status, result = result if isinstance(result, tuple) else (200, result)
+    except HTTPError as error:
+        status, result = error.status, {"error": str(error)}
+    except ValueError as error:
+        status, result = 400, {"error": str(error)}
+    except asyncio.TimeoutError:
+        status, result = 504, {"error": f"The request did not complete within {_request_timeout} seconds."}
+    except sqlite3.OperationalError as error:
+        if not is_locked_error(error):
+            raise
+        status, result = 503, {"error": "The database is busy - try again shortly."}
+    await send_json(writer, status, result, keep_alive)
+    return status, keep_alive
+
+# function to serve one client connection, answering requests until the client closes it (or asks to), the client is idle
+# for longer than the header timeout, or a response cannot be followed by another
+async def handle_client(reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except HTTPError as error:
+                await send_json(writer, error.status, {"error": str(error)}, False)
+                return
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return
+            if request is None:
+                return
+            method, target, version, headers, body = request
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+            started = time.monotonic()
+            try:
+                status, keep_alive = await respond(writer, method, target, version, body, keep_alive)
+            except Exception:
+                traceback.print_exc()
+                status, keep_alive = 500, False
+                await send_json(writer, 500, {"error": "Internal server error."}, False)
+            print(f"{method} {target} {status} {(time.monotonic() - started) * 1000:.1f}ms", file=sys.stderr)
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+# function to run the API server until interrupted. Brings the schema up to date and starts the background flight status
+# updates once, so requests never wait for either, then accepts connections on 'host' and 'port'
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=WORKER_THREADS, request_timeout=REQUEST_TIMEOUT):
+    global _executor, _request_timeout
+    from database_queries import start_flight_status_updates
+    from migrations import run_migrations
+    run_migrations()
+    stop_status_updates = start_flight_status_updates()
+    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+    _request_timeout = request_timeout
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"Serving the Flight Management API on http://{host}:{port} with {workers} worker threads", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        stop_status_updates.set()
+        _executor.shutdown(wait=True, cancel_futures=True)
+
+# function to parse the command line options and run the API server
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API to the Flight Management System.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=WORKER_THREADS, help=f"threads running database work (default: {WORKER_THREADS})")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help=f"seconds before a read times out (default: {REQUEST_TIMEOUT})")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.timeout))
+    except KeyboardInterrupt:
+        print("Stopped.", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
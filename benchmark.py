@@ -0,0 +1,368 @@
+import argparse
+import builtins
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from models import utc_now
+from query_log import enable, get_query_stats, reset_query_stats
+
+# benchmark of the main query paths of the Flight Management System. Generates a synthetic database of 'scale' flights
+# (with a proportional number of destinations, airports and pilots) from a fixed seed, then runs each query path with
+# its output discarded and reports latency percentiles, rows per second and peak memory use as JSON. The same scale and
+# seed always generate the same data, so results from different commits can be compared with '--compare'. Usage:
+#
+#   python benchmark.py --scale 100000 --output results.json
+#   python benchmark.py --scale 100000 --compare results.json
+#
+# Generated databases are kept in '--cache-dir' and reused for the rest of the day, as the larger scales take several
+# minutes to generate. Each run works on a copy, so the cached database is never changed
+
+# version of the data generator - increase whenever the generated data changes, so cached databases are not reused
+GENERATOR_VERSION = 1
+
+# number of rows inserted at a time by the generator
+INSERT_CHUNK_SIZE = 50000
+
+# relative number of flights departing in each hour of the day (GMT) - a morning and an evening peak, with few overnight flights
+HOURLY_WEIGHTS = [1, 1, 1, 1, 2, 4, 8, 10, 10, 9, 8, 7, 7, 7, 7, 8, 9, 10, 10, 8, 6, 4, 2, 1]
+
+# proportion of flights which are cancelled, and which have a pilot assigned
+CANCELLED_RATE = 0.03
+ASSIGNED_RATE = 0.85
+
+# flights which departed within this many days before the data was generated are left 'scheduled', as if the status update
+# had not run for that long, to give 'update_flight_status' some work
+STALE_STATUS_DAYS = 7
+
+# helper function to return the number of destinations, airports and pilots generated for a number of flights
+def reference_counts(scale):
+    destinations = max(10, scale // 1000)
+    return {
+        "destinations": destinations,
+        "airports": destinations * 3 // 2,
+        "pilots": max(20, scale // 200),
+        "flights": scale,
+    }
+
+# helper function to return the number of countries the generated destinations are spread across
+def country_count(counts):
+    return max(5, counts["destinations"] // 20)
+
+# helper function to generate the IATA code of the airport at position 'index' - three letters for the first 17,576
+# airports, then four
+def iata_code(index):
+    letters = ""
+    length = 3 if index < 26 ** 3 else 4
+    index = index if length == 3 else index - 26 ** 3
+    for _ in range(length):
+        index, letter = divmod(index, 26)
+        letters = chr(ord("A") + letter) + letters
+    return letters
+
+# helper function to generate the flight number of the flight at position 'index' - a two letter airline code followed by
+# a six digit number, which gives over 600 million unique numbers within the 8 characters allowed
+def flight_number(index):
+    code, number = divmod(index, 1000000)
+    return f"{chr(ord('A') + code // 26 % 26)}{chr(ord('A') + code % 26)}{number:06d}"
+
+# helper function to insert rows in chunks of INSERT_CHUNK_SIZE
+def insert_rows(conn, query, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == INSERT_CHUNK_SIZE:
+            conn.executemany(query, chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(query, chunk)
+
+# helper function to generate the flights. Departure times are spread over the year either side of 'now', weighted by
+# HOURLY_WEIGHTS; durations follow a log-normal distribution around two and a half hours; and busy airports are chosen
+# far more often than quiet ones (a Zipf-like distribution), as at real hubs. Yields rows ready to insert
+def generate_flights(rng, counts, now):
+    airport_weights = [1 / (rank + 1) ** 0.8 for rank in range(counts["airports"])]
+    cumulative_weights = []
+    total = 0
+    for weight in airport_weights:
+        total += weight
+        cumulative_weights.append(total)
+    hours = list(range(24))
+    stale_after = now - timedelta(days=STALE_STATUS_DAYS)
+    for index in range(counts["flights"]):
+        departure_airport_id, arrival_airport_id = rng.choices(range(1, counts["airports"] + 1), cum_weights=cumulative_weights, k=2)
+        if departure_airport_id == arrival_airport_id:
+            arrival_airport_id = departure_airport_id % counts["airports"] + 1
+        day = now.date() + timedelta(days=rng.randint(-365, 365))
+        departure_time = datetime(day.year, day.month, day.day, rng.choices(hours, weights=HOURLY_WEIGHTS)[0], rng.randrange(0, 60, 5))
+        minutes = min(max(round(rng.lognormvariate(math.log(150), 0.6) / 5) * 5, 30), 36 * 60)
+        arrival_time = departure_time + timedelta(minutes=minutes)
+        if rng.random() < CANCELLED_RATE:
+            status = "cancelled"
+        elif departure_time < stale_after:
+            status = "departed"
+        else:
+            status = "scheduled"
+        pilot_id = rng.randint(1, counts["pilots"]) if rng.random() < ASSIGNED_RATE else None
+        yield (
+            flight_number(index), departure_airport_id, arrival_airport_id, pilot_id,
+            departure_time.isoformat(" "), arrival_time.isoformat(" "), status
+        )
+
+# function to generate a synthetic database at 'path' for the provided scale and seed. The schema is created by the
+# migrations, and the flights table's indexes and traffic counter triggers are dropped while the flights are inserted and
+# recreated afterwards, with the counters recalculated (as in the bulk import). Returns the number of rows generated in each table
+def generate_database(path, scale, seed):
+    from migrations import REBUILD_TRAFFIC_COUNTERS, run_migrations
+    rng = random.Random(seed)
+    counts = reference_counts(scale)
+    now = utc_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    database.DATABASE = path
+    run_migrations()
+    database.close_all_connections()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    countries = country_count(counts)
+    insert_rows(conn, "INSERT INTO destinations (city, country) VALUES (?, ?)", (
+        (f"City {index}", f"Country {index % countries}") for index in range(counts["destinations"])
+    ))
+    insert_rows(conn, "INSERT INTO airports (airport_name, iata_code, destination_id) VALUES (?, ?, ?)", (
+        (f"Airport {index}", iata_code(index), index % counts["destinations"] + 1) for index in range(counts["airports"])
+    ))
+    insert_rows(conn, "INSERT INTO pilots (first_name, last_name, licence_number) VALUES (?, ?, ?)", (
+        (f"Pilot{index}", f"Surname{index}", f"LIC{index:08d}") for index in range(counts["pilots"])
+    ))
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'flights' AND sql IS NOT NULL").fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    counter_triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'flights' AND name LIKE 'traffic_on_%'").fetchall()
+    for name, _ in counter_triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    insert_rows(conn, '''
+        INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', generate_flights(rng, counts, now))
+    for _, sql in indexes + counter_triggers:
+        conn.execute(sql)
+    for statement in REBUILD_TRAFFIC_COUNTERS:
+        conn.execute(statement)
+    conn.execute("INSERT INTO flight_numbers (flight_number) SELECT flight_number FROM flights")
+    conn.commit()
+    conn.close()
+    return counts
+
+# helper function to return the peak memory use of this process so far, in megabytes ('ru_maxrss' is in kilobytes on
+# Linux and bytes on macOS)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# helper function to return the value at percentile 'p' of a sorted list, using the nearest-rank method
+def percentile(values, p):
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+# helper function to return the current commit, with '-dirty' added if the working tree has uncommitted changes, or
+# None if git is unavailable
+def current_commit():
+    repository = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repository, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repository, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+# helper function to run the program's functions headlessly - anything printed is discarded, every prompt is answered with
+# 'q' (which stops 'display_flights' after its first page) and 'clear_console' does nothing
+@contextlib.contextmanager
+def headless():
+    import menu
+    modules = [module for module in list(sys.modules.values()) if getattr(module, "clear_console", None) is menu.clear_console]
+    original_input = builtins.input
+    builtins.input = lambda prompt="": "q"
+    for module in modules:
+        module.clear_console = lambda: None
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        builtins.input = original_input
+        for module in modules:
+            module.clear_console = menu.clear_console
+
+# function to build the list of benchmark cases. Each case is a (name, function, repeat) tuple, where the function runs
+# one query path and returns the number of rows it produced, and 'repeat' is False for cases which change the data and so
+# are only run once. Parameters (such as the destination searched for) are picked from the generated data with the seed
+def build_cases(counts, seed):
+    from destinations import display_airport_flight_count, display_country_airport_count
+    from database_queries import update_flight_status
+    from flights import sort_flights_by_duration
+    from flights_helpers import FLIGHTS_PAGE_SIZE, DEFAULT_FLIGHT_COLUMNS, display_flights, display_flights_by_duration, get_longest_flights, iter_flights
+    from pilots_helpers import display_pilots
+    rng = random.Random(seed)
+    destination = f"City {rng.randrange(counts['destinations'] // 2)}"
+    pilot_id = rng.randint(1, counts["pilots"])
+    window_start = utc_now().replace(minute=0, second=0, microsecond=0) + timedelta(days=rng.randint(1, 30), hours=rng.randint(0, 23))
+    window_end = window_start + timedelta(hours=3)
+    destination_columns = [
+        "f.flight_number", "departure_airport.airport_name AS departure_airport", "f.departure_time",
+        "arrival_airport.airport_name AS arrival_airport", "f.arrival_time", "d.city", "d.country"
+    ]
+    def deep_pages():
+        return sum(1 for _ in zip(range(FLIGHTS_PAGE_SIZE * 50), iter_flights(DEFAULT_FLIGHT_COLUMNS, is_future=True)))
+    return [
+        ("flights_scheduled_first_page", lambda: display_flights(status="scheduled") or 0, True),
+        ("flights_future_50_pages", deep_pages, True),
+        ("flights_to_destination", lambda: display_flights(columns=destination_columns, destination=destination) or 0, True),
+        ("flights_for_pilot", lambda: display_flights(pilot=pilot_id) or 0, True),
+        ("pilots_available", lambda: len(display_pilots(only_available=True, departure_time=window_start, arrival_time=window_end) or []), True),
+        ("airport_flight_count_departing", lambda: display_airport_flight_count("departing") or counts["airports"], True),
+        ("airport_flight_count_arriving", lambda: display_airport_flight_count("arriving") or counts["airports"], True),
+        ("country_airport_count", lambda: display_country_airport_count() or country_count(counts), True),
+        ("sort_flights_by_duration", lambda: sort_flights_by_duration() or 0, True),
+        ("longest_50_flights", lambda: len(get_longest_flights(50)), True),
+        ("flights_8_to_12_hours", lambda: display_flights_by_duration(8 * 60, 12 * 60) or 0, True),
+        ("update_flight_status_full", lambda: update_flight_status(full=True), False),
+        ("update_flight_status_incremental", update_flight_status, True),
+    ]
+
+# function to time a benchmark case. Runs the case once (reported separately as 'cold_ms', as it fills any caches), then
+# repeats it up to 'repeat' times or until 'time_budget' seconds have passed. When 'query_stats' is set, the statements
+# the case ran (see 'query_log') are included, slowest in total first. Returns the case's results
+def run_case(function, repeat, time_budget, query_stats=False):
+    reset_query_stats()
+    with headless():
+        start = time.perf_counter()
+        rows = function()
+        cold = time.perf_counter() - start
+        timings = []
+        deadline = time.perf_counter() + time_budget
+        while len(timings) < repeat and time.perf_counter() < deadline:
+            start = time.perf_counter()
+            rows = function()
+            timings.append(time.perf_counter() - start)
+    result = {"cold_ms": round(cold * 1000, 3), "runs": len(timings), "rows": rows}
+    if timings:
+        timings.sort()
+        result.update({
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "p99_ms": round(percentile(timings, 99) * 1000, 3),
+            "max_ms": round(timings[-1] * 1000, 3),
+        })
+    median = percentile(timings, 50) if timings else cold
+    result["rows_per_sec"] = round(rows / median) if median else None
+    result["peak_rss_mb"] = peak_rss_mb()
+    if query_stats:
+        result["statements"] = get_query_stats()[:query_stats]
+    return result
+
+# function to compare results with those of an earlier run. Prints the change in median latency of each case and returns
+# the names of the cases which are more than 'threshold' times slower
+def compare_results(results, baseline, threshold):
+    if (baseline.get("scale"), baseline.get("seed")) != (results["scale"], results["seed"]):
+        print("Warning: the baseline was run with a different scale or seed.", file=sys.stderr)
+    regressions = []
+    for name, case in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if not before:
+            continue
+        key = "p50_ms" if "p50_ms" in case and "p50_ms" in before else "cold_ms"
+        ratio = case[key] / before[key] if before[key] else 1
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name}: {before[key]:.3f} ms -> {case[key]:.3f} ms ({ratio:.2f}x){flag}", file=sys.stderr)
+    return regressions
+
+# function to run the benchmark from the command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Flight Management System's query paths against synthetic data.")
+    parser.add_argument("--scale", type=int, default=10000, help="number of flights to generate (default: 10000)")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the data generator (default: 42)")
+    parser.add_argument("--repeat", type=int, default=20, help="maximum number of timed runs of each case (default: 20)")
+    parser.add_argument("--time-budget", type=float, default=10.0, help="maximum seconds of timed runs for each case (default: 10)")
+    parser.add_argument("--cases", help="comma separated names of the cases to run (default: all)")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "flight_benchmark"), help="directory to keep generated databases in")
+    parser.add_argument("--output", help="file to write the results to (default: stdout)")
+    parser.add_argument("--query-stats", type=int, default=0, metavar="N", help="include the N slowest statements of each case (adds some overhead to the timings)")
+    parser.add_argument("--compare", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slow down reported as a regression by --compare (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    if args.query_stats:
+        enable()
+    os.makedirs(args.cache_dir, exist_ok=True)
+    generated_on = utc_now().strftime("%Y%m%d")
+    cached_path = os.path.join(args.cache_dir, f"flights_{args.scale}_{args.seed}_v{GENERATOR_VERSION}_{generated_on}.db")
+    generation = None
+    if not os.path.exists(cached_path):
+        print(f"Generating {args.scale} flights...", file=sys.stderr)
+        start = time.perf_counter()
+        counts = generate_database(cached_path + ".tmp", args.scale, args.seed)
+        elapsed = time.perf_counter() - start
+        os.replace(cached_path + ".tmp", cached_path)
+        generation = {"seconds": round(elapsed, 3), "rows_per_sec": round(sum(counts.values()) / elapsed)}
+    counts = reference_counts(args.scale)
+    working_path = os.path.join(args.cache_dir, f"run_{os.getpid()}.db")
+    shutil.copyfile(cached_path, working_path)
+    database.DATABASE = working_path
+    try:
+        from migrations import run_migrations
+        run_migrations()
+        cases = build_cases(counts, args.seed)
+        if args.cases:
+            selected = set(args.cases.split(","))
+            cases = [case for case in cases if case[0] in selected]
+        results = {
+            "commit": current_commit(),
+            "timestamp": utc_now().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "counts": counts,
+            "generation": generation,
+            "cases": {},
+        }
+        for name, function, repeat in cases:
+            print(f"Running {name}...", file=sys.stderr)
+            results["cases"][name] = run_case(function, args.repeat if repeat else 0, args.time_budget, args.query_stats)
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        database.close_all_connections()
+        for path in (working_path, working_path + "-wal", working_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare_results(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
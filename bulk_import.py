@@ -0,0 +1,292 @@
+import argparse
+import csv
+import json
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from conflicts import scan_conflicts
+from database import get_connection, transaction
+from destinations_helpers import validate_airport_details, validate_destination
+from flight_numbers import allocate_flight_numbers, register_flight_numbers
+from flights_helpers import date_format, validate_flight_duration
+from migrations import REBUILD_TRAFFIC_COUNTERS, run_migrations
+from models import utc_now
+from pilot_availability import reset_assignments
+from pilots_helpers import validate_licence_number, validate_name
+from route_search import reset_routes
+
+# number of records validated and inserted together. Each chunk is inserted with a single 'executemany'
+CHUNK_SIZE = 50000
+
+# statuses a flight can be imported with - matches the CHECK constraint on the flights table
+FLIGHT_STATUSES = ("scheduled", "cancelled", "departed")
+
+# helper function to read the records in a CSV or JSONL file one at a time, so files of any size can be imported
+# without holding them in memory. The format is taken from the file extension unless 'file_format' is provided.
+# Yields the line number and record (a dictionary) for each row. JSONL lines that are not a valid JSON object are
+# yielded with a record of None so they can be rejected
+def read_records(path, file_format=None):
+    file_format = file_format or ("jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv")
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+# helper function to retrieve a field from a record as a stripped string, or an empty string if it is missing
+def _field(record, name):
+    value = record.get(name)
+    return "" if value is None else str(value).strip()
+
+# helper function to convert a departure or arrival time from a record to a datetime object. Accepts the format
+# stored in the database (YYYY-MM-DD HH:MM:SS) or the format entered in the menus (DD-MM-YYYY HH:MM)
+def _parse_time(value, name):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            raise ValueError(f"Invalid {name} format. Please use the format 'YYYY-MM-DD HH:MM:SS' or 'DD-MM-YYYY HH:MM'.")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+# helper functions to load the lookup maps used to validate each type of record and resolve IATA codes,
+# destinations and licence numbers to IDs without querying the database for every row
+def _load_destination_lookups(conn):
+    return {"destinations": set(conn.execute("SELECT city, country FROM destinations"))}
+
+def _load_airport_lookups(conn):
+    destinations = {(city, country): destination_id for destination_id, city, country in conn.execute("SELECT destination_id, city, country FROM destinations")}
+    return {
+        "destinations": destinations,
+        "destination_ids": set(destinations.values()),
+        "iata_codes": {row[0] for row in conn.execute("SELECT iata_code FROM airports")},
+    }
+
+def _load_pilot_lookups(conn):
+    return {"licence_numbers": {row[0] for row in conn.execute("SELECT licence_number FROM pilots")}}
+
+def _load_flight_lookups(conn):
+    return {
+        "airports": dict(conn.execute("SELECT iata_code, airport_id FROM airports")),
+        "pilots": dict(conn.execute("SELECT licence_number, pilot_id FROM pilots")),
+        "now": utc_now(),
+    }
+
+# helper function to validate a destination record (city, country) and return the values to insert. Raises a
+# ValueError describing the problem if the record is rejected
+def _prepare_destination(record, lookups):
+    city, country = _field(record, "city"), _field(record, "country")
+    error = validate_destination(city, country)
+    if error:
+        raise ValueError(error)
+    if (city, country) in lookups["destinations"]:
+        raise ValueError(f"The destination {city}, {country} already exists.")
+    lookups["destinations"].add((city, country))
+    return city, country
+
+# helper function to validate an airport record (airport_name, iata_code and either destination_id or city and
+# country) and return the values to insert
+def _prepare_airport(record, lookups):
+    airport_name, iata_code = _field(record, "airport_name"), _field(record, "iata_code")
+    error = validate_airport_details(airport_name, iata_code)
+    if error:
+        raise ValueError(error)
+    if iata_code in lookups["iata_codes"]:
+        raise ValueError(f"An airport with IATA code '{iata_code}' already exists.")
+    destination_id = _field(record, "destination_id")
+    if destination_id:
+        if not destination_id.isdigit() or int(destination_id) not in lookups["destination_ids"]:
+            raise ValueError(f"Unknown destination ID '{destination_id}'.")
+        destination_id = int(destination_id)
+    else:
+        city, country = _field(record, "city"), _field(record, "country")
+        destination_id = lookups["destinations"].get((city, country))
+        if destination_id is None:
+            raise ValueError(f"Unknown destination '{city}, {country}'.")
+    lookups["iata_codes"].add(iata_code)
+    return airport_name, iata_code, destination_id
+
+# helper function to validate a pilot record (first_name, last_name, licence_number) and return the values to insert
+def _prepare_pilot(record, lookups):
+    first_name, last_name = _field(record, "first_name"), _field(record, "last_name")
+    licence_number = _field(record, "licence_number")
+    error = validate_name(first_name, last_name) or validate_licence_number(licence_number)
+    if error:
+        raise ValueError(error)
+    if licence_number in lookups["licence_numbers"]:
+        raise ValueError(f"Pilot with licence number {licence_number} already exists.")
+    lookups["licence_numbers"].add(licence_number)
+    return first_name, last_name, licence_number
+
+# helper function to validate a flight record and return the values to insert. Each record needs a departure_iata,
+# arrival_iata and departure_time, plus either an arrival_time or a duration_hours and duration_minutes. A flight_number,
+# pilot_licence and status are optional - flights without a flight number are allocated one by '_finish_flights', and 
+# when no status is provided, flights departing in the past are imported as 'departed' and all others as 'scheduled'. A
+# flight departing in the past is also imported as 'departed' when its status is 'scheduled', as the flight status updates
+# only check flights departing after their last run, so would never update it
+def _prepare_flight(record, lookups):
+    flight_number = _field(record, "flight_number") or None
+    if flight_number and len(flight_number) > 8:
+        raise ValueError("Flight numbers must not exceed 8 characters.")
+    airports = lookups["airports"]
+    departure_iata, arrival_iata = _field(record, "departure_iata"), _field(record, "arrival_iata")
+    if departure_iata not in airports:
+        raise ValueError(f"Unknown departure IATA code '{departure_iata}'.")
+    if arrival_iata not in airports:
+        raise ValueError(f"Unknown arrival IATA code '{arrival_iata}'.")
+    if departure_iata == arrival_iata:
+        raise ValueError("The departure and arrival airports must be different.")
+    departure_time = _parse_time(_field(record, "departure_time"), "departure time")
+    if _field(record, "arrival_time"):
+        duration = _parse_time(_field(record, "arrival_time"), "arrival time") - departure_time
+        if duration <= timedelta(0):
+            raise ValueError("The arrival time must be after the departure time.")
+        hours, minutes = divmod(int(duration.total_seconds()) // 60, 60)
+    else:
+        try:
+            hours = int(_field(record, "duration_hours") or 0)
+            minutes = int(_field(record, "duration_minutes") or 0)
+        except ValueError:
+            raise ValueError("Invalid duration. Please enter numbers only.")
+        duration = timedelta(hours=hours, minutes=minutes)
+        if duration == timedelta(0):
+            raise ValueError("You must provide an arrival time or a flight duration.")
+    error = validate_flight_duration(hours, minutes)
+    if error:
+        raise ValueError(error)
+    pilot_id = None
+    pilot_licence = _field(record, "pilot_licence")
+    if pilot_licence:
+        pilot_id = lookups["pilots"].get(pilot_licence)
+        if pilot_id is None:
+            raise ValueError(f"Unknown pilot licence number '{pilot_licence}'.")
+    status = _field(record, "status").lower()
+    if status and status not in FLIGHT_STATUSES:
+        raise ValueError(f"Invalid status '{status}'. Status must be one of: {', '.join(FLIGHT_STATUSES)}.")
+    if status in ("", "scheduled"):
+        status = "departed" if departure_time < lookups["now"] else "scheduled"
+    # 'isoformat' produces the same text as 'db_date_format' (microseconds are removed by '_parse_time') and is much faster than 'strftime'
+    return (
+        flight_number, airports[departure_iata], airports[arrival_iata], pilot_id,
+        departure_time.isoformat(" "), (departure_time + duration).isoformat(" "), status
+    )
+
+# helper function to complete a chunk of validated flights before they are inserted, using the import's connection. Allocates
+# a flight number (in one call for the whole chunk) to each flight imported without one, and registers the flight numbers 
+# provided in the file so they are never allocated to another flight
+def _finish_flights(conn, rows):
+    missing = sum(1 for row in rows if row[0] is None)
+    flight_numbers = iter(allocate_flight_numbers(missing, conn)) if missing else None
+    register_flight_numbers(conn, (row[0] for row in rows if row[0] is not None))
+    return [row if row[0] is not None else (next(flight_numbers),) + row[1:] for row in rows] if missing else rows
+
+# the lookup loader, record validator, INSERT statement and (optionally) a function to complete each chunk of validated
+# rows before they are inserted, used to import each table
+IMPORTERS = {
+    "destinations": (_load_destination_lookups, _prepare_destination, "INSERT INTO destinations (city, country) VALUES (?, ?)", None),
+    "airports": (_load_airport_lookups, _prepare_airport, "INSERT INTO airports (airport_name, iata_code, destination_id) VALUES (?, ?, ?)", None),
+    "pilots": (_load_pilot_lookups, _prepare_pilot, "INSERT INTO pilots (first_name, last_name, licence_number) VALUES (?, ?, ?)", None),
+    "flights": (_load_flight_lookups, _prepare_flight, '''
+        INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', _finish_flights),
+}
+
+# function to import the records in a CSV or JSONL file into the 'destinations', 'airports', 'pilots' or 'flights' table.
+# Records are validated with the same rules as the menus and inserted in chunks of 'chunk_size', one transaction each.
+# Invalid records are skipped, and written with their line number and reason to 'rejects_path' when provided. With
+# 'defer_indexes', the table's indexes and counter triggers are dropped and rebuilt once at the end, in a single
+# transaction. Prints progress after each chunk and returns the rows read, inserted and rejected, the time taken and rate
+def import_file(table, path, file_format=None, chunk_size=CHUNK_SIZE, defer_indexes=False, rejects_path=None):
+    load_lookups, prepare, insert_query, finish = IMPORTERS[table]
+    with get_connection() as conn:
+        lookups = load_lookups(conn)
+    stats = {"table": table, "read": 0, "inserted": 0, "rejected": 0}
+    rejects_file = open(rejects_path, "w", newline="", encoding="utf-8") if rejects_path else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["line_number", "reason", "record"])
+    records = read_records(path, file_format)
+    start = time.perf_counter()
+    try:
+        with (transaction(immediate=True) if defer_indexes else nullcontext()) as import_conn:
+            indexes = []
+            counter_triggers = []
+            if defer_indexes:
+                indexes = import_conn.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+                ).fetchall()
+                for name, _ in indexes:
+                    import_conn.execute(f"DROP INDEX {name}")
+                counter_triggers = import_conn.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE 'traffic_on_%'", (table,)
+                ).fetchall()
+                for name, _ in counter_triggers:
+                    import_conn.execute(f"DROP TRIGGER {name}")
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                rows = []
+                for line_number, record in chunk:
+                    try:
+                        if record is None:
+                            raise ValueError("Invalid JSON object.")
+                        rows.append(prepare(record, lookups))
+                    except ValueError as error:
+                        stats["rejected"] += 1
+                        if rejects:
+                            rejects.writerow([line_number, str(error), json.dumps(record)])
+                with (nullcontext(import_conn) if defer_indexes else transaction()) as conn:
+                    if finish:
+                        rows = finish(conn, rows)
+                    conn.executemany(insert_query, rows)
+                stats["read"] += len(chunk)
+                stats["inserted"] += len(rows)
+                elapsed = time.perf_counter() - start
+                print(f"{stats['read']} rows read | {stats['inserted']} inserted | {stats['rejected']} rejected | {stats['inserted'] / elapsed:,.0f} rows/sec")
+            for _, sql in indexes + counter_triggers:
+                import_conn.execute(sql)
+            if counter_triggers:
+                for statement in REBUILD_TRAFFIC_COUNTERS:
+                    import_conn.execute(statement)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    if table == "flights":
+        reset_assignments()
+        reset_routes()
+        scan_conflicts()
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["rows_per_second"] = round(stats["inserted"] / stats["seconds"]) if stats["seconds"] else stats["inserted"]
+    return stats
+
+# allows files to be imported from the command line, e.g. 'python bulk_import.py flights timetable.csv --defer-indexes'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import destinations, airports, pilots or flights from a CSV or JSONL file.")
+    parser.add_argument("table", choices=IMPORTERS)
+    parser.add_argument("path", help="CSV file with a header row, or JSONL file with one JSON object per line")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="file format (taken from the file extension by default)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="number of rows inserted per batch")
+    parser.add_argument("--defer-indexes", action="store_true", help="drop the table's indexes during the import and rebuild them at the end")
+    parser.add_argument("--rejects", help="CSV file to write rejected rows to")
+    args = parser.parse_args()
+    # apply any outstanding migrations before importing
+    run_migrations()
+    stats = import_file(args.table, args.path, args.format, args.chunk_size, args.defer_indexes, args.rejects)
+    print(f"\nImported {stats['inserted']} of {stats['read']} {args.table} rows in {stats['seconds']} seconds "
+          f"({stats['rows_per_second']:,} rows/sec). {stats['rejected']} rows rejected.")
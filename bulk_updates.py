@@ -0,0 +1,199 @@
+import json
+
+from conflicts import scan_conflicts
+from database import retry_if_locked, transaction
+from models import utc_now
+from pilot_availability import reset_assignments
+from route_search import reset_routes
+
+# reasons a flight selected for a bulk update is left unchanged
+SKIP_REASONS = {
+    "missing": "Flight does not exist.",
+    "cancelled": "Flight is already cancelled.",
+    "departed": "Flight has already departed.",
+    "in_past": "The new departure time would be in the past.",
+    "pilot_unavailable": "The assigned pilot has another flight at the new time.",
+    "already_assigned": "The pilot is already assigned to this flight.",
+    "pilot_busy": "The pilot has another flight at the same time.",
+}
+
+# helper function to build the WHERE conditions selecting the flights for a bulk update, from a list of flight IDs and/or
+# filters on an airport (departing from or arriving at), a window of departure times (from 'start', up to but not including
+# 'end'), the assigned pilot ID ('pilot') and the status. The flight IDs are passed as a single JSON array and expanded with
+# 'json_each', so any number of IDs can be used without building a placeholder for each. Raises a ValueError if nothing is
+# provided, so an update can never select every flight by accident
+def build_flight_filter(flight_ids=None, airport_id=None, start=None, end=None, pilot=None, status=None):
+    conditions, params = [], []
+    if flight_ids is not None:
+        conditions.append("f.flight_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(flight_ids)))
+    if airport_id is not None:
+        conditions.append("(f.departure_airport_id = ? OR f.arrival_airport_id = ?)")
+        params.extend([airport_id, airport_id])
+    if start is not None:
+        conditions.append("f.departure_time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("f.departure_time < ?")
+        params.append(end)
+    if pilot is not None:
+        conditions.append("f.pilot_id = ?")
+        params.append(pilot)
+    if status is not None:
+        conditions.append("f.status = ?")
+        params.append(status)
+    if not conditions:
+        raise ValueError("Provide a list of flight IDs or at least one filter (airport, time window, pilot or status).")
+    return " AND ".join(conditions), params
+
+# helper function to find the flights selected for a bulk update and check which can be changed. Flights which have
+# departed or are cancelled are skipped, as they are by the single flight updates. Returns the selected flights as a list
+# of (flight_id, flight_number, pilot_id, departure_time, arrival_time) tuples in departure order, and a list of skipped
+# outcomes - including any requested flight IDs which do not exist
+def _select_flights(conn, now, flight_filter):
+    conditions, params = build_flight_filter(**flight_filter)
+    rows = conn.execute(f'''
+        SELECT f.flight_id, f.flight_number, f.pilot_id, f.departure_time, f.arrival_time,
+            CASE WHEN f.status = 'cancelled' THEN 'cancelled' WHEN f.departure_time <= ? THEN 'departed' END
+        FROM flights AS f
+        WHERE {conditions}
+        ORDER BY f.departure_time, f.flight_id
+    ''', [now, *params]).fetchall()
+    selected = [row[:5] for row in rows if row[5] is None]
+    skipped = [_outcome(row[0], row[1], "skipped", row[5]) for row in rows if row[5] is not None]
+    if flight_filter.get("flight_ids") is not None:
+        found = {row[0] for row in rows}
+        skipped.extend(_outcome(flight_id, None, "skipped", "missing") for flight_id in flight_filter["flight_ids"] if flight_id not in found)
+    return selected, skipped
+
+# helper function to describe the outcome of a bulk update for one flight
+def _outcome(flight_id, flight_number, outcome, reason=None, **details):
+    return {"flight_id": flight_id, "flight_number": flight_number, "outcome": outcome, "reason": SKIP_REASONS.get(reason), **details}
+
+# function to cancel every future, non-cancelled flight matching the provided flight IDs and/or filters (see
+# 'build_flight_filter') in a single transaction with one UPDATE. Returns the outcome for each selected flight - 'cancelled',
+# or 'skipped' with the reason. With 'dry_run', the changes are rolled back so the outcomes can be reviewed first
+@retry_if_locked
+def bulk_cancel_flights(dry_run=False, **flight_filter):
+    now = utc_now()
+    with transaction(immediate=True) as conn:
+        selected, skipped = _select_flights(conn, now, flight_filter)
+        flight_ids = [flight[0] for flight in selected]
+        conn.execute(
+            "UPDATE flights SET status = 'cancelled' WHERE flight_id IN (SELECT value FROM json_each(?))", (json.dumps(flight_ids),)
+        )
+        if dry_run:
+            conn.rollback()
+    if flight_ids and not dry_run:
+        reset_assignments()
+        reset_routes()
+        scan_conflicts(flight[2] for flight in selected)
+    return [_outcome(flight[0], flight[1], "cancelled") for flight in selected] + skipped
+
+# function to move every future, non-cancelled flight matching the provided flight IDs and/or filters by 'shift' (a
+# timedelta, which may be negative), keeping each flight's duration, in a single transaction with one UPDATE. A flight is
+# skipped if it would depart in the past, or if its pilot has another flight (not being moved) at the new time. As
+# skipping a flight leaves it where it was, the pilot check is repeated until no more flights are skipped. Returns the
+# outcome for each selected flight - 'rescheduled' with the new times, or 'skipped' with the reason
+@retry_if_locked
+def bulk_reschedule_flights(shift, dry_run=False, **flight_filter):
+    now = utc_now()
+    modifier = f"{int(shift.total_seconds()):+d} seconds"
+    with transaction(immediate=True) as conn:
+        selected, skipped = _select_flights(conn, now, flight_filter)
+        moving = {flight[0] for flight in selected}
+        rejected = {}
+        for flight_id, in conn.execute('''
+            SELECT flight_id FROM flights
+            WHERE flight_id IN (SELECT value FROM json_each(?)) AND datetime(departure_time, ?) <= ?
+        ''', (json.dumps(sorted(moving)), modifier, now.strftime("%Y-%m-%d %H:%M:%S"))):
+            rejected[flight_id] = "in_past"
+        moving -= set(rejected)
+        while moving:
+            moving_ids = json.dumps(sorted(moving))
+            conflicts = {flight_id for flight_id, in conn.execute('''
+                SELECT DISTINCT m.flight_id
+                FROM flights AS m
+                JOIN flights AS o ON o.pilot_id = m.pilot_id AND o.status != 'cancelled'
+                    AND o.departure_time <= datetime(m.arrival_time, ?) AND o.arrival_time >= datetime(m.departure_time, ?)
+                WHERE m.flight_id IN (SELECT value FROM json_each(?)) AND o.flight_id NOT IN (SELECT value FROM json_each(?))
+            ''', (modifier, modifier, moving_ids, moving_ids))}
+            if not conflicts:
+                break
+            rejected.update(dict.fromkeys(conflicts, "pilot_unavailable"))
+            moving -= conflicts
+        new_times = dict((row[0], row[1:]) for row in conn.execute('''
+            UPDATE flights
+            SET departure_time = datetime(departure_time, ?), arrival_time = datetime(arrival_time, ?)
+            WHERE flight_id IN (SELECT value FROM json_each(?))
+            RETURNING flight_id, departure_time, arrival_time
+        ''', (modifier, modifier, json.dumps(sorted(moving)))))
+        if dry_run:
+            conn.rollback()
+    if moving and not dry_run:
+        reset_assignments()
+        reset_routes()
+        scan_conflicts(flight[2] for flight in selected if flight[0] in moving)
+    outcomes = []
+    for flight_id, flight_number, _, _, _ in selected:
+        if flight_id in rejected:
+            outcomes.append(_outcome(flight_id, flight_number, "skipped", rejected[flight_id]))
+        else:
+            departure_time, arrival_time = new_times[flight_id]
+            outcomes.append(_outcome(flight_id, flight_number, "rescheduled", departure_time=departure_time, arrival_time=arrival_time))
+    return outcomes + skipped
+
+# function to assign one pilot to every future, non-cancelled flight matching the provided flight IDs and/or filters, in a
+# single transaction with one UPDATE, replacing any pilot already assigned. A flight is skipped if the pilot already has
+# another flight at the same time - checked against their existing flights in one query, then between the selected flights
+# themselves in departure order, so where selected flights overlap the earliest is assigned. Returns the outcome for each
+# selected flight - 'assigned', or 'skipped' with the reason. Raises a ValueError if the pilot does not exist
+@retry_if_locked
+def bulk_assign_pilot(pilot_id, dry_run=False, **flight_filter):
+    now = utc_now()
+    with transaction(immediate=True) as conn:
+        if not conn.execute("SELECT 1 FROM pilots WHERE pilot_id = ?", (pilot_id,)).fetchone():
+            raise ValueError(f"Pilot {pilot_id} does not exist.")
+        selected, skipped = _select_flights(conn, now, flight_filter)
+        rejected = {flight[0]: "already_assigned" for flight in selected if flight[2] == pilot_id}
+        candidates = [flight for flight in selected if flight[0] not in rejected]
+        candidate_ids = json.dumps([flight[0] for flight in candidates])
+        for flight_id, in conn.execute('''
+            SELECT DISTINCT m.flight_id
+            FROM flights AS m
+            JOIN flights AS o ON o.pilot_id = ? AND o.status != 'cancelled'
+                AND o.departure_time <= m.arrival_time AND o.arrival_time >= m.departure_time
+            WHERE m.flight_id IN (SELECT value FROM json_each(?)) AND o.flight_id NOT IN (SELECT value FROM json_each(?))
+        ''', (pilot_id, candidate_ids, candidate_ids)):
+            rejected[flight_id] = "pilot_busy"
+        assigned, last_arrival = [], None
+        for flight_id, _, _, departure_time, arrival_time in candidates:
+            if flight_id in rejected:
+                continue
+            if last_arrival is not None and departure_time <= last_arrival:
+                rejected[flight_id] = "pilot_busy"
+                continue
+            assigned.append(flight_id)
+            last_arrival = arrival_time
+        conn.execute(
+            "UPDATE flights SET pilot_id = ? WHERE flight_id IN (SELECT value FROM json_each(?))", (pilot_id, json.dumps(assigned))
+        )
+        if dry_run:
+            conn.rollback()
+    if assigned and not dry_run:
+        reset_assignments()
+        assigned_ids = set(assigned)
+        scan_conflicts([pilot_id, *(flight[2] for flight in selected if flight[0] in assigned_ids)])
+    outcomes = [
+        _outcome(flight[0], flight[1], "skipped", rejected[flight[0]]) if flight[0] in rejected
+        else _outcome(flight[0], flight[1], "assigned", pilot_id=pilot_id)
+        for flight in selected
+    ]
+    return outcomes + skipped
+
+# function to count the outcomes of a bulk update, such as {'cancelled': 120, 'skipped': 3}
+def summarize_outcomes(outcomes):
+    summary = {}
+    for outcome in outcomes:
+        summary[outcome["outcome"]] = summary.get(outcome["outcome"], 0) + 1
+    return summary
@@ -0,0 +1,598 @@
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+# command line interface to the Flight Management System, for scripts and pipelines. Each subcommand calls the same
+# operations as the menus in 'main.py', without clearing the console or asking for input, and prints its results as a
+# table or as JSON. Each subcommand imports only the modules it needs when it runs, so the program starts quickly. Usage:
+#
+#   python cli.py flights list --status scheduled --format jsonl
+#   python cli.py flights schedule --from JFK --to LHR --departure "01-06-2030 09:30" --duration 7:05
+#   python cli.py pilots assign 12 3
+#
+# Run 'python cli.py --help' (or '--help' after any subcommand) for the full list of subcommands and options
+
+date_format = "%d-%m-%Y %H:%M"
+
+# columns output by 'flights list' and 'flights show'
+FLIGHT_COLUMNS = [
+    "f.flight_id", "f.flight_number", "departure_airport.iata_code AS departure_iata", "f.departure_time",
+    "arrival_airport.iata_code AS arrival_iata", "f.arrival_time", "d.city", "d.country", "f.pilot_id", "f.status"
+]
+
+# number of flights read from the database at a time when listing flights
+LIST_PAGE_SIZE = 500
+
+# helper function to return the output name of a column - its alias if it has one, otherwise its name without the table alias
+def column_name(column):
+    if " AS " in column.upper():
+        return column.split(" AS ")[-1]
+    return column.split(".")[-1]
+
+# helper function to print records (dictionaries) in the requested format. 'jsonl' prints one JSON object per line and
+# 'json' prints a JSON array, both written as each record arrives so large results are never held in memory. 'table'
+# prints each record as 'name: value' pairs separated by ' | '. Returns the number of records printed
+def emit_records(records, output_format):
+    count = 0
+    if output_format == "json":
+        sys.stdout.write("[")
+    for record in records:
+        if output_format == "json":
+            sys.stdout.write(("," if count else "") + "\n" + json.dumps(record))
+        elif output_format == "jsonl":
+            sys.stdout.write(json.dumps(record) + "\n")
+        else:
+            sys.stdout.write(" | ".join(f"{name}: {value}" for name, value in record.items()) + "\n")
+        count += 1
+    if output_format == "json":
+        sys.stdout.write("\n]\n" if count else "]\n")
+    return count
+
+# helper function to print the result of a single operation (a dictionary) in the requested format
+def emit_result(result, output_format):
+    if output_format == "table":
+        emit_records([result], output_format)
+    else:
+        print(json.dumps(result))
+
+# helper function to convert rows from the database into records, using the output names of the columns as keys
+def to_records(rows, columns):
+    names = [column_name(column) for column in columns]
+    return (dict(zip(names, row)) for row in rows)
+
+# helper function to parse a date and time given on the command line, in the same format as the menus ('DD-MM-YYYY HH:MM')
+# or in ISO 8601 format
+def parse_time(value):
+    try:
+        return datetime.strptime(value.strip(), date_format)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date and time '{value}' - use 'DD-MM-YYYY HH:MM'")
+
+# helper function to parse a day given on the command line as 'YYYY-MM-DD', returning it in the same format
+def parse_day(value):
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid day '{value}' - use 'YYYY-MM-DD'")
+
+# helper function to parse a month given on the command line as 'YYYY-MM', returning it in the same format
+def parse_month(value):
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month '{value}' - use 'YYYY-MM'")
+
+# helper function to parse a flight duration given on the command line as 'HH:MM' or as a number of minutes
+def parse_duration(value):
+    try:
+        if ":" in value:
+            hours, minutes = value.split(":", 1)
+            return timedelta(hours=int(hours), minutes=int(minutes))
+        return timedelta(minutes=int(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration '{value}' - use 'HH:MM' or a number of minutes")
+
+# helper function to parse a shift in time given on the command line as '[+|-]HH:MM' or as a (signed) number of minutes
+def parse_shift(value):
+    sign = -1 if value.strip().startswith("-") else 1
+    try:
+        return sign * parse_duration(value.strip().lstrip("+-"))
+    except argparse.ArgumentTypeError:
+        raise argparse.ArgumentTypeError(f"invalid shift '{value}' - use '+HH:MM', '-HH:MM' or a number of minutes")
+
+# helper function to parse the days of the week a recurring flight operates on, given on the command line as day names
+# separated by commas or as 'daily', 'weekdays' or 'weekends', returning them as a bit mask
+def parse_days(value):
+    from flights_helpers import parse_days
+    try:
+        return parse_days(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+# helper function to parse a time of day given on the command line as 'HH:MM', returning it in the same format
+def parse_time_of_day(value):
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time of day '{value}' - use 'HH:MM'")
+
+# helper function to parse a comma separated list of flight IDs given on the command line
+def parse_ids(value):
+    try:
+        return [int(flight_id) for flight_id in value.split(",") if flight_id.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid flight IDs '{value}' - use a comma separated list such as '12,15,40'")
+
+# helper function to collect the flight selection arguments shared by the bulk update commands into keyword arguments for
+# the functions in 'bulk_updates'
+def bulk_filter(args):
+    return {
+        "flight_ids": args.ids, "airport_id": find_airport_id(args.airport) if args.airport else None,
+        "start": args.start, "end": args.end, "pilot": args.pilot, "status": args.status, "dry_run": args.dry_run,
+    }
+
+# helper function to add the flight selection arguments shared by the bulk update commands to a subcommand
+def add_bulk_filter_arguments(command):
+    command.add_argument("--ids", type=parse_ids, help="comma separated flight IDs")
+    command.add_argument("--airport", help="only flights departing from or arriving at this Airport ID or IATA code")
+    command.add_argument("--from", dest="start", type=parse_time, help="only flights departing at or after this time")
+    command.add_argument("--to", dest="end", type=parse_time, help="only flights departing before this time")
+    command.add_argument("--pilot", type=int, help="only flights assigned to this pilot ID")
+    command.add_argument("--status", choices=["scheduled", "departed", "cancelled"])
+    command.add_argument("--dry-run", action="store_true", help="report the outcome for each flight without changing anything")
+
+# helper function to find the ID of an airport given either its Airport ID or its IATA code. Raises a ValueError if no
+# airport matches
+def find_airport_id(value):
+    from database import get_connection
+    with get_connection() as conn:
+        if value.isdigit():
+            row = conn.execute("SELECT airport_id FROM airports WHERE airport_id = ?", (int(value),)).fetchone()
+        else:
+            row = conn.execute("SELECT airport_id FROM airports WHERE iata_code = ?", (value.upper(),)).fetchone()
+    if not row:
+        raise ValueError(f"Airport '{value}' does not exist.")
+    return row[0]
+
+# function to list flights matching the provided criteria, streaming them from the database a page at a time
+def list_flights(args):
+    from flights_helpers import iter_flights
+    flights = iter_flights(
+        FLIGHT_COLUMNS, pilot=args.pilot, is_future=args.future, exclude_status=args.exclude_status,
+        status=args.status, destination=args.destination, page_size=LIST_PAGE_SIZE
+    )
+    if args.limit:
+        from itertools import islice
+        flights = islice(flights, args.limit)
+    emit_records(to_records(flights, FLIGHT_COLUMNS), args.format)
+
+# function to list flights from the longest to the shortest, optionally only those lasting between a minimum and maximum
+# number of hours. Flights are read in order from the duration index, so only the flights listed are read
+def flights_by_duration(args):
+    from flights_helpers import iter_flights_by_duration
+    min_minutes = round(args.min_hours * 60) if args.min_hours is not None else None
+    max_minutes = round(args.max_hours * 60) if args.max_hours is not None else None
+    flights = iter_flights_by_duration(min_minutes, max_minutes, page_size=min(args.limit or LIST_PAGE_SIZE, LIST_PAGE_SIZE))
+    if args.limit:
+        from itertools import islice
+        flights = islice(flights, args.limit)
+    columns = ["flight_id", "flight_number", "departure_airport", "departure_time", "arrival_airport", "arrival_time", "duration_minutes"]
+    emit_records(to_records(flights, columns), args.format)
+
+# function to show the details of a single flight
+def show_flight(args):
+    from flights_helpers import find_flight
+    flight = find_flight(args.flight_id, columns=FLIGHT_COLUMNS)
+    if not flight:
+        raise ValueError(f"Flight {args.flight_id} does not exist.")
+    emit_result(next(to_records([flight], FLIGHT_COLUMNS)), args.format)
+
+# function to schedule a new flight
+def schedule_flight(args):
+    from flights import schedule_flight
+    flight_id, flight_number, arrival_time = schedule_flight(
+        find_airport_id(args.departure_airport), find_airport_id(args.arrival_airport), args.departure, args.duration
+    )
+    emit_result({
+        "flight_id": flight_id, "flight_number": flight_number,
+        "departure_time": str(args.departure), "arrival_time": str(arrival_time), "status": "scheduled"
+    }, args.format)
+
+# function to cancel a flight
+def cancel_flight(args):
+    from flights import cancel_flight
+    flight_number = cancel_flight(args.flight_id)
+    emit_result({"flight_id": args.flight_id, "flight_number": flight_number, "status": "cancelled"}, args.format)
+
+# function to change the departure time of a flight (the arrival time moves by the same amount)
+def reschedule_flight(args):
+    from flights import change_flight_departure_time
+    flight_number, arrival_time = change_flight_departure_time(args.flight_id, args.departure)
+    emit_result({
+        "flight_id": args.flight_id, "flight_number": flight_number,
+        "departure_time": str(args.departure), "arrival_time": str(arrival_time)
+    }, args.format)
+
+# function to cancel many flights at once, listing the outcome for each
+def bulk_cancel(args):
+    from bulk_updates import bulk_cancel_flights
+    emit_records(bulk_cancel_flights(**bulk_filter(args)), args.format)
+
+# function to move many flights by the same amount of time at once, listing the outcome for each
+def bulk_reschedule(args):
+    from bulk_updates import bulk_reschedule_flights
+    emit_records(bulk_reschedule_flights(args.by, **bulk_filter(args)), args.format)
+
+# function to change the arrival airport of a flight
+def change_destination(args):
+    from flights import change_flight_destination
+    arrival_airport_id = find_airport_id(args.arrival_airport)
+    flight_number = change_flight_destination(args.flight_id, arrival_airport_id)
+    emit_result({"flight_id": args.flight_id, "flight_number": flight_number, "arrival_airport_id": arrival_airport_id}, args.format)
+
+# function to list pilots, optionally only those who are free between the provided departure and arrival time
+def list_pilots(args):
+    from reference_cache import cached_query
+    pilots = cached_query("SELECT pilot_id, first_name, last_name, licence_number FROM pilots ORDER BY pilot_id", tables=("pilots",))
+    if args.available_from or args.available_to:
+        if not (args.available_from and args.available_to):
+            raise ValueError("Both --available-from and --available-to must be provided.")
+        from pilot_availability import get_available_pilot_ids
+        available = get_available_pilot_ids([pilot[0] for pilot in pilots], args.available_from, args.available_to)
+        pilots = [pilot for pilot in pilots if pilot[0] in available]
+    emit_records(to_records(pilots, ["pilot_id", "first_name", "last_name", "licence_number"]), args.format)
+
+# function to assign a pilot to a flight
+def assign_pilot(args):
+    from pilots import assign_pilot
+    flight_number, pilot_name = assign_pilot(args.flight_id, args.pilot_id)
+    emit_result({"flight_id": args.flight_id, "flight_number": flight_number, "pilot_id": args.pilot_id, "pilot_name": pilot_name}, args.format)
+
+# function to assign a pilot to many flights at once, listing the outcome for each
+def bulk_assign(args):
+    from bulk_updates import bulk_assign_pilot
+    emit_records(bulk_assign_pilot(args.pilot_id, **bulk_filter(args)), args.format)
+
+# function to assign pilots to every future flight without one. Prints a summary, or the pilot assigned to each flight
+# (and the flights left without one) with '--details'
+def auto_assign(args):
+    from crew_scheduler import auto_assign_pilots
+    result = auto_assign_pilots(
+        min_rest=args.min_rest or timedelta(0), same_airport=args.same_airport, start=args.start, end=args.end, dry_run=args.dry_run
+    )
+    assignments, unassigned = result.pop("assignments"), result.pop("unassigned_flight_ids")
+    if not args.details:
+        emit_result(result, args.format)
+        return
+    records = [{"flight_id": flight_id, "pilot_id": pilot_id} for flight_id, pilot_id in assignments]
+    records.extend({"flight_id": flight_id, "pilot_id": None} for flight_id in unassigned)
+    emit_records(records, args.format)
+
+# function to list the conflicts found in the pilots' schedules, optionally rescanning every pilot first
+def list_conflicts(args):
+    from conflicts import MIN_TURNAROUND, get_conflicts, scan_conflicts
+    if args.rescan:
+        scan_conflicts(min_turnaround=args.min_turnaround or MIN_TURNAROUND)
+    conflicts = get_conflicts(pilot_id=args.pilot)
+    emit_records(to_records(conflicts, [
+        "pilot_id", "conflict_type", "flight_id", "flight_number", "departure_time", "other_flight_id", "other_flight_number", "detail"
+    ]), args.format)
+
+# function to list the flights assigned to a pilot
+def pilot_schedule(args):
+    args.pilot, args.status, args.exclude_status, args.destination = args.pilot_id, None, None, None
+    list_flights(args)
+
+# function to search for the earliest-arriving routes between two airports, including connecting flights. In the table
+# format, the flights of each route are shown as a list of flight numbers
+def search_routes(args):
+    from route_search import MAX_CONNECTIONS, MIN_CONNECTION_TIME, find_routes
+    routes = find_routes(
+        find_airport_id(args.origin), find_airport_id(args.destination), args.depart, args.until,
+        MAX_CONNECTIONS if args.max_connections is None else args.max_connections, args.min_connection or MIN_CONNECTION_TIME
+    )
+    if args.format == "table":
+        for route in routes:
+            route["flights"] = ", ".join(leg["flight_number"] for leg in route["flights"])
+    emit_records(routes, args.format)
+
+# function to list every destination
+def list_destinations(args):
+    from reference_cache import cached_query
+    destinations = cached_query("SELECT destination_id, city, country FROM destinations ORDER BY destination_id", tables=("destinations",))
+    emit_records(to_records(destinations, ["destination_id", "city", "country"]), args.format)
+
+# function to search for destinations by city, country, airport name or IATA code, best match first
+def search_destinations(args):
+    from destinations_helpers import DESTINATION_SEARCH_LIMIT, search_destinations
+    matches = search_destinations(args.text, args.limit or DESTINATION_SEARCH_LIMIT)
+    emit_records(to_records(matches, ["airport_id", "airport_name", "iata_code", "city", "country"]), args.format)
+
+# function to list every airport and its destination
+def list_airports(args):
+    from reference_cache import cached_query
+    columns = ["a.airport_id", "a.airport_name", "a.iata_code", "d.city", "d.country"]
+    airports = cached_query(f'''
+        SELECT {", ".join(columns)} FROM airports AS a
+        JOIN destinations AS d ON a.destination_id = d.destination_id
+        ORDER BY a.airport_id
+    ''', tables=("airports", "destinations"))
+    emit_records(to_records(airports, columns), args.format)
+
+# function to list the number of flights departing from or arriving at each airport, busiest first
+def airport_flight_counts(args):
+    from destinations import get_airport_flight_counts
+    emit_records(to_records(get_airport_flight_counts(args.type), ["airport_name", "iata_code", "flight_count"]), args.format)
+
+# function to list the number of airports in each country
+def country_airport_counts(args):
+    from destinations import get_country_airport_counts
+    emit_records(to_records(get_country_airport_counts(), ["country", "airport_count"]), args.format)
+
+# function to list the number of flights departing from and arriving at an airport on each day in a range
+def airport_daily_traffic(args):
+    from destinations import get_airport_daily_traffic
+    traffic = get_airport_daily_traffic(find_airport_id(args.airport), args.start_day, args.end_day)
+    emit_records(to_records(traffic, ["day", "departures", "arrivals"]), args.format)
+
+# function to recalculate the airport and country traffic counters
+def rebuild_counters(args):
+    from migrations import rebuild_traffic_counters
+    rebuild_traffic_counters()
+    emit_result({"rebuilt": ["airport_traffic", "airport_daily_traffic", "country_airports"]}, args.format)
+
+# function to list the recurring flight schedules
+def list_schedules(args):
+    from recurring_schedules import list_schedules
+    emit_records(list_schedules(), args.format)
+
+# function to create a recurring flight schedule, adding its flights within the horizon
+def create_schedule(args):
+    from recurring_schedules import create_schedule
+    emit_result(create_schedule(
+        find_airport_id(args.departure_airport), find_airport_id(args.arrival_airport), args.days, args.departure,
+        args.duration, args.valid_from, args.valid_to
+    ), args.format)
+
+# function to change a recurring flight schedule and apply the change to its flights which have not departed
+def update_schedule(args):
+    from recurring_schedules import update_schedule
+    emit_result(update_schedule(
+        args.schedule_id, args.departure, args.duration, find_airport_id(args.arrival_airport) if args.arrival_airport else None,
+        args.days, args.valid_to
+    ), args.format)
+
+# function to end a recurring flight schedule, cancelling its flights which have not departed
+def cancel_schedule(args):
+    from recurring_schedules import cancel_schedule
+    emit_result(cancel_schedule(args.schedule_id), args.format)
+
+# function to add the flights of every recurring schedule within the horizon which have not been added yet
+def materialize_schedules(args):
+    from recurring_schedules import SCHEDULE_HORIZON, materialize_schedules
+    emit_result({"added": materialize_schedules(timedelta(days=args.horizon) if args.horizon else SCHEDULE_HORIZON)}, args.format)
+
+# function to copy the primary database to the read-only replica snapshot, for example from a scheduled job
+def refresh_replica(args):
+    from database import refresh_replica
+    emit_result(refresh_replica(args.snapshot), args.format)
+
+# function to report whether the system is running as a read-only replica and how far behind the primary it is
+def replica_status(args):
+    from database import replica_status
+    emit_result(replica_status(), args.format)
+
+# function to mark every scheduled flight whose departure time has passed as departed
+def update_statuses(args):
+    from database_queries import update_flight_status
+    emit_result({"updated": update_flight_status(full=args.full)}, args.format)
+
+# function to export new and changed flights to the columnar snapshot used by the analytics reports
+def export_snapshot(args):
+    from snapshot_export import export_snapshot
+    emit_result(export_snapshot(args.snapshot, full=args.full), args.format)
+
+# function to report the routes, airports or pilots with the most flights, calculated from the snapshot rather than the
+# live database
+def analytics_report(args):
+    import snapshot_analytics
+    report = {"routes": snapshot_analytics.route_summary, "airports": snapshot_analytics.airport_summary, "pilots": snapshot_analytics.pilot_summary}[args.command]
+    emit_records(report(args.snapshot, args.start_month, args.end_month, args.limit), args.format)
+
+# function to apply any outstanding migrations, and optionally the sample data
+def migrate(args):
+    from migrations import get_schema_version, run_migrations, seed_sample_data
+    applied = run_migrations()
+    if args.seed:
+        seed_sample_data()
+    emit_result({"applied": applied, "schema_version": get_schema_version(), "seeded": args.seed}, args.format)
+
+# function to build the argument parser. Every subcommand accepts '--format' to choose between a readable table and JSON output
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=["table", "json", "jsonl"], default="table", help="output format (default: table)")
+    parser = argparse.ArgumentParser(description="Command line interface to the Flight Management System.")
+    subsystems = parser.add_subparsers(dest="subsystem", required=True)
+
+    flights = subsystems.add_parser("flights", help="list, schedule and update flights").add_subparsers(dest="command", required=True)
+    command = flights.add_parser("list", parents=[common], help="list flights, ordered by departure time")
+    command.add_argument("--status", choices=["scheduled", "departed", "cancelled"])
+    command.add_argument("--exclude-status", choices=["scheduled", "departed", "cancelled"])
+    command.add_argument("--pilot", type=int, help="only flights assigned to this pilot ID")
+    command.add_argument("--destination", help="only flights to destinations matching this city, country, airport name or IATA code")
+    command.add_argument("--future", action="store_true", help="only flights which have not yet departed")
+    command.add_argument("--limit", type=int, help="maximum number of flights to list")
+    command.set_defaults(handler=list_flights)
+    command = flights.add_parser("by-duration", parents=[common], help="list flights from the longest to the shortest")
+    command.add_argument("--min-hours", type=float, help="only flights lasting at least this many hours")
+    command.add_argument("--max-hours", type=float, help="only flights lasting at most this many hours")
+    command.add_argument("--limit", type=int, help="maximum number of flights to list, e.g. 50 for the longest 50")
+    command.set_defaults(handler=flights_by_duration)
+    command = flights.add_parser("show", parents=[common], help="show a single flight")
+    command.add_argument("flight_id", type=int)
+    command.set_defaults(handler=show_flight)
+    command = flights.add_parser("schedule", parents=[common], help="schedule a new flight")
+    command.add_argument("--from", dest="departure_airport", required=True, help="departure Airport ID or IATA code")
+    command.add_argument("--to", dest="arrival_airport", required=True, help="arrival Airport ID or IATA code")
+    command.add_argument("--departure", type=parse_time, required=True, help="departure time (DD-MM-YYYY HH:MM, GMT)")
+    command.add_argument("--duration", type=parse_duration, required=True, help="flight duration (HH:MM or minutes)")
+    command.set_defaults(handler=schedule_flight)
+    command = flights.add_parser("cancel", parents=[common], help="cancel a flight")
+    command.add_argument("flight_id", type=int)
+    command.set_defaults(handler=cancel_flight)
+    command = flights.add_parser("reschedule", parents=[common], help="change the departure time of a flight")
+    command.add_argument("flight_id", type=int)
+    command.add_argument("--departure", type=parse_time, required=True, help="new departure time (DD-MM-YYYY HH:MM, GMT)")
+    command.set_defaults(handler=reschedule_flight)
+    command = flights.add_parser("set-destination", parents=[common], help="change the arrival airport of a flight")
+    command.add_argument("flight_id", type=int)
+    command.add_argument("--to", dest="arrival_airport", required=True, help="new arrival Airport ID or IATA code")
+    command.set_defaults(handler=change_destination)
+    command = flights.add_parser("bulk-cancel", parents=[common], help="cancel every selected future flight in one transaction")
+    add_bulk_filter_arguments(command)
+    command.set_defaults(handler=bulk_cancel)
+    command = flights.add_parser("bulk-reschedule", parents=[common], help="move every selected future flight by the same amount of time")
+    command.add_argument("--by", type=parse_shift, required=True, help="time to move each flight by ('+HH:MM', or minutes; use --by=-HH:MM to move flights earlier)")
+    add_bulk_filter_arguments(command)
+    command.set_defaults(handler=bulk_reschedule)
+
+    pilots = subsystems.add_parser("pilots", help="list pilots and assign them to flights").add_subparsers(dest="command", required=True)
+    command = pilots.add_parser("list", parents=[common], help="list pilots")
+    command.add_argument("--available-from", type=parse_time, help="only pilots free from this time...")
+    command.add_argument("--available-to", type=parse_time, help="...until this time")
+    command.set_defaults(handler=list_pilots)
+    command = pilots.add_parser("assign", parents=[common], help="assign a pilot to a flight")
+    command.add_argument("flight_id", type=int)
+    command.add_argument("pilot_id", type=int)
+    command.set_defaults(handler=assign_pilot)
+    command = pilots.add_parser("bulk-assign", parents=[common], help="assign a pilot to every selected future flight they are free for")
+    command.add_argument("pilot_id", type=int)
+    add_bulk_filter_arguments(command)
+    command.set_defaults(handler=bulk_assign)
+    command = pilots.add_parser("auto-assign", parents=[common], help="assign available pilots to every future flight without one")
+    command.add_argument("--min-rest", type=parse_duration, help="minimum rest between a pilot's flights (HH:MM or minutes)")
+    command.add_argument("--same-airport", action="store_true", help="pilots depart from the airport they last arrived at")
+    command.add_argument("--from", dest="start", type=parse_time, help="only flights departing at or after this time")
+    command.add_argument("--to", dest="end", type=parse_time, help="only flights departing before this time")
+    command.add_argument("--dry-run", action="store_true", help="work out the assignments without saving them")
+    command.add_argument("--details", action="store_true", help="list the pilot assigned to each flight instead of a summary")
+    command.set_defaults(handler=auto_assign)
+    command = pilots.add_parser("conflicts", parents=[common], help="list double bookings, short turnarounds and airport mismatches")
+    command.add_argument("--pilot", type=int, help="only conflicts for this pilot ID")
+    command.add_argument("--rescan", action="store_true", help="scan every pilot's flights first")
+    command.add_argument("--min-turnaround", type=parse_duration, help="shortest acceptable turnaround for --rescan (HH:MM or minutes, default: 0:45)")
+    command.set_defaults(handler=list_conflicts)
+    command = pilots.add_parser("schedule", parents=[common], help="list the flights assigned to a pilot")
+    command.add_argument("pilot_id", type=int)
+    command.add_argument("--future", action="store_true", help="only flights which have not yet departed")
+    command.add_argument("--limit", type=int, help="maximum number of flights to list")
+    command.set_defaults(handler=pilot_schedule)
+
+    routes = subsystems.add_parser("routes", help="search for routes between airports").add_subparsers(dest="command", required=True)
+    command = routes.add_parser("search", parents=[common], help="earliest-arriving routes, including connecting flights")
+    command.add_argument("--from", dest="origin", required=True, help="origin Airport ID or IATA code")
+    command.add_argument("--to", dest="destination", required=True, help="destination Airport ID or IATA code")
+    command.add_argument("--depart", type=parse_time, required=True, help="earliest departure time (DD-MM-YYYY HH:MM, GMT)")
+    command.add_argument("--until", type=parse_time, help="latest departure time of the first flight (default: a day after --depart)")
+    command.add_argument("--max-connections", type=int, help="maximum number of connections (default: 2)")
+    command.add_argument("--min-connection", type=parse_duration, help="minimum time between connecting flights (HH:MM or minutes, default: 1:00)")
+    command.set_defaults(handler=search_routes)
+
+    destinations = subsystems.add_parser("destinations", help="list and search destinations").add_subparsers(dest="command", required=True)
+    destinations.add_parser("list", parents=[common], help="list destinations").set_defaults(handler=list_destinations)
+    command = destinations.add_parser("search", parents=[common], help="search destinations by city, country, airport name or IATA code")
+    command.add_argument("text")
+    command.add_argument("--limit", type=int, help="maximum number of destinations to list (default: 25)")
+    command.set_defaults(handler=search_destinations)
+    airports = subsystems.add_parser("airports", help="list airports").add_subparsers(dest="command", required=True)
+    airports.add_parser("list", parents=[common], help="list airports").set_defaults(handler=list_airports)
+    command = airports.add_parser("counts", parents=[common], help="number of flights from or to each airport")
+    command.add_argument("--type", choices=["departing", "arriving"], default="departing")
+    command.set_defaults(handler=airport_flight_counts)
+    airports.add_parser("countries", parents=[common], help="number of airports in each country").set_defaults(handler=country_airport_counts)
+    command = airports.add_parser("traffic", parents=[common], help="flights from and to an airport on each day")
+    command.add_argument("airport", help="Airport ID or IATA code")
+    command.add_argument("--from", dest="start_day", required=True, type=parse_day, help="first day (YYYY-MM-DD)")
+    command.add_argument("--to", dest="end_day", required=True, type=parse_day, help="last day (YYYY-MM-DD)")
+    command.set_defaults(handler=airport_daily_traffic)
+
+    schedules = subsystems.add_parser("schedules", help="manage recurring flight schedules").add_subparsers(dest="command", required=True)
+    schedules.add_parser("list", parents=[common], help="list recurring schedules").set_defaults(handler=list_schedules)
+    command = schedules.add_parser("create", parents=[common], help="create a recurring schedule and add its flights within the horizon")
+    command.add_argument("--from", dest="departure_airport", required=True, help="departure Airport ID or IATA code")
+    command.add_argument("--to", dest="arrival_airport", required=True, help="arrival Airport ID or IATA code")
+    command.add_argument("--days", type=parse_days, required=True, help="days operated, such as 'Mon,Wed,Fri', 'daily', 'weekdays' or 'weekends'")
+    command.add_argument("--departure", type=parse_time_of_day, required=True, help="departure time (HH:MM, GMT)")
+    command.add_argument("--duration", type=parse_duration, required=True, help="flight duration (HH:MM or minutes)")
+    command.add_argument("--valid-from", type=parse_day, required=True, help="first day operated (YYYY-MM-DD)")
+    command.add_argument("--valid-to", type=parse_day, required=True, help="last day operated (YYYY-MM-DD)")
+    command.set_defaults(handler=create_schedule)
+    command = schedules.add_parser("update", parents=[common], help="change a recurring schedule and its flights which have not departed")
+    command.add_argument("schedule_id", type=int)
+    command.add_argument("--to", dest="arrival_airport", help="new arrival Airport ID or IATA code")
+    command.add_argument("--days", type=parse_days, help="new days operated")
+    command.add_argument("--departure", type=parse_time_of_day, help="new departure time (HH:MM, GMT)")
+    command.add_argument("--duration", type=parse_duration, help="new flight duration (HH:MM or minutes)")
+    command.add_argument("--valid-to", type=parse_day, help="new last day operated (YYYY-MM-DD)")
+    command.set_defaults(handler=update_schedule)
+    command = schedules.add_parser("cancel", parents=[common], help="end a recurring schedule, cancelling its flights which have not departed")
+    command.add_argument("schedule_id", type=int)
+    command.set_defaults(handler=cancel_schedule)
+    command = schedules.add_parser("materialize", parents=[common], help="add the flights of every schedule within the horizon")
+    command.add_argument("--horizon", type=int, help="number of days ahead to add flights for (default: 60)")
+    command.set_defaults(handler=materialize_schedules)
+
+    analytics = subsystems.add_parser("analytics", help="export the flights snapshot and report from it").add_subparsers(dest="command", required=True)
+    snapshot = argparse.ArgumentParser(add_help=False)
+    snapshot.add_argument("--snapshot", default="flight_snapshot", help="snapshot directory (default: flight_snapshot)")
+    command = analytics.add_parser("export", parents=[common, snapshot], help="export new and changed flights to the columnar snapshot")
+    command.add_argument("--full", action="store_true", help="rewrite the whole snapshot")
+    command.set_defaults(handler=export_snapshot)
+    for name, description in (("routes", "busiest routes"), ("airports", "busiest airports"), ("pilots", "pilots with the most flights")):
+        command = analytics.add_parser(name, parents=[common, snapshot], help=f"{description}, from the snapshot")
+        command.add_argument("--from", dest="start_month", type=parse_month, help="first month (YYYY-MM)")
+        command.add_argument("--to", dest="end_month", type=parse_month, help="last month (YYYY-MM)")
+        command.add_argument("--limit", type=int, default=50, help="maximum number to list (default: 50, 0 for all)")
+        command.set_defaults(handler=analytics_report, uses_database=False)
+
+    status = subsystems.add_parser("status", help="maintain flight statuses").add_subparsers(dest="command", required=True)
+    command = status.add_parser("update", parents=[common], help="mark flights whose departure time has passed as departed")
+    command.add_argument("--full", action="store_true", help="check every scheduled flight, not just those since the last update")
+    command.set_defaults(handler=update_statuses)
+
+    db = subsystems.add_parser("db", help="manage the database").add_subparsers(dest="command", required=True)
+    command = db.add_parser("migrate", parents=[common], help="apply outstanding migrations")
+    command.add_argument("--seed", action="store_true", help="also insert the sample data")
+    command.set_defaults(handler=migrate)
+    db.add_parser("rebuild-counters", parents=[common], help="recalculate the airport and country traffic counters").set_defaults(handler=rebuild_counters)
+    command = db.add_parser("refresh-replica", parents=[common], help="copy the database to the read-only replica snapshot")
+    command.add_argument("--snapshot", help="path of the snapshot (default: FMS_REPLICA_SNAPSHOT)")
+    command.set_defaults(handler=refresh_replica)
+    db.add_parser("replica-status", parents=[common], help="show whether this is a read-only replica, and its lag").set_defaults(handler=replica_status)
+    return parser
+
+# function to run the command line interface. Brings the schema up to date (except for the analytics reports, which never
+# open the database), then runs the chosen subcommand. Invalid
+# requests (such as cancelling a flight which has already departed) are reported on stderr with exit status 1
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.handler is not migrate and getattr(args, "uses_database", True):
+        from migrations import run_migrations
+        run_migrations()
+    try:
+        args.handler(args)
+    except ValueError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # the output was closed early (such as when piped to 'head')
+        sys.stderr.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
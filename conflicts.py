@@ -0,0 +1,140 @@
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
+from database import get_connection, is_read_only, retry_if_locked, transaction
+from models import utc_now
+
+# shortest time a pilot can have between landing one flight and departing on the next before it is reported as a conflict
+MIN_TURNAROUND = timedelta(minutes=45)
+
+# number of conflicts inserted together during a scan
+INSERT_BATCH_SIZE = 5000
+
+# key in the 'app_state' table holding the time every pilot was last scanned for conflicts. Until the first full scan (such
+# as just after the 'pilot_conflicts' table was created) the table is empty, so the first scan checks every pilot
+FULL_SCAN_KEY = "pilot_conflicts_scanned_at"
+_full_scan_done = False
+
+# helper function to read the non-cancelled flights assigned to the provided pilots (or every pilot), ordered by pilot and
+# departure time straight from the 'idx_flights_pilot_times' index, so the flights are sorted once by the database. Airports
+# are identified by their IATA codes, so they can be shown in the conflict details
+def _pilot_flights(conn, pilot_ids=None):
+    query = '''
+        SELECT f.pilot_id, f.flight_id, f.flight_number, departure_airport.iata_code, arrival_airport.iata_code,
+            f.departure_time, f.arrival_time
+        FROM flights AS f
+        JOIN airports AS departure_airport ON f.departure_airport_id = departure_airport.airport_id
+        JOIN airports AS arrival_airport ON f.arrival_airport_id = arrival_airport.airport_id
+        WHERE f.status != 'cancelled'
+    '''
+    params = []
+    if pilot_ids is None:
+        query += " AND f.pilot_id IS NOT NULL"
+    else:
+        query += " AND f.pilot_id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(pilot_ids)))
+    query += " ORDER BY f.pilot_id, f.departure_time, f.arrival_time"
+    return conn.execute(query, params)
+
+# function to find the conflicts in the pilots' schedules with a single linear sweep over each pilot's flights in departure
+# order. Tracks the flight with the latest arrival so far - a flight departing before it lands is an overlap (reported
+# against that flight). Otherwise the flight is checked against the one before it: a gap shorter than 'min_turnaround' is a
+# short turnaround, and departing from a different airport to the one the pilot last arrived at is an airport mismatch.
+# Accepts rows from '_pilot_flights' and yields a (pilot_id, conflict_type, flight_id, other_flight_id, detail) tuple for
+# each conflict, holding only one pilot's state at a time
+def sweep_conflicts(rows, min_turnaround=MIN_TURNAROUND):
+    current_pilot = None
+    latest = None
+    previous = None
+    for pilot_id, flight_id, flight_number, origin, destination, departure_time, arrival_time in rows:
+        departure, arrival = datetime.fromisoformat(departure_time), datetime.fromisoformat(arrival_time)
+        flight = (flight_id, flight_number, destination, arrival)
+        if pilot_id != current_pilot:
+            current_pilot, latest, previous = pilot_id, flight, flight
+            continue
+        if departure <= latest[3]:
+            yield (pilot_id, "overlap", flight_id, latest[0],
+                   f"Flight {flight_number} departs at {departure_time}, before flight {latest[1]} lands at {latest[3]}.")
+        else:
+            if departure - previous[3] < min_turnaround:
+                minutes = int((departure - previous[3]).total_seconds() // 60)
+                yield (pilot_id, "short_turnaround", flight_id, previous[0],
+                       f"Flight {flight_number} departs {minutes} minutes after flight {previous[1]} lands (minimum {int(min_turnaround.total_seconds() // 60)}).")
+            if origin != previous[2]:
+                yield (pilot_id, "airport_mismatch", flight_id, previous[0],
+                       f"Flight {flight_number} departs from {origin}, but flight {previous[1]} arrives at {previous[2]}.")
+        if arrival > latest[3]:
+            latest = flight
+        previous = flight
+
+# function to scan the pilots' schedules for conflicts (see 'sweep_conflicts') and store them in the 'pilot_conflicts'
+# table, using the provided connection's transaction. With 'pilot_ids', only those pilots' conflicts are replaced, otherwise
+# every pilot is scanned. Returns the number of conflicts found
+def store_conflicts(conn, pilot_ids=None, min_turnaround=MIN_TURNAROUND):
+    if pilot_ids is None:
+        conn.execute("DELETE FROM pilot_conflicts")
+        conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)", (FULL_SCAN_KEY, utc_now().strftime("%Y-%m-%d %H:%M:%S")))
+    else:
+        conn.execute("DELETE FROM pilot_conflicts WHERE pilot_id IN (SELECT value FROM json_each(?))", (json.dumps(pilot_ids),))
+    conflicts = sweep_conflicts(_pilot_flights(conn, pilot_ids), min_turnaround)
+    found = 0
+    while True:
+        batch = list(islice(conflicts, INSERT_BATCH_SIZE))
+        if not batch:
+            return found
+        conn.executemany('''
+            INSERT INTO pilot_conflicts (pilot_id, conflict_type, flight_id, other_flight_id, detail)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+        found += len(batch)
+
+# helper function to check whether every pilot has been scanned for conflicts at least once (see 'FULL_SCAN_KEY')
+def _is_fully_scanned(conn):
+    global _full_scan_done
+    if not _full_scan_done:
+        _full_scan_done = conn.execute("SELECT 1 FROM app_state WHERE key = ?", (FULL_SCAN_KEY,)).fetchone() is not None
+    return _full_scan_done
+
+# function to scan the pilots' schedules for conflicts in its own transaction. With 'pilot_ids', only those pilots are
+# scanned - called after each change to a pilot's flights, so the 'pilot_conflicts' table stays up to date for the price of
+# reading one pilot's flights. Without, or if every pilot has never been scanned, every pilot is scanned as a batch job.
+# Returns the number of conflicts found
+@retry_if_locked
+def scan_conflicts(pilot_ids=None, min_turnaround=MIN_TURNAROUND):
+    if pilot_ids is not None:
+        pilot_ids = sorted({pilot_id for pilot_id in pilot_ids if pilot_id is not None})
+        if not pilot_ids:
+            return 0
+    with transaction(immediate=True) as conn:
+        if not _is_fully_scanned(conn):
+            pilot_ids = None
+        return store_conflicts(conn, pilot_ids, min_turnaround)
+
+# function to return the stored conflicts, optionally only those of one pilot or involving one flight, in pilot and
+# departure order. Every pilot is scanned first if they have never been (except on a read-only replica). Each is a
+# (pilot_id, conflict_type, flight_id, flight_number, departure_time, other_flight_id, other_flight_number, detail) tuple
+def get_conflicts(pilot_id=None, flight_id=None):
+    if not _full_scan_done and not is_read_only():
+        with get_connection() as conn:
+            scanned = _is_fully_scanned(conn)
+        if not scanned:
+            scan_conflicts()
+    query = '''
+        SELECT c.pilot_id, c.conflict_type, c.flight_id, f.flight_number, f.departure_time, c.other_flight_id, o.flight_number, c.detail
+        FROM pilot_conflicts AS c
+        JOIN flights AS f ON c.flight_id = f.flight_id
+        JOIN flights AS o ON c.other_flight_id = o.flight_id
+    '''
+    conditions, params = [], []
+    if pilot_id is not None:
+        conditions.append("c.pilot_id = ?")
+        params.append(pilot_id)
+    if flight_id is not None:
+        conditions.append("(c.flight_id = ? OR c.other_flight_id = ?)")
+        params.extend([flight_id, flight_id])
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY c.pilot_id, f.departure_time, c.flight_id"
+    with get_connection() as conn:
+        return conn.execute(query, params).fetchall()
@@ -0,0 +1,151 @@
+import heapq
+from bisect import bisect_left
+from datetime import timedelta
+
+from conflicts import scan_conflicts
+from database import retry_if_locked, transaction
+from models import epoch_column, utc_now
+from pilot_availability import reset_assignments
+
+# default minimum rest a pilot must have between arriving from one flight and departing on the next
+DEFAULT_MIN_REST = timedelta(0)
+
+# helper function to load the state the solver starts from, inside its transaction: the future scheduled flights with no
+# pilot (optionally only those departing between 'start' and 'end'), in departure order, as (departure, arrival, flight_id,
+# departure_airport_id, arrival_airport_id) tuples; each pilot's existing assignments which have not yet landed; and the
+# airport each pilot last arrived at. Times are read as seconds since the epoch, converted by SQLite, so the rest time can
+# be added to them as a number of seconds
+def _load_state(conn, now, start, end):
+    query = f'''
+        SELECT {epoch_column("departure_time")}, {epoch_column("arrival_time")}, flight_id, departure_airport_id, arrival_airport_id
+        FROM flights
+        WHERE status = 'scheduled' AND pilot_id IS NULL AND departure_time > ?
+    '''
+    params = [now]
+    if start is not None:
+        query += " AND departure_time >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND departure_time < ?"
+        params.append(end)
+    query += " ORDER BY departure_time, flight_id"
+    flights = conn.execute(query, params).fetchall()
+    pilot_ids = [pilot_id for pilot_id, in conn.execute("SELECT pilot_id FROM pilots ORDER BY pilot_id")]
+    commitments = {pilot_id: [] for pilot_id in pilot_ids}
+    for pilot_id, dep, arr, destination in conn.execute(f'''
+        SELECT pilot_id, {epoch_column("departure_time")}, {epoch_column("arrival_time")}, arrival_airport_id
+        FROM flights
+        WHERE pilot_id IS NOT NULL AND status != 'cancelled' AND arrival_time > ?
+        ORDER BY pilot_id, departure_time
+    ''', (now,)):
+        commitments[pilot_id].append((dep, arr, destination))
+    # SQLite returns the other columns of the row holding the MAX() when a query has a single MAX() aggregate
+    locations = {pilot_id: airport_id for pilot_id, airport_id, _ in conn.execute('''
+        SELECT pilot_id, arrival_airport_id, MAX(arrival_time)
+        FROM flights
+        WHERE pilot_id IS NOT NULL AND status != 'cancelled' AND arrival_time <= ?
+        GROUP BY pilot_id
+    ''', (now,))}
+    return flights, pilot_ids, commitments, locations
+
+# function to assign pilots to flights with a greedy interval-partitioning algorithm. Flights are taken in departure
+# order, and each is given the pilot who has been free the longest - found with a min-heap of (free from, pilot_id), so
+# each assignment costs O(log pilots). A pilot is free from the arrival of their last flight plus 'min_rest', and must also
+# be able to land the new flight and rest before their next existing assignment. With 'same_airport', a pilot can only
+# depart from the airport they last arrived at (pilots who have never flown can depart from anywhere), using one heap per
+# airport. Heap entries for a pilot whose state has since changed are discarded when they reach the top. 'flights',
+# 'commitments' and 'locations' are as returned by '_load_state', with times in seconds since the epoch. Returns a list of
+# (flight_id, pilot_id) assignments and a list of the flight IDs no pilot could be found for
+def solve_assignments(flights, pilot_ids, commitments, locations, min_rest=DEFAULT_MIN_REST, same_airport=False):
+    min_rest = int(min_rest.total_seconds())
+    never = float("-inf")
+    free_from = {}
+    location = {}
+    next_index = {}
+    heaps = {}
+    for pilot_id in pilot_ids:
+        free_from[pilot_id] = never
+        location[pilot_id] = locations.get(pilot_id) if same_airport else None
+        next_index[pilot_id] = 0
+        heaps.setdefault(location[pilot_id], []).append((never, pilot_id))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+    # existing assignments are replayed in departure order alongside the flights being assigned, so each pilot's free
+    # time and location reflect the assignments they already hold before each new flight
+    existing = sorted((dep, arr, pilot_id, destination) for pilot_id, flights_held in commitments.items() for dep, arr, destination in flights_held)
+    departures = {pilot_id: [dep for dep, _, _ in flights_held] for pilot_id, flights_held in commitments.items()}
+    existing_index = 0
+    assignments, unassigned = [], []
+
+    # helper function to move a pilot to the end of a flight - free once they have landed and rested, at its arrival airport
+    def move(pilot_id, arrival, airport_id):
+        state = (free_from[pilot_id], location[pilot_id])
+        free_from[pilot_id] = max(free_from[pilot_id], arrival + min_rest)
+        if same_airport:
+            location[pilot_id] = airport_id
+        if (free_from[pilot_id], location[pilot_id]) != state:
+            heapq.heappush(heaps.setdefault(location[pilot_id], []), (free_from[pilot_id], pilot_id))
+
+    for dep, arr, flight_id, origin, destination in flights:
+        while existing_index < len(existing) and existing[existing_index][0] <= dep:
+            _, held_arrival, pilot_id, held_destination = existing[existing_index]
+            move(pilot_id, held_arrival, held_destination)
+            existing_index += 1
+        chosen = None
+        set_aside = []
+        for key in ((origin, None) if same_airport else (None,)):
+            heap = heaps.get(key)
+            while heap and chosen is None:
+                available, pilot_id = heap[0]
+                if available != free_from[pilot_id] or location[pilot_id] != key:
+                    heapq.heappop(heap)
+                    continue
+                if available > dep:
+                    break
+                heapq.heappop(heap)
+                # the pilot must land and rest before their next existing assignment departs
+                upcoming = departures.get(pilot_id, [])
+                position = bisect_left(upcoming, dep, next_index[pilot_id])
+                next_index[pilot_id] = position
+                if position < len(upcoming) and arr + min_rest > upcoming[position]:
+                    set_aside.append((key, available, pilot_id))
+                    continue
+                chosen = pilot_id
+            if chosen is not None:
+                break
+        for key, available, pilot_id in set_aside:
+            heapq.heappush(heaps[key], (available, pilot_id))
+        if chosen is None:
+            unassigned.append(flight_id)
+            continue
+        assignments.append((flight_id, chosen))
+        move(chosen, arr, destination)
+    return assignments, unassigned
+
+# function to automatically assign pilots to every future scheduled flight which has none (optionally only those departing
+# between 'start' and 'end'), without giving any pilot overlapping flights. 'min_rest' (a timedelta) is the minimum time a
+# pilot rests between flights, and 'same_airport' requires each pilot to depart from the airport they last arrived at (see
+# 'solve_assignments'). The flights are read, solved and updated in a single immediate transaction, so no other change can
+# be made in between. With 'dry_run', nothing is written. Returns a summary of the flights assigned and left unassigned,
+# the pilots used and the time taken, with the assignments and unassigned flight IDs
+@retry_if_locked
+def auto_assign_pilots(min_rest=DEFAULT_MIN_REST, same_airport=False, start=None, end=None, dry_run=False):
+    started = utc_now()
+    with transaction(immediate=True) as conn:
+        flights, pilot_ids, commitments, locations = _load_state(conn, started, start, end)
+        assignments, unassigned = solve_assignments(flights, pilot_ids, commitments, locations, min_rest, same_airport)
+        if not dry_run:
+            conn.executemany("UPDATE flights SET pilot_id = ? WHERE flight_id = ?", ((pilot_id, flight_id) for flight_id, pilot_id in assignments))
+    if assignments and not dry_run:
+        reset_assignments()
+        scan_conflicts(pilot_id for _, pilot_id in assignments)
+    return {
+        "flights": len(flights),
+        "assigned": len(assignments),
+        "unassigned": len(unassigned),
+        "pilots_used": len({pilot_id for _, pilot_id in assignments}),
+        "seconds": round((utc_now() - started).total_seconds(), 3),
+        "dry_run": dry_run,
+        "assignments": assignments,
+        "unassigned_flight_ids": unassigned,
+    }
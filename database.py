@@ -0,0 +1,400 @@
+import atexit
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import quote
+
+from query_log import connection_factory
+
+# name of the SQLite database file used by the Flight Management System
+DATABASE = 'flight_management'
+
+# maximum number of idle connections kept open for reuse. Connections borrowed while the pool
+# is empty are opened on demand, and any returned to a full pool are closed
+POOL_SIZE = 5
+
+# pool of idle, fully configured connections shared by every module (and thread) in the system
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# storage profiles - the PRAGMAs applied to every connection. 'wal' (the default) uses write-ahead logging, so any number of
+# readers (such as other operator terminals) keep reading while one writer commits, with 'synchronous = NORMAL' (durable
+# at each checkpoint rather than each commit, and never corrupted), a 64MB page cache, 256MB of memory-mapped I/O and
+# temporary tables and sorts held in memory. 'durable' is the same but syncs every commit to disk. 'rollback' keeps SQLite's
+# original rollback journal, where a writer blocks every reader, for file systems which cannot share WAL memory (such as
+# network drives). 'busy_timeout' is how long, in milliseconds, a connection waits for a lock before raising 'database is locked'
+STORAGE_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -65536, "mmap_size": 268435456,
+        "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 1000,
+    },
+    "durable": {
+        "journal_mode": "WAL", "synchronous": "FULL", "cache_size": -65536, "mmap_size": 268435456,
+        "temp_store": "MEMORY", "busy_timeout": 5000, "wal_autocheckpoint": 1000,
+    },
+    "rollback": {
+        "journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000, "mmap_size": 0,
+        "temp_store": "DEFAULT", "busy_timeout": 5000,
+    },
+}
+
+# seconds between the background checkpoints which copy committed changes from the write-ahead log back into the database
+# file (see 'start_checkpoints'), and the number of times, and initial delay in seconds, a write is retried when the
+# database stays locked for longer than the busy timeout (see 'retry_if_locked')
+CHECKPOINT_INTERVAL = 30
+LOCK_RETRY_ATTEMPTS = 5
+LOCK_RETRY_DELAY = 0.05
+
+# the storage settings in use - set with 'configure_storage', or the 'FMS_STORAGE_PROFILE' and 'FMS_CHECKPOINT_INTERVAL'
+# environment variables. 'journal_mode' is stored in the database file itself, so it is only set by the first connection
+_storage = {"profile": "wal", "pragmas": dict(STORAGE_PROFILES["wal"]), "checkpoint_interval": CHECKPOINT_INTERVAL}
+_journal_mode_set = False
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+# read-only replica mode, for reporting terminals which only view flights and counts. Connections are opened read-only
+# ('mode=ro') with a larger memory map, and the database is never written to - migrations, flight status updates and
+# transactions are refused, and the menu actions which make changes are disabled. With a 'snapshot' path, connections read a
+# copy of the database made with SQLite's online backup API instead of the primary file, so they never take its locks. The
+# copy is opened as 'immutable' (SQLite skips locking and change detection altogether) and refreshed every
+# 'refresh_interval' seconds by writing a new copy alongside it and moving it into place
+REPLICA_MMAP_SIZE = 1073741824
+REPLICA_REFRESH_INTERVAL = 300
+READ_ONLY_ERROR = "The database is open as a read-only replica, so changes cannot be made."
+_replica = {"enabled": False, "snapshot": None, "refresh_interval": REPLICA_REFRESH_INTERVAL}
+# the snapshot file the pooled connections read, as its (inode, modification time) - changes each time it is refreshed
+_replica_generation = None
+_replica_lock = threading.RLock()
+_refresher = None
+
+# function to choose the storage profile (one of 'STORAGE_PROFILES') and override any of its PRAGMAs, such as
+# 'configure_storage("wal", cache_size=-16000)'. 'checkpoint_interval' sets the seconds between background checkpoints, or
+# disables them when 0. Only affects connections opened afterwards, so must be called before the database is first used
+def configure_storage(profile="wal", checkpoint_interval=None, **pragmas):
+    global _journal_mode_set
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}'. Choose from: {', '.join(STORAGE_PROFILES)}.")
+    unknown = set(pragmas) - set(STORAGE_PROFILES["wal"])
+    if unknown:
+        raise ValueError(f"Unknown storage setting(s): {', '.join(sorted(unknown))}.")
+    _storage["profile"] = profile
+    _storage["pragmas"] = {**STORAGE_PROFILES[profile], **pragmas}
+    if checkpoint_interval is not None:
+        _storage["checkpoint_interval"] = checkpoint_interval
+    _journal_mode_set = False
+
+# function to configure the storage from the 'FMS_STORAGE_PROFILE' and 'FMS_CHECKPOINT_INTERVAL' environment variables,
+# when set. Called when the module is imported
+def configure_storage_from_environment():
+    profile = os.environ.get("FMS_STORAGE_PROFILE")
+    interval = os.environ.get("FMS_CHECKPOINT_INTERVAL")
+    if profile or interval:
+        configure_storage(profile or _storage["profile"], float(interval) if interval else None)
+
+# function to switch to read-only replica mode. Connections read the primary database file directly, or with 'snapshot',
+# a copy of it at that path, refreshed every 'refresh_interval' seconds (never when 0). Must be called before the database
+# is first used
+def configure_replica(snapshot=None, refresh_interval=None):
+    _replica["enabled"] = True
+    _replica["snapshot"] = snapshot
+    if refresh_interval is not None:
+        _replica["refresh_interval"] = refresh_interval
+
+# function to configure read-only replica mode from the 'FMS_READ_ONLY', 'FMS_REPLICA_SNAPSHOT' and
+# 'FMS_REPLICA_REFRESH_INTERVAL' environment variables, when set. Called when the module is imported
+def configure_replica_from_environment():
+    snapshot = os.environ.get("FMS_REPLICA_SNAPSHOT")
+    interval = os.environ.get("FMS_REPLICA_REFRESH_INTERVAL")
+    if snapshot or os.environ.get("FMS_READ_ONLY", "").lower() in ("1", "true", "yes"):
+        configure_replica(snapshot or None, float(interval) if interval else None)
+
+# function to check whether the system is running as a read-only replica
+def is_read_only():
+    return _replica["enabled"]
+
+# helper function to apply the storage profile's PRAGMAs to a new connection. The journal mode is set once, by the first
+# connection - changing it needs a moment of exclusive access, so if another program is using the database it is tried
+# again by the next connection opened
+def _apply_storage_settings(conn):
+    global _journal_mode_set
+    pragmas = _storage["pragmas"]
+    if not _journal_mode_set:
+        try:
+            conn.execute(f"PRAGMA journal_mode = {pragmas['journal_mode']}").fetchone()
+            _journal_mode_set = True
+        except sqlite3.OperationalError:
+            pass
+    for name in ("synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout", "wal_autocheckpoint"):
+        if name in pragmas:
+            conn.execute(f"PRAGMA {name} = {pragmas[name]}")
+
+# function to open a new connection with the settings every connection must share, to fill the pool or for modules needing
+# a dedicated connection. Foreign keys are enabled (a per-connection setting) and 'check_same_thread' is disabled, as a
+# pooled connection may be used by another thread. Uses the instrumented connection class when query instrumentation is
+# enabled, applies the storage profile, and starts the background checkpoints in WAL mode
+def open_connection():
+    if _replica["enabled"]:
+        return _open_replica_connection()
+    conn = sqlite3.connect(
+        DATABASE, timeout=_storage["pragmas"]["busy_timeout"] / 1000, check_same_thread=False, factory=connection_factory()
+    )
+    conn.execute("PRAGMA foreign_keys = ON")
+    _apply_storage_settings(conn)
+    if _storage["pragmas"]["journal_mode"].upper() == "WAL" and _storage["checkpoint_interval"]:
+        start_checkpoints()
+    return conn
+
+# helper function to open a read-only connection in replica mode - to the snapshot, which is made first if it does not exist
+# yet, or otherwise to the primary database file. 'query_only' makes SQLite refuse any statement which would write
+def _open_replica_connection():
+    snapshot = _replica["snapshot"]
+    if snapshot:
+        replica_generation()
+        uri = f"file:{quote(os.path.abspath(snapshot))}?immutable=1"
+    else:
+        uri = f"file:{quote(os.path.abspath(DATABASE))}?mode=ro"
+    conn = sqlite3.connect(
+        uri, uri=True, timeout=_storage["pragmas"]["busy_timeout"] / 1000, check_same_thread=False, factory=connection_factory()
+    )
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA cache_size = {_storage['pragmas']['cache_size']}")
+    conn.execute(f"PRAGMA mmap_size = {REPLICA_MMAP_SIZE}")
+    conn.execute(f"PRAGMA temp_store = {_storage['pragmas']['temp_store']}")
+    if snapshot and _replica["refresh_interval"]:
+        start_replica_refresh()
+    return conn
+
+# function to return the generation of the replica snapshot - its inode and modification time - which changes whenever it
+# is refreshed, by this program or another. When it has changed, the idle connections in the pool (which still read the
+# previous copy) are closed. Makes the snapshot if it does not exist yet. Returns None outside snapshot mode
+def replica_generation():
+    global _replica_generation
+    snapshot = _replica["snapshot"]
+    if not snapshot:
+        return None
+    with _replica_lock:
+        if not os.path.exists(snapshot):
+            refresh_replica()
+        stat = os.stat(snapshot)
+        generation = (stat.st_ino, stat.st_mtime_ns)
+        if generation != _replica_generation:
+            if _replica_generation is not None:
+                _close_idle_connections()
+            _replica_generation = generation
+        return generation
+
+# function to copy the primary database to the replica snapshot ('snapshot', or the configured path) with SQLite's online
+# backup API, which reads a consistent copy without holding up writers to the primary. The copy is written to a temporary
+# file, stamped with the time the copy started in a 'replica_info' table and then moved over the snapshot, so readers only
+# ever see a complete copy. Returns the replica's status (see 'replica_status')
+def refresh_replica(snapshot=None):
+    snapshot = snapshot or _replica["snapshot"]
+    if not snapshot:
+        raise ValueError("No replica snapshot has been configured - set FMS_REPLICA_SNAPSHOT or provide a path.")
+    started = time.time()
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(snapshot)), suffix=".tmp")
+    os.close(descriptor)
+    try:
+        source = sqlite3.connect(f"file:{quote(os.path.abspath(DATABASE))}?mode=ro", uri=True)
+        target = sqlite3.connect(temporary)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+            target.execute("CREATE TABLE IF NOT EXISTS replica_info (refreshed_at REAL NOT NULL)")
+            target.execute("DELETE FROM replica_info")
+            target.execute("INSERT INTO replica_info (refreshed_at) VALUES (?)", (started,))
+            target.commit()
+        finally:
+            source.close()
+            target.close()
+        os.replace(temporary, snapshot)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return _status(snapshot, started)
+
+# helper function to describe a replica: its mode, the file it reads, when its data was copied from the primary (GMT) and
+# how many seconds behind the primary it is
+def _status(snapshot, refreshed_at):
+    return {
+        "read_only": _replica["enabled"],
+        "mode": "snapshot" if snapshot else "direct",
+        "source": snapshot or DATABASE,
+        "refreshed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(refreshed_at)) if refreshed_at else None,
+        "lag_seconds": round(time.time() - refreshed_at, 1) if refreshed_at else 0.0,
+    }
+
+# function to report the replica's lag. Connections reading the primary file directly see every committed change, so have
+# no lag; a snapshot is as far behind as the time since it was copied, which is read from the snapshot itself
+def replica_status():
+    snapshot = _replica["snapshot"] if _replica["enabled"] else None
+    if not snapshot:
+        return _status(None, None)
+    with get_connection() as conn:
+        return _status(snapshot, conn.execute("SELECT refreshed_at FROM replica_info").fetchone()[0])
+
+# function to refresh the replica snapshot in the background every 'refresh_interval' seconds. Does nothing if the
+# refreshes are already running. A failed refresh (such as while the primary is being migrated) is tried again next time
+def start_replica_refresh():
+    global _refresher
+    with _replica_lock:
+        if _refresher is not None:
+            return
+        stop = threading.Event()
+        def run():
+            while not stop.wait(_replica["refresh_interval"]):
+                try:
+                    refresh_replica()
+                except (sqlite3.Error, OSError):
+                    pass
+        thread = threading.Thread(target=run, name="replica-refresh", daemon=True)
+        _refresher = (stop, thread)
+        thread.start()
+
+# function to stop the background refreshes of the replica snapshot
+def stop_replica_refresh():
+    global _refresher
+    with _replica_lock:
+        if _refresher is None:
+            return
+        stop, thread = _refresher
+        _refresher = None
+    stop.set()
+    thread.join()
+
+# context manager to borrow a configured connection from the pool for reading. Reuses an idle
+# connection where one is available, otherwise opens a new one. Any transaction left open by the
+# borrower is rolled back before the connection is returned to the pool. In snapshot replica mode, a connection borrowed
+# before the snapshot was refreshed is closed rather than returned, so the next borrower reads the new copy
+@contextmanager
+def get_connection():
+    generation = replica_generation()
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if generation != _replica_generation:
+            conn.close()
+        else:
+            try:
+                _pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+# context manager to run a group of statements as a single transaction. Commits when the block
+# completes, or rolls back all changes if an exception is raised, then returns the connection to the pool.
+# When 'immediate' is True the transaction is opened straight away with 'BEGIN IMMEDIATE', which takes
+# the write lock up front (serialising concurrent writers) and also makes schema changes (CREATE, ALTER),
+# which would otherwise be committed as they run, part of the transaction. Raises a ValueError in read-only replica mode
+@contextmanager
+def transaction(immediate=False):
+    if _replica["enabled"]:
+        raise ValueError(READ_ONLY_ERROR)
+    with get_connection() as conn:
+        if immediate:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+# helper function to check whether an error was raised because the database was locked by another connection
+def is_locked_error(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        getattr(error, "sqlite_errorname", "").startswith(("SQLITE_BUSY", "SQLITE_LOCKED")) or "locked" in str(error)
+    )
+
+# decorator to retry a function which writes to the database when it fails because the database is locked. Each
+# connection already waits up to the busy timeout for a lock, but a writer can still be refused - when the lock is held
+# for longer, or immediately when a transaction which has read from the database tries to write after another connection
+# has committed. The whole function is run again, after a short delay which doubles (with some randomness, so competing
+# writers do not retry in step) on each attempt, up to 'LOCK_RETRY_ATTEMPTS' times. The function must make its changes in
+# a single transaction, so a failed attempt leaves nothing behind
+def retry_if_locked(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        delay = LOCK_RETRY_DELAY
+        for attempt in range(LOCK_RETRY_ATTEMPTS):
+            try:
+                return function(*args, **kwargs)
+            except sqlite3.OperationalError as error:
+                if not is_locked_error(error) or attempt == LOCK_RETRY_ATTEMPTS - 1:
+                    raise
+            time.sleep(delay * random.uniform(1, 1.5))
+            delay *= 2
+    return wrapper
+
+# function to checkpoint the write-ahead log - copy the changes committed to it back into the database file. 'PASSIVE'
+# copies what it can without waiting for readers or writers; 'TRUNCATE' waits for them and then empties the log file.
+# Returns SQLite's (busy, log pages, pages checkpointed) result
+def checkpoint(mode="PASSIVE", conn=None):
+    if conn is not None:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    with get_connection() as conn:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+# function to start checkpointing the write-ahead log in the background every 'checkpoint_interval' seconds. SQLite
+# checkpoints automatically when a commit takes the log past 'wal_autocheckpoint' pages, but that work falls on whichever
+# writer happens to commit, and while readers are active the log keeps growing. A daemon thread with a dedicated
+# connection keeps the log short without holding up the menus. Does nothing if the checkpoints are already running
+def start_checkpoints():
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is not None:
+            return
+        stop = threading.Event()
+        conn = sqlite3.connect(DATABASE, timeout=_storage["pragmas"]["busy_timeout"] / 1000, check_same_thread=False)
+        def run():
+            while not stop.wait(_storage["checkpoint_interval"]):
+                try:
+                    checkpoint(conn=conn)
+                except sqlite3.Error:
+                    pass
+            conn.close()
+        thread = threading.Thread(target=run, name="wal-checkpoint", daemon=True)
+        _checkpointer = (stop, thread)
+        thread.start()
+
+# function to stop the background checkpoints, waiting for the thread to close its connection
+def stop_checkpoints():
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            return
+        stop, thread = _checkpointer
+        _checkpointer = None
+    stop.set()
+    thread.join()
+
+# helper function to close every idle connection in the pool
+def _close_idle_connections():
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+
+# function to close every idle connection in the pool and stop the background checkpoints and replica refreshes. Registered
+# to run when the program exits - when the last connection to the database closes, SQLite checkpoints and removes the write-ahead log
+def close_all_connections():
+    stop_checkpoints()
+    stop_replica_refresh()
+    _close_idle_connections()
+
+atexit.register(close_all_connections)
+configure_storage_from_environment()
+configure_replica_from_environment()
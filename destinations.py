@@ -1,6 +1,7 @@
-import sqlite3
+from database import get_connection, transaction
 from destinations_helpers import add_destination, get_airport_details, get_destination
-from menu import clear_console, create_menu
+from menu import clear_console, create_menu, writes_to_database
+from reference_cache import invalidate
 
 # function to display the top-level 'destinations' menu - 'Destination Management Menu' - and handle user 
 # selection. Accepts the previous_menu to allow the user to return to the main menu. Calls 'create_menu' 
@@ -9,7 +10,7 @@ def display_destinations_menu(previous_menu):
     destinations_menu = {
     "heading": "=== Destination Management Menu ===",
     "1": ("Add an airport to the Flight Management System", add_airport),
-    "2": ("Add a destination (city & country) to the Flight Management System", add_destination),
+    "2": ("Add a destination (city & country) to the Flight Management System", writes_to_database(add_destination)),
     "3": ("View the number of airports in each country", display_country_airport_count),
     "4": ("View the total number of flights from each airport", lambda: display_airport_flight_count("arriving")),
     "5": ("View the total number of flights to each airport", lambda: display_airport_flight_count("departing")),  
@@ -18,27 +19,17 @@ def display_destinations_menu(previous_menu):
     create_menu(destinations_menu, previous_menu)
 
 # function to display the total number of departing or arriving flights from or to an airport. Accepts the
-# 'type' of flight as an argument (departing or arriving) then sets the 'airport_id_type' accordingly. Fetches the
+# 'type' of flight as an argument (departing or arriving). Calls 'get_airport_flight_counts' to fetch the
 # number of flights to or from each airport and displays the results in a readable format
 def display_airport_flight_count(type):
     clear_console()
     if type not in ("arriving", "departing"):
         raise ValueError("Type of flight must be 'arriving' or 'departing'")
-    airport_id_type = "arrival_airport_id" if type == "arriving" else "departure_airport_id"
     if type == "arriving":
         print("========== View the number of flights to each airport ==========")   
     elif type == "departing":
         print("========== View the number of flights from each airport ==========") 
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute(f'''
-        SELECT a.airport_name, a.iata_code, COUNT(f.{airport_id_type}) AS flight_count
-        FROM airports a
-        LEFT JOIN flights f ON a.airport_id = f.{airport_id_type}
-        GROUP BY a.airport_id
-        ORDER BY flight_count DESC
-    ''')
-    result = cursor.fetchall()
+    result = get_airport_flight_counts(type)
     if not result:
         print("\nNo flights found.")
         return None
@@ -46,43 +37,46 @@ def display_airport_flight_count(type):
         print(f"Airport: {airport_name} ({iata_code}) | Total {type} flights: {flight_count}")
         print("-" * 50)
 
+# function to return the total number of departing or arriving flights (of any status) for each airport, busiest first,
+# as a list of (airport_name, iata_code, flight_count) tuples. Reads the 'airport_traffic' summary table, which holds one
+# row per airport kept up to date by triggers, so the cost depends on the number of airports rather than flights
+def get_airport_flight_counts(type):
+    if type not in ("arriving", "departing"):
+        raise ValueError("Type of flight must be 'arriving' or 'departing'")
+    count_column = "t.arrivals" if type == "arriving" else "t.departures"
+    with get_connection() as conn:
+        return conn.execute(f'''
+            SELECT a.airport_name, a.iata_code, {count_column} AS flight_count
+            FROM airport_traffic t
+            JOIN airports a ON a.airport_id = t.airport_id
+            ORDER BY flight_count DESC, a.airport_id
+        ''').fetchall()
+
 # function to add a new airport to the Flight Management System. Calls 'get_destination' to retrieve a
 # valid destination from the user, then calls 'get_airport_details' to retrieve a valid airport_name and 
 # IATA code for the new airport from the user. Checks that an airport with the provided IATA code does not already
 # exist - if it does, prints a message to inform the user that a duplicate IATA code cannot be used and returns.
 # Otherwise, inserts the airport details into the database and displays a success message
+@writes_to_database
 def add_airport():
     clear_console()
     print("========== Add an airport to the Flight Management System ===========")
     chosen_destination = get_destination()
     destination_id = chosen_destination[0]
     airport_name, iata_code = get_airport_details()
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM airports WHERE iata_code = ?", (iata_code,))
-    if cursor.fetchone():
-        print(f"\nAn airport with IATA code '{iata_code}' already exists. Unable to add a duplicate entry to the Flight Management System.")
-        conn.close()
-        return
-    cursor.execute("INSERT INTO airports (airport_name, iata_code, destination_id) VALUES (?, ?, ?)",(airport_name, iata_code, destination_id))
-    conn.commit()
-    conn.close() 
+    with transaction(immediate=True) as conn:
+        if conn.execute("SELECT * FROM airports WHERE iata_code = ?", (iata_code,)).fetchone():
+            print(f"\nAn airport with IATA code '{iata_code}' already exists. Unable to add a duplicate entry to the Flight Management System.")
+            return
+        conn.execute("INSERT INTO airports (airport_name, iata_code, destination_id) VALUES (?, ?, ?)",(airport_name, iata_code, destination_id))
+    invalidate("airports")
     print(f"Airport '{airport_name}' ({iata_code}) added successfully.")
 
-# function to fetch and display the number of airports in each country in a readable format
+# function to fetch and display the number of airports in each country in a readable format. Calls 'get_country_airport_counts'
 def display_country_airport_count():
     clear_console()
     print("========== View the number of airports in each country ==========")
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT d.country, COUNT(a.airport_id) AS airport_count
-        FROM destinations d
-        LEFT JOIN airports a ON d.destination_id = a.destination_id
-        GROUP BY d.country
-        ORDER BY airport_count DESC
-    ''')
-    result = cursor.fetchall()
+    result = get_country_airport_counts()
     if not result:
         print("\nNo cities found.")
         return None
@@ -90,4 +84,24 @@ def display_country_airport_count():
         print(f"Country: {country} | Number of airports: {airport_count}")
         print("-" * 50)
 
+# function to return the number of airports in each country with a destination, most first, as a list of (country, airport_count)
+# tuples. Reads the 'country_airports' summary table, which holds one row per country kept up to date by triggers
+def get_country_airport_counts():
+    with get_connection() as conn:
+        return conn.execute('''
+            SELECT country, airport_count
+            FROM country_airports
+            ORDER BY airport_count DESC, country
+        ''').fetchall()
 
+# function to return the number of flights departing from and arriving at an airport on each day between 'start_day'
+# and 'end_day' (inclusive, as 'YYYY-MM-DD' strings), as a list of (day, departures, arrivals) tuples. Reads the
+# 'airport_daily_traffic' summary table, kept up to date by triggers
+def get_airport_daily_traffic(airport_id, start_day, end_day):
+    with get_connection() as conn:
+        return conn.execute('''
+            SELECT day, departures, arrivals
+            FROM airport_daily_traffic
+            WHERE airport_id = ? AND day BETWEEN ? AND ?
+            ORDER BY day
+        ''', (airport_id, start_day, end_day)).fetchall()
@@ -1,5 +1,12 @@
-import sqlite3
+from database import get_connection, transaction
 from menu import clear_console
+from reference_cache import cached_query, invalidate
+
+# maximum number of destinations (airports) returned by a destination search, best matches first
+DESTINATION_SEARCH_LIMIT = 25
+
+# whether the 'destination_search' full-text index exists - checked the first time a search is made
+_search_index_available = None
 
 # helper function to fetch the details of a destination. Calls 'display_destinations' then asks the user to input 
 # the ID of the desination they want to select, or to press 'Enter' to add a new destination. On 'Enter', calls 'add_destination'
@@ -10,11 +17,9 @@ def get_destination():
     while True:
         response = input("Each airport must be linked to a destination. Enter an exising destination ID from the list above, or press 'Enter' to add a new destination: ")
         if response.strip() == "":
-            conn = sqlite3.connect('flight_management')
-            cursor = conn.cursor()
             city, country = add_destination()
-            response = cursor.execute("SELECT destination_id FROM destinations WHERE city = ? and country = ?", (city, country)).fetchone()[0]
-            conn.close()
+            with get_connection() as conn:
+                response = conn.execute("SELECT destination_id FROM destinations WHERE city = ? and country = ?", (city, country)).fetchone()[0]
             if response:
                 print(f"Destination selected: {city} ({country})")
             return response, city, country
@@ -35,21 +40,29 @@ def get_destination():
            
 
 # helper function to retrieve the name and IATA code of an airport from the user. Used to add an airport to the system. 
-# Ensures the provided airport_name and IATA codes are less than or equal to 100 characters and 10 characters respectivly, and not empty strings
+# Calls 'validate_airport_details' to check the provided values before returning them
 def get_airport_details():
     while True:
         airport_name = input("Please enter the name of the airport (e.g. Heathrow Airport): ").strip()
         iata_code = input("Please enter the IATA code (e.g. LHR): ").strip()
-        if len(airport_name) > 100 or len(iata_code) > 10: 
-            clear_console()
-            print(f"Your input: Airport name - {airport_name} IATA code - {iata_code}\n Airport name and IATA code must be less than 100 and 10 characters, respectivly.")
-        elif not airport_name or not iata_code:
+        error = validate_airport_details(airport_name, iata_code)
+        if error:
             clear_console()
-            print(f"Your input: Airport name - {airport_name} IATA code - {iata_code}\n You must provide a value for the airport's name and IATA code.")
+            print(f"Your input: Airport name - {airport_name} IATA code - {iata_code}\n {error}")
         else: 
             clear_console()
             return airport_name, iata_code  
 
+# helper function to validate the name and IATA code of an airport. Ensures the provided airport_name and IATA codes are less than 
+# or equal to 100 characters and 10 characters respectivly, and not empty strings. Returns an error message, or None if the details are valid.
+# Shared by 'get_airport_details' and the bulk import
+def validate_airport_details(airport_name, iata_code):
+    if len(airport_name) > 100 or len(iata_code) > 10: 
+        return "Airport name and IATA code must be less than 100 and 10 characters, respectivly."
+    if not airport_name or not iata_code:
+        return "You must provide a value for the airport's name and IATA code."
+    return None
+
 # helper function to allow the user to add a new destination to the system. Ensures the provided city and country are each less than or equal 
 # to 50 characters and not empty strings. Checks that the destination provided is unique (the city/country does not already exist). If not unique, 
 # displays an informative message then returns the destination details to allow them to be used when adding an airport. Otherwise, inserts the 
@@ -60,33 +73,34 @@ def add_destination():
     while True:
         city = input("Please enter the destination city: ").strip()
         country= input("Please enter the destination country: ").strip()
-        if len(city) > 50 or len(country) > 50: 
-            clear_console()
-            print(f"Your input: City - {city} Country - {country}\nDestination city and country must not exceed 50 characters each.")
-        elif not city or not country:
+        error = validate_destination(city, country)
+        if error:
             clear_console()
-            print(f"Your input: City - {city} Country - {country}\nYou must provide a value for the destination city and country.")
+            print(f"Your input: City - {city} Country - {country}\n{error}")
         else: 
            break
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT (*) FROM destinations WHERE city = ? and country = ?", (city, country))
-    if cursor.fetchone()[0] > 0:
-        print(f"\nThe destination {city}, {country} already exists. Unable to add a duplicate destination to the Flight Management System.")
-        conn.close()
-        return city, country
-    cursor.execute("INSERT INTO destinations (city, country) VALUES (?, ?)", (city, country))
-    conn.commit()
-    conn.close()
+    with transaction(immediate=True) as conn:
+        if conn.execute("SELECT COUNT (*) FROM destinations WHERE city = ? and country = ?", (city, country)).fetchone()[0] > 0:
+            print(f"\nThe destination {city}, {country} already exists. Unable to add a duplicate destination to the Flight Management System.")
+            return city, country
+        conn.execute("INSERT INTO destinations (city, country) VALUES (?, ?)", (city, country))
+    invalidate("destinations")
     print(f"\nDestination {city} {country} has been added successfully.")
     return city, country
 
-# helper function to fetch and display a list of all saved destinations
+# helper function to validate the city and country of a destination. Ensures each is less than or equal to 50 characters
+# and not an empty string. Returns an error message, or None if the destination is valid. Shared by 'add_destination' and the bulk import
+def validate_destination(city, country):
+    if len(city) > 50 or len(country) > 50: 
+        return "Destination city and country must not exceed 50 characters each."
+    if not city or not country:
+        return "You must provide a value for the destination city and country."
+    return None
+
+# helper function to fetch and display a list of all saved destinations. The list is fetched through 'reference_cache', 
+# so the database is only queried again once the destinations have changed
 def display_destinations():
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    destinations = cursor.execute("SELECT * FROM destinations ORDER BY country, city").fetchall()
-    conn.close()
+    destinations = cached_query("SELECT * FROM destinations ORDER BY country, city", tables=("destinations",))
     if not destinations:
         print("\nNo destinations found.")
         return None
@@ -98,10 +112,9 @@ def display_destinations():
 
 # helper function to fetch and display a list of aiports and their corresponding destinations (city & country).
 # Optionally accepts a departure_airport_id which, when provided, will be excluded from the results - used to omit the
-# departure aurport when choosing an arrival airport for a flight
+# departure aurport when choosing an arrival airport for a flight. The list is fetched through 'reference_cache', so the
+# database is only queried again once the airports or destinations have changed
 def display_airports_and_destinations(departure_airport_id=None):
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
     query = '''
         SELECT a.airport_id, a.airport_name, a.iata_code, d.city, d.country 
         FROM airports AS a
@@ -112,9 +125,7 @@ def display_airports_and_destinations(departure_airport_id=None):
         query += " WHERE a.airport_id != ?"
         params = (departure_airport_id,)
     query += " ORDER BY d.country, d.city, a.airport_name"
-    cursor.execute(query, params)
-    airports = cursor.fetchall()
-    conn.close()
+    airports = cached_query(query, params, tables=("airports", "destinations"))
     if not airports:
         print("\nNo airports found.")
         return None
@@ -124,3 +135,58 @@ def display_airports_and_destinations(departure_airport_id=None):
         print(f"Airport ID: {airport_id} | Airport: {airport_name} | IATA code: {iata_code} | Destination: {city}, {country}")
         print("-" * 50)
     return airports
+
+# helper function to check whether the 'destination_search' full-text index exists. It is not created if SQLite was built
+# without FTS5 or its trigram tokenizer (see 'migrations.create_destination_search')
+def has_search_index():
+    global _search_index_available
+    if _search_index_available is None:
+        with get_connection() as conn:
+            _search_index_available = bool(conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'destination_search'"
+            ).fetchone())
+    return _search_index_available
+
+# helper function to generate a query string to search for destinations, returning the airport_id, airport_name, iata_code,
+# city and country of the best 'limit' matching airports. A search of three or more characters matches any part of the city,
+# country, airport name or IATA code using the trigram index; a shorter search matches the start of any of them. Results are
+# ranked with an exact IATA code match first, then cities or countries starting with the search, then airport names starting
+# with it, then the remaining matches by relevance. Without the index, the same search is made with 'LIKE' on the airports
+# and destinations tables
+def build_destination_search(text, limit=DESTINATION_SEARCH_LIMIT):
+    text = text.strip()
+    prefix = f"{text}%"
+    if has_search_index():
+        query = "SELECT rowid AS airport_id, airport_name, iata_code, city, country FROM destination_search"
+    else:
+        query = '''
+            SELECT a.airport_id, a.airport_name, a.iata_code, d.city, d.country
+            FROM airports AS a JOIN destinations AS d ON a.destination_id = d.destination_id
+        '''
+    relevance = ""
+    if len(text) >= 3 and has_search_index():
+        query += " WHERE destination_search MATCH ?"
+        params = ['"' + text.replace('"', '""') + '"']
+        relevance = " bm25(destination_search, 4.0, 2.0, 1.0, 8.0),"
+    else:
+        pattern = f"%{text}%" if len(text) >= 3 else prefix
+        query += " WHERE (city LIKE ? OR country LIKE ? OR airport_name LIKE ? OR iata_code LIKE ?)"
+        params = [pattern] * 4
+    query += f'''
+        ORDER BY CASE
+            WHEN iata_code = ? THEN 0
+            WHEN city LIKE ? OR country LIKE ? THEN 1
+            WHEN airport_name LIKE ? THEN 2
+            ELSE 3
+        END,{relevance} airport_id
+        LIMIT ?
+    '''
+    params.extend([text.upper(), prefix, prefix, prefix, limit])
+    return query, params
+
+# helper function to search for destinations matching the provided text (see 'build_destination_search'). Returns a list
+# of (airport_id, airport_name, iata_code, city, country) tuples for the best matching airports, best first
+def search_destinations(text, limit=DESTINATION_SEARCH_LIMIT):
+    query, params = build_destination_search(text, limit)
+    with get_connection() as conn:
+        return conn.execute(query, params).fetchall()
@@ -0,0 +1,84 @@
+import random
+import threading
+from collections import deque
+
+from database import transaction
+
+# airline codes used as the prefix of generated flight numbers
+AIRLINE_CODES = ["NY", "LA", "LD", "TP", "BC", "KJ", "IB", "EN"]
+
+# generated numbers start at FIRST_NUMBER and are limited to MAX_NUMBER, so every flight number (airline code plus number)
+# fits in the 8 characters allowed by the flights table
+FIRST_NUMBER = 100
+MAX_NUMBER = 999999
+
+# number of flight numbers reserved from the database at a time for each airline code and kept in memory, so most
+# allocations need no database access at all
+BLOCK_SIZE = 20
+
+# largest block of flight numbers reserved in one go when allocating numbers in bulk
+MAX_BLOCK_SIZE = 10000
+
+# flight numbers reserved by this program but not yet handed out, for each airline code
+_reserved = {code: deque() for code in AIRLINE_CODES}
+_exhausted_codes = set()
+_lock = threading.Lock()
+
+# helper function to find the next number to allocate for an airline code when the code has no sequence yet. Continues
+# from the highest number already registered for the code (such as flight numbers created before the allocator existed)
+def _first_free_number(conn, code):
+    numbers = [
+        int(flight_number[len(code):]) for (flight_number,) in conn.execute(
+            "SELECT flight_number FROM flight_numbers WHERE flight_number GLOB ?", (f"{code}[0-9]*",)
+        ) if flight_number[len(code):].isdigit()
+    ]
+    return max(numbers, default=FIRST_NUMBER - 1) + 1
+
+# helper function to reserve up to 'size' consecutive free flight numbers for an airline code, using the provided connection
+# (which must be in a transaction). Each number is registered in the 'flight_numbers' table, whose primary key guarantees it
+# can never be handed out twice - numbers already registered by other means are skipped. The airline code's sequence
+# is then advanced past the reserved numbers. Returns the reserved numbers, which may be fewer than 'size' if the code has run out
+def _reserve_block(conn, code, size):
+    row = conn.execute("SELECT next_number FROM flight_number_sequences WHERE airline_code = ?", (code,)).fetchone()
+    next_number = row[0] if row else _first_free_number(conn, code)
+    flight_numbers = []
+    while len(flight_numbers) < size and next_number <= MAX_NUMBER:
+        flight_number = f"{code}{next_number}"
+        next_number += 1
+        if conn.execute("INSERT OR IGNORE INTO flight_numbers (flight_number) VALUES (?)", (flight_number,)).rowcount:
+            flight_numbers.append(flight_number)
+    conn.execute("INSERT OR REPLACE INTO flight_number_sequences (airline_code, next_number) VALUES (?, ?)", (code, next_number))
+    return flight_numbers
+
+# function to allocate 'count' unused flight numbers, each made up of a randomly chosen airline code and the next number in
+# that code's sequence. Numbers are handed out from blocks reserved in memory, and blocks are reserved in an immediate
+# transaction, so allocation is O(1) per number and separate programs writing to the same database never receive the same
+# number. When a connection that is already in a transaction is provided (such as during a bulk import), exactly 'count'
+# numbers are reserved within that transaction and none are kept in memory, as they would be lost if it were rolled back.
+# Returns a list of flight numbers, or raises a ValueError if every airline code has run out of numbers
+def allocate_flight_numbers(count=1, conn=None):
+    flight_numbers = []
+    with _lock:
+        while len(flight_numbers) < count:
+            codes = [code for code in AIRLINE_CODES if code not in _exhausted_codes]
+            if not codes:
+                raise ValueError("No flight numbers remain for any airline code.")
+            code = random.choice(codes)
+            remaining = count - len(flight_numbers)
+            if conn is not None:
+                block = _reserve_block(conn, code, min(remaining, MAX_BLOCK_SIZE))
+            else:
+                reserved = _reserved[code]
+                if not reserved:
+                    with transaction(immediate=True) as block_conn:
+                        reserved.extend(_reserve_block(block_conn, code, min(max(remaining, BLOCK_SIZE), MAX_BLOCK_SIZE)))
+                block = [reserved.popleft() for _ in range(min(remaining, len(reserved)))]
+            if not block:
+                _exhausted_codes.add(code)
+            flight_numbers.extend(block)
+    return flight_numbers
+
+# function to register flight numbers which were not allocated by 'allocate_flight_numbers' (such as those provided in a bulk
+# import), using the provided connection, so they are never allocated to another flight
+def register_flight_numbers(conn, flight_numbers):
+    conn.executemany("INSERT OR IGNORE INTO flight_numbers (flight_number) VALUES (?)", ((flight_number,) for flight_number in flight_numbers))
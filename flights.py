@@ -1,10 +1,15 @@
-from datetime import datetime
-from flights_helpers import display_flights, format_flight_times, generate_flight_number, get_departure_time, get_flight, get_flight_duration, select_airport
-from menu import clear_console, create_menu
-import sqlite3
+from flights_helpers import display_flights, display_flights_by_duration, format_days, format_db_time, generate_flight_number, get_departure_time, get_flight, get_flight_duration, get_schedule_dates, get_schedule_days, get_time_of_day, load_flight, select_airport, validate_flight_duration
+from menu import clear_console, create_menu, writes_to_database
+from models import utc_now
+from conflicts import get_conflicts, scan_conflicts
+from database import retry_if_locked, transaction
+from destinations_helpers import DESTINATION_SEARCH_LIMIT, search_destinations
+from pilot_availability import release_flight, reschedule_flight
 from pilots import assign_pilot_to_flight, view_assigned_flights
+from reference_cache import flights_version
+from recurring_schedules import SCHEDULE_HORIZON, cancel_schedule, create_schedule, list_schedules
+from route_search import find_routes, move_flight, record_flight, redirect_flight, remove_flight
 date_format = "%d-%m-%Y %H:%M"
-db_date_format = "%Y-%m-%d %H:%M:%S"
 
 # function to display the top-level 'flights' menu - 'Flight Management' - and handle user 
 # selection. Accepts the previous_menu to allow the user to return to the main
@@ -16,10 +21,11 @@ def display_flights_menu(previous_menu):
         display_flights_menu(previous_menu)
     flights_menu = {
         "heading": "=== Flight Management Menu ===",
-        "1": ("Update a flight", lambda: update_flights_menu(return_to_flights_menu)),
+        "1": ("Update a flight", writes_to_database(lambda: update_flights_menu(return_to_flights_menu))),
         "2": ("Schedule a flight", schedule_a_flight),
-        "3": ("View flights by criteria", lambda: view_flights_menu(return_to_flights_menu)),
-        "4": ("Return to Previous Menu", lambda: create_menu(previous_menu)),
+        "3": ("Recurring flight schedules", lambda: recurring_schedules_menu(return_to_flights_menu)),
+        "4": ("View flights by criteria", lambda: view_flights_menu(return_to_flights_menu)),
+        "5": ("Return to Previous Menu", lambda: create_menu(previous_menu)),
     }
     clear_console()
     create_menu(flights_menu, previous_menu)
@@ -32,13 +38,26 @@ def update_flights_menu(previous_menu):
         "heading": "=== Update a Flight Menu ===",
         "1": ("Change the departure time of a flight", change_departure_time),
         "2": ("Cancel a flight", cancel_a_flight), 
-        "3": ("Assign a pilot to a flight", lambda: assign_pilot_to_flight()),
+        "3": ("Assign a pilot to a flight", assign_pilot_to_flight),
         "4": ("Update flight destination", update_flight_destination),
         "5": ("Return to Previous Menu", lambda: previous_menu()),
     }
     clear_console()
     create_menu(update_flights_menu, previous_menu)
 
+# function to display the 'Recurring Flight Schedules' menu and handle user selection. Accepts the previous_menu to allow
+# the user to return to the 'Flight Management' menu. Calls 'create_menu' to print the menu and handle user input
+def recurring_schedules_menu(previous_menu):
+    recurring_schedules_menu = {
+        "heading": "=== Recurring Flight Schedules Menu ===",
+        "1": ("Schedule a recurring flight", schedule_a_recurring_flight),
+        "2": ("View recurring schedules", view_recurring_schedules),
+        "3": ("End a recurring schedule", end_recurring_schedule),
+        "4": ("Return to Previous Menu", lambda: previous_menu()),
+    }
+    clear_console()
+    create_menu(recurring_schedules_menu, previous_menu)
+
 # function to display the 'View Flights by Criteria' menu and handle user 
 # selection. Accepts the previous_menu to allow the user to return to the 'Flight 
 # Management' menu. Calls 'create_menu' to print the menu and handle user input. 
@@ -50,43 +69,64 @@ def view_flights_menu(previous_menu):
         "3": ("View all scheduled flights", view_scheduled_flights), # including cancel
         "4": ("View all cancelled flights", view_cancelled_flights), # including cancel
         "5": ("Sort flights by duration", sort_flights_by_duration),
-        "6": ("Return to Previous Menu", lambda: previous_menu()),
+        "6": ("View flights by duration range", view_flights_by_duration_range),
+        "7": ("Find routes between two airports", view_routes_between_airports),
+        "8": ("Return to Previous Menu", lambda: previous_menu()),
     }
     clear_console()
     create_menu(view_flights_menu, previous_menu)
 
 # function to update the departure time of a flight. Calls 'get_flight' and 'get_departure_time'
-# to retrieve the flight to be updated and the new departure time from the user. Finds the duration of 
-# the flight then updates both the departure and arrival time accordingly and displays a success message to the user
+# to retrieve the flight to be updated and the new departure time from the user, then calls 'change_flight_departure_time'
+# to update both the departure and arrival time and displays a success message to the user
+@writes_to_database
 def change_departure_time():
-    flight_to_update = get_flight("change the departure time for", is_future=True)
-    flight_id = flight_to_update[0]
+    flight_to_update = get_flight("change the departure time for", is_future=True, exclude_status="cancelled")
+    flight_id = flight_to_update.flight_id
     new_departure_time = get_departure_time(flight_to_update, existing_flight=True)
-    old_departure_time = flight_to_update[3]
-    old_arrival_time = flight_to_update[5]
-    flight_duration = new_departure_time - datetime.strptime(old_departure_time, db_date_format)
-    new_arrival_time = datetime.strptime(old_arrival_time, db_date_format) + flight_duration
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE flights
-        SET departure_time = ?, arrival_time = ?
-        WHERE flight_id = ?
-    ''', (new_departure_time, new_arrival_time, flight_id)
-    )    
-    conn.commit()
-    conn.close()
-    flight_number = flight_to_update[1]
+    flight_number, new_arrival_time = change_flight_departure_time(flight_id, new_departure_time)
     clear_console()
     print(f"Flight {flight_number} departure time updated to {new_departure_time.strftime(date_format)} GMT. Arrival time updated to {new_arrival_time.strftime(date_format)} GMT accordingly.")
+    conflicts = get_conflicts(flight_id=flight_id)
+    if conflicts:
+        print("\nWarning - the assigned pilot's schedule now has conflicts:")
+        for conflict in conflicts:
+            print(conflict[7])
+
+# function to change the departure time of a future, non-cancelled flight without any user interaction. Finds the duration
+# of the flight and moves the arrival time by the same amount. The flight is checked inside the immediate transaction which
+# updates it, so another program cannot cancel or move it in between. Returns the flight number and new arrival time, or
+# raises a ValueError if the flight cannot be updated. Shared by 'change_departure_time' and the command line interface
+@retry_if_locked
+def change_flight_departure_time(flight_id, new_departure_time):
+    if new_departure_time <= utc_now():
+        raise ValueError("The provided departure time must be in the future.")
+    with transaction(immediate=True) as conn:
+        flight = load_flight(flight_id, is_future=True, exclude_status="cancelled", conn=conn)
+        if not flight:
+            raise ValueError(f"Flight {flight_id} does not exist, has already departed or is cancelled.")
+        new_arrival_time = new_departure_time + flight.duration
+        before = flights_version(conn)
+        conn.execute('''
+            UPDATE flights
+            SET departure_time = ?, arrival_time = ?
+            WHERE flight_id = ?
+        ''', (new_departure_time, new_arrival_time, flight_id)
+        )
+        versions = (before, flights_version(conn))
+    reschedule_flight(flight_id, new_departure_time, new_arrival_time, versions)
+    move_flight(flight_id, new_departure_time, new_arrival_time, versions)
+    scan_conflicts([flight.pilot_id])
+    return flight.flight_number, new_arrival_time
 
 # function to change the status of a flight to 'cancelled'. Calls 'get_flight' to retrieve the flight to be cancelled from the user. 
-# Asks the user to confirm they wish to cancel the flight. Displays a success message to the user after they choose to cancel the flight, 
-# or returns to the 'Update a flight' menu if the user opts not to cancel the flight
+# Asks the user to confirm they wish to cancel the flight. Calls 'cancel_flight' and displays a success message to the user after they 
+# choose to cancel the flight, or returns to the 'Update a flight' menu if the user opts not to cancel the flight
+@writes_to_database
 def cancel_a_flight():
     flight_to_update = get_flight("cancel", exclude_status="cancelled", is_future=True)
-    flight_id = flight_to_update[0]
-    flight_number = flight_to_update[1]
+    flight_id = flight_to_update.flight_id
+    flight_number = flight_to_update.flight_number
     while True:
         confirmation = input(f"\nPlease confirm that you wish to cancel flight {flight_number} (y/n):")
         if confirmation.lower() == "n":
@@ -99,77 +139,181 @@ def cancel_a_flight():
             clear_console()
             print("Invalid choice, please enter 'y' or 'n' to confirm cancellation")
             continue
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("UPDATE flights SET status = ? WHERE flight_id = ?", ("cancelled", flight_id))    
-    conn.commit()
-    conn.close()
+    cancel_flight(flight_id)
     clear_console()
     print(f"Flight {flight_number} has been cancelled.")
 
+# function to cancel a future flight without any user interaction. The flight is checked inside the immediate transaction
+# which cancels it. Returns the flight number, or raises a ValueError if the flight cannot be cancelled. Shared by
+# 'cancel_a_flight' and the command line interface
+@retry_if_locked
+def cancel_flight(flight_id):
+    with transaction(immediate=True) as conn:
+        flight = load_flight(flight_id, exclude_status="cancelled", is_future=True, conn=conn)
+        if not flight:
+            raise ValueError(f"Flight {flight_id} does not exist, has already departed or is already cancelled.")
+        before = flights_version(conn)
+        conn.execute("UPDATE flights SET status = ? WHERE flight_id = ?", ("cancelled", flight_id))
+        versions = (before, flights_version(conn))
+    release_flight(flight_id, versions)
+    remove_flight(flight_id, versions)
+    scan_conflicts([flight.pilot_id])
+    return flight.flight_number
+
 # function to enable the user to update the destination of a scheduled flight. Calls 'get_flight' to retrieve
 # a flight to update from the user, excluding already departed or cancelled flights. Calls 'select_airport' to
 # retrieve a new destination airport from the user, excluding the departure airport from the avaliable options. 
-# Updates the 'arrival_airport_id' of the corresponding flight accordingly, then displays a success message to the
-# user.
+# Calls 'change_flight_destination' to update the flight, then displays a success message to the user.
+@writes_to_database
 def update_flight_destination():
     flight_to_update = get_flight("change the destination for", is_future=True, exclude_status="cancelled")
-    flight_id = flight_to_update[0]
-    conn = sqlite3.connect('flight_management')
-    departure_airport_id = conn.execute("SELECT departure_airport_id FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()[0]
-    new_destination = select_airport(departure_airport_id)
-    new_airport_id = new_destination[0]
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE flights
-        SET arrival_airport_id = ?
-        WHERE flight_id = ?
-    ''', (new_airport_id, flight_id)
-    )    
-    conn.commit()
-    conn.close()
-    flight_number = flight_to_update[1]
-    clear_console()
-    print(f"Flight {flight_number} destination updated to {new_destination[1]} ({new_destination[2]}), {new_destination[3]}, {new_destination[4]}.")
+    new_destination = select_airport(flight_to_update.departure_airport_id)
+    flight_number = change_flight_destination(flight_to_update.flight_id, new_destination.airport_id)
+    clear_console()
+    print(f"Flight {flight_number} destination updated to {new_destination.airport_name} ({new_destination.iata_code}), {new_destination.city}, {new_destination.country}.")
+
+# function to change the arrival airport of a future, non-cancelled flight without any user interaction. Returns the
+# flight number, or raises a ValueError if the flight or airport is invalid. Shared by 'update_flight_destination' and
+# the command line interface
+@retry_if_locked
+def change_flight_destination(flight_id, arrival_airport_id):
+    with transaction(immediate=True) as conn:
+        flight = load_flight(flight_id, is_future=True, exclude_status="cancelled", conn=conn)
+        if not flight:
+            raise ValueError(f"Flight {flight_id} does not exist, has already departed or is cancelled.")
+        if arrival_airport_id == flight.departure_airport_id:
+            raise ValueError("The arrival airport must be different from the departure airport.")
+        if not conn.execute("SELECT 1 FROM airports WHERE airport_id = ?", (arrival_airport_id,)).fetchone():
+            raise ValueError(f"Airport {arrival_airport_id} does not exist.")
+        before = flights_version(conn)
+        conn.execute('''
+            UPDATE flights
+            SET arrival_airport_id = ?
+            WHERE flight_id = ?
+        ''', (arrival_airport_id, flight_id)
+        )
+        versions = (before, flights_version(conn))
+    redirect_flight(flight_id, arrival_airport_id, versions)
+    scan_conflicts([flight.pilot_id])
+    return flight.flight_number
 
 
 # function to enable the user to schedule a new flight. Calls 'select_airport' and 'get_departure_time' to retrieve an
 # airport and departure time from the user. Calls 'select_airport' with the chosen departure_airport as an argument, 
-# which excludes the departure_airport from the list of available aiports to choose from. Calculates the arrival_time 
-# by calling 'get_flight_duration' to retrieve a flight duration from the user and adding the timedelta to the departure_time.
-# Inserts the new flight into the database and prints a success message to the user             
+# which excludes the departure_airport from the list of available aiports to choose from. Calls 'get_flight_duration' to 
+# retrieve a flight duration from the user, then calls 'schedule_flight' to insert the new flight into the database and 
+# prints a success message to the user             
+@writes_to_database
 def schedule_a_flight():
     clear_console()
     print("===========Schedule a flight==========")
     departure_airport = select_airport()
-    departure_airport_id = departure_airport[0]
     departure_time = get_departure_time(airport=departure_airport)
-    arrival_airport = select_airport(departure_airport_id=departure_airport_id)
-    arrival_airport_id = arrival_airport[0]
-    arrival_time = departure_time + get_flight_duration()
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
+    arrival_airport = select_airport(departure_airport_id=departure_airport.airport_id)
+    _, _, arrival_time = schedule_flight(departure_airport.airport_id, arrival_airport.airport_id, departure_time, get_flight_duration())
+    clear_console()
+    print(f"\nFlight to {arrival_airport.city}, {arrival_airport.country} scheduled successfully.\n"
+          f"Departing from {departure_airport.airport_name} at {departure_time.strftime(date_format)} GMT\n"
+          f"Arriving at {arrival_airport.airport_name} at {arrival_time.strftime(date_format)} GMT")
+
+# function to enable the user to schedule a flight which recurs on some days of each week. Calls 'select_airport' to
+# retrieve the airports, then 'get_schedule_days', 'get_time_of_day', 'get_flight_duration' and 'get_schedule_dates' to
+# retrieve the days, departure time, duration and first and last day from the user. Calls 'create_schedule', which adds
+# the flights within the schedules' horizon straight away, and prints a success message to the user
+@writes_to_database
+def schedule_a_recurring_flight():
+    clear_console()
+    print("===========Schedule a recurring flight==========")
+    departure_airport = select_airport()
+    arrival_airport = select_airport(departure_airport_id=departure_airport.airport_id)
+    days_of_week = get_schedule_days()
+    departure_time = get_time_of_day()
+    duration = get_flight_duration()
+    valid_from, valid_to = get_schedule_dates()
+    try:
+        schedule = create_schedule(departure_airport.airport_id, arrival_airport.airport_id, days_of_week, departure_time, duration, valid_from, valid_to)
+    except ValueError as error:
+        clear_console()
+        print(f"\nUnable to schedule the recurring flight. {error}")
+        return
+    clear_console()
+    print(f"\nFlight {schedule['flight_number']} from {departure_airport.airport_name} to {arrival_airport.airport_name} scheduled successfully.\n"
+          f"Departing at {departure_time} GMT ({format_days(days_of_week)}) from {valid_from.strftime('%d-%m-%Y')} to {valid_to.strftime('%d-%m-%Y')}.\n"
+          f"{schedule['added']} flights in the next {SCHEDULE_HORIZON.days} days have been added - later flights are added automatically.")
+
+# function to display every recurring schedule, with the number of its flights still to depart
+def view_recurring_schedules():
+    clear_console()
+    print("========== Recurring flight schedules ==========\n")
+    schedules = list_schedules()
+    if not schedules:
+        print("No recurring schedules found.")
+        return None
+    for schedule in schedules:
+        print(f"Schedule ID: {schedule['schedule_id']} | Flight Number: {schedule['flight_number']} | {schedule['departure_iata']} -> {schedule['arrival_iata']} | "
+              f"{schedule['days']} at {schedule['departure_time']} GMT | From {schedule['valid_from']} to {schedule['valid_to']} | Upcoming flights: {schedule['upcoming_flights']}")
+    return schedules
+
+# function to end a recurring schedule. Calls 'view_recurring_schedules' to display the schedules for the user to choose
+# from, asks the user to confirm, then calls 'cancel_schedule' to cancel every flight of the schedule still to depart
+@writes_to_database
+def end_recurring_schedule():
+    schedules = view_recurring_schedules()
+    if not schedules:
+        return
+    schedule_ids = {schedule["schedule_id"] for schedule in schedules}
+    while True:
+        schedule_id = input("\nPlease enter the Schedule ID of the schedule you'd like to end: ").strip()
+        if schedule_id.isdigit() and int(schedule_id) in schedule_ids:
+            break
+        print(f"Your input: {schedule_id}\nInvalid Schedule ID, please try again.")
+    if input(f"\nPlease confirm that you wish to end schedule {schedule_id} and cancel its upcoming flights (y/n): ").strip().lower() != "y":
+        clear_console()
+        print("\nNo changes made.")
+        return
+    result = cancel_schedule(int(schedule_id))
+    clear_console()
+    print(f"Schedule {schedule_id} (flight {result['flight_number']}) has ended. {result['cancelled']} upcoming flights have been cancelled.")
+
+# function to schedule a new flight without any user interaction. Checks the airports exist and are different, the 
+# departure time is in the future and the duration is valid, then inserts the flight with a newly generated flight number. 
+# The arrival time is calculated by adding the duration (a timedelta) to the departure_time. The airports are checked in
+# the immediate transaction which inserts the flight. Returns the new flight's flight_id, flight_number and arrival_time,
+# or raises a ValueError if any detail is invalid. Shared by 'schedule_a_flight' and the command line interface
+@retry_if_locked
+def schedule_flight(departure_airport_id, arrival_airport_id, departure_time, duration):
+    if departure_airport_id == arrival_airport_id:
+        raise ValueError("The arrival airport must be different from the departure airport.")
+    if departure_time <= utc_now():
+        raise ValueError("The provided departure time must be in the future.")
+    hours, minutes = divmod(int(duration.total_seconds()) // 60, 60)
+    error = validate_flight_duration(hours, minutes)
+    if error:
+        raise ValueError(error)
+    arrival_time = departure_time + duration
     flight_number = generate_flight_number()
-    cursor.execute('''
-        INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time)
-        VALUES (?, ?, ?, ?, ?)
-    ''',(flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time)
-    )
-    conn.commit()
-    conn.close()
-    clear_console()
-    print(f"\nFlight to {arrival_airport[3]}, {arrival_airport[4]} scheduled successfully.\n"
-          f"Departing from {departure_airport[1]} at {departure_time.strftime(date_format)} GMT\n"
-          f"Arriving at {arrival_airport[1]} at {arrival_time.strftime(date_format)} GMT")
-
-# function to retrive any existing flights to a user-provided city or country. Passes the relevant departure and arrival time 
+    with transaction(immediate=True) as conn:
+        found = conn.execute("SELECT COUNT(*) FROM airports WHERE airport_id IN (?, ?)", (departure_airport_id, arrival_airport_id)).fetchone()[0]
+        if found != 2:
+            raise ValueError("The departure and arrival airports must both exist.")
+        before = flights_version(conn)
+        cursor = conn.execute('''
+            INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time)
+            VALUES (?, ?, ?, ?, ?)
+        ''',(flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time)
+        )
+        versions = (before, flights_version(conn))
+    record_flight(cursor.lastrowid, flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, versions)
+    return cursor.lastrowid, flight_number, arrival_time
+
+# function to retrive any existing flights to a user-provided city, country, airport name or IATA code. The matching destinations
+# are found with 'search_destinations' and listed best match first. Passes the relevant departure and arrival time 
 # column indicies (to format time columns to be easily readable), columns and destination to 'display_flights' to disply all flights 
 # to the user-provided destination.
 def view_flights_to_destination():
     clear_console()
     print("========== View flights to a given destination ==========")
-    provided_location = input("Please enter a city or country to view any existing flights to that location: ").strip()
+    provided_location = input("Please enter a city, country, airport name or IATA code to view any existing flights to that location: ").strip()
     columns = [
         "f.flight_number",
         "departure_airport.airport_name AS departure_airport",
@@ -182,8 +326,17 @@ def view_flights_to_destination():
     if provided_location == "":
         print("\nYou did not provide a location. Displaying flights to all saved locations...\n")
     else:
+        matches = search_destinations(provided_location)
+        if not matches:
+            print(f"\nNo destinations match '{provided_location}'.")
+            return
+        print("\nMatching destinations (best match first):")
+        for airport_id, airport_name, iata_code, city, country in matches:
+            print(f"{iata_code}, {airport_name}, {city}, {country}")
+        if len(matches) == DESTINATION_SEARCH_LIMIT:
+            print(f"Showing the first {DESTINATION_SEARCH_LIMIT} matching destinations only - enter a longer search to narrow the results.")
         print(f"\n==========Flights to {provided_location}==========")
-    display_flights(departure_time_index=2, arrival_time_index=4, columns = columns, destination=provided_location)
+    display_flights(columns=columns, destination=provided_location)
    
 # function to view all scheduled flights. Calls 'display_flights' to print the relevant flight details for 
 # scheduled flights, or an informative message if no scheduled flights exist
@@ -200,37 +353,52 @@ def view_cancelled_flights():
     display_flights(status="cancelled")
     
 
-# function to fetch and display all saved flights in descending order of duration
+# function to display all saved flights in descending order of duration. Calls 'display_flights_by_duration', which reads the
+# flights in order from the duration index a page at a time
 def sort_flights_by_duration():
     clear_console()
     print("========== Flights - longest to shortest duration ==========")
-    query = '''
-        SELECT 
-        f.flight_id, 
-        f.flight_number, 
-        d.airport_name AS d,
-        f.departure_time, 
-        a.airport_name AS a,
-        f.arrival_time, 
-        (julianday(arrival_time) - julianday(departure_time)) * 24 * 60 AS duration_minutes
-        FROM flights AS f
-        JOIN airports AS d ON f.departure_airport_id = d.airport_id
-        JOIN airports AS a ON f.arrival_airport_id = a.airport_id
-        ORDER BY duration_minutes DESC;
-    '''
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    flights = cursor.fetchall()
-    conn.close()
-    if not flights:
-        print("\nNo flights found.")
-
-    for flight in flights:
-        flight_id, flight_number, departure_airport, departure_time, arrival_airport, arrival_time, duration = flight
-        flight = format_flight_times(flight, 3, 5)
-        print(f"Flight {flight_number} | Departure: {departure_airport}, {departure_time} GMT | Arrival: {arrival_airport}, {arrival_time} GMT | Duration: {int(duration)} minutes.")
-        print("-" * 50)
-    
+    return display_flights_by_duration()
+
+# function to display the flights lasting between a minimum and maximum number of hours provided by the user, longest first
+def view_flights_by_duration_range():
+    clear_console()
+    print("========== View flights by duration ==========")
+    while True:
+        try:
+            min_hours = float(input("\nPlease enter the minimum flight duration (hours): "))
+            max_hours = float(input("Please enter the maximum flight duration (hours): "))
+        except ValueError:
+            clear_console()
+            print("Invalid input. Please enter numbers only.")
+            continue
+        if min_hours < 0 or max_hours < min_hours:
+            clear_console()
+            print(f"Provided durations: {min_hours} to {max_hours} hours\nInvalid range. The minimum must be positive and no greater than the maximum.")
+            continue
+        break
+    clear_console()
+    print(f"========== Flights lasting between {min_hours:g} and {max_hours:g} hours ==========")
+    return display_flights_by_duration(round(min_hours * 60), round(max_hours * 60))
 
-    
\ No newline at end of file
+# function to find the earliest-arriving routes between two airports, including connecting flights. Calls 'select_airport'
+# to retrieve the origin and destination airports and 'get_departure_time' to retrieve the earliest departure time from the
+# user, then calls 'find_routes' and displays the best route for each number of connections, with every flight taken
+def view_routes_between_airports():
+    clear_console()
+    print("========== Find routes between two airports ==========")
+    origin = select_airport()
+    departure_time = get_departure_time(airport=origin)
+    destination = select_airport(departure_airport_id=origin.airport_id)
+    routes = find_routes(origin.airport_id, destination.airport_id, departure_time)
+    clear_console()
+    print(f"========== Routes from {origin.airport_name} ({origin.iata_code}) to {destination.airport_name} ({destination.iata_code}) ==========")
+    if not routes:
+        print("\nNo routes found departing within a day of the provided time.")
+        return
+    for route in routes:
+        hours, minutes = divmod(route["duration_minutes"], 60)
+        stops = "Direct" if not route["connections"] else f"{route['connections']} connection(s)"
+        print(f"\n{route['route']} | {stops} | Total time: {hours}h {minutes}m")
+        for leg in route["flights"]:
+            print(f"  Flight Number: {leg['flight_number']} | {leg['from']} {format_db_time(leg['departure_time'])} -> {leg['to']} {format_db_time(leg['arrival_time'])}")
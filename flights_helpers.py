@@ -1,49 +1,73 @@
 from datetime import datetime, timedelta
-import random
-import sqlite3
-
-from destinations_helpers import display_airports_and_destinations
+from itertools import islice
+from database import get_connection
+from destinations_helpers import build_destination_search, display_airports_and_destinations
+from flight_numbers import allocate_flight_numbers
 from menu import clear_console
+from models import Airport, Flight, utc_now
 
 date_format = "%d-%m-%Y %H:%M"
 db_date_format = "%Y-%m-%d %H:%M:%S"
 
+# number of flights displayed at a time by 'display_flights' before asking the user whether to show more
+FLIGHTS_PAGE_SIZE = 20
+
+# columns displayed by 'display_flights' when no columns are provided
+DEFAULT_FLIGHT_COLUMNS = [
+    "f.flight_id", "f.flight_number", "departure_airport.airport_name AS departure_airport", "f.departure_time", "arrival_airport.airport_name AS arrival_airport", "f.arrival_time"
+]
+
 # helper function to fetch the flight details of a flight. Calls 'display_flights' with the provided
 # arguments, making the function reusable. Asks the user to input the ID of the flight they want to update,
-# verifies it's a valid flight_id and that it matches the criteria passed in (if provided), then returns the
-# flight details as a tuple
-def get_flight(type, deparature_time_index=None, arrival_time_index=None, columns=None, pilot=None, is_future=None, exclude_status=None):
+# then calls 'load_flight' to verify it's a valid flight_id and that it matches the criteria passed in (if provided).
+# While more flights remain, pressing 'Enter' displays the next page. Invalid input is reported below the list of flights, 
+# without fetching the list again. Returns the flight as a 'Flight', whichever columns were displayed
+def get_flight(type, columns=None, pilot=None, is_future=None, exclude_status=None, page_size=FLIGHTS_PAGE_SIZE):
     clear_console()
     if is_future:
         header = "========== Upcoming Flights=========="
     else: 
         header = "==========Flights=========="
     print(header)
-    flights = display_flights(
-        departure_time_index=deparature_time_index, arrival_time_index=arrival_time_index, columns=columns, pilot=pilot, is_future=is_future, exclude_status=exclude_status
-        )
+    columns = columns or DEFAULT_FLIGHT_COLUMNS
+    flights = iter_flights(columns, pilot, is_future, exclude_status, page_size=page_size)
+    displayed = display_flight_page(flights, columns, page_size)
+    if not displayed:
+        print("\nNo matching flights found.")
     while True:
-        flight_id = input(f"\nPlease enter the Flight ID of the flight you'd like to {type}: ")
+        more_flights = displayed == page_size
+        prompt = ", or press Enter to show more flights" if more_flights else ""
+        flight_id = input(f"\nPlease enter the Flight ID of the flight you'd like to {type}{prompt}: ")
+        if more_flights and not flight_id.strip():
+            displayed = display_flight_page(flights, columns, page_size)
+            if not displayed:
+                print("\nNo more flights to show.")
+            continue
         try: 
             flight_id = int(flight_id)
         except ValueError:
-            clear_console()
-            print(header)
-            flights = display_flights(
-                departure_time_index=deparature_time_index, arrival_time_index=arrival_time_index, columns=columns, pilot=pilot, is_future=is_future, exclude_status=exclude_status
-                )
             print("\nYour input: " + str(flight_id) + "\nInvalid input. Please enter a valid Flight ID.")
             continue
-        flight = next((flight for flight in flights if flight[0] == flight_id), None)
+        flight = load_flight(flight_id, pilot=pilot, is_future=is_future, exclude_status=exclude_status)
         if flight:
             return flight
-        else: 
-            clear_console()
-            print(header)
-            flights = display_flights(
-                departure_time_index=deparature_time_index, arrival_time_index=arrival_time_index, columns=columns, pilot=pilot, is_future=is_future, exclude_status=exclude_status
-                )
-            print("\nYour input: " + str(flight_id) + "\nInvalid flight ID, please try again.")
+        print("\nYour input: " + str(flight_id) + "\nInvalid flight ID, please try again.")
+
+# helper function to look up a single flight by its ID. Accepts the same criteria as 'display_flights' and returns
+# the flight's details as a tuple of the requested columns, or None if no flight with the ID matches the criteria.
+# Pass 'conn' to check the flight inside a write transaction, so it cannot change before the transaction's update
+def find_flight(flight_id, columns=None, pilot=None, is_future=None, exclude_status=None, status=None, destination=None, conn=None):
+    query, params = build_flights_query(columns or DEFAULT_FLIGHT_COLUMNS, pilot, is_future, exclude_status, status, destination, flight_id=flight_id)
+    if conn is not None:
+        return conn.execute(query, params).fetchone()
+    with get_connection() as conn:
+        return conn.execute(query, params).fetchone()
+
+# helper function to look up a single flight by its ID as a 'Flight'. Accepts the same criteria as 'find_flight', and
+# returns None if no flight with the ID matches them
+def load_flight(flight_id, pilot=None, is_future=None, exclude_status=None, status=None, conn=None):
+    flight = find_flight(flight_id, columns=Flight.COLUMNS, pilot=pilot, is_future=is_future, exclude_status=exclude_status, status=status, conn=conn)
+    return Flight.from_row(flight) if flight else None
 
 # helper function to retrieve a departure time from the user. Used for updating the departure time of existing flights
 # and when scheduling new flights. Ensures the departure time is not in the past and is in the accepted format before 
@@ -51,16 +75,16 @@ def get_flight(type, deparature_time_index=None, arrival_time_index=None, column
 def get_departure_time(flight=None, airport=None, existing_flight=None):
     while True:
         if existing_flight:
-            departure_time = input(f"\nPlease enter a new departure date and time for flight {flight[1]} (DD-MM-YYYY HH:MM): ")
+            departure_time = input(f"\nPlease enter a new departure date and time for flight {flight.flight_number} (DD-MM-YYYY HH:MM): ")
         else: 
-            departure_time = input(f"\nPlease enter the date and departure time for flight from {airport[1]} (DD-MM-YYYY HH:MM): ")
+            departure_time = input(f"\nPlease enter the date and departure time for flight from {airport.airport_name} (DD-MM-YYYY HH:MM): ")
         try: 
             departure_time = datetime.strptime(departure_time.strip(), date_format)
         except ValueError:
             clear_console()
             print("Your input: " + str(departure_time) + "\nInvalid departure time format. Please use the format 'DD-MM-YYYY HH:MM'.")
             continue
-        if departure_time <= datetime.now():
+        if departure_time <= utc_now():
             clear_console()
             print("Your input: " + str(departure_time) + "\nInvalid input. The provided departure time must be in the future.")
             continue
@@ -69,7 +93,7 @@ def get_departure_time(flight=None, airport=None, existing_flight=None):
         return departure_time
     
 # helper function to retrieve an airport from the user. Calls 'display_airports_and_destinations' to display the
-# available airports, then checks the airport exists and is valid before returning the airport details as a tuple 
+# available airports, then checks the airport exists and is valid before returning the airport as an 'Airport' 
 def select_airport(departure_airport_id=None):
     while True:
         airports = display_airports_and_destinations(departure_airport_id)
@@ -83,62 +107,130 @@ def select_airport(departure_airport_id=None):
             clear_console()
             print("Your input: " + str(airport_id) + "\nInvalid input. Please enter a valid Airport ID.\n")
             continue
-        chosen_airport = next((airport for airport in airports if airport[0] == airport_id), None)
+        chosen_airport = next((Airport.from_row(airport) for airport in airports if airport[0] == airport_id), None)
         if chosen_airport:
             clear_console()
-            print(f"Airport selected: {chosen_airport[1]}({chosen_airport[2]})")
+            print(f"Airport selected: {chosen_airport.airport_name}({chosen_airport.iata_code})")
             return chosen_airport
         else: 
             clear_console()
             print("Your input: " + str(airport_id) + "\nInvalid Airport ID, please try again.\n")
 
-# helper function to generate a random flight number. Chooses a random airline code from 
-# a list and concatentates with a random 3 or 4 digit number to create a flight number. Checks the
-# flight number does not already exist in the database then returns it as a string
-def generate_flight_number():
-    airline_codes = ["NY", "LA", "LD", "TP", "BC", "KJ", "IB", "EN"]
-    flight_number = random.choice(airline_codes) + str(random.randint(100,9999))
+# names of the days of the week, Monday first, as used by recurring schedules (whose days are stored as a bit mask with
+# Monday as bit 0), and the groups of days which can be given by name
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+DAY_GROUPS = {"daily": 0b1111111, "weekdays": 0b0011111, "weekends": 0b1100000}
+
+# helper function to convert days of the week given as text - day names (or their first three letters or more) separated
+# by commas, such as 'Mon,Wed,Fri', or 'daily', 'weekdays' or 'weekends' - to a bit mask. Raises a ValueError if any day is invalid
+def parse_days(value):
+    value = value.strip().lower()
+    if value in DAY_GROUPS:
+        return DAY_GROUPS[value]
+    days_of_week = 0
+    for name in value.split(","):
+        name = name.strip()
+        day = next((index for index, day in enumerate(DAY_NAMES) if len(name) >= 3 and day.lower().startswith(name)), None)
+        if day is None:
+            raise ValueError(f"Invalid day '{name}' - use day names such as 'Mon,Wed,Fri', or 'daily', 'weekdays' or 'weekends'.")
+        days_of_week |= 1 << day
+    return days_of_week
+
+# helper function to convert a bit mask of days of the week to text, such as 'Mon, Wed, Fri' or 'Daily'
+def format_days(days_of_week):
+    if days_of_week == DAY_GROUPS["daily"]:
+        return "Daily"
+    return ", ".join(day[:3] for index, day in enumerate(DAY_NAMES) if days_of_week >> index & 1)
+
+# helper function to retrieve the days of the week a recurring flight operates on from the user. Returns them as a bit mask
+def get_schedule_days():
+    while True:
+        days = input("\nPlease enter the days the flight operates on (such as 'Mon,Wed,Fri', 'daily', 'weekdays' or 'weekends'): ")
+        try:
+            days_of_week = parse_days(days)
+        except ValueError as error:
+            clear_console()
+            print(f"Your input: {days}\n{error}")
+            continue
+        clear_console()
+        print(f"Days set to: {format_days(days_of_week)}\n")
+        return days_of_week
+
+# helper function to retrieve the time of day a recurring flight departs from the user. Returns it as text ('HH:MM')
+def get_time_of_day():
     while True:
-        conn = sqlite3.connect("flight_management")
-        cursor = conn.cursor()
+        departure_time = input("\nPlease enter the departure time of the flight (HH:MM, GMT): ")
         try:
-            cursor.execute("SELECT COUNT(*) FROM flights WHERE flight_number = ?", (flight_number,))
-            exists = cursor.fetchone()[0] > 0
-            if not exists:
-                return flight_number
-        finally:
-            conn.close()
-
-# helper function to retrieve the duration of a flight from the user. Checks that the provided hours and minutes are positive integers
-# and total less than 36 hours. Also checks that the value provided for minutes is less than 60. Returns the duration as a timedelta object. 
-# This is used when scheduling a flight to calculate the arrival time
+            departure_time = datetime.strptime(departure_time.strip(), "%H:%M").strftime("%H:%M")
+        except ValueError:
+            clear_console()
+            print("Your input: " + str(departure_time) + "\nInvalid departure time format. Please use the format 'HH:MM'.")
+            continue
+        clear_console()
+        print(f"Departure time set to: {departure_time} GMT\n")
+        return departure_time
+
+# helper function to retrieve the first and last day a recurring flight operates from the user. Ensures the last day is
+# not before the first day or in the past, and returns both as date objects
+def get_schedule_dates():
+    while True:
+        first_day = input("\nPlease enter the first day the flight operates (DD-MM-YYYY): ")
+        last_day = input("Please enter the last day the flight operates (DD-MM-YYYY): ")
+        try:
+            valid_from, valid_to = datetime.strptime(first_day.strip(), "%d-%m-%Y").date(), datetime.strptime(last_day.strip(), "%d-%m-%Y").date()
+        except ValueError:
+            clear_console()
+            print(f"Your input: {first_day} to {last_day}\nInvalid date format. Please use the format 'DD-MM-YYYY'.")
+            continue
+        if valid_to < valid_from or valid_to < utc_now().date():
+            clear_console()
+            print(f"Your input: {first_day} to {last_day}\nInvalid dates. The last day must not be before the first day or in the past.")
+            continue
+        clear_console()
+        return valid_from, valid_to
+
+# helper function to generate a unique flight number. Calls 'allocate_flight_numbers', which combines a random 
+# airline code with the next number in that code's sequence, then returns the flight number as a string
+def generate_flight_number():
+    return allocate_flight_numbers(1)[0]
+
+# helper function to retrieve the duration of a flight from the user. Calls 'validate_flight_duration' to check the provided hours 
+# and minutes. Returns the duration as a timedelta object. This is used when scheduling a flight to calculate the arrival time
 def get_flight_duration():
     print("\nTo enter the duration of the flight, please enter the hours first, then the minutes. The arrival time will be scheduled accordingly.")
     while True:
         try:
             hours = int(input("\nPlease enter flight duration (hours): "))
             minutes = int(input("Please enter the additional minutes: "))
-            if hours < 0 or minutes < 0:
+            error = validate_flight_duration(hours, minutes)
+            if error:
                 clear_console()
-                print(f"Provided flight duration: {hours} hours, {minutes} minutes\nInvalid duration. Duration must be a positive value.\n")
+                print(f"Provided flight duration: {hours} hours, {minutes} minutes\n{error}\n")
                 continue
-            if minutes > 60:
-                clear_console()
-                print(f"Provided flight duration: {hours} hours, {minutes} minutes\nInvalid duration. Minutes must be less than 60.\n")
-                continue
-            total_duration = timedelta(hours=hours, minutes=minutes)
-            if total_duration > timedelta(hours=36):
-                clear_console()
-                print(f"Provided flight duration: {hours} hours, {minutes} minutes\nInvalid duration. Total flight duration cannot exceed 36 hours.\n")
-                continue
-            return total_duration
+            return timedelta(hours=hours, minutes=minutes)
         except ValueError:
             clear_console()
             print("Invalid input. Please enter numbers only.")
 
+# helper function to validate the duration of a flight. Checks that the provided hours and minutes are positive integers
+# and total less than 36 hours. Also checks that the value provided for minutes is less than 60. Returns an error message, 
+# or None if the duration is valid. Shared by 'get_flight_duration' and the bulk import
+def validate_flight_duration(hours, minutes):
+    if hours < 0 or minutes < 0:
+        return "Invalid duration. Duration must be a positive value."
+    if hours == 0 and minutes == 0:
+        return "Invalid duration. Duration must be greater than zero."
+    if minutes > 60:
+        return "Invalid duration. Minutes must be less than 60."
+    if hours * 60 + minutes > 36 * 60:
+        return "Invalid duration. Total flight duration cannot exceed 36 hours."
+    return None
+
 # helper function to generate a query string to retrieve flights data from the database. Can be called with various arguments to make the
-# function reusable
-def build_flights_query(columns=None, pilot=None, is_future=None, exclude_status=None, status=None, destination=None):
+# function reusable. Flights are ordered by departure time then flight ID. To fetch flights one page at a time, 'after' accepts the 
+# (departure_time, flight_id) of the last flight on the previous page and 'limit' the number of flights per page - the query then
+# seeks straight to the next page using the departure_time index instead of reading and skipping the earlier flights
+def build_flights_query(columns=None, pilot=None, is_future=None, exclude_status=None, status=None, destination=None, flight_id=None, after=None, limit=None):
     columns_str = ", ".join(columns)
     query = f'''
         SELECT {columns_str}
@@ -150,7 +242,8 @@ def build_flights_query(columns=None, pilot=None, is_future=None, exclude_status
     '''
     params=[]
     if is_future:
-        query += " AND f.departure_time >= CURRENT_TIMESTAMP"
+        query += " AND f.departure_time >= ?"
+        params.append(utc_now().strftime(db_date_format))
     if pilot:
         query += " AND f.pilot_id = ?"
         params.append(pilot)
@@ -161,34 +254,155 @@ def build_flights_query(columns=None, pilot=None, is_future=None, exclude_status
         query += " AND f.status = ?"
         params.append(status)
     if destination:
-        query += " AND (d.city LIKE ? OR d.country LIKE ?)"
-        params.extend([f"%{destination}%", f"%{destination}%"])
+        search_query, search_params = build_destination_search(destination)
+        query += f" AND f.arrival_airport_id IN (SELECT airport_id FROM ({search_query}))"
+        params.extend(search_params)
+    if flight_id is not None:
+        query += " AND f.flight_id = ?"
+        params.append(flight_id)
+    if after:
+        query += " AND f.departure_time >= ? AND (f.departure_time > ? OR f.flight_id > ?)"
+        params.extend([after[0], after[0], after[1]])
+    query += " ORDER BY f.departure_time, f.flight_id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+# helper function to stream the flights matching the provided criteria. A generator which fetches 'page_size' flights at a time
+# from the database (see 'build_flights_query') and yields each flight as a tuple of the requested columns, so only one page is 
+# held in memory however many flights match
+def iter_flights(columns, pilot=None, is_future=None, exclude_status=None, status=None, destination=None, page_size=FLIGHTS_PAGE_SIZE):
+    # the departure time and flight ID of each flight are also selected, to find the start of the next page
+    columns = list(columns) + ["f.departure_time", "f.flight_id"]
+    after = None
+    while True:
+        query, params = build_flights_query(columns, pilot, is_future, exclude_status, status, destination, after=after, limit=page_size)
+        with get_connection() as conn:
+            page = conn.execute(query, params).fetchall()
+        for flight in page:
+            yield flight[:-2]
+        if len(page) < page_size:
+            return
+        after = page[-1][-2:]
+
+# helper function to generate a query string to retrieve flights in descending order of duration, optionally only those lasting
+# between 'min_minutes' and 'max_minutes' (inclusive). Flights are ordered by the indexed 'duration_minutes' column then flight ID
+# (which the index also holds), so the query reads flights straight from the index in order and stops after 'limit' flights rather
+# than sorting every flight. 'after' accepts the (duration_minutes, flight_id) of the last flight on the previous page
+def build_duration_query(min_minutes=None, max_minutes=None, after=None, limit=None):
+    query = '''
+        SELECT f.flight_id, f.flight_number, departure_airport.airport_name, f.departure_time,
+        arrival_airport.airport_name, f.arrival_time, f.duration_minutes
+        FROM flights AS f
+        JOIN airports AS departure_airport ON f.departure_airport_id = departure_airport.airport_id
+        JOIN airports AS arrival_airport ON f.arrival_airport_id = arrival_airport.airport_id
+        WHERE f.duration_minutes IS NOT NULL
+    '''
+    params = []
+    if min_minutes is not None:
+        query += " AND f.duration_minutes >= ?"
+        params.append(min_minutes)
+    if max_minutes is not None:
+        query += " AND f.duration_minutes <= ?"
+        params.append(max_minutes)
+    if after:
+        query += " AND (f.duration_minutes, f.flight_id) < (?, ?)"
+        params.extend(after)
+    query += " ORDER BY f.duration_minutes DESC, f.flight_id DESC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
     return query, params
 
+# helper function to stream flights from the longest to the shortest, optionally only those lasting between 'min_minutes'
+# and 'max_minutes'. A generator which fetches 'page_size' flights at a time (see 'build_duration_query') and yields each as a
+# tuple of (flight_id, flight_number, departure_airport, departure_time, arrival_airport, arrival_time, duration_minutes)
+def iter_flights_by_duration(min_minutes=None, max_minutes=None, page_size=FLIGHTS_PAGE_SIZE):
+    after = None
+    while True:
+        query, params = build_duration_query(min_minutes, max_minutes, after=after, limit=page_size)
+        with get_connection() as conn:
+            page = conn.execute(query, params).fetchall()
+        yield from page
+        if len(page) < page_size:
+            return
+        after = (page[-1][6], page[-1][0])
+
+# helper function to return the 'limit' longest flights, optionally only those lasting between 'min_minutes' and 'max_minutes',
+# as a list of tuples in the format yielded by 'iter_flights_by_duration'
+def get_longest_flights(limit=50, min_minutes=None, max_minutes=None):
+    return list(islice(iter_flights_by_duration(min_minutes, max_minutes, page_size=limit), limit))
+
+# helper function to display flights from the longest to the shortest, optionally only those lasting between 'min_minutes'
+# and 'max_minutes', 'page_size' at a time - when more flights remain, the user is asked whether to show the next page.
+# Returns the number of flights displayed, or None if no flights match
+def display_flights_by_duration(min_minutes=None, max_minutes=None, page_size=FLIGHTS_PAGE_SIZE):
+    flights = iter_flights_by_duration(min_minutes, max_minutes, page_size)
+    total_displayed = 0
+    while True:
+        page = list(islice(flights, page_size))
+        for flight_id, flight_number, departure_airport, departure_time, arrival_airport, arrival_time, duration in page:
+            print(f"Flight {flight_number} | Departure: {departure_airport}, {departure_time} GMT | Arrival: {arrival_airport}, {arrival_time} GMT | Duration: {duration} minutes.")
+            print("-" * 50)
+        if not page:
+            print("\nNo flights found." if not total_displayed else "\nNo more flights to show.")
+        total_displayed += len(page)
+        if len(page) < page_size or input("\nPress Enter to show more flights, or type 'q' to stop: ").strip().lower() == "q":
+            return total_displayed or None
+
 # helper function to display a list of flights in a readable format. Accpets a list of columns to display; if None, displays the defined columns.
-# Accepts an index for departure_time and arrival_time columns which, if not columns, is set to correspend with the defined columns. Passes the indicies to 
-# 'format_column_names' to display the date and time in a readable format. Accepts other arguments to make the function resuable, allowing relevant data 
-# to be displayed. Returns retrieved flights as a list of tuples to be used by functions which call this one
-def display_flights(departure_time_index=None, arrival_time_index=None, columns=None, pilot=None, is_future=None, exclude_status=None, status=None, destination=None):
-    if not columns:
-        columns = [
-            "f.flight_id", "f.flight_number", "departure_airport.airport_name AS departure_airport", "f.departure_time", "arrival_airport.airport_name AS arrival_airport", "f.arrival_time"
-        ]
-        departure_time_index=3
-        arrival_time_index=5
-    query, params = build_flights_query(columns, pilot, is_future, exclude_status, status, destination)
-    conn = sqlite3.connect('flight_management')
-    flights = conn.execute(query, params).fetchall()
-    conn.close()
-    if not flights: 
+# The departure_time and arrival_time columns are found by name and displayed in a readable format. Accepts other arguments to make the function
+# resuable, allowing relevant data to be displayed. Flights are streamed from 'iter_flights' and displayed 'page_size' at a time - when more flights
+# remain, the user is asked whether to show the next page. Returns the number of flights displayed, or None if no flights match
+def display_flights(columns=None, pilot=None, is_future=None, exclude_status=None, status=None, destination=None, page_size=FLIGHTS_PAGE_SIZE):
+    columns = columns or DEFAULT_FLIGHT_COLUMNS
+    flights = iter_flights(columns, pilot, is_future, exclude_status, status, destination, page_size)
+    displayed = display_flight_page(flights, columns, page_size)
+    if not displayed: 
         print("\nNo matching flights found.")
         return None
+    total_displayed = displayed
+    while displayed == page_size:
+        if input("\nPress Enter to show more flights, or type 'q' to stop: ").strip().lower() == "q":
+            break
+        displayed = display_flight_page(flights, columns, page_size)
+        if not displayed:
+            print("\nNo more flights to show.")
+        total_displayed += displayed
+    return total_displayed
+
+# helper function to display the next page of flights from a stream created by 'iter_flights'. Prints up to 'page_size'
+# flights (rendered together by 'render_flights') and returns the number printed - fewer than 'page_size' means the stream 
+# has no more flights
+def display_flight_page(flights, columns, page_size):
+    page = list(islice(flights, page_size))
+    if page:
+        print(render_flights(page, columns))
+    return len(page)
+
+# helper function to render a batch of flights as the text displayed by 'display_flights' - each flight's columns as 
+# 'Name: value' pairs separated by ' | ', followed by a divider line. The departure and arrival time columns (found by name
+# with 'find_time_columns') of the whole batch are formatted first, one column at a time, then every flight is rendered with
+# a single template built once for the batch, which reads the other values straight from the flight's tuple rather than copying it
+def render_flights(flights, columns):
     column_names = format_column_names(columns)
-    for flight in flights: 
-        flight = format_flight_times(flight, departure_time_index, arrival_time_index)
-        print(" | ".join(f"{column_names[i]}: {flight[i]}" for i in range(len(columns))))
-        print("-" * 50)
-    return flights
+    departure_time_index, arrival_time_index = find_time_columns(columns)
+    fields = []
+    for i, name in enumerate(column_names):
+        if i == departure_time_index:
+            fields.append(f"{name}: {{departure_time}}")
+        elif i == arrival_time_index:
+            fields.append(f"{name}: {{arrival_time}}")
+        else:
+            fields.append(f"{name}: {{0[{i}]}}")
+    template = " | ".join(fields) + "\n" + "-" * 50
+    departure_times = format_db_times(flights, departure_time_index)
+    arrival_times = format_db_times(flights, arrival_time_index)
+    return "\n".join(
+        template.format(flight, departure_time=departure_time, arrival_time=arrival_time)
+        for flight, departure_time, arrival_time in zip(flights, departure_times, arrival_times)
+    )
 
 # helper funtion to format the column names passed into, or defined in, 'display_flights' to enable the column names to be dynamically
 # formatted so they can be displayed in a readable format
@@ -215,17 +429,24 @@ def format_column_names(columns):
         formatted_names.append(name)
     return formatted_names
 
-# helper function to convert the departure and arrival time of flights to a user-friendly format. 
-# Acccpets the indicies of the flight list where the departure and arrial time are located.
-def format_flight_times(flight, departure_time_index, arrival_time_index):
-     # format the departure time
-    departure_time = datetime.strptime(flight[departure_time_index], db_date_format)
-    formatted_departure_time = departure_time.strftime(date_format) + " GMT"
-    # format the arrival time
-    arrival_time = datetime.strptime(flight[arrival_time_index], db_date_format)
-    formatted_arrival_time = arrival_time.strftime(date_format) + " GMT"
-    # replace the original departure_time and arrival_time in the flight list
-    flight = list(flight)
-    flight[departure_time_index] = formatted_departure_time
-    flight[arrival_time_index] = formatted_arrival_time
-    return flight
\ No newline at end of file
+# helper function to find the positions of the departure_time and arrival_time columns in a list of columns (by the name
+# they are selected as), so they can be displayed in a readable format. Either position is None if the column is not selected
+def find_time_columns(columns):
+    names = [column.split(" AS ")[-1].split(".")[-1] for column in columns]
+    return tuple(names.index(name) if name in names else None for name in ("departure_time", "arrival_time"))
+
+# helper function to convert a time stored in the database ('db_date_format') to the user-friendly format ('date_format' 
+# followed by GMT). The database format is fixed width, so the day, month, year and time are sliced straight out of the 
+# string, which gives the same result as parsing and reformatting it with 'strptime' and 'strftime' at a fraction of the
+# cost. Any other value falls back to 'strptime' and 'strftime'
+def format_db_time(value):
+    if len(value) == 19 and value[4] == value[7] == "-" and value[10] == " " and value[13] == value[16] == ":":
+        return f"{value[8:10]}-{value[5:7]}-{value[:4]} {value[11:16]} GMT"
+    return datetime.strptime(value, db_date_format).strftime(date_format) + " GMT"
+
+# helper function to format one time column of a batch of flights. Accepts the flights and the index of the column, and
+# returns a list of the formatted times in the same order (or a list of None values if no index is provided)
+def format_db_times(flights, index):
+    if index is None:
+        return [None] * len(flights)
+    return [format_db_time(flight[index]) for flight in flights]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from database_queries import update_flight_status
+from database_queries import start_flight_status_updates
 from destinations import display_destinations_menu
 from flights import display_flights_menu
 from pilots import display_pilots_menu
@@ -13,9 +13,10 @@ main_menu = {
     "4": ("Exit", lambda: (clear_console(), print("Exiting..."), exit()))
 }
 
-# call 'update_flight_status' to update any flights with a departure date in the past and a status of 
-# 'scheduled' to have a status of 'departed'
-update_flight_status()
+# call 'start_flight_status_updates' to update any flights with a departure date in the past and a status of 
+# 'scheduled' to have a status of 'departed'. Runs in the background and repeats periodically, so flights
+# departing while the program is open are also updated
+start_flight_status_updates()
 
 # call 'create_menu' to start the program - displays the main menu and handles user choices
 create_menu(main_menu)
@@ -1,5 +1,7 @@
 import os
 
+from database import is_read_only, replica_status
+
 # function to clear the console to enhance userability of the menu system
 def clear_console():
     """Clear the console screen."""
@@ -10,14 +12,34 @@ def clear_console():
     else:
         os.system('clear')
 
+# decorator to mark a menu action which changes the database. In read-only replica mode (see 'database.configure_replica')
+# these actions are shown as unavailable and cannot be chosen
+def writes_to_database(action):
+    action.writes_to_database = True
+    return action
+
+# helper function to check whether a menu action is unavailable because it changes the database and the system is
+# running as a read-only replica
+def is_unavailable(action):
+    return is_read_only() and getattr(action, "writes_to_database", False)
+
 # function to display a menu - accepts a dictionary and prints the heading, the 
-# numbers of the menu items and the name of the menu items
+# numbers of the menu items and the name of the menu items. In read-only replica mode, also prints how far
+# behind the primary database the replica is, and marks the items which make changes as unavailable
 def display_menu(menu):
     print(f"\n{menu['heading']}\n")
+    if is_read_only():
+        status = replica_status()
+        if status["refreshed_at"]:
+            print(f"Read-only replica - data as of {status['refreshed_at']} GMT ({round(status['lag_seconds'] / 60)} minutes behind)\n")
+        else:
+            print("Read-only replica - changes are disabled\n")
     for key, value in menu.items():
         if key != ["heading"]:
             if isinstance(value, tuple):
                 label, func = value
+                if is_unavailable(func):
+                    label += " (unavailable - read-only replica)"
                 print(f"{key}. {label}" )
 
 # function to create a menu and process user input to select an option. Accpets a 
@@ -31,7 +53,10 @@ def create_menu(menu, previous_menu=None):
     while True:
         display_menu(menu)
         choice = input("\nEnter the corresponding menu number to make a choice: ")
-        if choice in menu:
+        if choice in menu and is_unavailable(menu[choice][1]):
+            clear_console()
+            print(f"Your input: {choice}\nThis option makes changes, so is unavailable on a read-only replica.")
+        elif choice in menu:
             menu[choice][1]()
             if previous_menu is None:
                 break
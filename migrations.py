@@ -0,0 +1,605 @@
+import argparse
+import sqlite3
+
+from database import get_connection, is_read_only, transaction
+
+# create a pilots table where each row must not be null and the
+# licence number must be unique
+CREATE_PILOTS_TABLE = '''CREATE TABLE IF NOT EXISTS pilots (
+    pilot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(30) NOT NULL,
+    last_name VARCHAR(30) NOT NULL,
+    licence_number VARCHAR(20) UNIQUE NOT NULL
+)'''
+
+# create a destinations table where each city and country combination must only exist once
+CREATE_DESTINATIONS_TABLE = '''CREATE TABLE IF NOT EXISTS destinations (
+    destination_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    city VARCHAR(50) NOT NULL,
+    country VARCHAR(50) NOT NULL,
+    UNIQUE (city, country)
+)'''
+
+# create an airports table with a foreign key referencing the destinations table - every
+# airport must be linked to a destination
+CREATE_AIRPORTS_TABLE = '''CREATE TABLE IF NOT EXISTS airports (
+    airport_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    airport_name VARCHAR(100) NOT NULL,
+    iata_code VARCHAR(10) UNIQUE NOT NULL,
+    destination_id INT NOT NULL,
+    FOREIGN KEY (destination_id) REFERENCES destinations(destination_id)
+)'''
+
+# create a flights table where the status must be one of the specified options and
+# the arrival time must be after the departure time. Foreign key constraints used to
+# ensure the departure and arrival airport IDs and the pilot IDs reference entries in
+# the airports and pilots tables, respectively.
+CREATE_FLIGHTS_TABLE = '''CREATE TABLE IF NOT EXISTS flights (
+    flight_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    flight_number VARCHAR(8) NOT NULL,
+    departure_airport_id INTEGER,
+    arrival_airport_id INTEGER,
+    pilot_id INTEGER,
+    departure_time DATETIME,
+    arrival_time DATETIME,
+    status VARCHAR(10) CHECK (status IN ('scheduled', 'cancelled', 'departed')),
+    FOREIGN KEY (departure_airport_id) REFERENCES airports(airport_id),
+    FOREIGN KEY (arrival_airport_id) REFERENCES airports(airport_id),
+    FOREIGN KEY (pilot_id) REFERENCES pilots(pilot_id),
+    CHECK (arrival_time > departure_time),
+    CHECK (arrival_airport_id <> departure_airport_id)
+)'''
+
+# create a trigger to update the status of each new entry inserted into the flights table
+# based on the flight's departure_date. If the departure_date was in the past, the flight stauts will
+# default to 'departed' and a flight with a departure_date in the future will be assigned a status
+# of 'scheduled'. Although users are not permitted to select a past departure time,
+# this approch prevents a flight with a departure time in the past being set to scheduled as would happen if
+# the status was directly added during the 'INSERT' query and the user entered a departure_time only a few seconds
+# ahead of the current time.
+CREATE_FLIGHT_STATUS_TRIGGER = '''CREATE TRIGGER IF NOT EXISTS handle_flight_status_on_insert
+AFTER INSERT ON flights
+FOR EACH ROW
+BEGIN
+    UPDATE flights
+    SET status = CASE
+      WHEN NEW.departure_time < CURRENT_TIMESTAMP THEN 'departed'
+      ELSE 'scheduled'
+    END
+    WHERE flight_id = NEW.flight_id;
+END'''
+
+# recreate the flight status trigger so it only runs for flights inserted without a status. Flights inserted
+# with a status already set (such as by the bulk import, which works out the status of each flight itself)
+# keep the status provided, avoiding an extra UPDATE for every inserted row
+RECREATE_FLIGHT_STATUS_TRIGGER = [
+    "DROP TRIGGER IF EXISTS handle_flight_status_on_insert",
+    '''CREATE TRIGGER handle_flight_status_on_insert
+AFTER INSERT ON flights
+FOR EACH ROW WHEN NEW.status IS NULL
+BEGIN
+    UPDATE flights
+    SET status = CASE
+      WHEN NEW.departure_time < CURRENT_TIMESTAMP THEN 'departed'
+      ELSE 'scheduled'
+    END
+    WHERE flight_id = NEW.flight_id;
+END''',
+]
+
+# create the tables used to allocate flight numbers. Every flight number in use is registered in 'flight_numbers', whose
+# primary key ensures no number is allocated twice (existing flight numbers are registered when the table is created), and
+# 'flight_number_sequences' holds the next number to allocate for each airline code. Flight numbers are also indexed on the
+# flights table for lookups - the index cannot be unique as flights created before the allocator may share a number
+CREATE_FLIGHT_NUMBER_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS flight_numbers (
+    flight_number VARCHAR(8) PRIMARY KEY
+) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS flight_number_sequences (
+    airline_code VARCHAR(2) PRIMARY KEY,
+    next_number INTEGER NOT NULL
+)''',
+    "INSERT OR IGNORE INTO flight_numbers (flight_number) SELECT DISTINCT flight_number FROM flights",
+    "CREATE INDEX IF NOT EXISTS idx_flights_flight_number ON flights (flight_number)",
+]
+
+# create a table holding a version number for each reference table (pilots, airports and destinations), and triggers
+# which increase the version whenever a row in the table is inserted, updated or deleted. Used by 'reference_cache'
+# to tell which cached tables have been changed by another program
+REFERENCE_TABLES = ("pilots", "airports", "destinations")
+CREATE_TABLE_VERSIONS = ['''CREATE TABLE IF NOT EXISTS table_versions (
+    table_name VARCHAR(30) PRIMARY KEY,
+    version INTEGER NOT NULL
+)'''] + [
+    f'''CREATE TRIGGER IF NOT EXISTS {table}_version_on_{event.lower()}
+AFTER {event} ON {table}
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = version + 1;
+END'''
+    for table in REFERENCE_TABLES for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+# create summary tables holding the number of flights departing from and arriving at each airport (in total and on each
+# day) and the number of airports in each country, so the airport and country dashboards read one row per airport or
+# country instead of grouping every flight. Like the queries they replace, every flight is counted whatever its status.
+# The tables are kept up to date by triggers on the flights, airports and destinations tables, so every write path
+# (including the bulk import and other programs) maintains them; 'rebuild_traffic_counters' recalculates them from scratch
+CREATE_TRAFFIC_COUNTER_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS airport_traffic (
+    airport_id INTEGER PRIMARY KEY,
+    departures INTEGER NOT NULL DEFAULT 0,
+    arrivals INTEGER NOT NULL DEFAULT 0
+)''',
+    '''CREATE TABLE IF NOT EXISTS airport_daily_traffic (
+    airport_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    departures INTEGER NOT NULL DEFAULT 0,
+    arrivals INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (airport_id, day)
+) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS country_airports (
+    country VARCHAR(50) PRIMARY KEY,
+    airport_count INTEGER NOT NULL DEFAULT 0
+)''',
+]
+
+# helper function to build the statements of a trigger which add 'change' (1 or -1) to the traffic counters of a flight.
+# 'row' is NEW or OLD. Flights without an airport are skipped, and days left with no flights are removed
+def _traffic_counter_statements(row, change):
+    return f'''
+    INSERT INTO airport_traffic (airport_id, departures, arrivals)
+    SELECT {row}.departure_airport_id, {change}, 0 WHERE {row}.departure_airport_id IS NOT NULL
+    ON CONFLICT (airport_id) DO UPDATE SET departures = departures + excluded.departures;
+    INSERT INTO airport_traffic (airport_id, departures, arrivals)
+    SELECT {row}.arrival_airport_id, 0, {change} WHERE {row}.arrival_airport_id IS NOT NULL
+    ON CONFLICT (airport_id) DO UPDATE SET arrivals = arrivals + excluded.arrivals;
+    INSERT INTO airport_daily_traffic (airport_id, day, departures, arrivals)
+    SELECT {row}.departure_airport_id, date({row}.departure_time), {change}, 0 WHERE {row}.departure_airport_id IS NOT NULL
+    ON CONFLICT (airport_id, day) DO UPDATE SET departures = departures + excluded.departures;
+    INSERT INTO airport_daily_traffic (airport_id, day, departures, arrivals)
+    SELECT {row}.arrival_airport_id, date({row}.arrival_time), 0, {change} WHERE {row}.arrival_airport_id IS NOT NULL
+    ON CONFLICT (airport_id, day) DO UPDATE SET arrivals = arrivals + excluded.arrivals;''' + (f'''
+    DELETE FROM airport_daily_traffic WHERE departures = 0 AND arrivals = 0
+    AND ((airport_id = {row}.departure_airport_id AND day = date({row}.departure_time))
+        OR (airport_id = {row}.arrival_airport_id AND day = date({row}.arrival_time)));''' if change < 0 else "")
+
+# triggers which keep the summary tables up to date. A flight's counts are removed when it is deleted or its airports or
+# times change, and added when it is inserted or after the change. Every airport has a row in 'airport_traffic' (so airports
+# without flights are shown with a count of 0), and every country with a destination has a row in 'country_airports'
+CREATE_TRAFFIC_COUNTER_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS traffic_on_flight_insert
+AFTER INSERT ON flights
+BEGIN{_traffic_counter_statements("NEW", 1)}
+END''',
+    f'''CREATE TRIGGER IF NOT EXISTS traffic_on_flight_delete
+AFTER DELETE ON flights
+BEGIN{_traffic_counter_statements("OLD", -1)}
+END''',
+    f'''CREATE TRIGGER IF NOT EXISTS traffic_on_flight_update
+AFTER UPDATE OF departure_airport_id, arrival_airport_id, departure_time, arrival_time ON flights
+WHEN OLD.departure_airport_id IS NOT NEW.departure_airport_id OR OLD.arrival_airport_id IS NOT NEW.arrival_airport_id
+    OR date(OLD.departure_time) IS NOT date(NEW.departure_time) OR date(OLD.arrival_time) IS NOT date(NEW.arrival_time)
+BEGIN{_traffic_counter_statements("OLD", -1)}{_traffic_counter_statements("NEW", 1)}
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_airport_insert
+AFTER INSERT ON airports
+BEGIN
+    INSERT OR IGNORE INTO airport_traffic (airport_id) VALUES (NEW.airport_id);
+    UPDATE country_airports SET airport_count = airport_count + 1
+    WHERE country = (SELECT country FROM destinations WHERE destination_id = NEW.destination_id);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_airport_delete
+AFTER DELETE ON airports
+BEGIN
+    DELETE FROM airport_traffic WHERE airport_id = OLD.airport_id;
+    DELETE FROM airport_daily_traffic WHERE airport_id = OLD.airport_id;
+    UPDATE country_airports SET airport_count = airport_count - 1
+    WHERE country = (SELECT country FROM destinations WHERE destination_id = OLD.destination_id);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_airport_update
+AFTER UPDATE OF destination_id ON airports
+WHEN OLD.destination_id IS NOT NEW.destination_id
+BEGIN
+    UPDATE country_airports SET airport_count = airport_count - 1
+    WHERE country = (SELECT country FROM destinations WHERE destination_id = OLD.destination_id);
+    UPDATE country_airports SET airport_count = airport_count + 1
+    WHERE country = (SELECT country FROM destinations WHERE destination_id = NEW.destination_id);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_destination_insert
+AFTER INSERT ON destinations
+BEGIN
+    INSERT OR IGNORE INTO country_airports (country, airport_count) VALUES (NEW.country, 0);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_destination_update
+AFTER UPDATE OF country ON destinations
+WHEN OLD.country IS NOT NEW.country
+BEGIN
+    INSERT OR IGNORE INTO country_airports (country, airport_count) VALUES (NEW.country, 0);
+    UPDATE country_airports SET airport_count = airport_count + (SELECT COUNT(*) FROM airports WHERE destination_id = NEW.destination_id)
+    WHERE country = NEW.country;
+    UPDATE country_airports SET airport_count = airport_count - (SELECT COUNT(*) FROM airports WHERE destination_id = NEW.destination_id)
+    WHERE country = OLD.country;
+    DELETE FROM country_airports WHERE country = OLD.country AND NOT EXISTS (SELECT 1 FROM destinations WHERE country = OLD.country);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS traffic_on_destination_delete
+AFTER DELETE ON destinations
+BEGIN
+    DELETE FROM country_airports WHERE country = OLD.country AND NOT EXISTS (SELECT 1 FROM destinations WHERE country = OLD.country);
+END''',
+]
+
+# statements which recalculate the summary tables from the flights, airports and destinations tables
+REBUILD_TRAFFIC_COUNTERS = [
+    "DELETE FROM airport_traffic",
+    "DELETE FROM airport_daily_traffic",
+    "DELETE FROM country_airports",
+    '''INSERT INTO airport_traffic (airport_id, departures, arrivals)
+    SELECT a.airport_id,
+        (SELECT COUNT(*) FROM flights WHERE departure_airport_id = a.airport_id),
+        (SELECT COUNT(*) FROM flights WHERE arrival_airport_id = a.airport_id)
+    FROM airports AS a''',
+    '''INSERT INTO airport_daily_traffic (airport_id, day, departures, arrivals)
+    SELECT airport_id, day, SUM(departures), SUM(arrivals) FROM (
+        SELECT departure_airport_id AS airport_id, date(departure_time) AS day, 1 AS departures, 0 AS arrivals
+        FROM flights WHERE departure_airport_id IS NOT NULL
+        UNION ALL
+        SELECT arrival_airport_id, date(arrival_time), 0, 1
+        FROM flights WHERE arrival_airport_id IS NOT NULL
+    )
+    GROUP BY airport_id, day''',
+    '''INSERT INTO country_airports (country, airport_count)
+    SELECT d.country, COUNT(a.airport_id)
+    FROM destinations AS d
+    LEFT JOIN airports AS a ON d.destination_id = a.destination_id
+    GROUP BY d.country''',
+]
+
+# secondary indexes for the flight queries. 'departure_time' serves the ordering and 'is_future' filter
+# in 'build_flights_query'; (pilot_id, departure_time, arrival_time) covers the pilot availability check and
+# a pilot's schedule; (status, departure_time) serves status listings and the flight status update; the
+# airport indexes serve the joins and GROUP BYs behind the airport flight counts
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_flights_departure_time ON flights (departure_time)",
+    "CREATE INDEX IF NOT EXISTS idx_flights_pilot_times ON flights (pilot_id, departure_time, arrival_time)",
+    "CREATE INDEX IF NOT EXISTS idx_flights_status_departure ON flights (status, departure_time)",
+    "CREATE INDEX IF NOT EXISTS idx_flights_departure_airport ON flights (departure_airport_id)",
+    "CREATE INDEX IF NOT EXISTS idx_flights_arrival_airport ON flights (arrival_airport_id)",
+    "CREATE INDEX IF NOT EXISTS idx_airports_destination ON airports (destination_id)",
+]
+
+# create a table to store small pieces of system state as key/value pairs, such as the point up to which
+# flight statuses have been updated
+CREATE_APP_STATE_TABLE = '''CREATE TABLE IF NOT EXISTS app_state (
+    key VARCHAR(50) PRIMARY KEY,
+    value TEXT
+)'''
+
+# migration to rename the 'license_number' column created by earlier versions of the pilots table to
+# 'licence_number', the name used by the rest of the system. Does nothing if the column is already named correctly
+def rename_licence_number_column(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(pilots)")]
+    if "license_number" in columns and "licence_number" not in columns:
+        conn.execute("ALTER TABLE pilots RENAME COLUMN license_number TO licence_number")
+
+# migration to add each flight's duration in minutes to the flights table, as a virtual generated column calculated from
+# its departure and arrival times, with an index. The index stores the durations in order, so the longest or shortest
+# flights, or those within a range of durations, are read straight from it without calculating and sorting the duration of
+# every flight. 'PRAGMA table_xinfo' is used to check whether the column exists, as 'table_info' omits generated columns
+def add_duration_column(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_xinfo(flights)")]
+    if "duration_minutes" not in columns:
+        conn.execute('''ALTER TABLE flights ADD COLUMN duration_minutes INTEGER
+    GENERATED ALWAYS AS (CAST(ROUND((julianday(arrival_time) - julianday(departure_time)) * 1440) AS INTEGER)) VIRTUAL''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_flights_duration ON flights (duration_minutes)")
+
+# create a full-text index over the city, country, airport name and IATA code of every airport (with the airport's ID as
+# its rowid), used to search for destinations. The trigram tokenizer indexes every three character sequence, so a search
+# for any part of a name (not just its start) is answered from the index instead of scanning every destination with
+# 'LIKE '%...%''. Triggers keep the index in step with the airports and destinations tables
+CREATE_DESTINATION_SEARCH_TABLE = '''CREATE VIRTUAL TABLE IF NOT EXISTS destination_search
+USING fts5(city, country, airport_name, iata_code, tokenize = 'trigram')'''
+CREATE_DESTINATION_SEARCH_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS destination_search_on_airport_insert
+AFTER INSERT ON airports
+BEGIN
+    INSERT INTO destination_search (rowid, city, country, airport_name, iata_code)
+    SELECT NEW.airport_id, city, country, NEW.airport_name, NEW.iata_code FROM destinations WHERE destination_id = NEW.destination_id;
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS destination_search_on_airport_update
+AFTER UPDATE OF airport_name, iata_code, destination_id ON airports
+BEGIN
+    DELETE FROM destination_search WHERE rowid = OLD.airport_id;
+    INSERT INTO destination_search (rowid, city, country, airport_name, iata_code)
+    SELECT NEW.airport_id, city, country, NEW.airport_name, NEW.iata_code FROM destinations WHERE destination_id = NEW.destination_id;
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS destination_search_on_airport_delete
+AFTER DELETE ON airports
+BEGIN
+    DELETE FROM destination_search WHERE rowid = OLD.airport_id;
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS destination_search_on_destination_update
+AFTER UPDATE OF city, country ON destinations
+BEGIN
+    UPDATE destination_search SET city = NEW.city, country = NEW.country
+    WHERE rowid IN (SELECT airport_id FROM airports WHERE destination_id = NEW.destination_id);
+END''',
+]
+
+# migration to create the destination search index and fill it from the existing airports. If SQLite was built without
+# FTS5 or its trigram tokenizer the index is not created, and destination searches fall back to 'LIKE' (see
+# 'destinations_helpers.build_destination_search')
+def create_destination_search(conn):
+    try:
+        conn.execute(CREATE_DESTINATION_SEARCH_TABLE)
+    except sqlite3.OperationalError:
+        return
+    for statement in CREATE_DESTINATION_SEARCH_TRIGGERS:
+        conn.execute(statement)
+    conn.execute("DELETE FROM destination_search")
+    conn.execute('''
+        INSERT INTO destination_search (rowid, city, country, airport_name, iata_code)
+        SELECT a.airport_id, d.city, d.country, a.airport_name, a.iata_code
+        FROM airports AS a JOIN destinations AS d ON a.destination_id = d.destination_id
+    ''')
+
+# table of the conflicts found in the pilots' schedules - overlapping flights, turnarounds shorter than the minimum and
+# consecutive flights where the pilot departs from a different airport to the one they last arrived at. Each row links
+# a flight to the earlier flight it conflicts with. Maintained by 'conflicts.scan_conflicts', in full or a pilot at a time,
+# which fills it with the conflicts in the existing flights when it is first used
+CREATE_PILOT_CONFLICTS_TABLE = [
+    '''CREATE TABLE IF NOT EXISTS pilot_conflicts (
+    pilot_id INTEGER NOT NULL REFERENCES pilots (pilot_id) ON DELETE CASCADE,
+    conflict_type TEXT NOT NULL CHECK (conflict_type IN ('overlap', 'short_turnaround', 'airport_mismatch')),
+    flight_id INTEGER NOT NULL REFERENCES flights (flight_id),
+    other_flight_id INTEGER NOT NULL REFERENCES flights (flight_id),
+    detail TEXT NOT NULL,
+    found_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)''',
+    "CREATE INDEX IF NOT EXISTS idx_pilot_conflicts_pilot ON pilot_conflicts (pilot_id)",
+    "CREATE INDEX IF NOT EXISTS idx_pilot_conflicts_flight ON pilot_conflicts (flight_id)",
+]
+
+
+# table recording the flights changed since they were inserted, for the incremental export of the flights snapshot (see
+# 'snapshot_export'). Each update or deletion of a flight gives it the next change number, so the export reads only the
+# flights changed since its last run from the 'change_seq' index; new flights are found from their (never reused) IDs.
+# The update trigger is recreated by 'RECREATE_FLIGHT_CHANGES_UPDATE_TRIGGER' so that flights inserted without a status
+# are not recorded as changed too
+CREATE_FLIGHT_CHANGES_TABLE = [
+    '''CREATE TABLE IF NOT EXISTS flight_changes (
+    flight_id INTEGER PRIMARY KEY,
+    change_seq INTEGER NOT NULL
+)''',
+    "CREATE INDEX IF NOT EXISTS idx_flight_changes_seq ON flight_changes (change_seq)",
+] + [
+    f'''CREATE TRIGGER IF NOT EXISTS flight_changes_on_{event.lower()}
+AFTER {event} ON flights
+BEGIN
+    INSERT INTO flight_changes (flight_id, change_seq)
+    VALUES ({row}.flight_id, (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM flight_changes))
+    ON CONFLICT (flight_id) DO UPDATE SET change_seq = excluded.change_seq;
+END'''
+    for event, row in (("UPDATE", "NEW"), ("DELETE", "OLD"))
+]
+
+# recreate the trigger recording updated flights so it ignores the UPDATE made by 'handle_flight_status_on_insert', which sets
+# the status of a flight inserted without one - the only time a flight's status is NULL. Otherwise every such insert also
+# wrote a 'flight_changes' row, and the new flight was exported again by the next incremental export. Existing rows are
+# kept, as the flights version (see 'reference_cache.FLIGHTS_VERSION_QUERY') must never go down
+RECREATE_FLIGHT_CHANGES_UPDATE_TRIGGER = [
+    "DROP TRIGGER IF EXISTS flight_changes_on_update",
+    '''CREATE TRIGGER flight_changes_on_update
+AFTER UPDATE ON flights
+FOR EACH ROW WHEN OLD.status IS NOT NULL
+BEGIN
+    INSERT INTO flight_changes (flight_id, change_seq)
+    VALUES (NEW.flight_id, (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM flight_changes))
+    ON CONFLICT (flight_id) DO UPDATE SET change_seq = excluded.change_seq;
+END''',
+]
+
+# create the table of recurring flight schedules, each defining a flight flown on some days of the week at the same time
+# over a range of dates, and link the flights created from a schedule (its occurrences) to it. 'days_of_week' is a bit mask
+# with Monday as bit 0, and 'materialized_until' is the last day up to which the schedule's occurrences have been added to
+# the flights table (see 'recurring_schedules'). Occurrences are found by schedule and departure time from an index
+def create_flight_schedules(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS flight_schedules (
+    schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    flight_number VARCHAR(8) NOT NULL,
+    departure_airport_id INTEGER NOT NULL,
+    arrival_airport_id INTEGER NOT NULL,
+    days_of_week INTEGER NOT NULL CHECK (days_of_week BETWEEN 1 AND 127),
+    departure_time CHAR(5) NOT NULL,
+    duration_minutes INTEGER NOT NULL CHECK (duration_minutes > 0),
+    valid_from DATE NOT NULL,
+    valid_to DATE NOT NULL,
+    materialized_until DATE,
+    FOREIGN KEY (departure_airport_id) REFERENCES airports(airport_id),
+    FOREIGN KEY (arrival_airport_id) REFERENCES airports(airport_id),
+    CHECK (arrival_airport_id <> departure_airport_id)
+)''')
+    columns = [column[1] for column in conn.execute("PRAGMA table_xinfo(flights)")]
+    if "schedule_id" not in columns:
+        conn.execute("ALTER TABLE flights ADD COLUMN schedule_id INTEGER REFERENCES flight_schedules(schedule_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_flights_schedule ON flights (schedule_id, departure_time)")
+
+# list of numbered migrations, applied in order. Each migration is a tuple containing its version number,
+# a description and either a list of SQL statements or a function accepting a connection. Every migration
+# must be idempotent, so it can safely run against a database created before migrations were tracked.
+# New migrations must be appended with the next version number - applied migrations must never be edited
+MIGRATIONS = [
+    (1, "Create pilots, destinations, airports and flights tables", [
+        CREATE_PILOTS_TABLE, CREATE_DESTINATIONS_TABLE, CREATE_AIRPORTS_TABLE, CREATE_FLIGHTS_TABLE
+    ]),
+    (2, "Rename pilots.license_number to licence_number", rename_licence_number_column),
+    (3, "Create trigger to set the status of new flights", [CREATE_FLIGHT_STATUS_TRIGGER]),
+    (4, "Create indexes on flights and airports", CREATE_INDEXES),
+    (5, "Create app_state table", [CREATE_APP_STATE_TABLE]),
+    (6, "Only set the status of flights inserted without one", RECREATE_FLIGHT_STATUS_TRIGGER),
+    (7, "Create flight number allocation tables", CREATE_FLIGHT_NUMBER_TABLES),
+    (8, "Track changes to the reference tables", CREATE_TABLE_VERSIONS),
+    (9, "Create airport and country traffic counters", CREATE_TRAFFIC_COUNTER_TABLES + CREATE_TRAFFIC_COUNTER_TRIGGERS + REBUILD_TRAFFIC_COUNTERS),
+    (10, "Add indexed flights.duration_minutes column", add_duration_column),
+    (11, "Create destination search index", create_destination_search),
+    (12, "Create pilot_conflicts table", CREATE_PILOT_CONFLICTS_TABLE),
+    (13, "Track changed flights for the snapshot export", CREATE_FLIGHT_CHANGES_TABLE),
+    (14, "Create flight_schedules table and flights.schedule_id", create_flight_schedules),
+    (15, "Do not record flights inserted without a status as changed", RECREATE_FLIGHT_CHANGES_UPDATE_TRIGGER),
+]
+
+# function to bring the database schema up to date. Creates the 'schema_version' table if needed, then
+# applies each migration that has not yet been recorded there. Each migration runs in its own immediate
+# transaction together with its 'schema_version' entry, so a failed migration leaves no partial changes and
+# concurrent callers cannot apply the same migration twice. The applied versions are read up front, so when the schema is
+# already up to date (as on every start up after the first) no write lock is taken. A read-only replica leaves the schema
+# to the primary and applies nothing. Returns the list of versions applied
+def run_migrations():
+    if is_read_only():
+        return []
+    with transaction() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''')
+        recorded = {version for (version,) in conn.execute("SELECT version FROM schema_version")}
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version in recorded:
+            continue
+        with transaction(immediate=True) as conn:
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                continue
+            if callable(migration):
+                migration(conn)
+            else:
+                for statement in migration:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+        applied.append(version)
+    return applied
+
+# function to return the version of the most recent migration applied to the database, or 0 if none have been applied
+def get_schema_version():
+    with get_connection() as conn:
+        table = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+        if not table:
+            return 0
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+# function to recalculate the airport and country traffic counters from the flights, airports and destinations tables, in
+# one immediate transaction. The triggers keep the counters up to date, so this is only needed to repair them
+def rebuild_traffic_counters():
+    with transaction(immediate=True) as conn:
+        for statement in REBUILD_TRAFFIC_COUNTERS:
+            conn.execute(statement)
+
+# function to populate the database with sample data. Destinations, airports and pilots are inserted with
+# 'INSERT OR IGNORE' so existing entries are kept, and the sample flights are only added to an empty flights
+# table. The airport and flight IDs below assume the sample destinations, airports and pilots were the first
+# entries added to a new database
+def seed_sample_data():
+    with transaction() as conn:
+        conn.execute('''INSERT OR IGNORE INTO destinations (city, country)
+VALUES
+    ('New York', 'USA'),
+    ('Los Angeles', 'USA'),
+    ('London', 'UK'),
+    ('Paris', 'France'),
+    ('Tokyo', 'Japan'),
+    ('Berlin', 'Germany'),
+    ('Sydney', 'Australia'),
+    ('Rome', 'Italy'),
+    ('Toronto', 'Canada'),
+    ('Madrid', 'Spain'),
+    ('Dubai', 'UAE'),
+    ('Bangkok', 'Thailand'),
+    ('Moscow', 'Russia'),
+    ('Cairo', 'Egypt'),
+    ('Amsterdam', 'Netherlands'),
+    ('Mexico City', 'Mexico'),
+    ('Singapore', 'Singapore'),
+    ('Cape Town', 'South Africa'),
+    ('Rio de Janeiro', 'Brazil'),
+    ('Mumbai', 'India')
+''')
+        conn.execute('''INSERT OR IGNORE INTO airports (airport_name, iata_code, destination_id)
+VALUES
+    ('John F. Kennedy International Airport', 'JFK', 1),  -- New York
+    ('LaGuardia Airport', 'LGA', 1),  -- New York
+    ('Los Angeles International Airport', 'LAX', 2),  -- Los Angeles
+    ('San Francisco International Airport', 'SFO', 2),  -- Los Angeles
+    ('London Heathrow Airport', 'LHR', 3),  -- London
+    ('London Gatwick Airport', 'LGW', 3),  -- London
+    ('Charles de Gaulle Airport', 'CDG', 4),  -- Paris
+    ('Tokyo International Airport', 'HND', 5),  -- Tokyo
+    ('Berlin Brandenburg Airport', 'BER', 6),  -- Berlin
+    ('Sydney Kingsford Smith Airport', 'SYD', 7),  -- Sydney
+    ('Rome Fiumicino Airport', 'FCO', 8),  -- Rome
+    ('Toronto Pearson International Airport', 'YYZ', 9),  -- Toronto
+    ('Adolfo Suárez Madrid–Barajas Airport', 'MAD', 10),  -- Madrid
+    ('Dubai International Airport', 'DXB', 11),  -- Dubai
+    ('Suvarnabhumi Airport', 'BKK', 12),  -- Bangkok
+    ('Sheremetyevo International Airport', 'SVO', 13),  -- Moscow
+    ('Cairo International Airport', 'CAI', 14),  -- Cairo
+    ('Amsterdam Schiphol Airport', 'AMS', 15),  -- Amsterdam
+    ('Mexico City International Airport', 'MEX', 16),  -- Mexico City
+    ('Singapore Changi Airport', 'SIN', 17),  -- Singapore
+    ('Cape Town International Airport', 'CPT', 18),  -- Cape Town
+    ('Rio de Janeiro-Galeão International Airport', 'GIG', 19),  -- Rio de Janeiro
+    ('Chhatrapati Shivaji Maharaj International Airport', 'BOM', 20)  -- Mumbai
+''')
+        conn.execute('''INSERT OR IGNORE INTO pilots (first_name, last_name, licence_number)
+VALUES
+    ('John', 'Doe', 'LIC123456'),
+    ('Jane', 'Smith', 'LIC987654'),
+    ('Robert', 'Johnson', 'LIC112233'),
+    ('Emily', 'Brown', 'LIC445566'),
+    ('Michael', 'Davis', 'LIC778899'),
+    ('Sarah', 'Miller', 'LIC998877'),
+    ('David', 'Wilson', 'LIC223344'),
+    ('Daniel', 'Moore', 'LIC334455'),
+    ('Olivia', 'Taylor', 'LIC556677'),
+    ('James', 'Anderson', 'LIC667788')
+''')
+        if conn.execute("SELECT COUNT(*) FROM flights").fetchone()[0] > 0:
+            return
+        conn.execute('''INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status)
+VALUES
+    ('NY100', 1, 2, 1, '2025-02-01 10:00:00', '2025-02-01 13:00:00', 'scheduled'),  -- John F. Kennedy International Airport -> LaGuardia Airport (Pilot 1)
+    ('LA200', 3, 4, 2, '2025-03-02 14:00:00', '2025-03-02 17:00:00', 'scheduled'),  -- Los Angeles International Airport -> San Francisco International Airport (Pilot 2)
+    ('LD300', 5, 6, 3, '2025-03-03 09:00:00', '2025-03-03 11:30:00', 'scheduled'),  -- London Heathrow Airport -> London Gatwick Airport (Pilot 3)
+    ('TP400', 7, 8, NULL, '2025-03-04 16:00:00', '2025-03-04 19:30:00', 'scheduled'),  -- Charles de Gaulle Airport -> Tokyo International Airport (Pilot 4)
+    ('BR500', 9, 10, 5, '2025-03-05 20:00:00', '2025-03-06 02:00:00', 'scheduled'),  -- Berlin Brandenburg Airport -> Sydney Kingsford Smith Airport (Pilot 5)
+    ('SY600', 11, 12, 6, '2025-03-06 08:00:00', '2025-03-06 12:00:00', 'scheduled'),  -- Rome Fiumicino Airport -> Toronto Pearson International Airport (Pilot 6)
+    ('RO700', 13, 14, 7, '2025-03-07 09:00:00', '2025-03-07 11:00:00', 'scheduled'),  -- Adolfo Suárez Madrid–Barajas Airport -> Dubai International Airport (Pilot 7)
+    ('FM800', 15, 16, 8, '2025-04-08 14:00:00', '2025-04-08 18:00:00', 'scheduled'),  -- Suvarnabhumi Airport -> Sheremetyevo International Airport (Pilot 8)
+    ('DC900', 17, 18, 9, '2025-04-09 07:00:00', '2025-04-09 10:00:00', 'scheduled'),  -- Cairo International Airport -> Amsterdam Schiphol Airport (Pilot 9)
+    ('AS1000', 19, 20, 10, '2025-04-10 16:00:00', '2025-04-10 20:00:00', 'scheduled'),  -- Mexico City International Airport -> Singapore Changi Airport (Pilot 10)
+    ('RS1100', 21, 22, 1, '2025-04-11 11:00:00', '2025-04-11 14:30:00', 'scheduled'),  -- Cape Town International Airport -> Rio de Janeiro-Galeão International Airport (Pilot 1)
+    ('MX1200', 23, 1, 2, '2025-04-12 09:30:00', '2025-04-12 13:00:00', 'scheduled'),  -- Chhatrapati Shivaji Maharaj International Airport -> John F. Kennedy International Airport (Pilot 2)
+    ('CP1300', 2, 3, 3, '2025-04-13 12:00:00', '2025-04-13 16:00:00', 'scheduled'),  -- LaGuardia Airport -> Los Angeles International Airport (Pilot 3)
+    ('NG1400', 4, 5, 1, '2025-04-14 10:00:00', '2025-04-14 13:00:00', 'scheduled'),  -- San Francisco International Airport -> London Heathrow Airport (Pilot 4)
+    ('SG1500', 6, 7, 5, '2025-04-15 14:00:00', '2025-04-15 18:30:00', 'scheduled'),  -- London Gatwick Airport -> Charles de Gaulle Airport (Pilot 5)
+    ('FM1600', 8, 9, 6, '2025-04-16 18:00:00', '2025-04-16 22:00:00', 'scheduled'),  -- Tokyo International Airport -> Berlin Brandenburg Airport (Pilot 6)
+    ('CA1700', 10, 11, 7, '2025-04-17 07:00:00', '2025-04-17 10:00:00', 'scheduled'),  -- Sydney Kingsford Smith Airport -> Rome Fiumicino Airport (Pilot 7)
+    ('BR1800', 12, 13, 8, '2025-04-18 13:00:00', '2025-04-18 17:00:00', 'scheduled'),  -- Toronto Pearson International Airport -> Adolfo Suárez Madrid–Barajas Airport (Pilot 8)
+    ('LD1900', 14, 15, 9, '2025-05-19 15:00:00', '2025-05-19 19:30:00', 'scheduled'),  -- Dubai International Airport -> Suvarnabhumi Airport (Pilot 9)
+    ('CT2000', 16, 17, 10, '2025-05-20 10:00:00', '2025-05-20 14:00:00', 'scheduled')  -- Sheremetyevo International Airport -> Cairo International Airport (Pilot 10)
+''')
+
+# allows the migrations to be run directly from the command line, e.g. 'python migrations.py --seed'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations for the Flight Management System.")
+    parser.add_argument("--seed", action="store_true", help="populate the database with sample data after migrating")
+    parser.add_argument("--rebuild-counters", action="store_true", help="recalculate the airport and country traffic counters")
+    args = parser.parse_args()
+    applied = run_migrations()
+    print(f"Applied migrations: {', '.join(map(str, applied)) or 'none'}. Schema version: {get_schema_version()}.")
+    if args.seed:
+        seed_sample_data()
+        print("Sample data added.")
+    if args.rebuild_counters:
+        rebuild_traffic_counters()
+        print("Traffic counters rebuilt.")
@@ -0,0 +1,267 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from itertools import starmap
+
+db_date_format = "%Y-%m-%d %H:%M:%S"
+
+# compact records of the flights, airports and pilots held in memory. Each class declares '__slots__', so a record stores
+# its fields in a fixed layout without a per-record dictionary, and its fields are read by name rather than by position
+# in a database row. Times are held as whole seconds since the epoch (the system works in GMT, so no time zone is applied),
+# which compare and subtract as plain integers without parsing the database's text format again
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+
+# helper function to return the current time in GMT, without a time zone. Every time in the database is GMT (as is SQLite's
+# 'CURRENT_TIMESTAMP'), so the current time is always read with this rather than the local clock
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# helper function to convert a time - a datetime, or text in the database's format - to whole seconds since the epoch
+def to_epoch(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return (value.replace(tzinfo=None) - _EPOCH) // _ONE_SECOND
+
+# helper function to convert seconds since the epoch back to a datetime
+def from_epoch(seconds):
+    return _EPOCH + timedelta(seconds=seconds)
+
+# helper function to format seconds since the epoch in the database's text format
+def format_epoch(seconds):
+    return from_epoch(seconds).strftime(db_date_format)
+
+# helper function to return the SQL expression which reads a time column as seconds since the epoch, so times are
+# converted by SQLite as rows are read instead of being parsed in Python
+def epoch_column(column):
+    return f"CAST(strftime('%s', {column}) AS INTEGER)"
+
+# a flight, with its departure and arrival times in seconds since the epoch. 'COLUMNS' selects the fields in order from
+# the flights table (aliased 'f'), for 'from_row' and 'from_cursor'
+class Flight:
+    __slots__ = ("flight_id", "flight_number", "departure_airport_id", "arrival_airport_id", "pilot_id", "departure", "arrival", "status")
+
+    COLUMNS = [
+        "f.flight_id", "f.flight_number", "f.departure_airport_id", "f.arrival_airport_id", "f.pilot_id",
+        epoch_column("f.departure_time"), epoch_column("f.arrival_time"), "f.status",
+    ]
+
+    def __init__(self, flight_id, flight_number, departure_airport_id, arrival_airport_id, pilot_id, departure, arrival, status=None):
+        self.flight_id = flight_id
+        self.flight_number = flight_number
+        self.departure_airport_id = departure_airport_id
+        self.arrival_airport_id = arrival_airport_id
+        self.pilot_id = pilot_id
+        self.departure = departure
+        self.arrival = arrival
+        self.status = status
+
+    # function to create a flight from a row selected with 'COLUMNS'
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    # function to create a list of flights from every row of a cursor (or other iterable of rows) selected with 'COLUMNS'
+    @classmethod
+    def from_cursor(cls, cursor):
+        return list(starmap(cls, cursor))
+
+    @property
+    def departure_time(self):
+        return from_epoch(self.departure)
+
+    @property
+    def arrival_time(self):
+        return from_epoch(self.arrival)
+
+    @property
+    def duration(self):
+        return timedelta(seconds=self.arrival - self.departure)
+
+    def __repr__(self):
+        return f"Flight({self.flight_id}, {self.flight_number!r}, {format_epoch(self.departure)!r})"
+
+# an airport and the destination (city and country) it serves. 'COLUMNS' selects the fields in order from the airports
+# (aliased 'a') and destinations (aliased 'd') tables
+class Airport:
+    __slots__ = ("airport_id", "airport_name", "iata_code", "city", "country")
+
+    COLUMNS = ["a.airport_id", "a.airport_name", "a.iata_code", "d.city", "d.country"]
+
+    def __init__(self, airport_id, airport_name, iata_code, city=None, country=None):
+        self.airport_id = airport_id
+        self.airport_name = airport_name
+        self.iata_code = iata_code
+        self.city = city
+        self.country = country
+
+    # function to create an airport from a row selected with 'COLUMNS'
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __repr__(self):
+        return f"Airport({self.airport_id}, {self.iata_code!r})"
+
+# a pilot. 'COLUMNS' selects the fields in order from the pilots table
+class Pilot:
+    __slots__ = ("pilot_id", "first_name", "last_name", "licence_number")
+
+    COLUMNS = ["pilot_id", "first_name", "last_name", "licence_number"]
+
+    def __init__(self, pilot_id, first_name, last_name, licence_number=None):
+        self.pilot_id = pilot_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.licence_number = licence_number
+
+    # function to create a pilot from a row selected with 'COLUMNS' (or its first three columns)
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    @property
+    def name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return f"Pilot({self.pilot_id}, {self.name!r})"
+
+# a timetable of flights held as columns - one 'array' of machine integers per field, plus a list of flight numbers -
+# sorted by departure time. Each flight costs a few dozen bytes rather than a tuple of objects, and a range of departures
+# is found with a binary search straight over the 'departures' column. Flights are added and removed in place, keeping the
+# order. Used for the in-memory indexes of the scheduled flights ('route_search') and each pilot's flights ('pilot_availability')
+class FlightTimetable:
+    __slots__ = ("flight_ids", "departures", "arrivals", "origins", "destinations", "flight_numbers", "_departures_by_id", "_latest_arrivals")
+
+    def __init__(self):
+        self.flight_ids = array("q")
+        self.departures = array("q")
+        self.arrivals = array("q")
+        self.origins = array("i")
+        self.destinations = array("i")
+        self.flight_numbers = []
+        # maps each flight_id to its departure time, to find the flight's position in the columns
+        self._departures_by_id = {}
+        # running maximum of the arrival times in departure order, built when first needed by 'overlaps' and then kept up
+        # to date by 'add' and 'remove'
+        self._latest_arrivals = None
+
+    # function to create a timetable from rows of (flight_id, departure, arrival, departure_airport_id, arrival_airport_id,
+    # flight_number), in any order. Airports and flight numbers may be None when they are not needed
+    @classmethod
+    def from_rows(cls, rows):
+        timetable = cls()
+        rows = sorted(rows, key=lambda row: (row[1], row[2], row[0]))
+        timetable.flight_ids.extend(row[0] for row in rows)
+        timetable.departures.extend(row[1] for row in rows)
+        timetable.arrivals.extend(row[2] for row in rows)
+        timetable.origins.extend(-1 if row[3] is None else row[3] for row in rows)
+        timetable.destinations.extend(-1 if row[4] is None else row[4] for row in rows)
+        timetable.flight_numbers.extend(row[5] for row in rows)
+        timetable._departures_by_id = dict(zip(timetable.flight_ids, timetable.departures))
+        return timetable
+
+    def __len__(self):
+        return len(self.flight_ids)
+
+    def __contains__(self, flight_id):
+        return flight_id in self._departures_by_id
+
+    # helper function to find the position of a flight in the columns, or None if it is not in the timetable
+    def _position(self, flight_id):
+        departure = self._departures_by_id.get(flight_id)
+        if departure is None:
+            return None
+        position = bisect_left(self.departures, departure)
+        while self.flight_ids[position] != flight_id:
+            position += 1
+        return position
+
+    # function to add a flight after any others departing at the same time
+    def add(self, flight_id, departure, arrival, departure_airport_id=None, arrival_airport_id=None, flight_number=None):
+        position = bisect_right(self.departures, departure)
+        if self._latest_arrivals is not None:
+            self._raise_latest_arrivals(position, arrival)
+        self.flight_ids.insert(position, flight_id)
+        self.departures.insert(position, departure)
+        self.arrivals.insert(position, arrival)
+        self.origins.insert(position, -1 if departure_airport_id is None else departure_airport_id)
+        self.destinations.insert(position, -1 if arrival_airport_id is None else arrival_airport_id)
+        self.flight_numbers.insert(position, flight_number)
+        self._departures_by_id[flight_id] = departure
+
+    # function to remove a flight. Returns its (departure, arrival, departure_airport_id, arrival_airport_id, flight_number),
+    # or None if it was not in the timetable
+    def remove(self, flight_id):
+        position = self._position(flight_id)
+        if position is None:
+            return None
+        flight = self.leg(position)[1:]
+        for column in (self.flight_ids, self.departures, self.arrivals, self.origins, self.destinations, self.flight_numbers):
+            del column[position]
+        del self._departures_by_id[flight_id]
+        if self._latest_arrivals is not None:
+            self._lower_latest_arrivals(position, flight[1])
+        return flight
+
+    # helper function to update the running maximum of the arrival times for a flight added at 'position'. Later entries
+    # below the new arrival are raised to it, stopping at the first which is not, as the entries after it are no lower.
+    # A flight added at the end, or arriving before the flights departing after it, takes one step
+    def _raise_latest_arrivals(self, position, arrival):
+        latest = self._latest_arrivals
+        latest.insert(position, max(latest[position - 1], arrival) if position else arrival)
+        position += 1
+        while position < len(latest) and latest[position] < arrival:
+            latest[position] = arrival
+            position += 1
+
+    # helper function to update the running maximum of the arrival times for the flight removed from 'position'. Only the
+    # entries which the flight's arrival was the maximum for are recomputed, stopping at the first which is unchanged, so
+    # the cost depends on how many later flights it arrived after rather than on the size of the timetable
+    def _lower_latest_arrivals(self, position, arrival):
+        latest = self._latest_arrivals
+        del latest[position]
+        previous = latest[position - 1] if position else None
+        if previous is not None and arrival <= previous:
+            return
+        while position < len(latest):
+            value = self.arrivals[position] if previous is None else max(previous, self.arrivals[position])
+            if value == latest[position]:
+                break
+            latest[position] = previous = value
+            position += 1
+
+    # function to change the arrival airport of a flight. Does nothing if the flight is not in the timetable
+    def redirect(self, flight_id, arrival_airport_id):
+        position = self._position(flight_id)
+        if position is not None:
+            self.destinations[position] = arrival_airport_id
+
+    # function to return the (flight_id, departure, arrival, departure_airport_id, arrival_airport_id, flight_number) of
+    # the flight at a position in the timetable
+    def leg(self, position):
+        return (
+            self.flight_ids[position], self.departures[position], self.arrivals[position],
+            self.origins[position], self.destinations[position], self.flight_numbers[position],
+        )
+
+    # function to return the position of the first flight departing at or after 'departure'
+    def first_departing(self, departure):
+        return bisect_left(self.departures, departure)
+
+    # function to check whether any flight in the timetable is in the air at some point between 'departure' and 'arrival'
+    # (inclusive). Finds the last flight departing no later than 'arrival' with a binary search, then checks the running
+    # maximum of the arrival times up to it - so only one comparison is needed however many flights depart earlier. The
+    # running maximum is built in one pass the first time it is needed, and updated in place as flights are added and removed
+    def overlaps(self, departure, arrival):
+        position = bisect_right(self.departures, arrival)
+        if position == 0:
+            return False
+        if self._latest_arrivals is None:
+            latest, self._latest_arrivals = None, array("q")
+            for value in self.arrivals:
+                latest = value if latest is None or value > latest else latest
+                self._latest_arrivals.append(latest)
+        return self._latest_arrivals[position - 1] >= departure
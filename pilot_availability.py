@@ -0,0 +1,180 @@
+import threading
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+
+from database import get_connection
+from models import FlightTimetable, epoch_column, to_epoch
+from reference_cache import flights_version
+
+db_date_format = "%Y-%m-%d %H:%M:%S"
+
+# in-memory index of the flights assigned to each pilot, used to find available pilots without querying
+# the flights table. Maps each pilot_id to a 'FlightTimetable' of their non-cancelled flights, in departure order
+# with times in seconds since the epoch
+_schedules = {}
+# maps each assigned flight_id to its pilot_id, so an assignment can be found from the flight alone
+_flight_pilots = {}
+_loaded = False
+# the version of the flights table (see 'reference_cache.flights_version') the schedules are up to date with. When the
+# flights are changed by another connection - in this program or another - the schedules are reloaded when next used
+_version = None
+_lock = threading.RLock()
+
+# helper function to convert a departure or arrival time to the format stored in the database
+def _db_time(value):
+    if isinstance(value, datetime):
+        return value.strftime(db_date_format)
+    return str(value)
+
+# helper function to add a flight to a pilot's schedule, keeping the schedule in departure order
+def _add(flight_id, pilot_id, departure, arrival):
+    schedule = _schedules.get(pilot_id)
+    if schedule is None:
+        schedule = _schedules[pilot_id] = FlightTimetable()
+    schedule.add(flight_id, departure, arrival)
+    _flight_pilots[flight_id] = pilot_id
+
+# helper function to remove a flight from its pilot's schedule. Returns the pilot_id the flight was assigned to,
+# or None if the flight had no assigned pilot
+def _remove(flight_id):
+    pilot_id = _flight_pilots.pop(flight_id, None)
+    if pilot_id is None:
+        return None
+    schedule = _schedules[pilot_id]
+    schedule.remove(flight_id)
+    if not schedule:
+        del _schedules[pilot_id]
+    return pilot_id
+
+# function to (re)load every pilot's schedule from the flights table. Called automatically the first time the index is
+# used, and whenever the flights have changed since. The version is read in the same transaction as the flights
+def load_assignments():
+    global _loaded, _version
+    with _lock:
+        with get_connection() as conn:
+            conn.execute("BEGIN")
+            version = flights_version(conn)
+            rows = conn.execute(f'''
+                SELECT pilot_id, flight_id, {epoch_column("departure_time")}, {epoch_column("arrival_time")} FROM flights
+                WHERE pilot_id IS NOT NULL AND status != 'cancelled'
+                ORDER BY pilot_id
+            ''').fetchall()
+        _schedules.clear()
+        _flight_pilots.clear()
+        for pilot_id, flights in groupby(rows, key=itemgetter(0)):
+            _schedules[pilot_id] = FlightTimetable.from_rows((flight_id, departure, arrival, None, None, None) for _, flight_id, departure, arrival in flights)
+        _flight_pilots.update((flight_id, pilot_id) for pilot_id, flight_id, _, _ in rows)
+        _loaded, _version = True, version
+
+# function to discard the in-memory schedules so they are reloaded from the flights table the next time they
+# are used. Called after changes made in bulk, such as an import of flights
+def reset_assignments():
+    global _loaded
+    with _lock:
+        _loaded = False
+
+# helper function to check whether the schedules have been loaded and are up to date with the flights table
+def _is_current():
+    return _loaded and _version == flights_version()
+
+# helper function to load the schedules if they have not been loaded yet, or reload them if the flights have changed since
+def _ensure_loaded():
+    if not _is_current():
+        load_assignments()
+
+# helper function to check whether a change made by this program can be applied to the schedules. 'versions' is the
+# version of the flights table at the start and end of the transaction which made the change. The change is applied
+# only if the schedules were up to date with the version before it, and they are then up to date with the version after
+# it; otherwise the schedules are out of date and are reloaded when next used
+def _in_step(versions):
+    global _version
+    if not _loaded or _version != versions[0]:
+        return False
+    _version = versions[1]
+    return True
+
+# helper function to check whether a pilot has no flight between the departure and arrival time (inclusive), given in
+# seconds since the epoch (see 'FlightTimetable.overlaps')
+def _is_free(pilot_id, departure, arrival):
+    schedule = _schedules.get(pilot_id)
+    return schedule is None or not schedule.overlaps(departure, arrival)
+
+# function to check whether a pilot is free for the whole period between 'departure_time' and 'arrival_time'. If the schedules
+# have not been loaded or are out of date (such as in a single command line operation), the flights table is checked directly
+# with one indexed query instead of loading every pilot's schedule. Pass 'conn' to check the flights table inside a write
+# transaction, so the pilot cannot be assigned elsewhere before the transaction's update
+def is_pilot_available(pilot_id, departure_time, arrival_time, conn=None):
+    if conn is not None:
+        return _is_free_in_database(conn, pilot_id, departure_time, arrival_time)
+    with _lock:
+        if _is_current():
+            return _is_free(pilot_id, to_epoch(departure_time), to_epoch(arrival_time))
+    with get_connection() as conn:
+        return _is_free_in_database(conn, pilot_id, departure_time, arrival_time)
+
+# helper function to check whether a pilot has no non-cancelled flight between the departure and arrival time (inclusive)
+# in the flights table, using the (pilot_id, departure_time, arrival_time) index
+def _is_free_in_database(conn, pilot_id, departure_time, arrival_time):
+    return not conn.execute('''
+        SELECT 1 FROM flights
+        WHERE pilot_id = ? AND status != 'cancelled' AND departure_time <= ? AND arrival_time >= ?
+        LIMIT 1
+    ''', (pilot_id, _db_time(arrival_time), _db_time(departure_time))).fetchone()
+
+# function to return the set of pilot IDs, from the provided 'pilot_ids', that are not assigned to a flight
+# between 'departure_time' and 'arrival_time'
+def get_available_pilot_ids(pilot_ids, departure_time, arrival_time):
+    _ensure_loaded()
+    departure, arrival = to_epoch(departure_time), to_epoch(arrival_time)
+    with _lock:
+        return {pilot_id for pilot_id in pilot_ids if _is_free(pilot_id, departure, arrival)}
+
+# function to find the available pilots for many flights at once. Accepts the pilot IDs to consider and a list
+# of (departure_time, arrival_time) windows, and returns a list containing the set of available pilot IDs for
+# each window, in the same order
+def get_available_pilot_ids_batch(pilot_ids, windows):
+    _ensure_loaded()
+    windows = [(to_epoch(departure_time), to_epoch(arrival_time)) for departure_time, arrival_time in windows]
+    with _lock:
+        return [
+            {pilot_id for pilot_id in pilot_ids if _is_free(pilot_id, departure, arrival)}
+            for departure, arrival in windows
+        ]
+
+# function to record that a pilot has been assigned to a flight. Replaces any previous assignment for the flight.
+# Called after 'assign_pilot' updates the database. This and the functions below accept the version of the flights table
+# before and after the change ('versions', see '_in_step'), and do nothing unless the schedules were up to date before
+# it, as the change is then picked up from the database when they are next used
+def record_assignment(flight_id, pilot_id, departure_time, arrival_time, versions):
+    with _lock:
+        if not _in_step(versions):
+            return
+        _remove(flight_id)
+        _add(flight_id, pilot_id, to_epoch(departure_time), to_epoch(arrival_time))
+
+# function to move a flight to new departure and arrival times in its pilot's schedule. Called after
+# 'change_flight_departure_time' updates the database. Does nothing if the flight has no assigned pilot
+def reschedule_flight(flight_id, departure_time, arrival_time, versions):
+    with _lock:
+        if not _in_step(versions):
+            return
+        pilot_id = _remove(flight_id)
+        if pilot_id is not None:
+            _add(flight_id, pilot_id, to_epoch(departure_time), to_epoch(arrival_time))
+
+# function to remove a flight from its pilot's schedule. Called after 'cancel_flight' cancels the flight
+def release_flight(flight_id, versions):
+    with _lock:
+        if not _in_step(versions):
+            return
+        _remove(flight_id)
+
+# function to remove every flight from a pilot's schedule. Called after 'delete_pilot' unassigns the pilot from their flights
+def release_pilot(pilot_id, versions):
+    with _lock:
+        if not _in_step(versions):
+            return
+        schedule = _schedules.pop(pilot_id, None)
+        for flight_id in schedule.flight_ids if schedule is not None else ():
+            _flight_pilots.pop(flight_id, None)
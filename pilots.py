@@ -1,6 +1,12 @@
-import sqlite3
-from flights_helpers import display_flights, get_flight
-from menu import clear_console, create_menu
+from datetime import timedelta
+from conflicts import get_conflicts, scan_conflicts
+from crew_scheduler import auto_assign_pilots
+from database import get_connection, retry_if_locked, transaction
+from flights_helpers import FLIGHTS_PAGE_SIZE, display_flights, get_flight, load_flight
+from menu import clear_console, create_menu, writes_to_database
+from models import Pilot
+from pilot_availability import is_pilot_available, record_assignment, release_pilot
+from reference_cache import flights_version, invalidate
 from pilots_helpers import confirm_pilot_update, get_current_pilot, get_licence_number, get_name, select_pilot
 
 # function to display the top-level 'pilots' menu - 'Pilot Scheduling & Information Menu' - and handle user 
@@ -17,8 +23,10 @@ def display_pilots_menu(previous_menu):
         "2": ("View a pilot's schdule", view_assigned_flights),
         "3": ("Add a new pilot to the system", add_pilot),
         "4": ("Delete a pilot from the system", delete_pilot),
-        "5": ("Update a pilot's details", lambda: update_details_menu(return_to_pilots_menu)),
-        "6": ("Return to Previous Menu", lambda: create_menu(previous_menu)),
+        "5": ("Update a pilot's details", writes_to_database(lambda: update_details_menu(return_to_pilots_menu))),
+        "6": ("Automatically assign pilots to flights without one", auto_assign_pilots_to_flights),
+        "7": ("View conflicts in pilots' schedules", view_schedule_conflicts),
+        "8": ("Return to Previous Menu", lambda: create_menu(previous_menu)),
     }
     create_menu(pilots_menu, previous_menu)
 
@@ -27,26 +35,96 @@ def display_pilots_menu(previous_menu):
 # assigned to the flight, calls 'confirm_pilot_update' to prompt the user to confirm they wish to replace the 
 # currently assigned pilot with a new one. Calls 'select_pilot' to retrive a pilot to assign from the user. 
 # Updates the database and prints a success message to the user
+@writes_to_database
 def assign_pilot_to_flight():
     columns=["flight_id", "flight_number", "pilot_id", "departure_time", "arrival_time"]
-    flight_to_update = get_flight("assign a pilot to", deparature_time_index=3, arrival_time_index=4, columns=columns, exclude_status="cancelled", is_future=True)
-    flight_id, flight_number, departure_time, arrival_time = flight_to_update[0], flight_to_update[1], flight_to_update[3], flight_to_update[4]
-    current_pilot_id, current_pilot_name = get_current_pilot(flight_to_update)
+    flight = get_flight("assign a pilot to", columns=columns, exclude_status="cancelled", is_future=True)
+    current_pilot_id, current_pilot_name = get_current_pilot(flight)
     if current_pilot_id:
-        update_assigned_pilot = confirm_pilot_update(current_pilot_name, current_pilot_id, flight_number)  
+        update_assigned_pilot = confirm_pilot_update(current_pilot_name, current_pilot_id, flight.flight_number)  
         if not update_assigned_pilot:
             return      
-    pilot_id, pilot_name = select_pilot(only_available=True, departure_time=departure_time, arrival_time=arrival_time, flight_number=flight_number)
-    conn = sqlite3.connect('flight_management')
-    conn.execute("UPDATE flights SET pilot_id = ? WHERE flight_id = ?", (pilot_id, flight_id) )
-    conn.commit()
-    conn.close()
+    pilot_id, pilot_name = select_pilot(only_available=True, departure_time=flight.departure_time, arrival_time=flight.arrival_time, flight_number=flight.flight_number)
+    assign_pilot(flight.flight_id, pilot_id)
     clear_console()
-    print(f"Pilot {pilot_name} has been assigned to flight {flight_number}.")
+    print(f"Pilot {pilot_name} has been assigned to flight {flight.flight_number}.")
+
+# function to assign a pilot to a future, non-cancelled flight without any user interaction, replacing any pilot already
+# assigned. Checks the pilot exists and is not assigned to another flight at the same time. The checks are made against
+# the flights table inside the immediate transaction which assigns the pilot, rather than the in-memory schedules, so a
+# pilot assigned by another program (or terminal) in the meantime cannot be double booked. Returns the flight number and
+# pilot's name, or raises a ValueError if the pilot cannot be assigned. Shared by 'assign_pilot_to_flight' and the command line interface
+@retry_if_locked
+def assign_pilot(flight_id, pilot_id):
+    with transaction(immediate=True) as conn:
+        flight = load_flight(flight_id, exclude_status="cancelled", is_future=True, conn=conn)
+        if not flight:
+            raise ValueError(f"Flight {flight_id} does not exist, has already departed or is cancelled.")
+        pilot = conn.execute(f"SELECT {', '.join(Pilot.COLUMNS)} FROM pilots WHERE pilot_id = ?", (pilot_id,)).fetchone()
+        if not pilot:
+            raise ValueError(f"Pilot {pilot_id} does not exist.")
+        pilot = Pilot.from_row(pilot)
+        if pilot_id == flight.pilot_id:
+            return flight.flight_number, pilot.name
+        if not is_pilot_available(pilot_id, flight.departure_time, flight.arrival_time, conn=conn):
+            raise ValueError(f"Pilot {pilot.name} is assigned to another flight between the departure and arrival time of flight {flight.flight_number}.")
+        before = flights_version(conn)
+        conn.execute("UPDATE flights SET pilot_id = ? WHERE flight_id = ?", (pilot_id, flight_id) )
+        versions = (before, flights_version(conn))
+    record_assignment(flight_id, pilot_id, flight.departure_time, flight.arrival_time, versions)
+    scan_conflicts([pilot_id, flight.pilot_id])
+    return flight.flight_number, pilot.name
+
+# function to automatically assign pilots to every future scheduled flight without one. Asks the user for the minimum rest
+# between a pilot's flights and whether pilots must depart from the airport they last arrived at, then calls
+# 'auto_assign_pilots' and displays how many flights were assigned
+@writes_to_database
+def auto_assign_pilots_to_flights():
+    clear_console()
+    print("========== Automatically assign pilots to flights ==========\n")
+    while True:
+        rest = input("Please enter the minimum rest between a pilot's flights in hours (press Enter for none): ").strip()
+        try:
+            min_rest = timedelta(hours=float(rest)) if rest else timedelta(0)
+            if min_rest >= timedelta(0):
+                break
+        except ValueError:
+            pass
+        print(f"Your input: {rest}\nInvalid rest time, please enter a number of hours such as 1 or 1.5.")
+    while True:
+        choice = input("Must pilots depart from the airport they last arrived at? (y/n): ").strip().lower()
+        if choice in ("y", "n"):
+            break
+        print(f"Your input: {choice}\nInvalid choice, please enter 'y' or 'n' to indicate your choice.")
+    result = auto_assign_pilots(min_rest=min_rest, same_airport=choice == "y")
+    clear_console()
+    if not result["flights"]:
+        print("\nEvery scheduled flight already has a pilot assigned.")
+        return
+    print(f"\nAssigned pilots to {result['assigned']} of {result['flights']} flights using {result['pilots_used']} pilots.")
+    if result["unassigned"]:
+        print(f"No available pilot could be found for {result['unassigned']} flights.")
+
+# function to display the conflicts found in the pilots' schedules - flights which overlap, turnarounds shorter than the
+# minimum and flights departing from a different airport to the one the pilot last arrived at, a page at a time. Calls 'get_conflicts'
+def view_schedule_conflicts():
+    clear_console()
+    print("========== Conflicts in pilots' schedules ==========\n")
+    conflicts = get_conflicts()
+    if not conflicts:
+        print("No conflicts found.")
+        return
+    print(f"{len(conflicts)} conflicts found.\n")
+    labels = {"overlap": "Double booked", "short_turnaround": "Short turnaround", "airport_mismatch": "Airport mismatch"}
+    for index, (pilot_id, conflict_type, _, _, _, _, _, detail) in enumerate(conflicts, 1):
+        print(f"Pilot ID: {pilot_id} | {labels[conflict_type]} | {detail}")
+        if index % FLIGHTS_PAGE_SIZE == 0 and index < len(conflicts):
+            if input("\nPress Enter to show more conflicts, or type 'q' to stop: ").strip().lower() == "q":
+                return
 
 # function to view a pilot's schedule. Calls 'select pilot' to display a list of pilots for the user to 
-# choose from and return a pilot_id and pilot_name. Passes the relevant departure and arrival time column indicies 
-# (to format time columns to be easily readable), columns and pilot_id to 'display_flights' to display all flights assigned to that pilot
+# choose from and return a pilot_id and pilot_name. Passes the columns and pilot_id to 'display_flights' to display all
+# flights assigned to that pilot, with the departure and arrival times formatted to be easily readable
 def view_assigned_flights():
     clear_console()
     pilot_id, pilot_name = select_pilot(action="view assigned flights for")
@@ -60,7 +138,7 @@ def view_assigned_flights():
         "f.arrival_time",
         "f.status"
     ]
-    display_flights(departure_time_index=2, arrival_time_index=4, columns=columns, pilot=pilot_id)
+    display_flights(columns=columns, pilot=pilot_id)
 
 # function to add a new pilot to the Flight Management System. Calls helper functions to receive a 
 # valid name and licence number from the user, then queries the database to check a pilot with the 
@@ -68,20 +146,18 @@ def view_assigned_flights():
 # are added to the database and a success message is displayed. If the licence number already exists, the
 # pilot cannot be added (licence numbers must be unique), so a relevant message is displayed before returning to 
 # the 'Pilot Scheduling & Information Menu'  
+@writes_to_database
 def add_pilot():
     clear_console()
     print("========== Add a pilot to the Flight Management System ==========\n")
     first_name, last_name = get_name()
     licence_number = get_licence_number(f"{first_name} {last_name}")  
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM pilots WHERE licence_number = ?", (licence_number,))
-    if cursor.fetchone():
-        print(f"\nPilot with licence number {licence_number} already exists. Unable to add {first_name} {last_name} to the Flight Management System.")
-        conn.close()
-        return
-    cursor.execute("INSERT INTO pilots (first_name, last_name, licence_number) VALUES (?, ?, ?)", (first_name, last_name, licence_number))
-    conn.commit()
+    with transaction(immediate=True) as conn:
+        if conn.execute("SELECT * FROM pilots WHERE licence_number = ?", (licence_number,)).fetchone():
+            print(f"\nPilot with licence number {licence_number} already exists. Unable to add {first_name} {last_name} to the Flight Management System.")
+            return
+        conn.execute("INSERT INTO pilots (first_name, last_name, licence_number) VALUES (?, ?, ?)", (first_name, last_name, licence_number))
+    invalidate("pilots")
     print(f"\nPilot {first_name} {last_name} with licence {licence_number} has been added successfully.")
 
 # function to delete a pilot from the Flight Management System. Calls 'select_pilot' to display a list of pilots for the user to 
@@ -90,13 +166,14 @@ def add_pilot():
 # not to delete the pilot, a relevant message is displayed, before returnig to the 'Pilot Scheduling & Information Menu'. If the
 # user chooses to delete the pilot, the flights table is queried to update any flights with the chosen pilot_id to NULL (preventing
 # foreign key constraint violations), then the pilot is deleted from the pilots table and a success message is displayed
+@writes_to_database
 def delete_pilot():
     clear_console()
     print("========== Delete a pilot from the Flight Management System ==========\n")
     pilot_id, pilot_name = select_pilot(action="delete from the Flight Management System")
     clear_console()
     flights = display_flights(pilot=pilot_id, is_future=True, exclude_status="cancelled")
-    if flights and len(flights) > 0:
+    if flights:
          print(f"\nPilot {pilot_name} is assigned to the above scheduled flights.")
     else: clear_console()
     while True:    
@@ -110,12 +187,13 @@ def delete_pilot():
             break
         clear_console()
         print(f"Your input: {choice}\nInvalid choice, please enter 'y' or 'n' to indicate your choice.")
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("UPDATE flights SET pilot_id = NULL WHERE pilot_id = ?", (pilot_id,))        
-    cursor.execute("DELETE FROM pilots WHERE pilot_id = ?", (pilot_id,))
-    conn.commit()
-    conn.close()
+    with transaction(immediate=True) as conn:
+        before = flights_version(conn)
+        conn.execute("UPDATE flights SET pilot_id = NULL WHERE pilot_id = ?", (pilot_id,))
+        conn.execute("DELETE FROM pilots WHERE pilot_id = ?", (pilot_id,))
+        versions = (before, flights_version(conn))
+    release_pilot(pilot_id, versions)
+    invalidate("pilots")
     print(f"\nPilot {pilot_name} has been deleted from the Flight Management System and unassigned from all flights.")
 
 # function to display the 'Update a pilot's details' menu and handle user 
@@ -141,24 +219,21 @@ def update_details_menu(previous_menu):
 def update_details(field, return_to_pilots_menu):
     print(f"========== Update a pilot's {field} ==========\n")
     pilot_id, pilot_name = select_pilot(action="update details for")
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
     clear_console()
     if field == "name":
         first_name, last_name = get_name()
-        cursor.execute("UPDATE pilots SET first_name = ?, last_name = ? WHERE pilot_id = ?", (first_name, last_name, pilot_id)) 
+        with transaction() as conn:
+            conn.execute("UPDATE pilots SET first_name = ?, last_name = ? WHERE pilot_id = ?", (first_name, last_name, pilot_id))
     if field == "licence number":
         licence_number = get_licence_number(pilot_name)
-        cursor.execute("SELECT * FROM pilots WHERE licence_number = ?", (licence_number,))
-        if cursor.fetchone():
-            print(f"\nPilot with licence number {licence_number} already exists. Unable to update {pilot_name}'s licence number.")
-            conn.close()
-            return
-        cursor.execute("UPDATE pilots SET licence_number = ? WHERE pilot_id = ?", (licence_number, pilot_id)) 
-    conn.commit()
-    cursor.execute("SELECT first_name, last_name, licence_number FROM pilots WHERE pilot_id = ?", (pilot_id,))
-    pilot_details = cursor.fetchone()
-    conn.close()
+        with transaction(immediate=True) as conn:
+            if conn.execute("SELECT * FROM pilots WHERE licence_number = ?", (licence_number,)).fetchone():
+                print(f"\nPilot with licence number {licence_number} already exists. Unable to update {pilot_name}'s licence number.")
+                return
+            conn.execute("UPDATE pilots SET licence_number = ? WHERE pilot_id = ?", (licence_number, pilot_id))
+    invalidate("pilots")
+    with get_connection() as conn:
+        pilot_details = conn.execute("SELECT first_name, last_name, licence_number FROM pilots WHERE pilot_id = ?", (pilot_id,)).fetchone()
     if pilot_details:
         first_name, last_name, licence_number = pilot_details
         print(f"\nPilot details updated: Name - {first_name} {last_name}, licence Number - {licence_number}.")
@@ -1,5 +1,8 @@
-import sqlite3
+from database import get_connection
 from menu import clear_console
+from models import Pilot
+from pilot_availability import get_available_pilot_ids
+from reference_cache import cached_query
 
 # helper function to prompt the user to confirm that they wish to assign a pilot to a flight
 # when the flight already has a pilot assigned.
@@ -44,9 +47,9 @@ def select_pilot(only_available=None, departure_time=None, arrival_time=None, fl
             pilots = display_pilots(only_available, departure_time, arrival_time)
             print(f"\nYour input: {pilot_id}\nInvalid input. Please enter a valid pilot ID.")
             continue
-        pilot_to_assign = next((pilot for pilot in pilots if pilot[0] == pilot_id), None)
+        pilot_to_assign = next((Pilot.from_row(pilot) for pilot in pilots if pilot[0] == pilot_id), None)
         if pilot_to_assign:
-            return pilot_id, f"{pilot_to_assign[1]} { pilot_to_assign[2]}"
+            return pilot_id, pilot_to_assign.name
         else: 
             clear_console()
             print(header)
@@ -54,44 +57,28 @@ def select_pilot(only_available=None, departure_time=None, arrival_time=None, fl
             print(f"\nYour input: {str(pilot_id)}\nInvalid pilot ID, please try again.")
 
 
-# helper function to retrieve the pilot assigned to a specific flight. Returns the id and name of the 
+# helper function to retrieve the pilot assigned to a specific flight (a 'Flight'). Returns the id and name of the 
 # pilot currently assigned to a flight. If no pilot is yet assigned, returns None
 def get_current_pilot(flight):
-    current_pilot_id = flight[2]
+    current_pilot_id = flight.pilot_id
     if not current_pilot_id:
         return None, None
-    conn = sqlite3.connect('flight_management')
-    cursor = conn.cursor()
-    cursor.execute("SELECT first_name, last_name FROM pilots WHERE pilot_id = ?", (current_pilot_id,))
-    current_pilot_name = cursor.fetchone()
-    conn.close()
-    if current_pilot_name:
-        return current_pilot_id, f"{current_pilot_name[0]} {current_pilot_name[1]}"
+    with get_connection() as conn:
+        current_pilot = conn.execute(f"SELECT {', '.join(Pilot.COLUMNS)} FROM pilots WHERE pilot_id = ?", (current_pilot_id,)).fetchone()
+    if current_pilot:
+        return current_pilot_id, Pilot.from_row(current_pilot).name
     return current_pilot_id, "Unknown Pilot."
 
 
 # helper function to display a list of all pilots. Accepts arguments to make the function resuable.
-# When 'only_available' is True, only displays pilots who are not already assigned to a flight at the time
+# When 'only_available' is True, only displays pilots who are not already assigned to a (non-cancelled) flight 
+# at the time, using the in-memory schedules in 'pilot_availability' rather than searching the flights table. The list of
+# pilots is fetched through 'reference_cache', so the database is only queried again once the pilots have changed
 def display_pilots(only_available=None, departure_time=None, arrival_time=None):
-    conn = sqlite3.connect('flight_management')
-    query = "SELECT pilot_id, first_name, last_name FROM pilots "
-    params = ()
+    pilots = cached_query("SELECT pilot_id, first_name, last_name FROM pilots", tables=("pilots",))
     if only_available:
-        query += ''' 
-            WHERE pilot_id NOT IN (
-            SELECT DISTINCT pilot_id FROM flights 
-            WHERE pilot_id IS NOT NULL AND (
-            (departure_time <= ? AND arrival_time >= ?) 
-            OR
-            (departure_time <= ? AND arrival_time >= ?) 
-            OR
-            (departure_time >= ? AND arrival_time <= ?)  
-            )
-            )
-        '''
-        params = (departure_time, departure_time, arrival_time, arrival_time, departure_time, arrival_time)
-    pilots = conn.execute(query, params).fetchall()
-    conn.close()
+        available_pilot_ids = get_available_pilot_ids([pilot[0] for pilot in pilots], departure_time, arrival_time)
+        pilots = [pilot for pilot in pilots if pilot[0] in available_pilot_ids]
     if not pilots: 
         print("\nNo matching pilots found.")
         return None
@@ -105,12 +92,10 @@ def get_name():
     while True:
         first_name = input("Please enter the pilot's first name: ").strip()
         last_name = input("Please enter the pilot's surname: ").strip()
-        if len(first_name) > 30 or len(last_name) > 30: 
+        error = validate_name(first_name, last_name)
+        if error:
             clear_console()
-            print(f"Your input: First name - {first_name} Surname - {last_name}\nPilot's first name and last name must not exceed 30 characters each.")
-        elif not first_name or not last_name:
-            clear_console()
-            print(f"Your input: First name - {first_name} Surname - {last_name}\nYou must provide a value for the pilot's first name and surname.")
+            print(f"Your input: First name - {first_name} Surname - {last_name}\n{error}")
         else: 
             clear_console()
             return first_name, last_name  
@@ -121,12 +106,28 @@ def get_name():
 def get_licence_number(pilot_name):
     while True:
         licence_number = input(f"Please enter {pilot_name}'s licence number (e.g. LIC667788): ").strip()
-        if len(licence_number) > 20: 
-            clear_console()
-            print(f"Your input: {licence_number} \n Pilot's licence number must not exceed 20 characters.")
-        elif not licence_number:
+        error = validate_licence_number(licence_number)
+        if error:
             clear_console()
-            print(f"Your input: {licence_number} \n You must provide a licence number for the pilot.")
+            print(f"Your input: {licence_number} \n {error}")
         else: 
             clear_console()
-            return licence_number
\ No newline at end of file
+            return licence_number
+
+# helper function to validate a pilot's name. Ensures the first_name and last_name are each less than or equal to 30 characters
+# and not empty strings. Returns an error message, or None if the name is valid. Shared by 'get_name' and the bulk import
+def validate_name(first_name, last_name):
+    if len(first_name) > 30 or len(last_name) > 30: 
+        return "Pilot's first name and last name must not exceed 30 characters each."
+    if not first_name or not last_name:
+        return "You must provide a value for the pilot's first name and surname."
+    return None
+
+# helper function to validate a pilot's licence number. Ensures it is less than or equal to 20 characters and not an empty string.
+# Returns an error message, or None if the licence number is valid. Shared by 'get_licence_number' and the bulk import
+def validate_licence_number(licence_number):
+    if len(licence_number) > 20: 
+        return "Pilot's licence number must not exceed 20 characters."
+    if not licence_number:
+        return "You must provide a licence number for the pilot."
+    return None
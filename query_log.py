@@ -0,0 +1,272 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+# instrumentation of every statement run against the database. When enabled, 'database.open_connection' opens its connections
+# with 'connection_factory', so each statement's duration (including fetching its rows), rows returned and calling function
+# are recorded against its normalized SQL text. Statements slower than a threshold are written to a slow query log, optionally
+# with their query plan, and the totals for each statement can be dumped when the program exits. Configured with environment
+# variables, so it can be turned on for the menus, the command line interface or the benchmark without changing any code:
+#
+#   FMS_SLOW_QUERY_MS         log statements taking at least this many milliseconds (enables the instrumentation)
+#   FMS_SLOW_QUERY_LOG        file the slow query log is written to, one JSON object per line (default: slow_queries.log)
+#   FMS_EXPLAIN_SLOW_QUERIES  set to 1 to include the 'EXPLAIN QUERY PLAN' of each slow statement in the log
+#   FMS_QUERY_STATS           file to write the totals for each statement to at exit, or '-' for stderr (enables the instrumentation)
+#
+# When none of these are set, connections are opened as normal and nothing is recorded
+
+# modules whose functions are skipped when finding the function which ran a statement
+INTERNAL_MODULES = {__name__, "database", "contextlib", "sqlite3"}
+
+_settings = {"enabled": False, "threshold_ms": None, "log_path": "slow_queries.log", "explain": False, "stats_path": None}
+# totals for each normalized statement - calls, total and maximum duration, rows and the number of calls from each function
+_stats = {}
+_lock = threading.Lock()
+_log_file = None
+
+# regular expressions used to normalize SQL text - quoted strings and numbers are replaced with '?', lists of placeholders
+# (such as those built for 'IN (...)') are collapsed so statements differing only in list length are counted together, and
+# whitespace is collapsed
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+# function to normalize the text of a statement, so statements which differ only in their values are recorded together.
+# Results are cached, as the same statements are run again and again
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("?, ...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+# helper function to describe the shape of the parameters bound to a statement - the type of each positional parameter,
+# or the name and type of each named parameter - without recording the values themselves
+def parameter_shape(params):
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        if len(params) > 8:
+            types = {type(value).__name__ for value in params}
+            return f"({len(params)} x {'|'.join(sorted(types))})"
+        return "(" + ", ".join(type(value).__name__ for value in params) + ")"
+    return type(params).__name__
+
+# helper function to describe the parameters of 'executemany' - the number of rows and the shape of the first, when the
+# rows are provided as a list. Generators are not inspected, as that would consume them
+def many_parameter_shape(params):
+    if isinstance(params, (list, tuple)):
+        return f"{len(params)} x {parameter_shape(params[0]) if params else '()'}"
+    return "many"
+
+# helper function to find the function which ran a statement - the first function on the call stack outside this module,
+# 'database' and the standard library modules they use. Returned as 'module.function'
+def find_caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in INTERNAL_MODULES:
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+# helper function to add a finished statement to the totals for its normalized SQL
+def record_statement(sql, caller, duration_ms, rows):
+    with _lock:
+        stats = _stats.get(sql)
+        if stats is None:
+            stats = _stats[sql] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "slow": 0, "callers": {}}
+        stats["calls"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["rows"] += rows
+        stats["callers"][caller] = stats["callers"].get(caller, 0) + 1
+        if _settings["threshold_ms"] is not None and duration_ms >= _settings["threshold_ms"]:
+            stats["slow"] += 1
+
+# helper function to write a slow statement to the slow query log, with its query plan if enabled. The plan is found with
+# a plain cursor, so looking it up is not itself recorded
+def log_slow_statement(conn, raw_sql, params, entry):
+    global _log_file
+    if _settings["explain"] and params is not None and raw_sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+        try:
+            entry["plan"] = [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + raw_sql, params)]
+        except sqlite3.Error as error:
+            entry["plan"] = [f"unavailable: {error}"]
+    with _lock:
+        if _log_file is None:
+            _log_file = open(_settings["log_path"], "a", encoding="utf-8")
+        _log_file.write(json.dumps(entry) + "\n")
+        _log_file.flush()
+
+# cursor which times each statement it runs, including the time spent fetching its rows, and counts the rows fetched.
+# A statement is finished (and recorded) when all of its rows have been fetched, the cursor runs another statement, or
+# the cursor is closed or discarded
+class InstrumentedCursor(sqlite3.Cursor):
+    _statement = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        return self._run(super().execute, sql, params, parameter_shape(params), params)
+
+    def executemany(self, sql, params):
+        self._finish()
+        return self._run(super().executemany, sql, params, many_parameter_shape(params), None)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - start, len(rows), len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - start, 0, True)
+            raise
+        self._fetched(time.perf_counter() - start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # a statement left unfinished is recorded when its cursor is discarded - errors cannot be raised from here, and
+        # may occur if the program is shutting down
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    # helper method to run a statement and start recording it
+    def _run(self, method, sql, params, shape, explain_params):
+        caller = find_caller()
+        start = time.perf_counter()
+        try:
+            method(sql, params)
+        finally:
+            self._statement = [sql, shape, caller, time.perf_counter() - start, 0, explain_params]
+        return self
+
+    # helper method to add the time taken and rows returned by a fetch to the current statement, and finish it if there
+    # are no more rows
+    def _fetched(self, seconds, rows, exhausted):
+        if self._statement is not None:
+            self._statement[3] += seconds
+            self._statement[4] += rows
+            if exhausted:
+                self._finish()
+
+    # helper method to record the current statement, and write it to the slow query log if it took longer than the threshold
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        raw_sql, shape, caller, seconds, rows, params = statement
+        if not rows and self.rowcount > 0:
+            rows = self.rowcount
+        duration_ms = seconds * 1000
+        sql = normalize_sql(raw_sql)
+        record_statement(sql, caller, duration_ms, rows)
+        if _settings["threshold_ms"] is not None and duration_ms >= _settings["threshold_ms"]:
+            log_slow_statement(self.connection, raw_sql, params, {
+                "time": datetime.now().isoformat(timespec="milliseconds"), "duration_ms": round(duration_ms, 3),
+                "rows": rows, "caller": caller, "sql": sql, "params": shape,
+            })
+
+# connection whose statements are all run with an 'InstrumentedCursor'
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+# function to turn the instrumentation on. Only affects connections opened afterwards, so must be called before the
+# database is first used. 'threshold_ms' enables the slow query log, 'explain' adds query plans to it and 'stats_path'
+# writes the totals for each statement to a file (or stderr, for '-') when the program exits
+def enable(threshold_ms=None, log_path=None, explain=False, stats_path=None):
+    _settings.update(enabled=True, threshold_ms=threshold_ms, explain=explain)
+    if log_path:
+        _settings["log_path"] = log_path
+    if stats_path and not _settings["stats_path"]:
+        atexit.register(dump_query_stats)
+    if stats_path:
+        _settings["stats_path"] = stats_path
+
+# function to turn the instrumentation on from the environment variables described at the top of this module. Called when
+# the module is imported
+def configure_from_environment():
+    threshold = os.environ.get("FMS_SLOW_QUERY_MS")
+    stats_path = os.environ.get("FMS_QUERY_STATS")
+    if threshold is None and not stats_path:
+        return
+    enable(
+        threshold_ms=float(threshold) if threshold else None,
+        log_path=os.environ.get("FMS_SLOW_QUERY_LOG"),
+        explain=os.environ.get("FMS_EXPLAIN_SLOW_QUERIES") == "1",
+        stats_path=stats_path,
+    )
+
+# function to return the connection class 'database.open_connection' should use - the instrumented connection when the
+# instrumentation is enabled, otherwise SQLite's own, so there is no overhead when it is off
+def connection_factory():
+    return InstrumentedConnection if _settings["enabled"] else sqlite3.Connection
+
+# function to return the totals for each statement recorded so far, slowest in total first. Each entry holds the normalized
+# SQL, the number of calls, the total, mean and maximum duration in milliseconds, the rows returned, the number of slow
+# calls and the number of calls from each function
+def get_query_stats():
+    with _lock:
+        entries = [
+            {"sql": sql, **stats, "callers": dict(stats["callers"])} for sql, stats in _stats.items()
+        ]
+    for entry in entries:
+        entry["mean_ms"] = round(entry["total_ms"] / entry["calls"], 3)
+        entry["total_ms"] = round(entry["total_ms"], 3)
+        entry["max_ms"] = round(entry["max_ms"], 3)
+    return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+# function to discard the totals recorded so far
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
+
+# function to write the totals for each statement as JSON to the file set by 'FMS_QUERY_STATS' (or passed to 'enable'),
+# or to stderr when it is '-'. Registered to run when the program exits
+def dump_query_stats(path=None):
+    path = path or _settings["stats_path"]
+    output = json.dumps(get_query_stats(), indent=2)
+    if path == "-":
+        print(output, file=sys.stderr)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+
+configure_from_environment()
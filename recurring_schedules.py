@@ -0,0 +1,257 @@
+from datetime import date, datetime, timedelta
+
+from conflicts import scan_conflicts
+from database import get_connection, retry_if_locked, transaction
+from flight_numbers import allocate_flight_numbers
+from flights_helpers import format_days, validate_flight_duration
+from models import utc_now
+from pilot_availability import reset_assignments
+from route_search import reset_routes
+
+db_date_format = "%Y-%m-%d %H:%M:%S"
+
+# recurring flight schedules. A schedule defines a flight operated on some days of the week, departing at the same time
+# with the same duration, between two dates, and is stored once in the 'flight_schedules' table. Its occurrences are
+# ordinary rows of the flights table (sharing the schedule's flight number and linked to it by 'schedule_id'), but they are
+# only added over a rolling horizon - 'materialize_schedules' adds the occurrences departing in the next 'SCHEDULE_HORIZON'
+# which have not been added yet, and is run with the background flight status updates as the horizon moves on. Changes to a
+# schedule are applied to every occurrence which has not departed with one UPDATE, rather than a flight at a time
+
+# how far ahead the occurrences of every schedule are added to the flights table
+SCHEDULE_HORIZON = timedelta(days=60)
+
+# SQL condition checking whether a schedule (aliased 's', or the bit mask provided as 'days') operates on the weekday of a
+# day or time. SQLite's '%w' numbers the days from Sunday (0), so it is shifted to number them from Monday
+OPERATES_ON = "((({days}) >> ((CAST(strftime('%w', {day}) AS INTEGER) + 6) % 7)) & 1)"
+
+# columns output by 'list_schedules'
+SCHEDULE_COLUMNS = [
+    "schedule_id", "flight_number", "departure_iata", "arrival_iata", "days", "departure_time", "duration_minutes",
+    "valid_from", "valid_to", "materialized_until", "upcoming_flights",
+]
+
+# helper function to convert a day - a date, or text as 'YYYY-MM-DD' - to text as 'YYYY-MM-DD'
+def _day(value):
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Invalid day '{value}' - use 'YYYY-MM-DD'.")
+
+# helper function to convert a time of day - text as 'HH:MM' - to text as 'HH:MM', checking it is valid
+def _time_of_day(value):
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        raise ValueError(f"Invalid departure time '{value}' - use 'HH:MM'.")
+
+# helper function to convert a flight duration (a timedelta) to minutes, checking it with 'validate_flight_duration'
+def _duration_minutes(duration):
+    hours, minutes = divmod(int(duration.total_seconds()) // 60, 60)
+    error = validate_flight_duration(hours, minutes)
+    if error:
+        raise ValueError(error)
+    return hours * 60 + minutes
+
+# helper function to add the occurrences of the schedules (or only 'schedule_id') departing after 'now' and up to the end of
+# the horizon which have not been added yet, using the provided connection (which must be in a transaction). The days
+# between each schedule's last materialized day and the end of the horizon are generated with a recursive query, and the
+# occurrences on the days the schedule operates are inserted with a single INSERT ... SELECT. A day which already has an
+# occurrence (including a cancelled one, which 'update_schedule' reinstates if needed) is skipped. Returns the number of flights added
+def _materialize(conn, now, horizon=SCHEDULE_HORIZON, schedule_id=None):
+    now_text, until = now.strftime(db_date_format), (now + horizon).strftime("%Y-%m-%d")
+    condition, params = ("AND schedule_id = ?", [schedule_id]) if schedule_id is not None else ("", [])
+    added = conn.execute(f'''
+        INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, status, schedule_id)
+        WITH RECURSIVE pending (schedule_id, day, last_day) AS (
+            SELECT schedule_id, MAX(valid_from, date(?), COALESCE(date(materialized_until, '+1 day'), '')), MIN(valid_to, ?)
+            FROM flight_schedules
+            WHERE COALESCE(materialized_until, '') < MIN(valid_to, ?) {condition}
+            UNION ALL
+            SELECT schedule_id, date(day, '+1 day'), last_day FROM pending WHERE day < last_day
+        )
+        SELECT s.flight_number, s.departure_airport_id, s.arrival_airport_id, datetime(p.day || ' ' || s.departure_time),
+            datetime(p.day || ' ' || s.departure_time, '+' || s.duration_minutes || ' minutes'), 'scheduled', s.schedule_id
+        FROM pending AS p
+        JOIN flight_schedules AS s ON s.schedule_id = p.schedule_id
+        WHERE p.day <= p.last_day AND {OPERATES_ON.format(days="s.days_of_week", day="p.day")}
+            AND datetime(p.day || ' ' || s.departure_time) > ?
+            AND NOT EXISTS (
+                SELECT 1 FROM flights AS f
+                WHERE f.schedule_id = s.schedule_id AND f.departure_time >= p.day AND f.departure_time < date(p.day, '+1 day')
+            )
+    ''', [now_text, until, until, *params, now_text]).rowcount
+    conn.execute(f'''
+        UPDATE flight_schedules SET materialized_until = MIN(valid_to, ?)
+        WHERE COALESCE(materialized_until, '') < MIN(valid_to, ?) {condition}
+    ''', [until, until, *params])
+    return added
+
+# function to add the occurrences of every schedule departing within 'horizon' (a timedelta) which have not been added to
+# the flights table yet. Checks whether any schedule needs occurrences first, so no write lock is taken when every schedule
+# is already materialized up to the horizon (as on every run but the first each day). Returns the number of flights added
+@retry_if_locked
+def materialize_schedules(horizon=SCHEDULE_HORIZON):
+    now = utc_now()
+    until = (now + horizon).strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        if not conn.execute("SELECT 1 FROM flight_schedules WHERE COALESCE(materialized_until, '') < MIN(valid_to, ?) LIMIT 1", (until,)).fetchone():
+            return 0
+    with transaction(immediate=True) as conn:
+        added = _materialize(conn, now, horizon)
+    if added:
+        reset_routes()
+    return added
+
+# function to create a recurring schedule without any user interaction: a flight between two airports operated on
+# 'days_of_week' (a bit mask, see 'flights_helpers.parse_days') departing at 'departure_time' ('HH:MM', GMT) for 'duration'
+# (a timedelta), from 'valid_from' to 'valid_to' (dates, or text as 'YYYY-MM-DD'). The schedule is given one flight number,
+# shared by all of its occurrences, and the occurrences within the horizon are added straight away. Returns the schedule's
+# ID, flight number and the number of flights added, or raises a ValueError if any detail is invalid
+@retry_if_locked
+def create_schedule(departure_airport_id, arrival_airport_id, days_of_week, departure_time, duration, valid_from, valid_to, horizon=SCHEDULE_HORIZON):
+    if departure_airport_id == arrival_airport_id:
+        raise ValueError("The arrival airport must be different from the departure airport.")
+    if not 0 < days_of_week < 128:
+        raise ValueError("The schedule must operate on at least one day of the week.")
+    departure_time, duration_minutes = _time_of_day(departure_time), _duration_minutes(duration)
+    valid_from, valid_to = _day(valid_from), _day(valid_to)
+    now = utc_now()
+    if valid_to < valid_from or valid_to < now.strftime("%Y-%m-%d"):
+        raise ValueError("The last day of the schedule must not be before the first day or in the past.")
+    with get_connection() as conn:
+        found = conn.execute("SELECT COUNT(*) FROM airports WHERE airport_id IN (?, ?)", (departure_airport_id, arrival_airport_id)).fetchone()[0]
+    if found != 2:
+        raise ValueError("The departure and arrival airports must both exist.")
+    flight_number = allocate_flight_numbers(1)[0]
+    with transaction(immediate=True) as conn:
+        schedule_id = conn.execute('''
+            INSERT INTO flight_schedules (flight_number, departure_airport_id, arrival_airport_id, days_of_week, departure_time, duration_minutes, valid_from, valid_to)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (flight_number, departure_airport_id, arrival_airport_id, days_of_week, departure_time, duration_minutes, valid_from, valid_to)
+        ).lastrowid
+        added = _materialize(conn, now, horizon, schedule_id)
+    if added:
+        reset_routes()
+    return {"schedule_id": schedule_id, "flight_number": flight_number, "added": added}
+
+# helper function to refresh the in-memory indexes and the conflicts of the pilots affected after occurrences of a schedule
+# have been moved, redirected or cancelled
+def _occurrences_changed(pilot_ids):
+    reset_routes()
+    pilot_ids = [pilot_id for pilot_id in pilot_ids if pilot_id is not None]
+    if pilot_ids:
+        reset_assignments()
+        scan_conflicts(pilot_ids)
+
+# function to change a recurring schedule without any user interaction - its departure time ('HH:MM'), duration (a
+# timedelta), arrival airport, days of the week (a bit mask) and/or last day - and apply the change to every occurrence
+# which has not departed, in one transaction. Occurrences are moved to the new time on the same day (keeping any pilot, whose
+# schedule is then checked for conflicts) and redirected with a single UPDATE. Occurrences on days the schedule no longer
+# operates are cancelled with another. Cancelled occurrences on days it did not operate before the change, but does now
+# (such as when a day of the week is added back, or the last day is moved later), are reinstated without a pilot, and
+# occurrences on any other new days within the horizon are added. Occurrences cancelled by hand on days the schedule kept
+# operating stay cancelled. Returns the number of flights rescheduled, cancelled, reinstated and added, or raises a
+# ValueError if the schedule or any detail is invalid
+@retry_if_locked
+def update_schedule(schedule_id, departure_time=None, duration=None, arrival_airport_id=None, days_of_week=None, valid_to=None, horizon=SCHEDULE_HORIZON):
+    now = utc_now()
+    now_text = now.strftime(db_date_format)
+    with transaction(immediate=True) as conn:
+        schedule = conn.execute('''
+            SELECT flight_number, departure_airport_id, arrival_airport_id, days_of_week, departure_time, duration_minutes, valid_from, valid_to
+            FROM flight_schedules WHERE schedule_id = ?
+        ''', (schedule_id,)).fetchone()
+        if not schedule:
+            raise ValueError(f"Schedule {schedule_id} does not exist.")
+        flight_number, departure_airport_id, current_arrival_airport_id, current_days, current_time, current_minutes, valid_from, current_valid_to = schedule
+        new_time = _time_of_day(departure_time) if departure_time is not None else current_time
+        new_minutes = _duration_minutes(duration) if duration is not None else current_minutes
+        new_arrival_airport_id = arrival_airport_id if arrival_airport_id is not None else current_arrival_airport_id
+        new_days = days_of_week if days_of_week is not None else current_days
+        new_valid_to = _day(valid_to) if valid_to is not None else current_valid_to
+        if not 0 < new_days < 128:
+            raise ValueError("The schedule must operate on at least one day of the week.")
+        if new_valid_to < valid_from or new_valid_to < now.strftime("%Y-%m-%d"):
+            raise ValueError("The last day of the schedule must not be before the first day or in the past.")
+        if new_arrival_airport_id == departure_airport_id:
+            raise ValueError("The arrival airport must be different from the departure airport.")
+        if not conn.execute("SELECT 1 FROM airports WHERE airport_id = ?", (new_arrival_airport_id,)).fetchone():
+            raise ValueError(f"Airport {new_arrival_airport_id} does not exist.")
+        conn.execute('''
+            UPDATE flight_schedules
+            SET arrival_airport_id = ?, days_of_week = ?, departure_time = ?, duration_minutes = ?, valid_to = ?, materialized_until = NULL
+            WHERE schedule_id = ?
+        ''', (new_arrival_airport_id, new_days, new_time, new_minutes, new_valid_to, schedule_id))
+        rescheduled = []
+        if (new_time, new_minutes, new_arrival_airport_id) != (current_time, current_minutes, current_arrival_airport_id):
+            rescheduled = conn.execute('''
+                UPDATE flights
+                SET departure_time = datetime(date(departure_time) || ' ' || ?),
+                    arrival_time = datetime(date(departure_time) || ' ' || ?, '+' || ? || ' minutes'),
+                    arrival_airport_id = ?
+                WHERE schedule_id = ? AND status = 'scheduled' AND departure_time > ? AND datetime(date(departure_time) || ' ' || ?) > ?
+                RETURNING pilot_id
+            ''', (new_time, new_time, new_minutes, new_arrival_airport_id, schedule_id, now_text, new_time, now_text)).fetchall()
+        cancelled = conn.execute(f'''
+            UPDATE flights SET status = 'cancelled'
+            WHERE schedule_id = ? AND status = 'scheduled' AND departure_time > ?
+                AND (NOT {OPERATES_ON.format(days="?", day="departure_time")} OR date(departure_time) > ?)
+            RETURNING pilot_id
+        ''', (schedule_id, now_text, new_days, new_valid_to)).fetchall()
+        reinstated = conn.execute(f'''
+            UPDATE flights
+            SET status = 'scheduled', pilot_id = NULL, arrival_airport_id = ?,
+                departure_time = datetime(date(departure_time) || ' ' || ?),
+                arrival_time = datetime(date(departure_time) || ' ' || ?, '+' || ? || ' minutes')
+            WHERE schedule_id = ? AND status = 'cancelled' AND datetime(date(departure_time) || ' ' || ?) > ?
+                AND {OPERATES_ON.format(days="?", day="departure_time")} AND date(departure_time) <= ?
+                AND (NOT {OPERATES_ON.format(days="?", day="departure_time")} OR date(departure_time) > ?)
+        ''', (new_arrival_airport_id, new_time, new_time, new_minutes, schedule_id, new_time, now_text, new_days, new_valid_to, current_days, current_valid_to)).rowcount
+        added = _materialize(conn, now, horizon, schedule_id)
+    if rescheduled or cancelled or reinstated or added:
+        _occurrences_changed(pilot_id for pilot_id, in rescheduled + cancelled)
+    return {
+        "schedule_id": schedule_id, "flight_number": flight_number, "rescheduled": len(rescheduled), "cancelled": len(cancelled),
+        "reinstated": reinstated, "added": added,
+    }
+
+# function to end a recurring schedule without any user interaction: every occurrence which has not departed is cancelled
+# with a single UPDATE, and no more are added. Returns the schedule's flight number and the number of flights cancelled,
+# or raises a ValueError if the schedule does not exist
+@retry_if_locked
+def cancel_schedule(schedule_id):
+    now = utc_now()
+    yesterday = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    with transaction(immediate=True) as conn:
+        schedule = conn.execute('''
+            UPDATE flight_schedules SET valid_to = MIN(valid_to, ?), materialized_until = MIN(valid_to, ?)
+            WHERE schedule_id = ?
+            RETURNING flight_number
+        ''', (yesterday, yesterday, schedule_id)).fetchone()
+        if not schedule:
+            raise ValueError(f"Schedule {schedule_id} does not exist.")
+        cancelled = conn.execute('''
+            UPDATE flights SET status = 'cancelled'
+            WHERE schedule_id = ? AND status = 'scheduled' AND departure_time > ?
+            RETURNING pilot_id
+        ''', (schedule_id, now.strftime(db_date_format))).fetchall()
+    if cancelled:
+        _occurrences_changed(pilot_id for pilot_id, in cancelled)
+    return {"schedule_id": schedule_id, "flight_number": schedule[0], "cancelled": len(cancelled)}
+
+# function to list every recurring schedule, with the number of its occurrences still to depart. Returns a list of
+# dictionaries with the keys in 'SCHEDULE_COLUMNS'
+def list_schedules():
+    with get_connection() as conn:
+        rows = conn.execute('''
+            SELECT s.schedule_id, s.flight_number, departure_airport.iata_code, arrival_airport.iata_code, s.days_of_week,
+                s.departure_time, s.duration_minutes, s.valid_from, s.valid_to, s.materialized_until,
+                (SELECT COUNT(*) FROM flights AS f WHERE f.schedule_id = s.schedule_id AND f.status = 'scheduled' AND f.departure_time > ?)
+            FROM flight_schedules AS s
+            JOIN airports AS departure_airport ON departure_airport.airport_id = s.departure_airport_id
+            JOIN airports AS arrival_airport ON arrival_airport.airport_id = s.arrival_airport_id
+            ORDER BY s.schedule_id
+        ''', (utc_now().strftime(db_date_format),)).fetchall()
+    return [dict(zip(SCHEDULE_COLUMNS, (*row[:4], format_days(row[4]), *row[5:]))) for row in rows]
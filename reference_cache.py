@@ -0,0 +1,89 @@
+import threading
+
+from database import get_connection, open_connection, replica_generation
+
+# in-process cache of the results of queries against the reference tables (pilots, airports and destinations), which are
+# small and change rarely but are displayed every time a menu is redrawn. Maps each (query, params) pair to its rows and
+# the tables the query reads from
+_cache = {}
+_lock = threading.Lock()
+
+# dedicated connection used to detect changes made by other connections. SQLite's 'PRAGMA data_version' returns a
+# different value whenever another connection has committed a change to the database since it was last checked
+_version_conn = None
+_data_version = None
+# the last seen version of each reference table, from the 'table_versions' table maintained by triggers
+_table_versions = {}
+# the replica snapshot '_version_conn' reads, in snapshot replica mode (see 'database.replica_generation')
+_generation = None
+# the last seen version of the flights table (see 'flights_version')
+_flights_version = None
+
+# query returning the version of the flights table - a number which increases with every change to it. Each update or
+# deletion gives a flight the next change number in 'flight_changes', and each insert takes the next flight ID (IDs are
+# never reused), so their sum increases whatever the change. Used by the in-memory indexes of the flights to tell whether
+# they are still up to date, without a trigger on every row of the flights table
+FLIGHTS_VERSION_QUERY = '''SELECT (SELECT COALESCE(MAX(change_seq), 0) FROM flight_changes)
+    + (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'flights')'''
+
+# helper function to discard cached results when the database has been changed by another connection (including one in
+# another program). When 'PRAGMA data_version' shows a change, the 'table_versions' table is read to find which
+# reference tables were modified, and only the results which read from those tables are discarded. An immutable replica
+# snapshot never reports changes, so when it has been refreshed the connection is reopened and the whole cache discarded
+def _check_for_changes():
+    global _version_conn, _data_version, _table_versions, _generation, _flights_version
+    generation = replica_generation()
+    if generation != _generation and _version_conn is not None:
+        _version_conn.close()
+        _version_conn, _data_version = None, None
+    _generation = generation
+    if _version_conn is None:
+        _version_conn = open_connection()
+    data_version = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == _data_version:
+        return
+    table_versions = dict(_version_conn.execute("SELECT table_name, version FROM table_versions"))
+    changed_tables = {table for table in set(table_versions) | set(_table_versions) if table_versions.get(table) != _table_versions.get(table)}
+    if _data_version is None:
+        _cache.clear()
+    elif changed_tables:
+        _invalidate(changed_tables)
+    _data_version, _table_versions = data_version, table_versions
+    _flights_version = _version_conn.execute(FLIGHTS_VERSION_QUERY).fetchone()[0]
+
+# helper function to discard the cached results of every query which reads from any of the provided tables
+def _invalidate(tables):
+    for key in [key for key, (_, query_tables) in _cache.items() if query_tables & tables]:
+        del _cache[key]
+
+# function to run a query against the reference tables and return all of its rows, using the cached rows when the same
+# query has been run with the same params since the tables it reads from ('tables') last changed
+def cached_query(query, params=(), tables=()):
+    key = (query, tuple(params))
+    with _lock:
+        _check_for_changes()
+        if key not in _cache:
+            with get_connection() as conn:
+                _cache[key] = (conn.execute(query, params).fetchall(), set(tables))
+        return _cache[key][0]
+
+# function to discard the cached results which read from any of the provided tables. Called after a table is changed by
+# this program (such as by 'add_airport' or 'add_pilot') so the change is displayed straight away. If no tables are
+# provided, the whole cache is cleared
+def invalidate(*tables):
+    with _lock:
+        if tables:
+            _invalidate(set(tables))
+        else:
+            _cache.clear()
+
+# function to return the version of the flights table (see 'FLIGHTS_VERSION_QUERY'). With 'conn', the version is read in
+# that connection's transaction - read at the start and end of a write transaction, the two versions tell an index whether
+# the transaction's changes were the only ones made. Otherwise the latest committed version is returned, which is only
+# read again when 'PRAGMA data_version' shows another connection has committed a change
+def flights_version(conn=None):
+    if conn is not None:
+        return conn.execute(FLIGHTS_VERSION_QUERY).fetchone()[0]
+    with _lock:
+        _check_for_changes()
+        return _flights_version
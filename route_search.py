@@ -0,0 +1,163 @@
+import threading
+from datetime import timedelta
+
+from database import get_connection
+from models import FlightTimetable, epoch_column, format_epoch, to_epoch, utc_now
+from reference_cache import cached_query, flights_version
+
+# shortest time allowed between landing at an airport and departing on the next flight of an itinerary
+MIN_CONNECTION_TIME = timedelta(hours=1)
+# default maximum number of connections (changes of flight) in an itinerary
+MAX_CONNECTIONS = 2
+# default length of the window the first flight must depart in, and how long after the window later flights are searched
+DEPARTURE_WINDOW = timedelta(hours=24)
+SEARCH_HORIZON = timedelta(hours=48)
+
+# in-memory timetable of the future scheduled flights, used to search for routes between airports without querying the
+# flights table. Every flight is a connection from its departure airport to its arrival airport, held in a 'FlightTimetable'
+# in departure order with its times in seconds since the epoch
+_timetable = FlightTimetable()
+_loaded = False
+_lock = threading.RLock()
+# the version of the flights table (see 'reference_cache.flights_version') the timetable is up to date with. When the
+# flights are changed by another connection - in this program or another - the timetable is reloaded for the next search
+_version = None
+
+# function to (re)load the timetable from the future scheduled flights. Called automatically the first time a route is
+# searched for, and whenever the flights have changed since. The version is read in the same transaction as the flights
+def load_routes():
+    global _timetable, _loaded, _version
+    with _lock:
+        with get_connection() as conn:
+            conn.execute("BEGIN")
+            version = flights_version(conn)
+            rows = conn.execute(f'''
+                SELECT flight_id, {epoch_column("departure_time")}, {epoch_column("arrival_time")}, departure_airport_id, arrival_airport_id, flight_number
+                FROM flights
+                WHERE status = 'scheduled' AND departure_time > ?
+            ''', (utc_now(),))
+            _timetable = FlightTimetable.from_rows(rows)
+        _loaded, _version = True, version
+
+# function to discard the timetable so it is reloaded from the flights table the next time a route is searched for.
+# Called after changes made in bulk, such as an import of flights
+def reset_routes():
+    global _timetable, _loaded
+    with _lock:
+        _timetable = FlightTimetable()
+        _loaded = False
+
+# helper function to check whether a change made by this program can be applied to the timetable. 'versions' is the
+# version of the flights table at the start and end of the transaction which made the change. The change is applied only
+# if the timetable was up to date with the version before it, and it is then up to date with the version after it;
+# otherwise the timetable is out of date and is reloaded for the next search
+def _in_step(versions):
+    global _version
+    if not _loaded or _version != versions[0]:
+        return False
+    _version = versions[1]
+    return True
+
+# function to add a newly scheduled flight to the timetable. Called after 'schedule_flight' inserts the flight. This and
+# the functions below accept the version of the flights table before and after the change ('versions', see '_in_step'),
+# and do nothing unless the timetable was up to date before it, as the change is then picked up from the database
+def record_flight(flight_id, flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, versions):
+    with _lock:
+        if _in_step(versions):
+            _timetable.add(flight_id, to_epoch(departure_time), to_epoch(arrival_time), departure_airport_id, arrival_airport_id, flight_number)
+
+# function to move a flight to new departure and arrival times. Called after 'change_flight_departure_time' updates the database
+def move_flight(flight_id, departure_time, arrival_time, versions):
+    with _lock:
+        flight = _timetable.remove(flight_id) if _in_step(versions) else None
+        if flight is not None:
+            _timetable.add(flight_id, to_epoch(departure_time), to_epoch(arrival_time), flight[2], flight[3], flight[4])
+
+# function to change the arrival airport of a flight. Called after 'change_flight_destination' updates the database
+def redirect_flight(flight_id, arrival_airport_id, versions):
+    with _lock:
+        if _in_step(versions):
+            _timetable.redirect(flight_id, arrival_airport_id)
+
+# function to remove a flight from the timetable. Called after 'cancel_flight' cancels the flight
+def remove_flight(flight_id, versions):
+    with _lock:
+        if _in_step(versions):
+            _timetable.remove(flight_id)
+
+# helper function to load the timetable if it has not been loaded yet, or reload it if the flights have changed since
+def _ensure_loaded():
+    if not _loaded or _version != flights_version():
+        load_routes()
+
+# function to find the earliest-arriving itineraries from one airport to another with the connection scan algorithm. The
+# first flight must depart between 'earliest_departure' and 'latest_departure' (by default a day later). The connections
+# are scanned once in departure order from 'earliest_departure', keeping the earliest arrival at each airport for each
+# number of flights taken (up to 'max_connections' + 1); a flight can be taken from an airport reached with one fewer flight
+# if it departs at least 'min_connection' after landing there. The scan stops once flights depart after the earliest direct
+# arrival (no later flight can improve on it) or 'SEARCH_HORIZON' after the window. Returns the best itinerary for each
+# number of connections which arrives earlier than every itinerary with fewer connections, fewest connections first
+def find_routes(origin_id, destination_id, earliest_departure, latest_departure=None, max_connections=MAX_CONNECTIONS, min_connection=MIN_CONNECTION_TIME):
+    if origin_id == destination_id:
+        raise ValueError("The origin and destination airports must be different.")
+    latest_departure = latest_departure or earliest_departure + DEPARTURE_WINDOW
+    horizon = to_epoch(latest_departure + SEARCH_HORIZON)
+    earliest_departure, latest_departure = to_epoch(earliest_departure), to_epoch(latest_departure)
+    min_connection = int(min_connection.total_seconds())
+    max_flights = max_connections + 1
+    never = float("inf")
+    # earliest[count] maps each airport to the earliest arrival there using exactly 'count' flights, and taken[count] to
+    # the position in the timetable of the flight which arrived then
+    earliest = [{} for _ in range(max_flights + 1)]
+    taken = [{} for _ in range(max_flights + 1)]
+    with _lock:
+        _ensure_loaded()
+        departures, arrivals, origins, destinations = _timetable.departures, _timetable.arrivals, _timetable.origins, _timetable.destinations
+        for index in range(_timetable.first_departing(earliest_departure), len(_timetable)):
+            departure_time, arrival_time = departures[index], arrivals[index]
+            direct = earliest[1].get(destination_id)
+            if departure_time > horizon or (direct is not None and departure_time > direct):
+                break
+            departure_airport_id, arrival_airport_id = origins[index], destinations[index]
+            if arrival_airport_id == origin_id:
+                continue
+            for count in range(1, max_flights + 1):
+                if count == 1:
+                    can_board = departure_airport_id == origin_id and departure_time <= latest_departure
+                else:
+                    landed = earliest[count - 1].get(departure_airport_id)
+                    can_board = landed is not None and landed + min_connection <= departure_time
+                if can_board and arrival_time < earliest[count].get(arrival_airport_id, never):
+                    earliest[count][arrival_airport_id] = arrival_time
+                    taken[count][arrival_airport_id] = index
+        itineraries = []
+        best_arrival = never
+        for count in range(1, max_flights + 1):
+            arrival_time = earliest[count].get(destination_id)
+            if arrival_time is None or arrival_time >= best_arrival:
+                continue
+            best_arrival = arrival_time
+            legs, airport_id = [], destination_id
+            for leg in range(count, 0, -1):
+                legs.append(_timetable.leg(taken[leg][airport_id]))
+                airport_id = legs[-1][3]
+            itineraries.append(legs[::-1])
+    return [_describe(legs) for legs in itineraries]
+
+# helper function to describe an itinerary - a list of (flight_id, departure, arrival, departure_airport_id,
+# arrival_airport_id, flight_number) legs from the timetable - with the airports' IATA codes
+def _describe(legs):
+    iata_codes = dict(cached_query("SELECT airport_id, iata_code FROM airports", tables=("airports",)))
+    departure_time, arrival_time = legs[0][1], legs[-1][2]
+    return {
+        "connections": len(legs) - 1,
+        "departure_time": format_epoch(departure_time),
+        "arrival_time": format_epoch(arrival_time),
+        "duration_minutes": (arrival_time - departure_time) // 60,
+        "route": "-".join([iata_codes.get(legs[0][3], str(legs[0][3]))] + [iata_codes.get(leg[4], str(leg[4])) for leg in legs]),
+        "flights": [{
+            "flight_id": flight_id, "flight_number": flight_number,
+            "from": iata_codes.get(origin, origin), "to": iata_codes.get(destination, destination),
+            "departure_time": format_epoch(departure), "arrival_time": format_epoch(arrival),
+        } for flight_id, departure, arrival, origin, destination, flight_number in legs],
+    }
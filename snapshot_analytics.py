@@ -0,0 +1,169 @@
+import json
+import os
+from array import array
+from datetime import datetime, timezone
+
+from snapshot_export import COLUMNS, SNAPSHOT_DIR, STATUS_CODES, partition_path, read_column, read_manifest
+
+# NumPy is optional - when it is installed, the aggregates are calculated with whole-column operations over the snapshot's
+# '.npy' files, otherwise the same aggregates are calculated with the standard library, a row at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# code of cancelled flights in the 'status' column
+CANCELLED = STATUS_CODES.index("cancelled")
+
+# default number of routes, airports or pilots listed in a report
+REPORT_LIMIT = 50
+
+# function to load columns of the snapshot in 'snapshot_dir' (by default every column except the flight numbers),
+# optionally only the partitions of the months from 'start_month' to 'end_month' ('YYYY-MM', inclusive). Returns a
+# dictionary of column name to NumPy array, or to 'array' when NumPy is not installed. Raises a ValueError if no snapshot
+# has been exported
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR, start_month=None, end_month=None, columns=None):
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        raise ValueError(f"No snapshot has been exported to '{snapshot_dir}' - export one first.")
+    months = [
+        month for month in manifest["months"]
+        if (start_month is None or month >= start_month) and (end_month is None or month <= end_month)
+    ]
+    typecodes = {name: typecode for name, typecode, _ in COLUMNS}
+    loaded = {}
+    for name in columns or [name for name, _, _ in COLUMNS if name != "flight_number"]:
+        paths = [os.path.join(partition_path(snapshot_dir, month), f"{name}.npy") for month in months]
+        if numpy is not None:
+            loaded[name] = numpy.concatenate([numpy.load(path) for path in paths]) if paths else numpy.array([], dtype=numpy.int64)
+        else:
+            loaded[name] = array(typecodes[name])
+            for path in paths:
+                loaded[name].extend(read_column(path, typecodes[name]))
+    return loaded
+
+# helper function to read one of the reference tables ('airports', 'destinations' or 'pilots') written with the snapshot,
+# as a dictionary keyed by ID
+def _reference_table(snapshot_dir, table):
+    with open(os.path.join(snapshot_dir, f"{table}.json"), encoding="utf-8") as file:
+        rows = json.load(file)
+    return {row[next(iter(row))]: row for row in rows}
+
+# helper function to select the rows to aggregate: those whose status is (or, with 'exclude', is not) 'status', and
+# optionally only those where the column 'present' is not -1 (such as flights with a pilot)
+def _mask(columns, status, exclude=False, present=None):
+    if numpy is not None:
+        mask = columns["status"] != status if exclude else columns["status"] == status
+        return mask & (columns[present] != -1) if present else mask
+    if present:
+        return [(code != status) == exclude and value != -1 for code, value in zip(columns["status"], columns[present])]
+    return [(code != status) == exclude for code in columns["status"]]
+
+# helper function to group the selected rows ('mask') by one or two key columns and calculate the count, total, minimum
+# and maximum of a value column in each group. With NumPy, the keys are combined into one 64-bit integer, grouped with
+# 'unique', counted and totalled with 'bincount', and the minimum and maximum are taken with 'reduceat' over the values
+# sorted by group. Returns a dictionary of key tuple to (count, total, minimum, maximum)
+def _aggregate(keys, values, mask):
+    if numpy is None:
+        groups = {}
+        for *key, value, selected in zip(*keys, values, mask):
+            if not selected:
+                continue
+            key = tuple(key)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [1, value, value, value]
+            else:
+                group[0] += 1
+                group[1] += value
+                group[2] = min(group[2], value)
+                group[3] = max(group[3], value)
+        return {key: tuple(group) for key, group in groups.items()}
+    combined = keys[0][mask].astype(numpy.int64) + 1
+    if len(keys) == 2:
+        combined = (combined << 32) | (keys[1][mask].astype(numpy.int64) + 1)
+    values = values[mask].astype(numpy.int64)
+    if not len(values):
+        return {}
+    unique, inverse = numpy.unique(combined, return_inverse=True)
+    counts = numpy.bincount(inverse)
+    totals = numpy.bincount(inverse, weights=values)
+    ordered = values[numpy.argsort(inverse, kind="stable")]
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+    minimums, maximums = numpy.minimum.reduceat(ordered, starts), numpy.maximum.reduceat(ordered, starts)
+    groups = {}
+    for key, count, total, minimum, maximum in zip(unique.tolist(), counts.tolist(), totals.tolist(), minimums.tolist(), maximums.tolist()):
+        key = ((key >> 32) - 1, (key & 0xFFFFFFFF) - 1) if len(keys) == 2 else (key - 1,)
+        groups[key] = (count, int(total), minimum, maximum)
+    return groups
+
+# helper function to sort report records by the number of flights, busiest first, and keep the first 'limit'. The records
+# are built in ID order, and records with the same number of flights keep that order
+def _busiest(records, limit):
+    records.sort(key=lambda record: -record["flights"])
+    return records[:limit] if limit else records
+
+# helper function to format a time from the snapshot (seconds since the epoch, GMT) in the database's format
+def _format_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+# function to report each route (departure and arrival airport) in the snapshot, busiest first: the number of flights
+# operated (not cancelled), with their average, shortest and longest duration in minutes, and the number cancelled
+def route_summary(snapshot_dir=SNAPSHOT_DIR, start_month=None, end_month=None, limit=REPORT_LIMIT):
+    columns = load_snapshot(snapshot_dir, start_month, end_month, ["departure_airport_id", "arrival_airport_id", "duration_minutes", "status"])
+    airports = _reference_table(snapshot_dir, "airports")
+    keys = [columns["departure_airport_id"], columns["arrival_airport_id"]]
+    operated = _aggregate(keys, columns["duration_minutes"], _mask(columns, CANCELLED, exclude=True))
+    cancelled = _aggregate(keys, columns["duration_minutes"], _mask(columns, CANCELLED))
+    records = []
+    for key in sorted(operated.keys() | cancelled.keys()):
+        flights, total, shortest, longest = operated.get(key, (0, 0, None, None))
+        records.append({
+            "route": "-".join(airports.get(airport_id, {}).get("iata_code", str(airport_id)) for airport_id in key),
+            "departure_airport_id": key[0], "arrival_airport_id": key[1], "flights": flights,
+            "avg_duration_minutes": round(total / flights, 1) if flights else None,
+            "min_duration_minutes": shortest, "max_duration_minutes": longest,
+            "cancelled": cancelled.get(key, (0,))[0],
+        })
+    return _busiest(records, limit)
+
+# function to report each airport in the snapshot, busiest first: the number of flights operated (not cancelled)
+# departing from and arriving at it, and the number of its departures cancelled
+def airport_summary(snapshot_dir=SNAPSHOT_DIR, start_month=None, end_month=None, limit=REPORT_LIMIT):
+    columns = load_snapshot(snapshot_dir, start_month, end_month, ["departure_airport_id", "arrival_airport_id", "duration_minutes", "status"])
+    airports = _reference_table(snapshot_dir, "airports")
+    destinations = _reference_table(snapshot_dir, "destinations")
+    operated = _mask(columns, CANCELLED, exclude=True)
+    departures = _aggregate([columns["departure_airport_id"]], columns["duration_minutes"], operated)
+    arrivals = _aggregate([columns["arrival_airport_id"]], columns["duration_minutes"], operated)
+    cancelled = _aggregate([columns["departure_airport_id"]], columns["duration_minutes"], _mask(columns, CANCELLED))
+    records = []
+    for key in sorted(departures.keys() | arrivals.keys() | cancelled.keys()):
+        airport = airports.get(key[0], {})
+        destination = destinations.get(airport.get("destination_id"), {})
+        record = {
+            "airport_id": key[0], "iata_code": airport.get("iata_code"), "city": destination.get("city"), "country": destination.get("country"),
+            "departures": departures.get(key, (0,))[0], "arrivals": arrivals.get(key, (0,))[0], "cancelled_departures": cancelled.get(key, (0,))[0],
+        }
+        record["flights"] = record["departures"] + record["arrivals"]
+        records.append(record)
+    return _busiest(records, limit)
+
+# function to report each pilot in the snapshot, busiest first: the number of flights they operated (not cancelled),
+# their total flying hours, and their first and last departure
+def pilot_summary(snapshot_dir=SNAPSHOT_DIR, start_month=None, end_month=None, limit=REPORT_LIMIT):
+    columns = load_snapshot(snapshot_dir, start_month, end_month, ["pilot_id", "duration_minutes", "departure_time", "status"])
+    pilots = _reference_table(snapshot_dir, "pilots")
+    operated = _mask(columns, CANCELLED, exclude=True, present="pilot_id")
+    minutes = _aggregate([columns["pilot_id"]], columns["duration_minutes"], operated)
+    departures = _aggregate([columns["pilot_id"]], columns["departure_time"], operated)
+    records = []
+    for key, (flights, total, _, _) in sorted(minutes.items()):
+        pilot = pilots.get(key[0], {})
+        _, _, first, last = departures[key]
+        records.append({
+            "pilot_id": key[0], "name": f"{pilot.get('first_name', '')} {pilot.get('last_name', '')}".strip() or None,
+            "flights": flights, "flight_hours": round(total / 60, 1),
+            "first_departure": _format_time(first), "last_departure": _format_time(last),
+        })
+    return _busiest(records, limit)
@@ -0,0 +1,250 @@
+import ast
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+
+from database import get_connection
+from models import utc_now
+
+# export of the flights history to a compact columnar snapshot, so reports can be calculated without reading the live
+# database. Each month of departures is a partition directory ('month=2030-06') holding one file per column in NumPy's
+# '.npy' format - written here with the standard library, and readable with 'numpy.load' or 'read_column'. Times are
+# stored as seconds since the epoch (GMT), IDs as integers (-1 where there is none) and statuses as codes; flight numbers
+# are stored as codes into a list of the partition's flight numbers. The airports, destinations and pilots are written
+# alongside as JSON, and 'manifest.json' records the partitions and how far the export has read. Usage:
+#
+#   python snapshot_export.py                # export new and changed flights since the last run
+#   python snapshot_export.py --full         # rewrite the whole snapshot
+
+# default directory of the snapshot
+SNAPSHOT_DIR = "flight_snapshot"
+
+# version of the snapshot layout, recorded in the manifest - a snapshot with a different version is rewritten in full
+SNAPSHOT_VERSION = 1
+
+# the columns of each partition as (name, array type code, '.npy' data type) tuples, in the order of the rows read by
+# '_FLIGHT_QUERY' (after the month)
+COLUMNS = [
+    ("flight_id", "q", "<i8"),
+    ("flight_number", "i", "<i4"),
+    ("departure_time", "q", "<i8"),
+    ("arrival_time", "q", "<i8"),
+    ("duration_minutes", "i", "<i4"),
+    ("departure_airport_id", "i", "<i4"),
+    ("arrival_airport_id", "i", "<i4"),
+    ("pilot_id", "i", "<i4"),
+    ("status", "b", "|i1"),
+]
+
+# flight statuses in the order of their codes in the 'status' column (-1 for a flight without a status)
+STATUS_CODES = ["scheduled", "departed", "cancelled"]
+
+# number of rows read from the database at a time during an export
+EXPORT_BATCH_SIZE = 10000
+
+# query reading the flights for the snapshot, with the month each departs in first. Flights without a departure time
+# cannot be placed in a month, so are left out
+_FLIGHT_QUERY = f'''
+    SELECT substr(departure_time, 1, 7), flight_id, flight_number,
+        CAST(strftime('%s', departure_time) AS INTEGER), COALESCE(CAST(strftime('%s', arrival_time) AS INTEGER), -1),
+        COALESCE(duration_minutes, -1), COALESCE(departure_airport_id, -1), COALESCE(arrival_airport_id, -1),
+        COALESCE(pilot_id, -1), CASE status {" ".join(f"WHEN '{status}' THEN {code}" for code, status in enumerate(STATUS_CODES))} ELSE -1 END
+    FROM flights
+    WHERE departure_time IS NOT NULL
+'''
+
+# helper function to write a one-dimensional array to a file in NumPy's '.npy' format (version 1.0): a magic string, the
+# length of the header, a header describing the data type and shape padded so the data starts on a 64 byte boundary, then
+# the values in little-endian order
+def write_column(path, values, descr):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    with open(path, "wb") as file:
+        file.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin-1"))
+        file.write(values.tobytes())
+
+# helper function to read a column written by 'write_column' into an array with the provided type code
+def read_column(path, typecode):
+    with open(path, "rb") as file:
+        if file.read(8) != b"\x93NUMPY\x01\x00":
+            raise ValueError(f"'{path}' is not a snapshot column.")
+        header = ast.literal_eval(file.read(int.from_bytes(file.read(2), "little")).decode("latin-1"))
+        values = array(typecode)
+        values.frombytes(file.read())
+    if values.itemsize != int(header["descr"][2:]) or len(values) != header["shape"][0]:
+        raise ValueError(f"'{path}' does not hold {header['shape'][0]} values of type {header['descr']}.")
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+# helper function to return the directory of a month's partition
+def partition_path(snapshot_dir, month):
+    return os.path.join(snapshot_dir, f"month={month}")
+
+# function to read the snapshot's manifest, or None if no snapshot has been exported to 'snapshot_dir'
+def read_manifest(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, "manifest.json"), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+# helper function to write a file in the snapshot by writing a temporary file and renaming it over the old one, so a
+# reader never sees a partly written file
+def _write_json(path, value):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(value, file)
+    os.replace(path + ".tmp", path)
+
+# helper function to read every row of a month's partition back into the tuples read by '_FLIGHT_QUERY' (without the month)
+def _read_partition(snapshot_dir, month):
+    path = partition_path(snapshot_dir, month)
+    columns = [read_column(os.path.join(path, f"{name}.npy"), typecode) for name, typecode, _ in COLUMNS]
+    with open(os.path.join(path, "flight_number.json"), encoding="utf-8") as file:
+        flight_numbers = json.load(file)
+    columns[1] = [flight_numbers[code] for code in columns[1]]
+    return list(zip(*columns))
+
+# helper function to write a month's partition from its rows, in departure order. The partition is written to a temporary
+# directory which then replaces the old one
+def _write_partition(snapshot_dir, month, rows):
+    path = partition_path(snapshot_dir, month)
+    temporary = path + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    rows.sort(key=lambda row: (row[2], row[0]))
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in COLUMNS]
+    flight_numbers = sorted(set(columns[1]))
+    codes = {flight_number: code for code, flight_number in enumerate(flight_numbers)}
+    columns[1] = [codes[flight_number] for flight_number in columns[1]]
+    for (name, typecode, descr), values in zip(COLUMNS, columns):
+        write_column(os.path.join(temporary, f"{name}.npy"), array(typecode, values), descr)
+    _write_json(os.path.join(temporary, "flight_number.json"), flight_numbers)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporary, path)
+
+# helper function to write the airports, destinations and pilots to the snapshot as JSON, so reports can name them
+def _write_reference_tables(conn, snapshot_dir):
+    tables = {
+        "airports": ("SELECT airport_id, airport_name, iata_code, destination_id FROM airports", ["airport_id", "airport_name", "iata_code", "destination_id"]),
+        "destinations": ("SELECT destination_id, city, country FROM destinations", ["destination_id", "city", "country"]),
+        "pilots": ("SELECT pilot_id, first_name, last_name FROM pilots", ["pilot_id", "first_name", "last_name"]),
+    }
+    for table, (query, names) in tables.items():
+        _write_json(os.path.join(snapshot_dir, f"{table}.json"), [dict(zip(names, row)) for row in conn.execute(query)])
+
+# helper function to write every flight to the snapshot, reading them in departure order and writing each month's partition
+# as soon as the next month starts. Partitions left from an earlier export with no flights now are removed. Returns the
+# number of rows in each month's partition, and the number of rows and partitions written
+def _export_all(conn, snapshot_dir):
+    months = {}
+    cursor = conn.execute(_FLIGHT_QUERY + " ORDER BY departure_time, flight_id")
+    month, rows = None, []
+    while True:
+        batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        for row in batch:
+            if row[0] != month:
+                if rows:
+                    _write_partition(snapshot_dir, month, rows)
+                    months[month] = len(rows)
+                month, rows = row[0], []
+            rows.append(row[1:])
+        if not batch:
+            break
+    if rows:
+        _write_partition(snapshot_dir, month, rows)
+        months[month] = len(rows)
+    for name in os.listdir(snapshot_dir):
+        if name.startswith("month=") and name[6:] not in months:
+            shutil.rmtree(os.path.join(snapshot_dir, name))
+    return months, {"rows": sum(months.values()), "partitions": len(months)}
+
+# helper function to apply the flights inserted or changed since the last export to the snapshot. The partitions holding
+# the old versions of changed flights (found by reading their 'flight_id' columns) and the partitions of the months the
+# new and changed flights now depart in are read, the old versions replaced, and written back. Deleted flights are removed.
+# Returns the number of rows in each month's partition, and the number of rows and partitions written
+def _export_changes(conn, snapshot_dir, manifest):
+    months = dict(manifest["months"])
+    changed_ids = {flight_id for flight_id, in conn.execute(
+        "SELECT flight_id FROM flight_changes WHERE change_seq > ?", (manifest["last_change_seq"],)
+    )}
+    rows = conn.execute(
+        _FLIGHT_QUERY + " AND (flight_id > ? OR flight_id IN (SELECT flight_id FROM flight_changes WHERE change_seq > ?))",
+        (manifest["last_flight_id"], manifest["last_change_seq"])
+    ).fetchall()
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[0], []).append(row[1:])
+    touched = set(by_month)
+    if changed_ids:
+        for month in months:
+            flight_ids = read_column(os.path.join(partition_path(snapshot_dir, month), "flight_id.npy"), "q")
+            if not changed_ids.isdisjoint(flight_ids):
+                touched.add(month)
+    replaced = changed_ids | {row[1] for row in rows}
+    for month in sorted(touched):
+        kept = [row for row in _read_partition(snapshot_dir, month) if row[0] not in replaced] if month in months else []
+        kept.extend(by_month.get(month, []))
+        if kept:
+            _write_partition(snapshot_dir, month, kept)
+            months[month] = len(kept)
+        else:
+            shutil.rmtree(partition_path(snapshot_dir, month), ignore_errors=True)
+            months.pop(month, None)
+    return dict(sorted(months.items())), {"rows": len(rows), "partitions": len(touched)}
+
+# function to export the flights to a columnar snapshot in 'snapshot_dir'. The first export (or one with 'full') reads
+# every flight in departure order and writes each month's partition as soon as it is complete, so only one month is held
+# in memory. Later exports read only the flights inserted (with IDs above the last exported) or changed (recorded in the
+# 'flight_changes' table) since the last export, and rewrite only the partitions they were in or are now in. Everything
+# is read in one read transaction, so the snapshot matches the database at a single point in time. Returns a summary of
+# the rows exported, the partitions written and the time taken
+def export_snapshot(snapshot_dir=SNAPSHOT_DIR, full=False):
+    started = time.perf_counter()
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or manifest.get("version") != SNAPSHOT_VERSION:
+        full = True
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with get_connection() as conn:
+        conn.execute("BEGIN")
+        last_flight_id = conn.execute("SELECT COALESCE(MAX(flight_id), 0) FROM flights").fetchone()[0]
+        last_change_seq = conn.execute("SELECT COALESCE(MAX(change_seq), 0) FROM flight_changes").fetchone()[0]
+        if full:
+            months, exported = _export_all(conn, snapshot_dir)
+        else:
+            months, exported = _export_changes(conn, snapshot_dir, manifest)
+        _write_reference_tables(conn, snapshot_dir)
+    _write_json(os.path.join(snapshot_dir, "manifest.json"), {
+        "version": SNAPSHOT_VERSION,
+        "exported_at": utc_now().isoformat(timespec="seconds"),
+        "last_flight_id": last_flight_id,
+        "last_change_seq": last_change_seq,
+        "columns": {name: descr for name, _, descr in COLUMNS},
+        "statuses": STATUS_CODES,
+        "months": months,
+    })
+    return {
+        "full": full,
+        "rows_exported": exported["rows"],
+        "partitions_written": exported["partitions"],
+        "rows": sum(months.values()),
+        "partitions": len(months),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+# allows the snapshot to be exported from the command line, e.g. by a scheduled job
+if __name__ == "__main__":
+    import argparse
+    from migrations import run_migrations
+    parser = argparse.ArgumentParser(description="Export the flights history to a columnar snapshot partitioned by month.")
+    parser.add_argument("--snapshot", default=SNAPSHOT_DIR, help=f"snapshot directory (default: {SNAPSHOT_DIR})")
+    parser.add_argument("--full", action="store_true", help="rewrite the whole snapshot instead of exporting only the changes")
+    args = parser.parse_args()
+    run_migrations()
+    print(json.dumps(export_snapshot(args.snapshot, args.full)))
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conflicts
+import database
+import flight_numbers
+import pilot_availability
+import reference_cache
+import route_search
+from migrations import run_migrations, seed_sample_data
+from models import utc_now
+
+# helper function to close the connections the modules keep open between calls, so the next test opens its own database
+def _close_connections():
+    while True:
+        try:
+            database._pool.get_nowait().close()
+        except database.queue.Empty:
+            break
+    if reference_cache._version_conn is not None:
+        reference_cache._version_conn.close()
+    reference_cache._version_conn, reference_cache._data_version, reference_cache._flights_version = None, None, None
+    reference_cache._table_versions = {}
+    reference_cache._cache.clear()
+
+# fixture to run a test against a new database in a temporary directory, migrated and holding the sample destinations,
+# airports (IDs 1 to 23) and pilots (IDs 1 to 10). The in-memory indexes and caches are reset before and after, so no state
+# is shared between tests. Background checkpoints are disabled
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "flight_management"))
+    monkeypatch.setitem(database._storage, "checkpoint_interval", 0)
+    _close_connections()
+    pilot_availability.reset_assignments()
+    route_search.reset_routes()
+    monkeypatch.setattr(conflicts, "_full_scan_done", False)
+    monkeypatch.setattr(flight_numbers, "_reserved", {code: deque() for code in flight_numbers.AIRLINE_CODES})
+    monkeypatch.setattr(flight_numbers, "_exhausted_codes", set())
+    run_migrations()
+    seed_sample_data()
+    with database.transaction() as conn:
+        conn.execute("DELETE FROM flights")
+    yield tmp_path
+    _close_connections()
+    pilot_availability.reset_assignments()
+    route_search.reset_routes()
+
+# fixture to run a test with the local clock set to a time zone either side of GMT, so any time read from the local clock
+# instead of GMT is hours out
+@pytest.fixture(params=["America/New_York", "Asia/Tokyo"])
+def local_time_zone(request, monkeypatch):
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+# helper function to add a flight directly to the database and return its ID. 'departure' is a datetime, or a number of
+# hours from now, and 'hours' is the flight's duration
+def add_flight(departure, hours=2, origin=1, destination=2, pilot_id=None, status="scheduled", flight_number=None):
+    if not isinstance(departure, datetime):
+        departure = utc_now().replace(microsecond=0) + timedelta(hours=departure)
+    arrival = departure + timedelta(hours=hours)
+    with database.transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (flight_number or "TS000", origin, destination, pilot_id, departure.strftime("%Y-%m-%d %H:%M:%S"),
+              arrival.strftime("%Y-%m-%d %H:%M:%S"), status))
+        return cursor.lastrowid
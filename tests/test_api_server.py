@@ -0,0 +1,155 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+import api_server
+from conftest import add_flight
+from database import transaction
+from models import utc_now
+
+# seconds a read may take before the server in these tests answers '504 Gateway Timeout'
+REQUEST_TIMEOUT = 1
+
+# helper function to find a port no other program is listening on
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# fixture to run the API server with 'serve' on its own event loop in a background thread, against the test database and
+# without the background status updates. Yields the port it listens on, and stops the server afterwards
+@pytest.fixture
+def server(db, monkeypatch):
+    import database_queries
+    monkeypatch.setattr(database_queries, "start_flight_status_updates", lambda: threading.Event())
+    port = _free_port()
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(api_server.serve(port=port, workers=2, request_timeout=REQUEST_TIMEOUT))
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        # connections still open when the server stops are closed before the loop
+        pending = asyncio.all_tasks(loop)
+        for client in pending:
+            client.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    yield port
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(10)
+    loop.close()
+
+# helper function to send a request and return the response's status, headers and body
+def _request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, path, body=body if body is None or isinstance(body, (str, bytes)) else json.dumps(body))
+        response = conn.getresponse()
+        return response.status, response.headers, response.read()
+    finally:
+        conn.close()
+
+# helper function to add 'count' future flights at once
+def _add_flights(count):
+    start = utc_now().replace(microsecond=0) + timedelta(days=1)
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, status)
+            VALUES (?, 1, 2, ?, ?, 'scheduled')
+        ''', [(f"TS{index:04d}", str(start + timedelta(minutes=index)), str(start + timedelta(minutes=index + 120))) for index in range(count)])
+
+def test_health(server):
+    status, _, body = _request(server, "GET", "/health")
+    assert status == 200
+    assert json.loads(body)["status"] == "ok"
+
+def test_unknown_flight_and_endpoint(server):
+    assert _request(server, "GET", "/flights/9999")[0] == 404
+    assert _request(server, "POST", "/flights/9999/cancel", {})[0] == 404
+    assert _request(server, "GET", "/no-such-endpoint")[0] == 404
+
+def test_wrong_method(server):
+    assert _request(server, "DELETE", "/flights")[0] == 405
+    assert _request(server, "POST", "/pilots", {})[0] == 405
+
+def test_bad_request_bodies(server):
+    for body in ("not json", "[1, 2]", {}, {"from": "JFK", "to": "LHR", "departure": "yesterday", "duration": "2:00"}):
+        status, _, response = _request(server, "POST", "/flights", body)
+        assert status == 400
+        assert json.loads(response)["error"]
+    # a flight which exists but has departed is an invalid request rather than a missing one
+    departed = add_flight(-5)
+    assert _request(server, "POST", f"/flights/{departed}/cancel", {})[0] == 400
+
+def test_schedule_and_show_a_flight(server):
+    departure = (utc_now() + timedelta(days=2)).strftime("%d-%m-%Y %H:%M")
+    status, _, body = _request(server, "POST", "/flights", {"from": "1", "to": "2", "departure": departure, "duration": "2:30"})
+    assert status == 201
+    flight_id = json.loads(body)["flight_id"]
+    status, _, body = _request(server, "GET", f"/flights/{flight_id}")
+    assert (status, json.loads(body)["flight_id"]) == (200, flight_id)
+
+def test_listing_streamed_over_several_pages(server):
+    count = api_server.STREAM_PAGE_SIZE * 2 + 300
+    _add_flights(count + 50)
+    status, headers, body = _request(server, "GET", f"/flights?limit={count}")
+    assert status == 200
+    assert headers["Transfer-Encoding"] == "chunked"
+    flights = json.loads(body)
+    assert len(flights) == count
+    assert [flight["flight_number"] for flight in flights] == [f"TS{index:04d}" for index in range(count)]
+
+def test_error_part_way_through_a_stream_closes_the_connection(server, monkeypatch):
+    import cli
+    to_records = cli.to_records
+    def failing_records(rows, columns):
+        for index, record in enumerate(to_records(rows, columns)):
+            if index == api_server.STREAM_PAGE_SIZE + 10:
+                raise RuntimeError("lost the disk")
+            yield record
+    monkeypatch.setattr(cli, "to_records", failing_records)
+    _add_flights(api_server.STREAM_PAGE_SIZE * 2)
+    with socket.create_connection(("127.0.0.1", server), timeout=10) as sock:
+        sock.sendall(f"GET /flights?limit={api_server.STREAM_PAGE_SIZE * 2} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = b"".join(iter(lambda: sock.recv(65536), b""))
+    # the first page is sent, then the connection is closed with the array unterminated, rather than an error response
+    # being written into the middle of it
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.count(b"flight_number") == api_server.STREAM_PAGE_SIZE
+    assert b"HTTP/1.1 500" not in response and not response.endswith(b"0\r\n\r\n")
+    assert _request(server, "GET", "/health")[0] == 200
+
+def test_slow_read_times_out_but_a_change_is_waited_for(server, monkeypatch):
+    import flights
+    import flights_helpers
+    find_flight, cancel_flight = flights_helpers.find_flight, flights.cancel_flight
+    def slow(function):
+        def call(*args, **options):
+            time.sleep(REQUEST_TIMEOUT * 1.5)
+            return function(*args, **options)
+        return call
+    flight_id = add_flight(24)
+    monkeypatch.setattr(flights_helpers, "find_flight", slow(find_flight))
+    assert _request(server, "GET", f"/flights/{flight_id}")[0] == 504
+    monkeypatch.setattr(flights_helpers, "find_flight", find_flight)
+    monkeypatch.setattr(flights, "cancel_flight", slow(cancel_flight))
+    status, _, body = _request(server, "POST", f"/flights/{flight_id}/cancel", {})
+    assert (status, json.loads(body)["status"]) == (200, "cancelled")
@@ -0,0 +1,125 @@
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+
+from bulk_import import import_file
+from conftest import add_flight
+from database import get_connection, transaction
+from models import utc_now
+
+FIELDS = ["flight_number", "departure_iata", "arrival_iata", "departure_time", "arrival_time", "duration_hours",
+          "duration_minutes", "pilot_licence", "status"]
+
+# helper function to format a time 'hours' from now as the menus do
+def _time(hours):
+    return (utc_now() + timedelta(hours=hours)).strftime("%d-%m-%Y %H:%M")
+
+# rows to import, each with the reason it is rejected or None if it is imported
+ROWS = [
+    ({"flight_number": "IM001", "departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24), "arrival_time": _time(31)}, None),
+    ({"departure_iata": "LHR", "arrival_iata": "CDG", "departure_time": _time(30), "duration_hours": "1", "duration_minutes": "15",
+      "pilot_licence": "LIC123456"}, None),
+    ({"flight_number": "IM003", "departure_iata": "CDG", "arrival_iata": "JFK", "departure_time": _time(-48), "duration_hours": "8",
+      "status": "scheduled"}, None),
+    ({"flight_number": "IM004", "departure_iata": "CDG", "arrival_iata": "HND", "departure_time": _time(-24), "duration_hours": "12"}, None),
+    ({"flight_number": "IM005", "departure_iata": "HND", "arrival_iata": "SYD", "departure_time": _time(48), "duration_hours": "9",
+      "status": "Cancelled"}, None),
+    ({"departure_iata": "XXX", "arrival_iata": "LHR", "departure_time": _time(24), "duration_hours": "7"}, "Unknown departure IATA code"),
+    ({"departure_iata": "LHR", "arrival_iata": "LHR", "departure_time": _time(24), "duration_hours": "1"}, "must be different"),
+    ({"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": "tomorrow", "duration_hours": "7"}, "Invalid departure time"),
+    ({"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24), "arrival_time": _time(23)}, "must be after"),
+    ({"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24)}, "arrival time or a flight duration"),
+    ({"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24), "duration_hours": "7", "pilot_licence": "LIC000000"},
+     "Unknown pilot licence"),
+    ({"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24), "duration_hours": "7", "status": "delayed"}, "Invalid status"),
+    ({"flight_number": "TOOLONG123", "departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": _time(24), "duration_hours": "7"},
+     "must not exceed 8"),
+]
+
+# helper function to write the rows to a CSV file, repeated 'copies' times
+def _write_csv(path, copies=1):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, FIELDS)
+        writer.writeheader()
+        for _ in range(copies):
+            writer.writerows(row for row, _ in ROWS)
+    return str(path)
+
+# helper function to read the imported flights as {flight_number: (pilot_id, departure_time, arrival_time, status)}
+def _flights():
+    with get_connection() as conn:
+        return {row[0]: row[1:] for row in conn.execute("SELECT flight_number, pilot_id, departure_time, arrival_time, status FROM flights")}
+
+# helper function to read the traffic counters, leaving out airports with no flights
+def _counters(conn):
+    return (
+        conn.execute("SELECT * FROM airport_traffic WHERE departures OR arrivals ORDER BY airport_id").fetchall(),
+        conn.execute("SELECT * FROM airport_daily_traffic ORDER BY airport_id, day").fetchall(),
+    )
+
+def test_import_validates_each_row(db):
+    rejects_path = str(db / "rejects.csv")
+    stats = import_file("flights", _write_csv(db / "flights.csv"), chunk_size=4, rejects_path=rejects_path)
+    expected_rejects = [reason for _, reason in ROWS if reason]
+    assert (stats["read"], stats["inserted"], stats["rejected"]) == (len(ROWS), len(ROWS) - len(expected_rejects), len(expected_rejects))
+    with open(rejects_path, newline="", encoding="utf-8") as file:
+        rejects = list(csv.DictReader(file))
+    # line numbers count the header row
+    assert [int(reject["line_number"]) for reject in rejects] == [index + 2 for index, (_, reason) in enumerate(ROWS) if reason]
+    for reject, reason in zip(rejects, expected_rejects):
+        assert reason in reject["reason"]
+    flights = _flights()
+    assert len(flights) == stats["inserted"]
+    assert flights["IM001"][3] == "scheduled"
+    # a past flight imported as 'scheduled' would be left behind the status updates, so is imported as departed
+    assert (flights["IM003"][3], flights["IM004"][3], flights["IM005"][3]) == ("departed", "departed", "cancelled")
+    # the flight without a flight number was allocated one, and has its pilot and duration
+    allocated = [flight for number, flight in flights.items() if not number.startswith("IM")]
+    assert len(allocated) == 1 and allocated[0][0] == 1
+    _, departure_time, arrival_time, _ = allocated[0]
+    assert datetime.fromisoformat(arrival_time) - datetime.fromisoformat(departure_time) == timedelta(hours=1, minutes=15)
+
+def test_import_from_jsonl_rejects_invalid_lines(db):
+    path = db / "flights.jsonl"
+    path.write_text('{"departure_iata": "JFK", "arrival_iata": "LHR", "departure_time": "%s", "duration_hours": 7}\nnot json\n[1]\n\n' % _time(24))
+    stats = import_file("flights", str(path))
+    assert (stats["read"], stats["inserted"], stats["rejected"]) == (3, 1, 2)
+
+@pytest.mark.parametrize("chunk_size", [3, 1000])
+def test_deferred_indexes_are_rebuilt(db, chunk_size):
+    with get_connection() as conn:
+        schema = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'flights' ORDER BY name").fetchall()
+    add_flight(12, origin=1, destination=5)
+    stats = import_file("flights", _write_csv(db / "flights.csv", copies=3), chunk_size=chunk_size, defer_indexes=True)
+    assert stats["inserted"] == 3 * sum(1 for _, reason in ROWS if reason is None)
+    with get_connection() as conn:
+        assert conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'flights' ORDER BY name").fetchall() == schema
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        counters = _counters(conn)
+        assert counters[0] == conn.execute('''
+            SELECT a.airport_id,
+                (SELECT COUNT(*) FROM flights WHERE departure_airport_id = a.airport_id),
+                (SELECT COUNT(*) FROM flights WHERE arrival_airport_id = a.airport_id)
+            FROM airports AS a
+            WHERE EXISTS (SELECT 1 FROM flights WHERE a.airport_id IN (departure_airport_id, arrival_airport_id))
+            ORDER BY a.airport_id
+        ''').fetchall()
+    # the counter triggers are back, so the counters follow later changes
+    departures = dict((airport_id, departures) for airport_id, departures, _ in counters[0])[1]
+    add_flight(12, origin=1, destination=5)
+    with get_connection() as conn:
+        assert conn.execute("SELECT departures FROM airport_traffic WHERE airport_id = 1").fetchone() == (departures + 1,)
+
+def test_deferred_and_normal_imports_match(db):
+    path = _write_csv(db / "flights.csv")
+    import_file("flights", path, chunk_size=5)
+    with get_connection() as conn:
+        normal = conn.execute("SELECT departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status FROM flights ORDER BY flight_id").fetchall()
+        normal_counters = _counters(conn)
+    with transaction() as conn:
+        conn.execute("DELETE FROM flights")
+    import_file("flights", path, chunk_size=5, defer_indexes=True)
+    with get_connection() as conn:
+        assert conn.execute("SELECT departure_airport_id, arrival_airport_id, pilot_id, departure_time, arrival_time, status FROM flights ORDER BY flight_id").fetchall() == normal
+        assert _counters(conn) == normal_counters
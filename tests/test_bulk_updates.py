@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from bulk_updates import SKIP_REASONS, bulk_reschedule_flights
+from conftest import add_flight
+from database import get_connection
+from models import utc_now
+
+# positions of the departure and arrival times in a row of the flights table
+DEPARTURE, ARRIVAL = 5, 6
+
+# helper function to read every flight, so the table can be compared before and after an update
+def _flights():
+    with get_connection() as conn:
+        return conn.execute("SELECT * FROM flights ORDER BY flight_id").fetchall()
+
+# helper function to count the changes recorded in the 'flight_changes' table
+def _change_count():
+    with get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM flight_changes").fetchone()[0]
+
+# helper function to index the outcomes of a bulk update by flight ID
+def _by_flight(outcomes):
+    return {outcome["flight_id"]: outcome for outcome in outcomes}
+
+@pytest.fixture
+def timetable(db):
+    start = utc_now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+    return {
+        "free": add_flight(start, hours=3),
+        "departed": add_flight(-5, hours=2),
+        "cancelled": add_flight(start, hours=2, status="cancelled"),
+        "soon": add_flight(1, hours=2, pilot_id=2),
+        # pilot 1 flies 'blocked' into 'fixed', which is not being moved, and 'cascade' would then run into 'blocked'
+        "cascade": add_flight(start + timedelta(hours=5), hours=1, pilot_id=1),
+        "blocked": add_flight(start + timedelta(hours=7), hours=2, pilot_id=1),
+        "fixed": add_flight(start + timedelta(hours=10), hours=2, pilot_id=1),
+        # pilot 3's flights move together, so they never conflict with each other
+        "pair_first": add_flight(start + timedelta(hours=1), hours=2, pilot_id=3),
+        "pair_second": add_flight(start + timedelta(hours=4), hours=2, pilot_id=3),
+    }
+
+def test_reschedule_outcomes(timetable):
+    ids = [flight_id for name, flight_id in timetable.items() if name != "fixed"] + [9999]
+    before = {row[0]: row for row in _flights()}
+    outcomes = _by_flight(bulk_reschedule_flights(timedelta(hours=2), flight_ids=ids))
+    assert set(outcomes) == set(ids)
+    assert {name: outcomes[flight_id]["outcome"] for name, flight_id in timetable.items() if flight_id in outcomes} == {
+        "free": "rescheduled", "departed": "skipped", "cancelled": "skipped", "soon": "rescheduled",
+        "cascade": "skipped", "blocked": "skipped", "pair_first": "rescheduled", "pair_second": "rescheduled",
+    }
+    assert outcomes[9999]["reason"] == SKIP_REASONS["missing"]
+    assert outcomes[timetable["departed"]]["reason"] == SKIP_REASONS["departed"]
+    assert outcomes[timetable["cancelled"]]["reason"] == SKIP_REASONS["cancelled"]
+    assert outcomes[timetable["blocked"]]["reason"] == SKIP_REASONS["pilot_unavailable"]
+    assert outcomes[timetable["cascade"]]["reason"] == SKIP_REASONS["pilot_unavailable"]
+    after = {row[0]: row for row in _flights()}
+    for name, flight_id in timetable.items():
+        old, new = before[flight_id], after[flight_id]
+        if name in ("free", "soon", "pair_first", "pair_second"):
+            moved = [str(datetime.fromisoformat(old[index]) + timedelta(hours=2)) for index in (DEPARTURE, ARRIVAL)]
+            assert [new[DEPARTURE], new[ARRIVAL]] == moved
+            assert [outcomes[flight_id]["departure_time"], outcomes[flight_id]["arrival_time"]] == moved
+        else:
+            assert new == old
+
+def test_reschedule_into_the_past_is_skipped(timetable):
+    outcomes = _by_flight(bulk_reschedule_flights(timedelta(hours=-3), flight_ids=[timetable["soon"], timetable["free"]]))
+    assert outcomes[timetable["soon"]]["reason"] == SKIP_REASONS["in_past"]
+    assert outcomes[timetable["free"]]["outcome"] == "rescheduled"
+
+def test_reschedule_by_filter(timetable):
+    outcomes = bulk_reschedule_flights(timedelta(minutes=30), pilot=3)
+    assert [(outcome["flight_id"], outcome["outcome"]) for outcome in outcomes] == [
+        (timetable["pair_first"], "rescheduled"), (timetable["pair_second"], "rescheduled")
+    ]
+
+def test_dry_run_leaves_the_database_untouched(timetable):
+    before, changes = _flights(), _change_count()
+    ids = list(timetable.values()) + [9999]
+    dry_run = bulk_reschedule_flights(timedelta(hours=2), dry_run=True, flight_ids=ids)
+    assert _flights() == before
+    assert _change_count() == changes
+    assert any(outcome["outcome"] == "rescheduled" for outcome in dry_run)
+    assert bulk_reschedule_flights(timedelta(hours=2), flight_ids=ids) == dry_run
+    assert _flights() != before
+
+def test_a_filter_is_required(db):
+    with pytest.raises(ValueError):
+        bulk_reschedule_flights(timedelta(hours=1))
@@ -0,0 +1,105 @@
+import io
+import json
+import sqlite3
+import sys
+from datetime import timedelta
+
+import pytest
+
+import database
+import pilot_availability
+from cli import main
+from conftest import add_flight
+from database import get_connection
+from models import utc_now
+
+# helper function to run the command line interface and return its exit status, stdout and stderr
+def _run(capsys, *argv):
+    status = main(list(argv))
+    out, err = capsys.readouterr()
+    return status, out, err
+
+# helper function to change the flights table from a connection outside this program
+def _change_elsewhere(sql, params):
+    conn = sqlite3.connect(database.DATABASE)
+    with conn:
+        conn.execute(sql, params)
+    conn.close()
+
+def test_list_flights_as_json_and_jsonl(db, capsys):
+    flight_ids = [add_flight(hours, flight_number=f"TS{hours:03d}") for hours in (5, 1, 3)]
+    status, out, _ = _run(capsys, "flights", "list", "--format", "json")
+    assert status == 0
+    flights = json.loads(out)
+    assert [flight["flight_id"] for flight in flights] == [flight_ids[1], flight_ids[2], flight_ids[0]]
+    assert set(flights[0]) == {"flight_id", "flight_number", "departure_iata", "departure_time", "arrival_iata", "arrival_time",
+                               "city", "country", "pilot_id", "status"}
+    status, out, _ = _run(capsys, "flights", "list", "--format", "jsonl", "--limit", "2")
+    assert [json.loads(line) for line in out.splitlines()] == flights[:2]
+
+def test_empty_listing_is_an_empty_array(db, capsys):
+    assert json.loads(_run(capsys, "flights", "list", "--format", "json")[1]) == []
+    assert _run(capsys, "flights", "list", "--format", "jsonl")[1] == ""
+
+def test_show_flight_as_a_table_and_json(db, capsys):
+    flight_id = add_flight(2, flight_number="TS123")
+    status, out, _ = _run(capsys, "flights", "show", str(flight_id))
+    assert status == 0
+    assert out.startswith(f"flight_id: {flight_id} | flight_number: TS123 | ")
+    status, out, _ = _run(capsys, "flights", "show", str(flight_id), "--format", "json")
+    assert json.loads(out)["flight_number"] == "TS123"
+
+def test_invalid_requests_exit_with_status_1(db, capsys):
+    departed = add_flight(-5)
+    assert _run(capsys, "flights", "show", "9999") == (1, "", "Error: Flight 9999 does not exist.\n")
+    status, out, err = _run(capsys, "flights", "cancel", str(departed))
+    assert (status, out) == (1, "")
+    assert err.startswith("Error: ") and "departed" in err
+    status, _, err = _run(capsys, "flights", "schedule", "--from", "XXX", "--to", "LHR", "--departure", "01-06-2040 09:30", "--duration", "2:00")
+    assert (status, err) == (1, "Error: Airport 'XXX' does not exist.\n")
+
+def test_invalid_arguments_exit_with_status_2(db, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(["flights", "schedule", "--from", "1", "--to", "2", "--departure", "tomorrow", "--duration", "2:00"])
+    assert exit.value.code == 2
+
+def test_schedule_and_cancel(db, capsys):
+    departure = (utc_now() + timedelta(days=3)).strftime("%d-%m-%Y %H:%M")
+    status, out, _ = _run(capsys, "flights", "schedule", "--from", "1", "--to", "2", "--departure", departure, "--duration", "1:30", "--format", "json")
+    assert status == 0
+    flight = json.loads(out)
+    status, out, _ = _run(capsys, "flights", "cancel", str(flight["flight_id"]), "--format", "json")
+    assert (status, json.loads(out)["status"]) == (0, "cancelled")
+    with get_connection() as conn:
+        assert conn.execute("SELECT status FROM flights WHERE flight_id = ?", (flight["flight_id"],)).fetchone()[0] == "cancelled"
+
+def test_flight_cancelled_elsewhere_is_rejected(db, capsys):
+    flight_id = add_flight(24)
+    _change_elsewhere("UPDATE flights SET status = 'cancelled' WHERE flight_id = ?", (flight_id,))
+    assert _run(capsys, "flights", "reschedule", str(flight_id), "--departure", "01-06-2040 09:30")[0] == 1
+    assert _run(capsys, "pilots", "assign", str(flight_id), "1")[0] == 1
+
+def test_pilot_assigned_elsewhere_is_not_double_booked(db, capsys):
+    first, second = add_flight(24), add_flight(25)
+    pilot_availability.load_assignments()
+    # the in-memory schedules still show pilot 1 as free when the check is made, so only a check of the flights table inside
+    # the transaction finds the other assignment
+    _change_elsewhere("UPDATE flights SET pilot_id = 1 WHERE flight_id = ?", (first,))
+    pilot_availability._version = pilot_availability.flights_version()
+    status, _, err = _run(capsys, "pilots", "assign", str(second), "1")
+    assert status == 1
+    assert "assigned to another flight" in err
+    assert _run(capsys, "pilots", "assign", str(second), "2")[0] == 0
+
+def test_broken_pipe(db, monkeypatch):
+    for hours in range(1, 4):
+        add_flight(hours)
+    class ClosedPipe(io.StringIO):
+        def write(self, text):
+            raise BrokenPipeError
+    stderr = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", ClosedPipe())
+    monkeypatch.setattr(sys, "stderr", stderr)
+    assert main(["flights", "list", "--format", "jsonl"]) == 0
+    # stderr is closed so no error is printed as the program exits
+    assert stderr.closed
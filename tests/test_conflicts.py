@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta
+
+from conftest import add_flight
+from conflicts import get_conflicts, scan_conflicts, sweep_conflicts
+from database import get_connection, transaction
+
+# helper function to build a row as read by '_pilot_flights' for a flight departing 'departure' minutes after a fixed time
+def _row(pilot_id, flight_id, origin, destination, departure, minutes):
+    start = datetime(2030, 6, 1, 6, 0) + timedelta(minutes=departure)
+    return (pilot_id, flight_id, f"TS{flight_id:03d}", origin, destination, str(start), str(start + timedelta(minutes=minutes)))
+
+# helper function to return the conflicts found in the rows as (pilot_id, conflict_type, flight_id, other_flight_id) tuples
+def _sweep(rows, min_turnaround=timedelta(minutes=45)):
+    return [conflict[:4] for conflict in sweep_conflicts(rows, min_turnaround)]
+
+def test_no_conflicts_in_a_clean_schedule():
+    assert _sweep([
+        _row(1, 1, "JFK", "LHR", 0, 420),
+        _row(1, 2, "LHR", "CDG", 480, 60),
+        _row(1, 3, "CDG", "JFK", 600, 480),
+    ]) == []
+
+def test_overlap():
+    assert _sweep([
+        _row(1, 1, "JFK", "LHR", 0, 420),
+        _row(1, 2, "LHR", "CDG", 300, 60),
+    ]) == [(1, "overlap", 2, 1)]
+
+def test_overlap_is_reported_against_the_flight_landing_latest():
+    # flight 3 departs after flight 2 lands, but before flight 1 (which is still in the air) does
+    assert _sweep([
+        _row(1, 1, "JFK", "LHR", 0, 600),
+        _row(1, 2, "LHR", "LHR", 60, 60),
+        _row(1, 3, "LHR", "CDG", 300, 60),
+    ]) == [(1, "overlap", 2, 1), (1, "overlap", 3, 1)]
+
+def test_departing_as_the_previous_flight_lands_is_an_overlap():
+    assert _sweep([_row(1, 1, "JFK", "LHR", 0, 60), _row(1, 2, "LHR", "CDG", 60, 60)]) == [(1, "overlap", 2, 1)]
+
+def test_short_turnaround():
+    conflicts = list(sweep_conflicts([_row(1, 1, "JFK", "LHR", 0, 60), _row(1, 2, "LHR", "CDG", 90, 60)], timedelta(minutes=45)))
+    assert [conflict[:4] for conflict in conflicts] == [(1, "short_turnaround", 2, 1)]
+    assert "30 minutes" in conflicts[0][4]
+    assert _sweep([_row(1, 1, "JFK", "LHR", 0, 60), _row(1, 2, "LHR", "CDG", 105, 60)]) == []
+
+def test_airport_mismatch():
+    conflicts = list(sweep_conflicts([_row(1, 1, "JFK", "LHR", 0, 60), _row(1, 2, "LGW", "CDG", 180, 60)]))
+    assert [conflict[:4] for conflict in conflicts] == [(1, "airport_mismatch", 2, 1)]
+    assert "LGW" in conflicts[0][4] and "LHR" in conflicts[0][4]
+
+def test_short_turnaround_and_airport_mismatch_together():
+    assert _sweep([_row(1, 1, "JFK", "LHR", 0, 60), _row(1, 2, "LGW", "CDG", 70, 60)]) == [
+        (1, "short_turnaround", 2, 1), (1, "airport_mismatch", 2, 1)
+    ]
+
+def test_pilots_are_checked_separately():
+    assert _sweep([_row(1, 1, "JFK", "LHR", 0, 420), _row(2, 2, "CDG", "MAD", 60, 60)]) == []
+
+# helper function to read the stored conflicts, in a fixed order
+def _stored_conflicts():
+    with get_connection() as conn:
+        return conn.execute('''
+            SELECT pilot_id, conflict_type, flight_id, other_flight_id, detail FROM pilot_conflicts
+            ORDER BY pilot_id, flight_id, conflict_type, other_flight_id
+        ''').fetchall()
+
+def test_first_use_scans_every_pilot(db):
+    add_flight(24, hours=3, pilot_id=1)
+    add_flight(25, hours=3, pilot_id=1)
+    assert [conflict[1] for conflict in get_conflicts()] == ["overlap"]
+
+def test_incremental_scan_matches_full_scan(db):
+    rng = random.Random(3)
+    flight_ids = [
+        add_flight(rng.randrange(1, 24 * 14), hours=rng.randint(1, 6), origin=rng.randint(1, 4), destination=rng.randint(5, 8),
+                   pilot_id=rng.randint(1, 10))
+        for _ in range(200)
+    ]
+    scan_conflicts()
+    for _ in range(5):
+        # change some of the flights directly, as the system's own updates would, then scan only the pilots affected
+        changed_pilots = set()
+        with transaction() as conn:
+            for flight_id in rng.sample(flight_ids, 15):
+                old_pilot = conn.execute("SELECT pilot_id FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()[0]
+                new_pilot = rng.randint(1, 10)
+                shift = f"{rng.randint(-180, 180)} minutes"
+                conn.execute('''
+                    UPDATE flights SET pilot_id = ?, departure_time = datetime(departure_time, ?), arrival_time = datetime(arrival_time, ?),
+                        status = ?
+                    WHERE flight_id = ?
+                ''', (new_pilot, shift, shift, rng.choice(["scheduled", "scheduled", "cancelled"]), flight_id))
+                changed_pilots.update([old_pilot, new_pilot])
+        scan_conflicts(changed_pilots)
+        incremental = _stored_conflicts()
+        scan_conflicts()
+        assert incremental == _stored_conflicts()
+        assert incremental
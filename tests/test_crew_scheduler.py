@@ -0,0 +1,113 @@
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_flight
+from crew_scheduler import auto_assign_pilots, solve_assignments
+from database import get_connection
+from models import utc_now
+
+HOUR = 3600
+
+# helper function to generate a random timetable for the solver: flights as (departure, arrival, flight_id, origin,
+# destination) tuples in departure order, and existing assignments for some of the pilots, none of which overlap
+def _random_state(seed, flight_count=300, pilot_count=12, airports=6):
+    rng = random.Random(seed)
+    flights = []
+    for flight_id in range(1, flight_count + 1):
+        dep = rng.randrange(0, 10 * 24 * HOUR, 300)
+        origin = rng.randint(1, airports)
+        destination = rng.choice([airport for airport in range(1, airports + 1) if airport != origin])
+        flights.append((dep, dep + rng.randint(1, 8) * HOUR, flight_id, origin, destination))
+    flights.sort()
+    pilot_ids = list(range(1, pilot_count + 1))
+    commitments = {pilot_id: [] for pilot_id in pilot_ids}
+    for pilot_id in pilot_ids[: pilot_count // 3]:
+        time = rng.randrange(0, 2 * 24 * HOUR, 300)
+        for _ in range(rng.randint(1, 4)):
+            time += rng.randint(1, 48) * HOUR
+            commitments[pilot_id].append((time, time + rng.randint(1, 6) * HOUR, rng.randint(1, airports)))
+            time = commitments[pilot_id][-1][1]
+    locations = {pilot_id: rng.randint(1, airports) for pilot_id in pilot_ids[pilot_count // 3: pilot_count // 2]}
+    return flights, pilot_ids, commitments, locations
+
+# helper function to list each pilot's flights after solving - their existing assignments and the new ones - as
+# (departure, arrival, origin, destination, is_new) tuples in departure order
+def _schedules(flights, commitments, assignments):
+    by_id = {flight[2]: flight for flight in flights}
+    schedules = defaultdict(list)
+    for pilot_id, held in commitments.items():
+        schedules[pilot_id].extend((dep, arr, None, destination, False) for dep, arr, destination in held)
+    for flight_id, pilot_id in assignments:
+        dep, arr, _, origin, destination = by_id[flight_id]
+        schedules[pilot_id].append((dep, arr, origin, destination, True))
+    return {pilot_id: sorted(schedule) for pilot_id, schedule in schedules.items()}
+
+# helper function to check that no pilot is given a flight overlapping, or departing less than 'min_rest' seconds after
+# the arrival of, another of their flights (comparing every pair which includes a new assignment)
+def _assert_rest_respected(schedules, min_rest):
+    for pilot_id, schedule in schedules.items():
+        for index, first in enumerate(schedule):
+            for second in schedule[index + 1:]:
+                if first[4] or second[4]:
+                    assert second[0] >= first[1] + min_rest, f"pilot {pilot_id}: {first} and {second}"
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("min_rest", [timedelta(0), timedelta(hours=1), timedelta(hours=10)])
+def test_no_overlaps_and_min_rest_respected(seed, min_rest):
+    flights, pilot_ids, commitments, locations = _random_state(seed)
+    assignments, unassigned = solve_assignments(flights, pilot_ids, commitments, locations, min_rest)
+    assert sorted([flight_id for flight_id, _ in assignments] + unassigned) == sorted(flight[2] for flight in flights)
+    assert set(pilot_id for _, pilot_id in assignments) <= set(pilot_ids)
+    _assert_rest_respected(_schedules(flights, commitments, assignments), int(min_rest.total_seconds()))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_airport_departs_where_the_pilot_landed(seed):
+    flights, pilot_ids, commitments, locations = _random_state(seed)
+    min_rest = timedelta(minutes=45)
+    assignments, _ = solve_assignments(flights, pilot_ids, commitments, locations, min_rest, same_airport=True)
+    schedules = _schedules(flights, commitments, assignments)
+    _assert_rest_respected(schedules, int(min_rest.total_seconds()))
+    for pilot_id, schedule in schedules.items():
+        last_airport = locations.get(pilot_id)
+        for dep, arr, origin, destination, is_new in schedule:
+            if is_new and last_airport is not None:
+                assert origin == last_airport, f"pilot {pilot_id} departs from {origin} after landing at {last_airport}"
+            last_airport = destination
+
+def test_every_flight_assigned_when_there_are_enough_pilots():
+    flights, _, _, _ = _random_state(7)
+    # the most flights in the air at once - arrivals are counted before departures at the same time, as a pilot can
+    # depart the moment they land
+    events = sorted([(dep, 1) for dep, _, _, _, _ in flights] + [(arr, -1) for _, arr, _, _, _ in flights])
+    in_air = peak = 0
+    for _, change in events:
+        in_air += change
+        peak = max(peak, in_air)
+    pilot_ids = list(range(1, peak + 1))
+    assignments, unassigned = solve_assignments(flights, pilot_ids, {pilot_id: [] for pilot_id in pilot_ids}, {})
+    assert unassigned == []
+    _assert_rest_respected(_schedules(flights, {}, assignments), 0)
+    _, unassigned = solve_assignments(flights, pilot_ids[:-1], {pilot_id: [] for pilot_id in pilot_ids[:-1]}, {})
+    assert unassigned
+
+def test_auto_assign_respects_existing_assignments(db):
+    start = utc_now().replace(microsecond=0) + timedelta(days=1)
+    for pilot_id in range(1, 11):
+        add_flight(start + timedelta(hours=pilot_id), hours=3, pilot_id=pilot_id)
+    for index in range(40):
+        add_flight(start + timedelta(minutes=50 * index), hours=2)
+    result = auto_assign_pilots(min_rest=timedelta(hours=1))
+    assert result["flights"] == 40
+    assert result["assigned"] > 0 and result["assigned"] + result["unassigned"] == 40
+    with get_connection() as conn:
+        rows = conn.execute('''
+            SELECT pilot_id, departure_time, arrival_time FROM flights
+            WHERE pilot_id IS NOT NULL ORDER BY pilot_id, departure_time
+        ''').fetchall()
+    assert len(rows) == 10 + result["assigned"]
+    for (pilot_id, _, arrival), (next_pilot_id, departure, _) in zip(rows, rows[1:]):
+        if pilot_id == next_pilot_id:
+            assert datetime.fromisoformat(departure) >= datetime.fromisoformat(arrival) + timedelta(hours=1)
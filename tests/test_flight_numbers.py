@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import flight_numbers
+from database import get_connection, transaction
+from flight_numbers import AIRLINE_CODES, BLOCK_SIZE, FIRST_NUMBER, allocate_flight_numbers, register_flight_numbers
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# helper function to read every registered flight number
+def _registered():
+    with get_connection() as conn:
+        return {flight_number for flight_number, in conn.execute("SELECT flight_number FROM flight_numbers")}
+
+# helper function to allocate flight numbers in another program using the same database, which has its own reserved blocks
+def _allocate_elsewhere(db, count):
+    script = f"import sys; sys.path.insert(0, {REPO!r}); from flight_numbers import allocate_flight_numbers; print(' '.join(allocate_flight_numbers({count})))"
+    return subprocess.run([sys.executable, "-c", script], cwd=db, capture_output=True, text=True, check=True).stdout.split()
+
+def test_numbers_are_unique_across_blocks(db):
+    # numbers registered by other means (such as a bulk import) ahead of each code's sequence
+    existing = [f"{code}{number}" for code in AIRLINE_CODES for number in (FIRST_NUMBER + 2, FIRST_NUMBER + BLOCK_SIZE + 1)]
+    with transaction() as conn:
+        conn.executemany("INSERT INTO flight_number_sequences (airline_code, next_number) VALUES (?, ?)", [(code, FIRST_NUMBER) for code in AIRLINE_CODES])
+        register_flight_numbers(conn, existing)
+    allocated = [number for _ in range(BLOCK_SIZE * len(AIRLINE_CODES) * 2) for number in allocate_flight_numbers()]
+    allocated += allocate_flight_numbers(BLOCK_SIZE * 3)
+    assert len(set(allocated)) == len(allocated)
+    assert not set(allocated) & set(existing)
+    # every number handed out is registered, so it can never be allocated again
+    assert set(allocated) <= _registered()
+    assert all(len(number) <= 8 and number[:2] in AIRLINE_CODES for number in allocated)
+
+def test_numbers_are_unique_across_programs(db):
+    allocated = allocate_flight_numbers(5)
+    # numbers this program has reserved but not handed out are not given to the other program
+    assert any(flight_numbers._reserved.values())
+    elsewhere = _allocate_elsewhere(db, 300)
+    allocated += allocate_flight_numbers(300)
+    assert len(elsewhere) == 300
+    assert len(set(allocated + elsewhere)) == len(allocated) + len(elsewhere)
+
+def test_numbers_are_unique_across_threads(db):
+    results = []
+    def allocate():
+        for _ in range(50):
+            results.extend(allocate_flight_numbers())
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == len(set(results)) == 200
+
+def test_numbers_reserved_in_a_rolled_back_transaction_are_not_kept(db):
+    with pytest.raises(RuntimeError):
+        with transaction(immediate=True) as conn:
+            rolled_back = allocate_flight_numbers(50, conn)
+            raise RuntimeError("import failed")
+    assert not any(flight_numbers._reserved.values())
+    assert not set(rolled_back) & _registered()
+    allocated = allocate_flight_numbers(100)
+    assert len(set(allocated)) == 100
+    assert set(allocated) <= _registered()
+
+def test_running_out_of_numbers(db, monkeypatch):
+    monkeypatch.setattr(flight_numbers, "MAX_NUMBER", flight_numbers.FIRST_NUMBER + 4)
+    allocated = allocate_flight_numbers(5 * len(AIRLINE_CODES))
+    assert len(set(allocated)) == 5 * len(AIRLINE_CODES)
+    with pytest.raises(ValueError):
+        allocate_flight_numbers()
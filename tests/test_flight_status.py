@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_flight
+from database import get_connection, transaction
+from models import utc_now
+
+T0 = datetime(2030, 6, 1, 12, 0)
+
+# fixture to run the status updates with a clock set by the test, starting at 'T0'
+@pytest.fixture
+def clock(db, monkeypatch):
+    import database_queries
+    now = {"time": T0}
+    monkeypatch.setattr(database_queries, "utc_now", lambda: now["time"])
+    return now
+
+# helper function to run the status update, as 'database_queries' is only imported once the test database is set up
+def _update(**options):
+    from database_queries import update_flight_status
+    return update_flight_status(**options)
+
+# helper function to read a flight's status
+def _status(flight_id):
+    with get_connection() as conn:
+        return conn.execute("SELECT status FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()[0]
+
+# helper function to read the stored high-water mark
+def _mark():
+    from database_queries import STATUS_HIGH_WATER_MARK
+    with get_connection() as conn:
+        row = conn.execute("SELECT value FROM app_state WHERE key = ?", (STATUS_HIGH_WATER_MARK,)).fetchone()
+        return row[0] if row else None
+
+def test_high_water_mark_advances(clock):
+    earlier = add_flight(T0 - timedelta(days=3))
+    assert _update() == 1
+    assert _mark() == "2030-06-01 12:00:00"
+    flight_id = add_flight(T0 + timedelta(minutes=30))
+    clock["time"] = T0 + timedelta(minutes=10)
+    assert _update() == 0
+    assert _mark() == "2030-06-01 12:10:00"
+    clock["time"] = T0 + timedelta(hours=1)
+    assert _update() == 1
+    assert _mark() == "2030-06-01 13:00:00"
+    assert (_status(earlier), _status(flight_id)) == ("departed", "departed")
+
+def test_flights_on_the_boundary(clock):
+    _update()
+    # a flight departing exactly at the mark was not yet departed at the last update, so is checked by the next one
+    on_mark = add_flight(T0)
+    clock["time"] = T0 + timedelta(minutes=1)
+    # a flight departing exactly now has not departed yet
+    on_now = add_flight(clock["time"])
+    assert _update() == 1
+    assert (_status(on_mark), _status(on_now)) == ("departed", "scheduled")
+    clock["time"] += timedelta(seconds=1)
+    assert _update() == 1
+    assert _status(on_now) == "departed"
+
+def test_updates_in_batches(clock):
+    flight_ids = [add_flight(T0 - timedelta(minutes=minutes)) for minutes in range(1, 8)]
+    assert _update(batch_size=2) == 7
+    assert {_status(flight_id) for flight_id in flight_ids} == {"departed"}
+    assert _mark() == "2030-06-01 12:00:00"
+
+def test_cancelled_flights_are_left_alone(clock):
+    flight_id = add_flight(T0 - timedelta(minutes=5), status="cancelled")
+    assert _update() == 0
+    assert _status(flight_id) == "cancelled"
+
+def test_mark_ahead_of_the_clock_is_not_used(clock):
+    # such as a mark written in local time, hours ahead of GMT, by an earlier version
+    from database_queries import STATUS_HIGH_WATER_MARK
+    with transaction() as conn:
+        conn.execute("INSERT INTO app_state (key, value) VALUES (?, ?)", (STATUS_HIGH_WATER_MARK, "2030-06-01 21:00:00"))
+    flight_id = add_flight(T0 - timedelta(minutes=30))
+    assert _update() == 1
+    assert _status(flight_id) == "departed"
+    assert _mark() == "2030-06-01 12:00:00"
+
+def test_full_update_ignores_the_mark(clock):
+    _update()
+    # a scheduled flight behind the mark, as left by a change made outside the system
+    flight_id = add_flight(T0 - timedelta(hours=1))
+    assert _update() == 0
+    assert _update(full=True) == 1
+    assert _status(flight_id) == "departed"
+
+def test_flight_inserted_without_a_status_after_an_update(db, local_time_zone):
+    # the insert trigger and the status update must agree on the time, or a flight departing between the two clocks is
+    # stored 'scheduled' behind the mark and never updated
+    _update()
+    departure = utc_now().replace(microsecond=0) + timedelta(seconds=2)
+    flight_id = add_flight(departure, status=None)
+    assert _status(flight_id) == "scheduled"
+    time.sleep(max(0, (departure - utc_now()).total_seconds()) + 1.1)
+    assert _update() == 1
+    assert _status(flight_id) == "departed"
+
+def test_background_updates_keep_running_after_an_error(db, monkeypatch, capsys):
+    import database_queries
+    calls = []
+    done = threading.Event()
+    def failing_update():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+        if len(calls) == 3:
+            done.set()
+    monkeypatch.setattr(database_queries, "update_flight_status", failing_update)
+    monkeypatch.setattr(database_queries, "materialize_schedules", lambda: 0)
+    stop = database_queries.start_flight_status_updates(interval=0.01)
+    try:
+        assert done.wait(5)
+    finally:
+        stop.set()
+    assert "Background failing_update failed" in capsys.readouterr().err
@@ -0,0 +1,89 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_flight
+from database import get_connection
+from flights_helpers import DEFAULT_FLIGHT_COLUMNS, display_flights, format_column_names, format_db_time, render_flights
+
+# the column lists displayed by the menus, as passed to 'display_flights' in the original version, with the positions of
+# their departure and arrival times
+MENU_COLUMNS = [
+    (DEFAULT_FLIGHT_COLUMNS, 3, 5),
+    (["flight_id", "flight_number", "pilot_id", "departure_time", "arrival_time"], 3, 4),
+    (["f.flight_number", "departure_airport.airport_name AS departure_airport", "f.departure_time",
+      "arrival_airport.airport_name AS arrival_airport", "f.arrival_time", "f.status"], 2, 4),
+    (["f.flight_number", "departure_airport.airport_name AS departure_airport", "f.departure_time",
+      "arrival_airport.airport_name AS arrival_airport", "f.arrival_time", "d.city", "d.country"], 2, 4),
+]
+
+# helper function to render flights exactly as the original 'display_flights' printed them, parsing and reformatting each
+# time with 'strptime' and 'strftime'
+def _original_render(flights, columns, departure_time_index, arrival_time_index):
+    column_names = format_column_names(columns)
+    lines = []
+    for flight in flights:
+        flight = list(flight)
+        for index in (departure_time_index, arrival_time_index):
+            flight[index] = datetime.strptime(flight[index], "%Y-%m-%d %H:%M:%S").strftime("%d-%m-%Y %H:%M") + " GMT"
+        lines.append(" | ".join(f"{column_names[i]}: {flight[i]}" for i in range(len(columns))))
+        lines.append("-" * 50)
+    return "\n".join(lines)
+
+# helper function to generate random flights with a value for each of the columns
+def _random_flights(rng, columns, departure_time_index, arrival_time_index, count=200):
+    flights = []
+    for _ in range(count):
+        departure = datetime(2030, 1, 1) + timedelta(minutes=rng.randrange(0, 5 * 365 * 24 * 60))
+        flight = [rng.choice([rng.randint(1, 99999), f"AB{rng.randint(0, 999999):06d}", "Heathrow {T5}", None]) for _ in columns]
+        flight[departure_time_index] = departure.strftime("%Y-%m-%d %H:%M:%S")
+        flight[arrival_time_index] = (departure + timedelta(minutes=rng.randint(30, 1200))).strftime("%Y-%m-%d %H:%M:%S")
+        flights.append(tuple(flight))
+    return flights
+
+def test_render_flights_golden():
+    flights = [
+        (12, "AA000011", "John F. Kennedy International Airport", "2030-06-01 09:30:00", "London Heathrow Airport", "2030-06-01 16:35:00"),
+        (13, "AA000012", "London Heathrow Airport", "2030-12-31 23:05:00", "Charles de Gaulle Airport", "2031-01-01 00:20:00"),
+    ]
+    assert render_flights(flights, DEFAULT_FLIGHT_COLUMNS) == (
+        "Flight ID: 12 | Flight Number: AA000011 | Departure Airport: John F. Kennedy International Airport | "
+        "Departure Time: 01-06-2030 09:30 GMT | Arrival Airport: London Heathrow Airport | Arrival Time: 01-06-2030 16:35 GMT\n"
+        + "-" * 50 + "\n"
+        "Flight ID: 13 | Flight Number: AA000012 | Departure Airport: London Heathrow Airport | "
+        "Departure Time: 31-12-2030 23:05 GMT | Arrival Airport: Charles de Gaulle Airport | Arrival Time: 01-01-2031 00:20 GMT\n"
+        + "-" * 50
+    )
+
+@pytest.mark.parametrize("columns, departure_time_index, arrival_time_index", MENU_COLUMNS)
+def test_render_flights_matches_the_original_output(columns, departure_time_index, arrival_time_index):
+    flights = _random_flights(random.Random(len(columns)), columns, departure_time_index, arrival_time_index)
+    assert render_flights(flights, columns) == _original_render(flights, columns, departure_time_index, arrival_time_index)
+
+def test_format_db_time_matches_strftime():
+    rng = random.Random(1)
+    for _ in range(2000):
+        value = (datetime(1990, 1, 1) + timedelta(seconds=rng.randrange(0, 60 * 365 * 24 * 3600))).strftime("%Y-%m-%d %H:%M:%S")
+        assert format_db_time(value) == datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime("%d-%m-%Y %H:%M") + " GMT"
+
+def test_format_db_time_rejects_other_formats():
+    with pytest.raises(ValueError):
+        format_db_time("2030-06-01T09:30")
+    with pytest.raises(ValueError):
+        format_db_time("not a time")
+
+def test_display_flights_prints_the_original_output(db, capsys):
+    for index in range(12):
+        add_flight(datetime(2030, 6, 1, 9, 30) + timedelta(hours=5 * (index % 4), minutes=index), hours=index + 1,
+                   origin=index % 5 + 1, destination=index % 5 + 6, flight_number=f"TS{index:03d}")
+    with get_connection() as conn:
+        flights = conn.execute('''
+            SELECT f.flight_id, f.flight_number, departure_airport.airport_name, f.departure_time, arrival_airport.airport_name, f.arrival_time
+            FROM flights AS f
+            JOIN airports AS departure_airport ON f.departure_airport_id = departure_airport.airport_id
+            JOIN airports AS arrival_airport ON f.arrival_airport_id = arrival_airport.airport_id
+            ORDER BY f.departure_time, f.flight_id
+        ''').fetchall()
+    assert display_flights(page_size=20) == 12
+    assert capsys.readouterr().out == _original_render(flights, DEFAULT_FLIGHT_COLUMNS, 3, 5) + "\n"
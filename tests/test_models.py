@@ -0,0 +1,35 @@
+import random
+from itertools import accumulate
+
+from models import FlightTimetable
+
+# helper function to check whether any flight is in the air between 'departure' and 'arrival' by checking every flight
+def _brute_force(flights, departure, arrival):
+    return any(flight_departure <= arrival and flight_arrival >= departure for flight_departure, flight_arrival in flights.values())
+
+def test_overlaps_stays_correct_as_flights_are_added_and_removed():
+    rng = random.Random(4)
+    timetable, flights = FlightTimetable(), {}
+    for flight_id in range(3000):
+        if flights and rng.random() < 0.4:
+            removed = rng.choice(list(flights))
+            assert timetable.remove(removed)[:2] == flights.pop(removed)
+        else:
+            departure = rng.randrange(0, 10000)
+            flights[flight_id] = (departure, departure + rng.choice([0, rng.randrange(1, 50), rng.randrange(50, 3000)]))
+            timetable.add(flight_id, *flights[flight_id])
+        departure = rng.randrange(-100, 10100)
+        arrival = departure + rng.randrange(0, 200)
+        assert timetable.overlaps(departure, arrival) == _brute_force(flights, departure, arrival)
+        if flight_id % 100 == 0:
+            # the running maximum kept up to date in place matches one built from scratch
+            assert list(timetable._latest_arrivals or []) == list(accumulate(timetable.arrivals, max))
+    assert sorted(timetable.flight_ids) == sorted(flights)
+
+def test_from_rows_orders_by_departure():
+    timetable = FlightTimetable.from_rows([(3, 50, 60, None, None, None), (1, 10, 90, None, None, None), (2, 10, 20, None, None, None)])
+    assert list(timetable.flight_ids) == [2, 1, 3]
+    assert timetable.overlaps(70, 80)
+    assert not timetable.overlaps(91, 100)
+    timetable.remove(1)
+    assert not timetable.overlaps(70, 80)
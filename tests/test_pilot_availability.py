@@ -0,0 +1,122 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import pilot_availability
+from conftest import add_flight
+from database import get_connection
+from models import utc_now
+
+START = utc_now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+# helper function to read the flights assigned to each pilot from the in-memory index
+def _index():
+    return {pilot_id: sorted(schedule.flight_ids) for pilot_id, schedule in pilot_availability._schedules.items()}
+
+# helper function to check the index was kept up to date by the change just made, without a reload, and matches a reload
+def _assert_in_step():
+    assert pilot_availability._is_current()
+    index, flight_pilots = _index(), dict(pilot_availability._flight_pilots)
+    pilot_availability.load_assignments()
+    assert (_index(), pilot_availability._flight_pilots) == (index, flight_pilots)
+
+# helper function to find the pilots with no non-cancelled flight overlapping a window by checking every flight
+def _brute_force(pilot_ids, departure, arrival):
+    with get_connection() as conn:
+        flights = conn.execute("SELECT pilot_id, departure_time, arrival_time FROM flights WHERE pilot_id IS NOT NULL AND status != 'cancelled'").fetchall()
+    busy = {
+        pilot_id for pilot_id, flight_departure, flight_arrival in flights
+        if datetime.fromisoformat(flight_departure) <= arrival and datetime.fromisoformat(flight_arrival) >= departure
+    }
+    return set(pilot_ids) - busy
+
+@pytest.fixture
+def loaded(db):
+    flight_ids = {
+        "first": add_flight(START, hours=2, pilot_id=1),
+        "second": add_flight(START + timedelta(hours=4), hours=2, pilot_id=1),
+        "other": add_flight(START, hours=3, pilot_id=2),
+        "free": add_flight(START + timedelta(hours=1), hours=2),
+    }
+    pilot_availability.load_assignments()
+    return flight_ids
+
+def test_batch_matches_a_brute_force_check(db):
+    rng = random.Random(3)
+    for _ in range(150):
+        add_flight(START + timedelta(minutes=rng.randrange(0, 7 * 24 * 60, 15)), hours=rng.randint(1, 10),
+                   pilot_id=rng.randint(1, 10), status=rng.choice(["scheduled", "scheduled", "cancelled"]))
+    windows = []
+    for _ in range(200):
+        departure = START + timedelta(minutes=rng.randrange(-24 * 60, 8 * 24 * 60, 5))
+        windows.append((departure, departure + timedelta(minutes=rng.randint(0, 12 * 60))))
+    # the boundaries of the flights themselves, which overlap inclusively
+    with get_connection() as conn:
+        windows += [(datetime.fromisoformat(arrival), datetime.fromisoformat(arrival) + timedelta(hours=1))
+                    for arrival, in conn.execute("SELECT arrival_time FROM flights LIMIT 20")]
+    pilot_ids = range(1, 11)
+    results = pilot_availability.get_available_pilot_ids_batch(pilot_ids, windows)
+    assert results == [_brute_force(pilot_ids, departure, arrival) for departure, arrival in windows]
+    assert [pilot_availability.get_available_pilot_ids(pilot_ids, departure, arrival) for departure, arrival in windows] == results
+
+def test_stale_index_falls_back_to_the_database(loaded):
+    window = (START + timedelta(days=2), START + timedelta(days=2, hours=2))
+    assert pilot_availability.is_pilot_available(3, *window)
+    # another program assigns pilot 3 to a flight in the window
+    flight_id = add_flight(START + timedelta(days=2, hours=1), hours=1)
+    conn = sqlite3.connect(database.DATABASE)
+    with conn:
+        conn.execute("UPDATE flights SET pilot_id = 3 WHERE flight_id = ?", (flight_id,))
+    conn.close()
+    assert not pilot_availability._is_current()
+    assert not pilot_availability.is_pilot_available(3, *window)
+    # the single check queries the flights table rather than reloading every schedule
+    assert not pilot_availability._is_current()
+    assert 3 not in pilot_availability.get_available_pilot_ids(range(1, 11), *window)
+    assert pilot_availability._is_current()
+
+def test_assign_pilot_keeps_the_index_in_step(loaded):
+    from pilots import assign_pilot
+    assign_pilot(loaded["free"], 3)
+    _assert_in_step()
+    assert pilot_availability._flight_pilots[loaded["free"]] == 3
+    with pytest.raises(ValueError):
+        assign_pilot(loaded["free"], 1)
+    assign_pilot(loaded["free"], 4)
+    _assert_in_step()
+    assert 3 not in _index()
+
+def test_cancel_keeps_the_index_in_step(loaded):
+    from flights import cancel_flight
+    assert not pilot_availability.is_pilot_available(1, START, START + timedelta(hours=1))
+    cancel_flight(loaded["first"])
+    _assert_in_step()
+    assert pilot_availability.is_pilot_available(1, START, START + timedelta(hours=1))
+    assert _index()[1] == [loaded["second"]]
+
+def test_reschedule_keeps_the_index_in_step(loaded):
+    from flights import change_flight_departure_time
+    later = START + timedelta(days=3)
+    change_flight_departure_time(loaded["first"], later)
+    _assert_in_step()
+    assert pilot_availability.is_pilot_available(1, START, START + timedelta(hours=1))
+    assert not pilot_availability.is_pilot_available(1, later + timedelta(hours=1), later + timedelta(hours=3))
+    # a flight without a pilot is not added to the index
+    change_flight_departure_time(loaded["free"], later)
+    _assert_in_step()
+    assert loaded["free"] not in pilot_availability._flight_pilots
+
+def test_delete_pilot_keeps_the_index_in_step(loaded, monkeypatch):
+    import pilots
+    monkeypatch.setattr(pilots, "select_pilot", lambda **options: (1, "Test Pilot"))
+    monkeypatch.setattr(pilots, "display_flights", lambda **options: 2)
+    monkeypatch.setattr(pilots, "clear_console", lambda: None)
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    pilots.delete_pilot()
+    _assert_in_step()
+    assert 1 not in _index()
+    assert loaded["first"] not in pilot_availability._flight_pilots
+    assert pilot_availability._flight_pilots[loaded["other"]] == 2
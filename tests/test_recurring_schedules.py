@@ -0,0 +1,136 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import recurring_schedules
+from conflicts import get_conflicts, scan_conflicts
+from conftest import add_flight
+from database import get_connection, transaction
+from flights_helpers import parse_days
+from recurring_schedules import cancel_schedule, create_schedule, list_schedules, materialize_schedules, update_schedule
+
+# a Monday, before the schedules in these tests start
+T0 = datetime(2030, 6, 3, 6, 0)
+
+# fixture to run the schedule functions with a clock set by the test, starting at 'T0'
+@pytest.fixture
+def clock(db, monkeypatch):
+    now = {"time": T0}
+    monkeypatch.setattr(recurring_schedules, "utc_now", lambda: now["time"])
+    return now
+
+# helper function to create a schedule from airport 1 to 2 departing at 10:00 for two hours, through June 2030
+def _create(days="daily", **options):
+    return create_schedule(1, 2, parse_days(days), options.pop("departure_time", "10:00"), timedelta(hours=2),
+                           "2030-06-03", options.pop("valid_to", "2030-06-30"), **options)
+
+# helper function to read the occurrences of a schedule as {day: (departure_time, arrival_time, status, pilot_id)}
+def _occurrences(schedule_id):
+    with get_connection() as conn:
+        return {
+            row[0][:10]: row for row in conn.execute(
+                "SELECT departure_time, arrival_time, status, pilot_id FROM flights WHERE schedule_id = ?", (schedule_id,)
+            )
+        }
+
+# helper function to list the days a schedule has a flight still scheduled on
+def _scheduled_days(schedule_id):
+    return sorted(day for day, row in _occurrences(schedule_id).items() if row[2] == "scheduled")
+
+# helper function to list the days of June 2030 from 'first' to 'last' on the weekdays provided (0 for Monday)
+def _days(weekdays, first=3, last=30):
+    return [date(2030, 6, day).isoformat() for day in range(first, last + 1) if date(2030, 6, day).weekday() in weekdays]
+
+def test_create_adds_the_occurrences(clock):
+    created = _create("mon,wed,fri")
+    assert created["added"] == len(_days({0, 2, 4}))
+    assert _scheduled_days(created["schedule_id"]) == _days({0, 2, 4})
+    assert _occurrences(created["schedule_id"])["2030-06-05"][:2] == ("2030-06-05 10:00:00", "2030-06-05 12:00:00")
+    assert list_schedules()[0]["upcoming_flights"] == created["added"]
+
+def test_change_days_and_back(clock):
+    schedule_id = _create("mon,wed,fri")["schedule_id"]
+    changed = update_schedule(schedule_id, days_of_week=parse_days("tue,thu"))
+    assert (changed["cancelled"], changed["reinstated"], changed["added"]) == (len(_days({0, 2, 4})), 0, len(_days({1, 3})))
+    assert _scheduled_days(schedule_id) == _days({1, 3})
+    changed = update_schedule(schedule_id, days_of_week=parse_days("mon,wed,fri"))
+    # the cancelled occurrences are reinstated rather than added again
+    assert (changed["cancelled"], changed["reinstated"], changed["added"]) == (len(_days({1, 3})), len(_days({0, 2, 4})), 0)
+    assert _scheduled_days(schedule_id) == _days({0, 2, 4})
+    assert len(_occurrences(schedule_id)) == len(_days(range(5)))
+
+def test_occurrences_cancelled_by_hand_stay_cancelled(clock):
+    schedule_id = _create("mon,wed,fri")["schedule_id"]
+    with transaction() as conn:
+        conn.execute("UPDATE flights SET status = 'cancelled' WHERE schedule_id = ? AND departure_time LIKE '2030-06-05%'", (schedule_id,))
+    update_schedule(schedule_id, days_of_week=parse_days("mon,tue,wed,fri"))
+    assert _occurrences(schedule_id)["2030-06-05"][2] == "cancelled"
+    assert _scheduled_days(schedule_id) == [day for day in _days({0, 1, 2, 4}) if day != "2030-06-05"]
+
+def test_shorten_and_extend(clock):
+    schedule_id = _create()["schedule_id"]
+    changed = update_schedule(schedule_id, valid_to="2030-06-15")
+    assert (changed["cancelled"], changed["added"]) == (15, 0)
+    assert _scheduled_days(schedule_id) == _days(range(7), last=15)
+    changed = update_schedule(schedule_id, valid_to="2030-06-20")
+    assert (changed["cancelled"], changed["reinstated"], changed["added"]) == (0, 5, 0)
+    assert _scheduled_days(schedule_id) == _days(range(7), last=20)
+    changed = update_schedule(schedule_id, valid_to="2030-07-02")
+    assert (changed["reinstated"], changed["added"]) == (10, 2)
+    assert _scheduled_days(schedule_id)[-1] == "2030-07-02"
+
+def test_only_future_occurrences_change(clock):
+    schedule_id = _create()["schedule_id"]
+    clock["time"] = datetime(2030, 6, 10, 11, 0)
+    changed = update_schedule(schedule_id, departure_time="09:00", valid_to="2030-06-12")
+    # the 10th departed at 10:00, and the occurrences from the 11th are moved before those after the 12th are cancelled
+    assert (changed["rescheduled"], changed["cancelled"]) == (20, 18)
+    occurrences = _occurrences(schedule_id)
+    assert occurrences["2030-06-10"][:3] == ("2030-06-10 10:00:00", "2030-06-10 12:00:00", "scheduled")
+    assert occurrences["2030-06-11"][:2] == ("2030-06-11 09:00:00", "2030-06-11 11:00:00")
+
+def test_change_time_with_a_pilot_assigned(clock):
+    schedule_id = _create()["schedule_id"]
+    with transaction() as conn:
+        conn.execute("UPDATE flights SET pilot_id = 1 WHERE schedule_id = ? AND departure_time LIKE '2030-06-05%'", (schedule_id,))
+    other = add_flight(datetime(2030, 6, 5, 14, 0), hours=2, origin=2, destination=1, pilot_id=1)
+    scan_conflicts()
+    assert get_conflicts(pilot_id=1) == []
+    changed = update_schedule(schedule_id, departure_time="13:00", duration=timedelta(hours=1, minutes=30))
+    assert changed["rescheduled"] == 28
+    occurrence = _occurrences(schedule_id)["2030-06-05"]
+    assert occurrence == ("2030-06-05 13:00:00", "2030-06-05 14:30:00", "scheduled", 1)
+    # the pilot's moved occurrence now overlaps their other flight
+    assert [conflict[1:3] for conflict in get_conflicts(pilot_id=1)] == [("overlap", other)]
+
+def test_materialize_follows_the_horizon(clock):
+    schedule_id = _create(horizon=timedelta(days=7))["schedule_id"]
+    assert _scheduled_days(schedule_id) == _days(range(7), last=10)
+    assert materialize_schedules(timedelta(days=7)) == 0
+    clock["time"] += timedelta(days=7)
+    assert materialize_schedules(timedelta(days=7)) == 7
+    assert _scheduled_days(schedule_id) == _days(range(7), last=17)
+
+def test_cancelled_schedule_adds_nothing(clock):
+    schedule_id = _create(horizon=timedelta(days=7))["schedule_id"]
+    assert cancel_schedule(schedule_id)["cancelled"] == 8
+    assert _scheduled_days(schedule_id) == []
+    assert materialize_schedules() == 0
+    clock["time"] += timedelta(days=10)
+    assert materialize_schedules() == 0
+    assert _scheduled_days(schedule_id) == []
+    with pytest.raises(ValueError):
+        cancel_schedule(9999)
+
+def test_invalid_details_are_rejected(clock):
+    with pytest.raises(ValueError):
+        create_schedule(1, 1, parse_days("daily"), "10:00", timedelta(hours=2), "2030-06-03", "2030-06-30")
+    with pytest.raises(ValueError):
+        _create(departure_time="25:00")
+    with pytest.raises(ValueError):
+        _create(valid_to="2030-06-01")
+    schedule_id = _create()["schedule_id"]
+    with pytest.raises(ValueError):
+        update_schedule(schedule_id, days_of_week=0)
+    with pytest.raises(ValueError):
+        update_schedule(9999, valid_to="2030-06-20")
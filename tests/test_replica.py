@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import pytest
+
+import database
+from conftest import _close_connections, add_flight
+from database import get_connection, refresh_replica, replica_status, transaction
+
+# fixture to switch to read-only replica mode against the test database, reading a snapshot of it when the test is
+# parametrized with 'snapshot', or the database file directly with 'direct'. Snapshots are only refreshed by the test.
+# Yields the snapshot's path, or None
+@pytest.fixture
+def replica(db, monkeypatch, request):
+    add_flight(24, flight_number="TS001")
+    _close_connections()
+    snapshot = str(db / "replica.db") if request.param == "snapshot" else None
+    monkeypatch.setitem(database._replica, "enabled", True)
+    monkeypatch.setitem(database._replica, "snapshot", snapshot)
+    monkeypatch.setitem(database._replica, "refresh_interval", 0)
+    monkeypatch.setattr(database, "_replica_generation", None)
+    yield snapshot
+    _close_connections()
+
+# helper function to add a flight to the primary database, as the program writing to it would
+def _add_to_primary(flight_number):
+    conn = sqlite3.connect(database.DATABASE)
+    with conn:
+        conn.execute('''
+            INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, status)
+            VALUES (?, 1, 2, '2040-01-01 10:00:00', '2040-01-01 12:00:00', 'scheduled')
+        ''', (flight_number,))
+    conn.close()
+
+# helper function to format a time in seconds since the epoch as GMT, as the replica status reports it
+def _gmt(seconds):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+# helper function to read the flight numbers the replica sees
+def _flight_numbers():
+    with get_connection() as conn:
+        return sorted(flight_number for flight_number, in conn.execute("SELECT flight_number FROM flights"))
+
+@pytest.mark.parametrize("replica", ["snapshot", "direct"], indirect=True)
+def test_changes_are_refused(replica):
+    with pytest.raises(ValueError, match="read-only replica"):
+        with transaction():
+            pass
+    with pytest.raises(ValueError, match="read-only replica"):
+        with transaction(immediate=True):
+            pass
+    from flights import cancel_flight
+    with pytest.raises(ValueError):
+        cancel_flight(1)
+    # a write made on a borrowed connection is refused by SQLite itself
+    with get_connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM flights")
+    from migrations import run_migrations
+    assert run_migrations() == []
+
+@pytest.mark.parametrize("replica", ["snapshot"], indirect=True)
+def test_snapshot_is_refreshed(replica):
+    assert _flight_numbers() == ["TS001"]
+    _add_to_primary("TS002")
+    # the snapshot is only as up to date as its last refresh
+    assert _flight_numbers() == ["TS001"]
+    before = time.time()
+    refreshed = refresh_replica()
+    assert _flight_numbers() == ["TS001", "TS002"]
+    status = replica_status()
+    assert {key: status[key] for key in ("read_only", "mode", "source")} == {"read_only": True, "mode": "snapshot", "source": replica}
+    assert status["refreshed_at"] == refreshed["refreshed_at"]
+    # the time the copy started, in GMT
+    assert _gmt(before - 1) <= status["refreshed_at"] <= _gmt(time.time())
+    assert 0 <= status["lag_seconds"] < 60
+
+@pytest.mark.parametrize("replica", ["direct"], indirect=True)
+def test_direct_replica_sees_every_commit(replica):
+    _add_to_primary("TS002")
+    assert _flight_numbers() == ["TS001", "TS002"]
+    assert replica_status() == {"read_only": True, "mode": "direct", "source": database.DATABASE, "refreshed_at": None, "lag_seconds": 0.0}
+    with pytest.raises(ValueError):
+        refresh_replica()
@@ -0,0 +1,76 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+import database
+from conftest import add_flight
+from models import utc_now
+from route_search import find_routes
+
+START = utc_now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+# helper function to add a flight departing 'hours' after 'START', taking 'duration' hours
+def _flight(origin, destination, hours, duration, **options):
+    return add_flight(START + timedelta(hours=hours), hours=duration, origin=origin, destination=destination, **options)
+
+# helper function to search for routes from airport 1 to 2 departing from 'START', returning the flight IDs of each itinerary
+def _routes(**options):
+    return [[flight["flight_id"] for flight in itinerary["flights"]] for itinerary in find_routes(1, 2, START, **options)]
+
+def test_one_stop_route_arriving_before_the_direct_flight(db):
+    direct = _flight(1, 2, 0, 8)
+    first, second = _flight(1, 3, 0, 2), _flight(3, 2, 3, 2)
+    itineraries = find_routes(1, 2, START)
+    assert [[flight["flight_id"] for flight in itinerary["flights"]] for itinerary in itineraries] == [[direct], [first, second]]
+    assert [(itinerary["connections"], itinerary["duration_minutes"]) for itinerary in itineraries] == [(0, 480), (1, 300)]
+    assert itineraries[1]["arrival_time"] == (START + timedelta(hours=5)).strftime("%Y-%m-%d %H:%M:%S")
+
+def test_one_stop_route_arriving_after_the_direct_flight_is_left_out(db):
+    direct = _flight(1, 2, 0, 4)
+    _flight(1, 3, 0, 2), _flight(3, 2, 3, 2)
+    assert _routes() == [[direct]]
+
+def test_earliest_arrival_is_chosen(db):
+    _flight(1, 2, 1, 6)
+    earliest = _flight(1, 2, 2, 3)
+    # departs before the search window
+    _flight(1, 2, -1, 1)
+    assert _routes() == [[earliest]]
+
+def test_minimum_connection_time(db):
+    first, second = _flight(1, 3, 0, 2), _flight(3, 2, 2.5, 2)
+    assert _routes() == []
+    assert _routes(min_connection=timedelta(minutes=30)) == [[first, second]]
+    assert _routes(min_connection=timedelta(minutes=31)) == []
+
+def test_max_connections(db):
+    legs = [_flight(1, 3, 0, 2), _flight(3, 4, 3, 2), _flight(4, 2, 6, 2)]
+    assert _routes(max_connections=1) == []
+    assert _routes(max_connections=2) == [legs]
+
+def test_cancelled_flights_are_ignored(db):
+    _flight(1, 2, 0, 2, status="cancelled")
+    later = _flight(1, 2, 4, 2)
+    assert _routes() == [[later]]
+    from flights import cancel_flight
+    cancel_flight(later)
+    assert _routes() == []
+
+def test_timetable_reloads_after_a_change_by_another_connection(db):
+    later = _flight(1, 2, 4, 2)
+    assert _routes() == [[later]]
+    # another program schedules an earlier flight and cancels the later one
+    conn = sqlite3.connect(database.DATABASE)
+    with conn:
+        earlier = conn.execute('''
+            INSERT INTO flights (flight_number, departure_airport_id, arrival_airport_id, departure_time, arrival_time, status)
+            VALUES ('TS001', 1, 2, ?, ?, 'scheduled')
+        ''', ((START + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"), (START + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S"))).lastrowid
+        conn.execute("UPDATE flights SET status = 'cancelled' WHERE flight_id = ?", (later,))
+    conn.close()
+    assert _routes() == [[earlier]]
+
+def test_same_origin_and_destination_is_rejected(db):
+    with pytest.raises(ValueError):
+        find_routes(1, 1, START)
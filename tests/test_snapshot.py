@@ -0,0 +1,114 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import snapshot_analytics
+from conftest import add_flight
+from database import get_connection, transaction
+from snapshot_export import _read_partition, export_snapshot, read_manifest
+
+# helper function to add flights departing at random times in the first half of 2030, some with pilots, some departed and
+# some cancelled
+def _add_flights(rng, count):
+    for _ in range(count):
+        origin = rng.randint(1, 8)
+        add_flight(
+            datetime(2030, 1, 1) + timedelta(minutes=rng.randrange(0, 180 * 24 * 60, 5)), hours=rng.randint(1, 12),
+            origin=origin, destination=rng.choice([airport for airport in range(1, 9) if airport != origin]),
+            pilot_id=rng.choice([None, *range(1, 11)]), status=rng.choice(["scheduled", "scheduled", "departed", "cancelled"]),
+            flight_number=f"TS{rng.randint(100, 999)}",
+        )
+
+# helper function to read every partition of a snapshot
+def _snapshot_rows(snapshot_dir):
+    manifest = read_manifest(snapshot_dir)
+    return manifest["months"], {month: _read_partition(snapshot_dir, month) for month in manifest["months"]}
+
+@pytest.fixture
+def snapshot_dir(db):
+    _add_flights(random.Random(5), 600)
+    path = str(db / "snapshot")
+    export_snapshot(path)
+    return path
+
+# helper function to run every report over the snapshot
+def _reports(snapshot_dir):
+    return [
+        snapshot_analytics.route_summary(snapshot_dir, limit=None),
+        snapshot_analytics.airport_summary(snapshot_dir, limit=None),
+        snapshot_analytics.pilot_summary(snapshot_dir, limit=None),
+        snapshot_analytics.route_summary(snapshot_dir, "2030-02", "2030-03", limit=10),
+    ]
+
+def test_numpy_and_standard_library_reports_match(snapshot_dir, monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    monkeypatch.setattr(snapshot_analytics, "numpy", numpy)
+    with_numpy = _reports(snapshot_dir)
+    monkeypatch.setattr(snapshot_analytics, "numpy", None)
+    assert _reports(snapshot_dir) == with_numpy
+
+def test_route_summary_matches_the_database(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(snapshot_analytics, "numpy", None)
+    with get_connection() as conn:
+        expected = {
+            (row[0], row[1]): row[2:] for row in conn.execute('''
+                SELECT departure_airport_id, arrival_airport_id,
+                    SUM(status != 'cancelled'), MIN(CASE WHEN status != 'cancelled' THEN duration_minutes END),
+                    MAX(CASE WHEN status != 'cancelled' THEN duration_minutes END), SUM(status = 'cancelled')
+                FROM flights GROUP BY departure_airport_id, arrival_airport_id
+            ''')
+        }
+    records = snapshot_analytics.route_summary(snapshot_dir, limit=None)
+    assert {
+        (record["departure_airport_id"], record["arrival_airport_id"]):
+            (record["flights"], record["min_duration_minutes"], record["max_duration_minutes"], record["cancelled"])
+        for record in records
+    } == expected
+    assert [record["flights"] for record in records] == sorted((record["flights"] for record in records), reverse=True)
+
+def test_incremental_export_matches_full_export(snapshot_dir, db):
+    rng = random.Random(9)
+    for _ in range(3):
+        _add_flights(rng, 40)
+        with transaction() as conn:
+            flight_ids = [flight_id for flight_id, in conn.execute("SELECT flight_id FROM flights")]
+            for flight_id in rng.sample(flight_ids, 30):
+                # moves flights by up to two months either way, so some change partition
+                shift = f"{rng.randint(-60 * 24, 60 * 24)} hours"
+                conn.execute(
+                    "UPDATE flights SET departure_time = datetime(departure_time, ?), arrival_time = datetime(arrival_time, ?) WHERE flight_id = ?",
+                    (shift, shift, flight_id)
+                )
+            for flight_id in rng.sample(flight_ids, 10):
+                conn.execute("UPDATE flights SET status = 'cancelled', pilot_id = NULL WHERE flight_id = ?", (flight_id,))
+            conn.execute("DELETE FROM flights WHERE flight_id IN (SELECT value FROM json_each(?))", (str(rng.sample(flight_ids, 5)),))
+        incremental = export_snapshot(snapshot_dir)
+        assert not incremental["full"]
+        assert incremental["rows_exported"] < incremental["rows"]
+        full_dir = str(db / "full")
+        assert export_snapshot(full_dir, full=True)["full"]
+        assert _snapshot_rows(snapshot_dir) == _snapshot_rows(full_dir)
+        assert sorted(os.listdir(snapshot_dir)) == sorted(os.listdir(full_dir))
+
+def test_flight_inserted_without_a_status_is_not_recorded_as_changed(snapshot_dir, db):
+    from reference_cache import flights_version
+    with get_connection() as conn:
+        before = conn.execute("SELECT COUNT(*), MAX(change_seq) FROM flight_changes").fetchone()
+        version = flights_version(conn)
+    flight_id = add_flight(datetime(2030, 3, 1, 9, 30), status=None)
+    with get_connection() as conn:
+        # the status is set by the insert trigger's UPDATE
+        assert conn.execute("SELECT status FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()[0] == "scheduled"
+        assert conn.execute("SELECT COUNT(*), MAX(change_seq) FROM flight_changes").fetchone() == before
+        # the insert still moves the flights version on, from the new flight ID
+        assert flights_version(conn) > version
+    assert not export_snapshot(snapshot_dir)["full"]
+    full_dir = str(db / "full")
+    export_snapshot(full_dir, full=True)
+    assert _snapshot_rows(snapshot_dir) == _snapshot_rows(full_dir)
+    # later changes to the flight are still recorded
+    with transaction() as conn:
+        conn.execute("UPDATE flights SET status = 'cancelled' WHERE flight_id = ?", (flight_id,))
+        assert conn.execute("SELECT change_seq FROM flight_changes WHERE flight_id = ?", (flight_id,)).fetchone() == (before[1] + 1,)
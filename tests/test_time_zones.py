@@ -0,0 +1,63 @@
+import csv
+from datetime import datetime, timedelta
+
+from bulk_import import import_file
+from conftest import add_flight
+from database import get_connection, transaction
+from flights import schedule_flight
+from flights_helpers import iter_flights
+from models import utc_now
+
+# helper function to read a flight's status
+def _status(flight_id):
+    with get_connection() as conn:
+        return conn.execute("SELECT status FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()[0]
+
+# helper function to return a time a number of hours from now in the database's format
+def _hours_from_now(hours):
+    return (utc_now() + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+# helper function to list the IDs of the future flights, as the menus and '--future' listings do
+def _future_flight_ids():
+    return [flight[0] for flight in iter_flights(["f.flight_id"], is_future=True)]
+
+def test_local_time_zone_is_not_gmt(local_time_zone):
+    assert abs(datetime.now() - utc_now()) > timedelta(hours=1)
+
+def test_python_and_sqlite_clocks_agree(db, local_time_zone):
+    with get_connection() as conn:
+        sqlite_now = datetime.fromisoformat(conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0])
+    assert abs(sqlite_now - utc_now()) < timedelta(seconds=5)
+
+def test_scheduled_flight_is_listed_as_future(db, local_time_zone):
+    from database_queries import update_flight_status
+    flight_id, _, _ = schedule_flight(1, 2, utc_now().replace(microsecond=0) + timedelta(hours=2), timedelta(hours=3))
+    assert _status(flight_id) == "scheduled"
+    assert _future_flight_ids() == [flight_id]
+    update_flight_status()
+    assert _status(flight_id) == "scheduled"
+
+def test_flights_inserted_without_a_status(db, local_time_zone):
+    past, future = add_flight(-2, status=None), add_flight(2, status=None)
+    assert (_status(past), _status(future)) == ("departed", "scheduled")
+    assert _future_flight_ids() == [future]
+
+def test_status_update_uses_gmt(db, local_time_zone):
+    from database_queries import STATUS_HIGH_WATER_MARK, update_flight_status
+    with transaction() as conn:
+        conn.execute("INSERT INTO app_state (key, value) VALUES (?, ?)", (STATUS_HIGH_WATER_MARK, _hours_from_now(-2)))
+    departed, scheduled = add_flight(-1 / 60), add_flight(1)
+    update_flight_status()
+    assert (_status(departed), _status(scheduled)) == ("departed", "scheduled")
+
+def test_import_uses_gmt(db, local_time_zone, tmp_path):
+    path = tmp_path / "flights.csv"
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["departure_iata", "arrival_iata", "departure_time", "duration_hours", "status"])
+        for hours, status in ((-1, ""), (-1, "scheduled"), (1, ""), (1, "scheduled")):
+            writer.writerow(["JFK", "LHR", _hours_from_now(hours), 2, status])
+    assert import_file("flights", str(path))["inserted"] == 4
+    with get_connection() as conn:
+        statuses = [status for status, in conn.execute("SELECT status FROM flights ORDER BY flight_id")]
+    assert statuses == ["departed", "departed", "scheduled", "scheduled"]